@@ -24,6 +24,7 @@ from .pdfdocumentrepository import PDFDocumentRepository
 from .compositerepository import CompositeRepository, CompositeStore
 from .resources import Resources
 from .wordreader import WordReader
+from .officeconverter import OfficeConverter
 from .wsgiapp import WSGIApp
 from .devel import Devel
 # gets pulled into setup.py and docs/conf.py -- but appveyor.yml is separate
@@ -3,12 +3,16 @@ from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 from builtins import *
 
+from collections import defaultdict, OrderedDict
+from concurrent import futures
+from urllib.parse import urlsplit
+import json
+import logging
 import os
+import threading
 import time
-import logging
-from collections import defaultdict, OrderedDict
 
-from ferenda import DocumentRepository, DocumentStore
+from ferenda import DocumentRepository, DocumentStore, DocumentEntry
 from ferenda import util, errors
 from ferenda.decorators import updateentry
 
@@ -25,6 +29,7 @@ class CompositeStore(DocumentStore):
             docrepo_instances = OrderedDict()
         self.docrepo_instances = docrepo_instances
         self.basefiles = defaultdict(set)
+        self._index_mtime = None
 
     def list_basefiles_for(self, action, basedir=None, force=True):
         if not basedir:
@@ -35,18 +40,83 @@ class CompositeStore(DocumentStore):
         # of download (see lagen.nu.myndfskr), we only need to query
         # subrepos prior to the parse step
         if action in ("parse"): 
+            # while we're walking the subrepos, the saved index can't
+            # be trusted
+            self.invalidate_subrepo_index()
             documents = set()
+            found = defaultdict(set)
             for cls, inst in self.docrepo_instances.items():
                 for basefile in inst.store.list_basefiles_for(action, force=force):
+                    found[cls].add(basefile)
                     self.basefiles[cls].add(basefile)
                     if basefile not in documents:
                         documents.add(basefile)
                         yield basefile
+            self.basefiles = found
+            self.save_subrepo_index()
         else:
             for basefile in super(CompositeStore,
                                   self).list_basefiles_for(action, basedir, force):
                 yield basefile
 
+    def subrepo_index_path(self):
+        return self.resourcepath("subrepos.json")
+
+    def save_subrepo_index(self):
+        """Saves which subrepos have which basefiles, so that other
+        processes (like the workers of a parse --all) can look this up
+        instead of checking for downloaded files in every subrepo."""
+        path = self.subrepo_index_path()
+        util.ensure_dir(path)
+        data = dict((cls.alias, sorted(basefiles))
+                    for cls, basefiles in self.basefiles.items())
+        tmppath = "%s.%s.tmp" % (path, os.getpid())
+        with open(tmppath, "w") as fp:
+            json.dump(data, fp)
+        os.replace(tmppath, path)
+        self._index_mtime = os.path.getmtime(path)
+
+    def load_subrepo_index(self):
+        """Loads the index saved by :py:meth:`save_subrepo_index`, if it
+        exists and has changed since it was last loaded. Returns True
+        if the index was loaded."""
+        path = self.subrepo_index_path()
+        if not os.path.exists(path):
+            # someone else might have invalidated it
+            self._index_mtime = None
+            return False
+        mtime = os.path.getmtime(path)
+        if mtime == self._index_mtime:
+            return False
+        with open(path) as fp:
+            data = json.load(fp)
+        for cls in self.docrepo_instances:
+            if cls.alias in data:
+                self.basefiles[cls] = set(data[cls.alias])
+        self._index_mtime = mtime
+        return True
+
+    def invalidate_subrepo_index(self):
+        util.robust_remove(self.subrepo_index_path())
+        self._index_mtime = None
+
+    def add_to_subrepo_index(self, cls, basefile):
+        """Records that the subrepo *cls* has *basefile*, updating the
+        saved index if there is one."""
+        self.load_subrepo_index()
+        self.basefiles[cls].add(basefile)
+        if os.path.exists(self.subrepo_index_path()):
+            self.save_subrepo_index()
+
+    def subrepos_for(self, basefile):
+        """Returns the subrepo classes that have *basefile* according to
+        the saved index, or None if there is no index."""
+        self.load_subrepo_index()
+        if self._index_mtime is None:
+            return None
+        return [cls for cls in self.docrepo_instances
+                if basefile in self.basefiles[cls]]
+
     def remove(self, basefile):
         removed = 0
         for cls, inst in self.docrepo_instances.items():
@@ -162,7 +232,10 @@ class CompositeRepository(DocumentRepository):
             for k, v in c.get_default_options().items():
                 if k not in opts:
                     opts[k] = v
-        # 3. add the extra 'failfast' option
+        # 3. add the extra 'failfast' option. 'downloadsperhost' is
+        # inherited from DocumentRepository, but for a composite repo
+        # it also limits the number of subrepos downloading from the
+        # same host at the same time
         opts['failfast'] = False
         return opts
 
@@ -184,33 +257,72 @@ class CompositeRepository(DocumentRepository):
             config.datadir + os.sep + self.alias,
             storage_policy=self.storage_policy,
             docrepo_instances=self._instances)
+        if 'entrytype' in config:
+            self.store.set_entrytype(config.entrytype)
 
     def download(self, basefile=None):
         for c in self.subrepos:
-            inst = self.get_instance(c)
             # make sure that our store has access to our now
             # initialized subrepo objects
             if c not in self.store.docrepo_instances:
-                self.store.docrepo_instances[c] = inst
-            try:
-                # temporarily re-set the logging level so that the
-                # subrepos INFO messages get reported (see note in
-                # get_instance).
-                loglevel_workaround = False
-                if (self.log.getEffectiveLevel() == logging.INFO and
-                    inst.log.getEffectiveLevel() == logging.INFO + 1):
-                    loglevel_workaround = True
-                    inst.log.setLevel(self.log.getEffectiveLevel())
-                ret = inst.download(basefile)
-                if loglevel_workaround:
-                    inst.log.setLevel(self.log.getEffectiveLevel() + 1)
-            except Exception as e:  # be resilient
-                loc = util.location_exception(e)
-                self.log.error("download for %s failed: %s (%s)" % (c.alias, e, loc))
-                ret = False
-            if basefile and ret:
-                # we got the doc we want, we're done!
-                return
+                self.store.docrepo_instances[c] = self.get_instance(c)
+        if basefile:
+            for c in self.subrepos:
+                if self.download_subrepo(c, basefile):
+                    # we got the doc we want, we're done!
+                    self.store.add_to_subrepo_index(c, basefile)
+                    return
+            return
+
+        # Subrepos typically fetch from different hosts, so download
+        # from all of them at the same time, but with at most
+        # config.downloadsperhost subrepos per host. The saved index
+        # can't be trusted while they're downloading, and is written
+        # again with the basefiles of each subrepo when all are done.
+        self.store.invalidate_subrepo_index()
+        found = {}
+        hostlimits = {}
+        for c in self.subrepos:
+            host = urlsplit(self.get_instance(c).start_url or "").netloc
+            if host not in hostlimits:
+                hostlimits[host] = threading.BoundedSemaphore(
+                    max(1, self.config.downloadsperhost))
+
+        def download(c, limit):
+            with limit:
+                self.download_subrepo(c)
+            found[c] = set(self.get_instance(c).store.list_basefiles_for("parse"))
+
+        with futures.ThreadPoolExecutor(max_workers=len(self.subrepos) or 1) as executor:
+            jobs = [executor.submit(download, c,
+                                    hostlimits[urlsplit(self.get_instance(c).start_url or "").netloc])
+                    for c in self.subrepos]
+            for job in jobs:
+                job.result()
+        self.store.basefiles = defaultdict(set, found)
+        self.store.save_subrepo_index()
+
+    def download_subrepo(self, c, basefile=None):
+        """Calls download on the instance of subrepo *c*, returning its
+        result (or False if it raised an error)."""
+        inst = self.get_instance(c)
+        try:
+            # temporarily re-set the logging level so that the
+            # subrepos INFO messages get reported (see note in
+            # get_instance).
+            loglevel_workaround = False
+            if (self.log.getEffectiveLevel() == logging.INFO and
+                inst.log.getEffectiveLevel() == logging.INFO + 1):
+                loglevel_workaround = True
+                inst.log.setLevel(self.log.getEffectiveLevel())
+            ret = inst.download(basefile)
+            if loglevel_workaround:
+                inst.log.setLevel(self.log.getEffectiveLevel() + 1)
+        except Exception as e:  # be resilient
+            loc = util.location_exception(e)
+            self.log.error("download for %s failed: %s (%s)" % (c.alias, e, loc))
+            ret = False
+        return ret
 
     # NOTE: this impl should NOT use the @managedparsing decorator --
     # but it can use @updateentry to catch warnings and errors thrown
@@ -295,10 +407,18 @@ class CompositeRepository(DocumentRepository):
                 
 
     def get_preferred_instances(self, basefile):
+        # if there's a saved index of which subrepos have which
+        # basefiles (kept up to date by download and
+        # list_basefiles_for("parse")), there's no need to look for
+        # downloaded files in every subrepo
+        known = self.store.subrepos_for(basefile)
         for c in self.subrepos:
             inst = self.get_instance(c)
-            if (basefile in self.store.basefiles[c] or
-                os.path.exists(inst.store.downloaded_path(basefile))):
+            if known is not None:
+                if c in known:
+                    yield(inst)
+            elif (basefile in self.store.basefiles[c] or
+                  os.path.exists(inst.store.downloaded_path(basefile))):
                 yield(inst)
 
     def copy_parsed(self, basefile, instance):
@@ -313,11 +433,25 @@ class CompositeRepository(DocumentRepository):
             self.log.debug("%s: Attachments are (likely) up-to-date" % basefile)
             return
 
-        util.link_or_copy(instance.store.documententry_path(basefile),
-                          self.store.documententry_path(basefile))
-
-        util.link_or_copy(instance.store.distilled_path(basefile),
-                          self.store.distilled_path(basefile))
+        src = instance.store.documententry_path(basefile)
+        dst = self.store.documententry_path(basefile)
+        if (DocumentEntry.backend_for(src).separate_files and
+                DocumentEntry.backend_for(dst).separate_files):
+            util.link_or_copy(src, dst)
+        else:
+            # at least one of the entries isn't stored as a separate
+            # file, so we can't link them
+            DocumentEntry(src).save(dst)
+
+        # keep the format of the subrepo's distilled file, and remove
+        # any distilled file in another format
+        distilled_format = instance.store.distilled_file_format(basefile)
+        for fmt in self.store.distilled_formats:
+            path = self.store.distilled_path(basefile, format=fmt)
+            if fmt == distilled_format:
+                util.link_or_copy(instance.store.distilled_path(basefile), path)
+            elif os.path.exists(path):
+                util.robust_remove(path)
 
         util.link_or_copy(instance.store.parsed_path(basefile),
                           self.store.parsed_path(basefile))
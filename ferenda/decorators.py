@@ -19,7 +19,9 @@ import codecs
 import functools
 import itertools
 import os
+import random
 import sys
+import threading
 import time
 import logging
 try:
@@ -35,7 +37,6 @@ from ferenda import util
 from ferenda import DocumentEntry
 from ferenda.documentstore import Needed
 from ferenda.errors import DocumentRemovedError, ParseError, DocumentRenamedError
-from ferenda.elements import serialize
 
 
 def timed(f):
@@ -64,6 +65,11 @@ def timed(f):
     return wrapper
 
 
+# several repos (eg. the subrepos of a CompositeRepository) may finish
+# downloading at the same time, but share the same config file
+_config_write_lock = threading.Lock()
+
+
 def recordlastdownload(f):
     """Automatically stores current time in ``self.config.lastdownload``
     """
@@ -74,8 +80,9 @@ def recordlastdownload(f):
         # specific basefile was specified)
         if not args or not any(args):
             if self.download_record_last_download:
-                self.config.lastdownload = datetime.now()
-                LayeredConfig.write(self.config)
+                with _config_write_lock:
+                    self.config.lastdownload = datetime.now()
+                    LayeredConfig.write(self.config)
         return ret
     return wrapper
 
@@ -175,13 +182,8 @@ def render(f):
                 os.rename(old_intermediate, new_intermediate)
         # now render thath doc data as files (JSON, XHTML, RDF/XML)
         if self.config.serializejson == True:
-            with self.store.open_serialized(doc.basefile, "wb") as fp:
-                r = serialize(doc, format="json")  # should be a (unicode) str
-                fp.write(r.encode('utf-8'))
-            self.log.debug(
-                "Created %s" %
-                (self.store.serialized_path(
-                    doc.basefile)))
+            path = self.store.write_serialized(doc.basefile, doc)
+            self.log.debug("Created %s" % path)
         # css file + background images + png renderings of text
         resources = self.create_external_resources(doc)
         if resources:
@@ -199,12 +201,26 @@ def render(f):
 
 
         # Extract all triples on the XHTML/RDFa data to a separate
-        # RDF/XML file
-        distilled_graph = Graph()
-        with codecs.open(self.store.parsed_path(doc.basefile, version=doc.version),
-                         encoding="utf-8") as fp:  # unicode
-            distilled_graph.parse(data=fp.read(), format="rdfa",
-                                  publicID=doc.uri)
+        # RDF/XML file. Normally the triples are taken directly from
+        # the document tree, which is a lot faster than a full RDFa
+        # parse of the XHTML file. The RDFa parser is used as a
+        # fallback and, for a sample of documents, as a consistency
+        # check.
+        parsed_path = self.store.parsed_path(doc.basefile, version=doc.version)
+        distilled_graph = self.render_xhtml_graph(doc)
+        sample = self.config.rdfasample if 'rdfasample' in self.config else 0
+        if distilled_graph is None or (sample and random.randrange(sample) == 0):
+            rdfa_graph = Graph()
+            with codecs.open(parsed_path, encoding="utf-8") as fp:  # unicode
+                rdfa_graph.parse(data=fp.read(), format="rdfa",
+                                 publicID=doc.uri)
+            if distilled_graph is not None:
+                (in_both, in_first, in_second) = graph_diff(distilled_graph, rdfa_graph)
+                if in_first or in_second:
+                    self.log.warning("Triples extracted from the document tree differ "
+                                     "from the RDFa parse (-%s, +%s), using the "
+                                     "latter", len(in_second), len(in_first))
+            distilled_graph = rdfa_graph
 
         # The act of parsing from RDFa binds a lot of namespaces
         # in the graph in an unneccesary manner. Particularly it
@@ -216,15 +232,11 @@ def render(f):
             "dcterms",
             URIRef("http://example.org/this-prefix-should-not-be-used"))
 
-        util.ensure_dir(self.store.distilled_path(doc.basefile, version=doc.version))
-        with open(self.store.distilled_path(doc.basefile, version=doc.version),
-                  "wb") as distilled_file:
-            # print("============distilled===============")
-            # print(distilled_graph.serialize(format="turtle").decode('utf-8'))
-            distilled_graph.serialize(distilled_file, format="pretty-xml")
-        self.log.debug(
-            '%s triples extracted to %s',
-            len(distilled_graph), self.store.distilled_path(doc.basefile, version=doc.version))
+        # print("============distilled===============")
+        # print(distilled_graph.serialize(format="turtle").decode('utf-8'))
+        distilled_path = self.store.write_distilled(doc.basefile, distilled_graph,
+                                                    version=doc.version)
+        self.log.debug('%s triples extracted to %s', len(distilled_graph), distilled_path)
 
         # Validate that all required triples are present (we check
         # distilled_graph, but we could just as well check doc.meta)
@@ -153,6 +153,7 @@ class DevelHandler(RequestHandler):
                                          "refresh", "download", "url",
                                          "develurl", "fulltextindex", "relate",
                                          "clientname", "bulktripleload",
+                                         "bulkfulltextload",
                                          "class", "storetype", "storelocation",
                                          "storerepository", "indextype",
                                          "indexlocation", "combineresources",
@@ -869,28 +870,29 @@ class Devel(object):
         writer.writerow(dict([(p, p) for p in predicates]))
         for basefile in repo.store.list_basefiles_for("relate"):
             baseuri = URIRef(repo.canonical_uri(basefile))
-            with repo.store.open_distilled(basefile) as fp:
-                row = {}
-                if 'basefile' in predicates:
-                    row['basefile'] = basefile
-                g = Graph().parse(fp, format="xml")
-                for (p, o) in g.predicate_objects(baseuri):
-                    qname = g.qname(p)
-                    if qname in predicates:
-                        if isinstance(o, URIRef) and qname not in ("prov:wasDerivedFrom",):
-                            row[qname] = g.qname(o)
-                        else:
-                            # it seems py2 CSV modue expects latin-1
-                            # encoded bytestrings (for non-ascii
-                            # values), while py3 CSV expects unicode
-                            # (sensibly)
-                            fld = str(o)
-                            # if six.PY2:
-                            #     fld = fld.encode("latin-1", errors="replace")
-                            row[qname] = fld
-                if 'subobjects' in predicates:
-                    row['subobjects'] = len(list(g.subject_objects(RDF.type)))
-                writer.writerow(row)
+            row = {}
+            if 'basefile' in predicates:
+                row['basefile'] = basefile
+            # non-RDF/XML files lack namespace prefixes, so start
+            # with the ones the repo knows about
+            g = repo.store.read_distilled(basefile, graph=repo.make_graph())
+            for (p, o) in g.predicate_objects(baseuri):
+                qname = g.qname(p)
+                if qname in predicates:
+                    if isinstance(o, URIRef) and qname not in ("prov:wasDerivedFrom",):
+                        row[qname] = g.qname(o)
+                    else:
+                        # it seems py2 CSV modue expects latin-1
+                        # encoded bytestrings (for non-ascii
+                        # values), while py3 CSV expects unicode
+                        # (sensibly)
+                        fld = str(o)
+                        # if six.PY2:
+                        #     fld = fld.encode("latin-1", errors="replace")
+                        row[qname] = fld
+            if 'subobjects' in predicates:
+                row['subobjects'] = len(list(g.subject_objects(RDF.type)))
+            writer.writerow(row)
 
     def _repo_from_alias(self, alias, datadir=None, repoconfig=None, basefile=None):
         #  (FIXME: This uses several undocumented APIs)
@@ -1362,11 +1364,10 @@ class Devel(object):
             util.ensure_dir(dst)
             shutil.copy2(sourcerepo.store.path(basefile, "register", ".html"),
                          dst)
-        # also copy the docentry json file
-        if os.path.exists(sourcerepo.store.documententry_path(basefile)):
-            util.ensure_dir(destrepo.store.documententry_path(basefile))
-            shutil.copy(sourcerepo.store.documententry_path(basefile),
-                         destrepo.store.documententry_path(basefile))
+        # also copy the docentry
+        src = sourcerepo.store.documententry_path(basefile)
+        if DocumentEntry.backend_for(src).exists(src):
+            DocumentEntry(src).save(destrepo.store.documententry_path(basefile))
 
 
     @decorators.action
@@ -1423,13 +1424,24 @@ class Devel(object):
                 print("%s: Copying docs from %s" % (alias, aliasdir))
                 self.samplerepo(alias, aliasdir)
 
+    statusreport_pagesize = 500
+    """The maximum number of documents listed on each page of a repo
+    status report (see :py:meth:`statusreport`)."""
+
     @decorators.action
     def statusreport(self, alias=None):
         """Generate report on which files parse()d OK, with errors, or failed.
 
-        Creates a servable HTML file containing information about how
-        the last parse went for each doc in the given repo (or all
-        repos if none given).
+        Creates a servable HTML file (``status/status.html``)
+        summarizing how the last run of each action went for the docs
+        in the given repo (or all repos if none given), linking to a
+        paginated set of files for each repo (``status/<alias>/1.html``
+        and onwards) that list all docs and their status.
+
+        The results for each doc are cached between runs, so that only
+        the entries that have changed since the last report need to be
+        read, and the pages for a repo are only re-rendered if
+        anything in it has changed.
 
         """
         log = logging.getLogger("devel")
@@ -1438,6 +1450,13 @@ class Devel(object):
         else:
             repos = [self._repo_from_alias(alias) for alias in self.config._parent._subsections]
         root = etree.fromstring("<status></status>")
+        statusdir = os.sep.join([self.config.datadir, 'status'])
+        conffile = os.path.abspath(
+            os.sep.join([self.config.datadir, 'rsrc', 'resources.xml']))
+        resourceloader = [x.resourceloader for x in repos if hasattr(x, 'resourceloader')][0]
+        transformer = Transformer('XSLT', "xsl/statusreport.xsl", "xsl",
+                                  resourceloader=resourceloader,
+                                  config=conffile)
 
         for repo in sorted(repos, key=attrgetter("alias")):
             # Find out if this repo is outwardly-responsible for
@@ -1453,92 +1472,189 @@ class Devel(object):
             basefiles = list(repo.store.list_basefiles_for("news"))
             if not basefiles:
                 continue
-            repo_el = etree.SubElement(root, "repo", {"alias": repo.alias})
+            repodir = os.sep.join([statusdir, repo.alias])
+            cachefile = os.sep.join([repodir, ".status.json"])
+            cached = {}
+            if os.path.exists(cachefile):
+                with open(cachefile) as fp:
+                    try:
+                        cached = json.load(fp)
+                    except ValueError:
+                        log.warning("%s: %s is not a valid JSON file, rereading all entries" % (repo.alias, cachefile))
+            results, changed = self._statusreport_results(repo, basefiles, cached)
+            if changed or not os.path.exists(cachefile):
+                util.ensure_dir(cachefile)
+                with open(cachefile, "w") as fp:
+                    json.dump(results, fp)
+            self._statusreport_durations(repo, results, changed)
+
             successcnt = warncnt = failcnt = removecnt = errcnt = 0
-            durations = defaultdict(dict)
-            for basefile in basefiles:
-                # sys.stdout.write(".")
-                # print("%s/%s" % (repo.alias, basefile))
-                entrypath = repo.store.documententry_path(basefile)
-                if not os.path.exists(entrypath):
-                    log.warning("%s/%s: file %s doesn't exist" % (repo.alias, basefile, entrypath))
-                    errcnt += 1
-                    continue
-                elif os.path.getsize(entrypath) == 0:
-                    log.warning("%s/%s: file %s is 0 bytes" % (repo.alias, basefile, entrypath))
-                    errcnt += 1
-                    continue
-                try:
-                    entry = DocumentEntry(entrypath)
-                except ValueError as e:
-                    log.error("%s/%s: %s %s" % (repo.alias, basefile, e.__class__.__name__, e))
-                    errcnt += 1
-                    continue
-                if not entry.status:  # an empty dict
-                    log.warning("%s/%s: file %s has no status sub-dict" % (repo.alias, basefile, entrypath))
+            total = duration = 0
+            failed = set()
+            warned = set()
+            listed = []
+            for basefile, result in results.items():
+                if result["corrupt"]:
                     errcnt += 1
                     continue
-                if "parse" in entry.status and "success" in entry.status["parse"] and entry.status["parse"]["success"] == "removed":
-                    log.debug("%s/%s: document was removed in parse" % (repo.alias, basefile))
-                    durations["parse"][basefile] = -1
+                if result["status"].get("parse", {}).get("success") == "removed":
                     continue
-                doc_el = etree.SubElement(repo_el, "basefile",
-                                          {"id": basefile})
-                # FIXME: we should sort the entries in a reasonable way, eg
-                # "download"/"parse"/"relate"/"generate"/any custom
-                # action, probably through a custom key func
-                for action in sorted(entry.status):
-                    status = entry.status[action]
-                    if not status:
-                        log.warning("%s/%s: file %s has no status data for action %s" % (repo.alias, basefile, entrypath, action))
-                        continue
-                    if "success" in status and status["success"] == "removed":
-                        # this special truthy value indicates that
-                        # everything went as OK as it could, but the
-                        # actual document doesn't exist (anymore) so we
-                        # don't feature it in our overview.
-                        #
-                        # FIXME: Can this ever be reached, seemingly
-                        # as we check for entry.status.parse.success
-                        # == "removed" above, and no other action
-                        # could produce a removed status?
-                        durations[action][basefile] = -1
+                total += 1
+                for action, status in result["status"].items():
+                    if status.get("success") == "removed":
                         removecnt += 1
                         continue
-                    durations[action][basefile] = status["duration"]
-                    action_el = etree.SubElement(doc_el, "action",
-                                                 {"id": action,
-                                                  "success": str(status["success"]),
-                                                  "duration": str(status["duration"]),
-                                                  "date": str(status["date"])})
-                    if status["success"]:
+                    duration += status.get("duration", 0)
+                    if status.get("success"):
                         successcnt += 1
                     else:
                         failcnt += 1
+                        failed.add(basefile)
                     if "warnings" in status:
                         warncnt += 1
-
-                    # add additional (optional) text data if present
-                    for optional in ("warnings", "error", "traceback"):
-                        if optional in status:
-                            opt_el = etree.SubElement(action_el, optional)
-                            opt_el.text = status[optional]
-            log.info("%s: %s processed, %s ok (%s w/ warnings), %s failed, %s removed. %s corrupted entries." % (repo.alias, len(basefiles), successcnt, warncnt, failcnt, removecnt, errcnt))
-            with open(repo.store.path(".durations", "entries", ".json", storage_policy="file"), "w") as fp:
-                json.dump(durations, fp, indent=4)
-        conffile = os.path.abspath(
-            os.sep.join([self.config.datadir, 'rsrc', 'resources.xml']))
-        resourceloader = [x.resourceloader for x in repos if hasattr(x, 'resourceloader')][0]
-        transformer = Transformer('XSLT', "xsl/statusreport.xsl", "xsl",
-                                  resourceloader=resourceloader,
-                                  config=conffile)
+                        warned.add(basefile)
+                listed.append(basefile)
+            log.info("%s: %s processed (%s changed since last report), %s ok (%s w/ warnings), %s failed, %s removed. %s corrupted entries." % (repo.alias, len(basefiles), len(changed), successcnt, warncnt, failcnt, removecnt, errcnt))
+
+            listed.sort(key=util.split_numalpha)
+            pagesize = self.statusreport_pagesize
+            pagecount = (len(listed) + pagesize - 1) // pagesize
+            repoattrs = {"alias": repo.alias,
+                         "total": str(total),
+                         "failed": str(len(failed)),
+                         "warnings": str(len(warned)),
+                         "duration": str(duration)}
+            repo_el = etree.SubElement(root, "repo", repoattrs)
+            for pageno in range(1, pagecount + 1):
+                etree.SubElement(repo_el, "page", {"n": str(pageno),
+                                                   "href": "%s/%s.html" % (repo.alias, pageno)})
+            if changed or not os.path.exists(os.sep.join([repodir, "1.html"])):
+                for f in os.listdir(repodir):
+                    if f.endswith(".html"):
+                        os.unlink(os.sep.join([repodir, f]))
+                for pageno in range(1, pagecount + 1):
+                    page = listed[(pageno - 1) * pagesize:pageno * pagesize]
+                    pageroot = self._statusreport_page(repoattrs, results, page,
+                                                       pageno, pagecount)
+                    outfile = os.sep.join([repodir, "%s.html" % pageno])
+                    xhtmltree = transformer.transform(pageroot, depth=2)
+                    with open(outfile, "wb") as fp:
+                        fp.write(etree.tostring(xhtmltree, encoding="utf-8", pretty_print=True))
+                log.info("%s: Wrote %s pages to %s" % (repo.alias, pagecount, repodir))
         xhtmltree = transformer.transform(root, depth=1)
-        outfile = os.sep.join([self.config.datadir, 'status', 'status.html'])
+        outfile = os.sep.join([statusdir, 'status.html'])
         util.ensure_dir(outfile)
         with open(outfile, "wb") as fp:
             fp.write(etree.tostring(xhtmltree, encoding="utf-8", pretty_print=True))
         log.info("Wrote %s" % outfile)
 
+    def _statusreport_results(self, repo, basefiles, cached):
+        # Returns the results for all basefiles, reusing cached
+        # results for those whose entries haven't been saved since,
+        # along with the set of basefiles that are new, changed or
+        # gone since the cached results were made.
+        backend = DocumentEntry.backend_for(repo.store.documententry_path(basefiles[0]))
+        results = OrderedDict()
+        mtimes = {}
+        for basefile in basefiles:
+            mtime = backend.mtime(repo.store.documententry_path(basefile))
+            if basefile in cached and cached[basefile]["mtime"] == mtime:
+                results[basefile] = cached[basefile]
+            else:
+                results[basefile] = None
+                mtimes[basefile] = mtime
+        for basefile, entry in repo.store.load_entries(mtimes):
+            results[basefile] = self._statusreport_result(repo, basefile, entry,
+                                                          mtimes[basefile])
+        changed = set(mtimes)
+        changed.update(basefile for basefile in cached if basefile not in results)
+        return results, changed
+
+    def _statusreport_result(self, repo, basefile, entry, mtime):
+        log = logging.getLogger("devel")
+        entrypath = repo.store.documententry_path(basefile)
+        result = {"mtime": mtime, "corrupt": False, "status": {}}
+        if entry is None:
+            log.warning("%s/%s: entry %s doesn't exist, is empty or is invalid" % (repo.alias, basefile, entrypath))
+            result["corrupt"] = True
+        elif not entry.status:  # an empty dict
+            log.warning("%s/%s: file %s has no status sub-dict" % (repo.alias, basefile, entrypath))
+            result["corrupt"] = True
+        else:
+            for action, status in entry.status.items():
+                if not status:
+                    log.warning("%s/%s: file %s has no status data for action %s" % (repo.alias, basefile, entrypath, action))
+                    continue
+                result["status"][action] = dict(
+                    (key, str(status[key]) if key == "date" else status[key])
+                    for key in ("success", "duration", "date",
+                                "warnings", "error", "traceback")
+                    if key in status)
+        return result
+
+    def _statusreport_durations(self, repo, results, changed):
+        # Updates the durations of the changed basefiles in
+        # .durations.json (used by list_basefiles_for to process the
+        # most demanding basefiles first), instead of recreating it
+        # from all results.
+        path = repo.store.path(".durations", "entries", ".json", storage_policy="file")
+        durations = None
+        if os.path.exists(path):
+            with open(path) as fp:
+                try:
+                    durations = json.load(fp)
+                except ValueError:
+                    pass
+        if durations is None:
+            durations = {}
+            changed = results
+        elif not changed:
+            return
+        for basefile in changed:
+            for d in durations.values():
+                d.pop(basefile, None)
+            if basefile not in results or results[basefile]["corrupt"]:
+                continue
+            status = results[basefile]["status"]
+            if status.get("parse", {}).get("success") == "removed":
+                durations.setdefault("parse", {})[basefile] = -1
+                continue
+            for action in status:
+                if status[action].get("success") == "removed":
+                    durations.setdefault(action, {})[basefile] = -1
+                elif "duration" in status[action]:
+                    durations.setdefault(action, {})[basefile] = status[action]["duration"]
+        util.ensure_dir(path)
+        with open(path, "w") as fp:
+            json.dump(durations, fp, indent=4)
+
+    def _statusreport_page(self, repoattrs, results, basefiles, pageno, pagecount):
+        root = etree.fromstring("<status></status>")
+        attrs = dict(repoattrs)
+        attrs["page"] = str(pageno)
+        repo_el = etree.SubElement(root, "repo", attrs)
+        for n in range(1, pagecount + 1):
+            etree.SubElement(repo_el, "page", {"n": str(n), "href": "%s.html" % n})
+        for basefile in basefiles:
+            doc_el = etree.SubElement(repo_el, "basefile", {"id": basefile})
+            # FIXME: we should sort the entries in a reasonable way, eg
+            # "download"/"parse"/"relate"/"generate"/any custom
+            # action, probably through a custom key func
+            for action, status in sorted(results[basefile]["status"].items()):
+                if status.get("success") == "removed":
+                    continue
+                action_el = etree.SubElement(doc_el, "action",
+                                             {"id": action,
+                                              "success": str(status.get("success")),
+                                              "duration": str(status.get("duration")),
+                                              "date": str(status.get("date"))})
+                # add additional (optional) text data if present
+                for optional in ("warnings", "error", "traceback"):
+                    if optional in status:
+                        opt_el = etree.SubElement(action_el, optional)
+                        opt_el.text = status[optional]
+        return root
+
     # FIXME: These are dummy implementations of methods and class
     # variables that manager.py expects all docrepos to have. We don't
     # want to have coverage counting these as missing lines, hence the
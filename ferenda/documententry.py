@@ -16,7 +16,10 @@ except ImportError:
     JSONDecodeError = ValueError  # what json on python < 3.5 uses instead
 import logging
 import os
+import sqlite3
 import sys
+import threading
+import time
 
 from rdflib import Literal
 from rdflib.namespace import RDF
@@ -103,36 +106,40 @@ class DocumentEntry(object):
     #           'last-modified': '<isodatestring>',
     #           'etag': '234242323424'}]
 
+    backends = []
+    """A list of ``(directory, backend)`` tuples. Entries with paths
+    in any of these directories are stored using the corresponding
+    backend, all other entries are stored as JSON files. Use
+    :py:meth:`~ferenda.DocumentEntry.register_backend` to add to
+    this list."""
+
     def __init__(self, path=None):
-        if path and os.path.exists(path) and os.path.getsize(path) > 0:
-            with open(path) as fp:
-                hook = util.make_json_date_object_hook('orig_created',
-                                                       'orig_updated',
-                                                       'orig_checked',
-                                                       'published',
-                                                       'updated',
-                                                       'indexed_ts',
-                                                       'indexed_dep',
-                                                       'indexed_ft',
-                                                       'date')
-                try:
-                    d = json.load(fp, object_hook=hook)
-                except JSONDecodeError as e:
-                    if e.msg == "Extra data":
-                        logging.getLogger("documententry").warning("%s exists but has extra data from pos %s" % (path, e.pos))
-                        fp.seek(0)
-                        jsondata = fp.read(e.pos)
-                        d = json.loads(jsondata, object_hook=hook)
-                    else:
-                        raise e
+        d = self.backend_for(path).load(path) if path else None
+        self._load(d, path)
+
+    @classmethod
+    def from_dict(cls, d, path=None):
+        """Create a object from a dict, as returned by the ``load``
+        or ``load_many`` methods of a entry backend, without
+        accessing the backend.
+
+        :param d: The data for the entry, or None for an empty entry
+        :type d: dict
+        :param path: The path that the entry will be saved to
+        :type path: str
+        """
+        entry = cls.__new__(cls)
+        entry._load(d, path)
+        return entry
+
+    def _load(self, d, path):
+        if d:
             if 'summary_type' in d and d['summary_type'] == "html":
                 d['summary'] = Literal(d['summary'], datatype=RDF.XMLLiteral)
                 del d['summary_type']
             self.__dict__.update(d)
             self._path = path
         else:
-            if path and os.path.exists(path):
-                logging.getLogger("documententry").warning("%s exists but is empty" % path)
             self.id = None
             self.basefile = None
             self.orig_updated = None
@@ -163,6 +170,36 @@ class DocumentEntry(object):
             self.status['parse'] = self.parse
             delattr(self, 'parse')
 
+    @classmethod
+    def register_backend(cls, directory, backend):
+        """Store all entries below *directory* using *backend*
+        instead of as separate JSON files. If *backend* is None, any
+        previously registered backend for *directory* is removed.
+
+        :param directory: The directory that the entry paths are in,
+                          normally the ``entries`` directory of a
+                          :py:class:`~ferenda.DocumentStore`.
+        :type directory: str
+        :param backend: The backend to use
+        :type backend: JSONEntryBackend or SQLiteEntryBackend
+        """
+        directory = os.path.normpath(directory) + os.sep
+        cls.backends[:] = [(d, b) for (d, b) in cls.backends if d != directory]
+        if backend:
+            cls.backends.append((directory, backend))
+            # match the most specific directory first
+            cls.backends.sort(key=lambda x: len(x[0]), reverse=True)
+
+    @classmethod
+    def backend_for(cls, path):
+        """Returns the backend used for storing the entry at *path*."""
+        if cls.backends:
+            path = os.path.normpath(path) + os.sep
+            for directory, backend in cls.backends:
+                if path.startswith(directory):
+                    return backend
+        return _jsonbackend
+
     def __repr__(self):
         return '<%s id=%s>' % (self.__class__.__name__, self.id)
 
@@ -190,11 +227,9 @@ class DocumentEntry(object):
         if isinstance(self.summary, Literal) and self.summary.datatype == RDF.XMLLiteral:
             d["summary_type"] = "html"
 
-        util.ensure_dir(path)
         s = json.dumps(d, default=util.json_default_date, indent=2,
                        separators=(', ', ': '), sort_keys=True)
-        with open(path, "w") as fp:
-            fp.write(s)
+        self.backend_for(path).save(path, s)
 
     # If inline=True, the contents of filename is included in the Atom
     # entry. Otherwise, it just references it.
@@ -256,6 +291,7 @@ class DocumentEntry(object):
         """Given a filename, return a MIME-type based on the file extension."""
         exts = {'.pdf': 'application/pdf',
                 '.rdf': 'application/rdf+xml',
+                '.nt': 'application/n-triples',
                 '.html': 'text/html',
                 '.xhtml': 'application/html+xml'}
         for ext, mimetype in list(exts.items()):
@@ -288,6 +324,12 @@ class DocumentEntry(object):
         formatter = logging.Formatter(fmt, datefmt="%H:%M:%S")
         handler.setFormatter(formatter)
         handler.setLevel(logging.WARNING)
+        # only capture events from this thread, so that entries being
+        # updated concurrently (eg by
+        # DocumentRepository.download_concurrently) don't get each
+        # other's warnings
+        thread = threading.get_ident()
+        handler.addFilter(lambda record: record.thread == thread)
         rootlog = logging.getLogger()
         rootlog.addHandler(handler)
         start = datetime.datetime.now()
@@ -342,3 +384,191 @@ class DocumentEntry(object):
                 entry.save()
     
     
+
+
+def _decode(s, path=None):
+    hook = util.make_json_date_object_hook('orig_created',
+                                           'orig_updated',
+                                           'orig_checked',
+                                           'published',
+                                           'updated',
+                                           'indexed_ts',
+                                           'indexed_dep',
+                                           'indexed_ft',
+                                           'date')
+    try:
+        return json.loads(s, object_hook=hook)
+    except JSONDecodeError as e:
+        if e.msg == "Extra data":
+            logging.getLogger("documententry").warning("%s exists but has extra data from pos %s" % (path, e.pos))
+            return json.loads(s[:e.pos], object_hook=hook)
+        else:
+            raise e
+
+
+class JSONEntryBackend(object):
+    """Stores each entry as a separate JSON file. This is the default
+    backend."""
+
+    separate_files = True
+    """Whether each entry is stored in a file of its own, at the path
+    given for the entry."""
+
+    def load(self, path):
+        """Returns the data for the entry at *path* as a dict, or None if
+        no such entry exists."""
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path) as fp:
+                return _decode(fp.read(), path)
+        elif os.path.exists(path):
+            logging.getLogger("documententry").warning("%s exists but is empty" % path)
+        return None
+
+    def load_many(self, paths):
+        """Returns a generator of ``(path, data)`` tuples for those of
+        *paths* that has an entry."""
+        for path in paths:
+            d = self.load(path)
+            if d:
+                yield path, d
+
+    def save(self, path, data):
+        """Stores the JSON string *data* as the entry for *path*."""
+        util.ensure_dir(path)
+        with open(path, "w") as fp:
+            fp.write(data)
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def mtime(self, path):
+        """Returns the time that the entry was last saved, or None."""
+        if os.path.exists(path):
+            return os.stat(path).st_mtime
+
+_jsonbackend = JSONEntryBackend()
+
+
+class SQLiteEntryBackend(JSONEntryBackend):
+    """Stores all entries in a directory in a single SQLite database,
+    where each row has the same JSON data as the corresponding entry
+    file would have had.
+
+    :param dbpath: The path to the database file
+    :type  dbpath: str
+    :param directory: The directory that the entry paths are in. Paths
+                      are stored relative to this.
+    :type  directory: str
+    """
+
+    separate_files = False
+
+    def __init__(self, dbpath, directory):
+        self.dbpath = dbpath
+        self.directory = os.path.normpath(directory)
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        # sqlite connections can't be shared between threads or with
+        # forked child processes, so each thread has its own, and a
+        # new one is created whenever the pid changes
+        local = self._local
+        if getattr(local, 'conn', None) is None or local.pid != os.getpid():
+            util.ensure_dir(self.dbpath)
+            local.conn = sqlite3.connect(self.dbpath, timeout=60)
+            local.conn.execute("CREATE TABLE IF NOT EXISTS entries "
+                               "(path TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                               "mtime REAL NOT NULL)")
+            local.conn.commit()
+            local.pid = os.getpid()
+        return local.conn
+
+    def _key(self, path):
+        return os.path.relpath(os.path.normpath(path), self.directory).replace(os.sep, "/")
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace("/", os.sep))
+
+    def load(self, path):
+        row = self.conn.execute("SELECT data FROM entries WHERE path = ?",
+                                (self._key(path),)).fetchone()
+        if row:
+            return _decode(row[0], path)
+
+    def load_many(self, paths):
+        keys = dict((self._key(p), p) for p in paths)
+        if len(keys) > 500:
+            # fetching everything in one sequential scan is faster
+            # than lots of small lookups
+            cursor = self.conn.execute("SELECT path, data FROM entries")
+            for key, data in cursor:
+                if key in keys:
+                    yield keys[key], _decode(data, keys[key])
+        else:
+            for key, path in keys.items():
+                d = self.load(path)
+                if d:
+                    yield path, d
+
+    def save(self, path, data):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO entries (path, data, mtime) "
+                              "VALUES (?, ?, ?)", (self._key(path), data, time.time()))
+
+    def exists(self, path):
+        return self.mtime(path) is not None
+
+    def mtime(self, path):
+        row = self.conn.execute("SELECT mtime FROM entries WHERE path = ?",
+                                (self._key(path),)).fetchone()
+        if row:
+            return row[0]
+
+    def list(self):
+        """Returns a generator of the paths of all entries."""
+        return (self._path(key) for (key,) in
+                self.conn.execute("SELECT path FROM entries ORDER BY path"))
+
+    def close(self):
+        """Closes the database connection of the current thread, if
+        open. A new connection is made the next time it's needed."""
+        local = self._local
+        if getattr(local, 'conn', None) is not None and local.pid == os.getpid():
+            local.conn.close()
+        local.conn = None
+
+    def import_json(self):
+        """Imports all JSON entry files in the directory into the
+        database, in a single transaction.
+
+        :returns: The number of imported entries
+        :rtype: int
+        """
+        cnt = 0
+        with self.conn:
+            for path in util.list_dirs(self.directory, ".json"):
+                if os.path.getsize(path) == 0:
+                    continue
+                with open(path) as fp:
+                    data = fp.read()
+                self.conn.execute("INSERT OR REPLACE INTO entries (path, data, mtime) "
+                                  "VALUES (?, ?, ?)",
+                                  (self._key(path), data, os.stat(path).st_mtime))
+                cnt += 1
+        return cnt
+
+    def export_json(self):
+        """Writes all entries in the database to separate JSON files in
+        the directory.
+
+        :returns: The number of exported entries
+        :rtype: int
+        """
+        cnt = 0
+        for key, data, mtime in self.conn.execute("SELECT path, data, mtime FROM entries"):
+            path = self._path(key)
+            _jsonbackend.save(path, data)
+            os.utime(path, (mtime, mtime))
+            cnt += 1
+        return cnt
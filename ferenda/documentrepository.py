@@ -7,13 +7,14 @@ from future.utils import native_str
 
 # stdlib
 from collections import defaultdict, OrderedDict
-from datetime import datetime
+from concurrent import futures
+from datetime import datetime, date
 from io import BytesIO, StringIO
 from itertools import chain
 from operator import itemgetter
 from tempfile import mkstemp
 from wsgiref.handlers import format_date_time as format_http_date
-from urllib.parse import quote, unquote, parse_qsl, urlparse
+from urllib.parse import quote, unquote, parse_qsl, urlparse, urljoin
 import builtins
 import locale
 import calendar
@@ -21,10 +22,12 @@ import codecs
 import difflib
 import filecmp
 import functools
+import hashlib
 import inspect
 import json
 import logging
 import logging.handlers
+import multiprocessing
 import os
 import pickle
 import re
@@ -33,6 +36,7 @@ import stat
 import sys
 import time
 import unicodedata
+import weakref
 
 # 3rd party
 from layeredconfig import LayeredConfig, Defaults
@@ -57,14 +61,32 @@ from ferenda import (Describer, TripleStore, FulltextIndex, Document,
                      DocumentStore, Transformer, Facet, Feed, Feedset,
                      ResourceLoader, RequestHandler)
 from ferenda.elements import (Body, Link,
-                              UnorderedList, ListItem, Paragraph)
+                              UnorderedList, ListItem, Paragraph, serialize,
+                              AbstractElement, UnicodeElement, CompoundElement,
+                              LinkSubject, LinkMarkup, SectionalElement)
 from ferenda.elements.html import elements_from_soup
+from ferenda.elements.html import Body as HTMLBody
 from ferenda.documentstore import RelateNeeded
 # establish two central RDF Namespaces at the top level
 DCTERMS = Namespace(util.ns['dcterms'])
 PROV = Namespace(util.ns['prov'])
 
 
+class _NotDistillable(Exception):
+    # raised when triples can't be taken directly from a document
+    # tree, see DocumentRepository.render_xhtml_graph
+    pass
+
+
+def _touch_storestamp(docstore):
+    # records that the repo's context in the triple store has been
+    # changed, see DocumentRepository.faceted_data
+    path = docstore.resourcepath("distilled/triplestore.stamp")
+    util.ensure_dir(path)
+    with open(path, "a"):
+        os.utime(path, None)
+
+
 class DocumentRepository(object):
 
     """Base class for handling a repository of documents.
@@ -264,6 +286,11 @@ class DocumentRepository(object):
     time, there will exist no current version (in any of its forms, eg
     parsed or generated)."""
 
+    download_chunksize = 64 * 1024
+    """The number of bytes to read at a time when streaming a downloaded
+    document to disk in
+    :py:meth:`~ferenda.DocumentRepository.download_if_needed`."""
+
     download_iterlinks = True
     """If ``True`` (the default),
     :py:meth:`~ferenda.DocumentRepository.download_get_basefiles`
@@ -374,6 +401,14 @@ class DocumentRepository(object):
             self._config = config
         if not hasattr(self, 'store'):
             self.store = self.documentstore_class(self.config.datadir + os.sep + self.alias, compression=self.config.compress)
+            if 'distilledformat' in self.config:
+                self.store.distilled_format = self.config.distilledformat
+            if 'serializeformat' in self.config:
+                self.store.serialized_format = self.config.serializeformat
+            if 'archivedeltas' in self.config:
+                self.store.archive_deltas = self.config.archivedeltas
+            if 'entrytype' in self.config:
+                self.store.set_entrytype(self.config.entrytype)
         self.requesthandler = self.requesthandler_class(self)
         
         # allow this docrepo to override a particular property of its
@@ -439,16 +474,17 @@ class DocumentRepository(object):
         """
         # in most cases, the user of the Docrepo object won't want to
         # look at the defined ontologies. But in case one does!
-        o = Graph()
+        bindings = OrderedDict()
         for prefix, uri in self.ns.items():
             # , "foaf", "skos", "dcterms", "bibo", "prov"):
             if prefix in ("rdf", "rdfs", "owl"):
                 continue
             ontopath = "vocab/%s.ttl" % prefix
             if self.resourceloader.exists(ontopath):
-                with self.resourceloader.open(ontopath) as fp:
-                    o.parse(data=fp.read(), format="turtle")                 
-                    o.bind(prefix, uri)
+                bindings[ontopath] = (prefix, uri)
+        o = self.load_graph(bindings.keys())
+        for prefix, uri in bindings.values():
+            o.bind(prefix, uri)
         return o
 
 
@@ -460,14 +496,65 @@ class DocumentRepository(object):
         series in which they're published, and so on. The data is
         taken from ``extra/[repoalias].ttl``.
         """
-        cd = Graph()
+        commonpaths = []
         for cls in inspect.getmro(self.__class__):
             if hasattr(cls, "alias"):
                 commonpath = "extra/%s.ttl" % cls.alias
                 if self.resourceloader.exists(commonpath):
-                    with self.resourceloader.open(commonpath, binary=True) as fp:
-                        cd.parse(data=fp.read(), format="turtle")                 
-        return cd
+                    commonpaths.append(commonpath)
+        return self.load_graph(commonpaths)
+
+    # process-wide cache of pickled graphs, shared by all docrepo
+    # instances. See load_graph.
+    _graphcache = {}
+
+    def load_graph(self, resourcenames):
+        """Returns a new :py:class:`~rdflib.graph.Graph` containing the
+        triples from the given Turtle resources.
+
+        Since the same resources are typically used by many docrepo
+        instances, the combined graph is parsed only once per process
+        and kept (in pickled form) in a cache keyed on the resource
+        paths and their modification times. If the ``graphsnapshots``
+        config option is set, the pickled graph is also saved under
+        ``[datadir]/rdfcache`` so that other processes don't need to
+        parse the Turtle files either. Each call returns a separate
+        copy, so the caller may modify it.
+
+        :param resourcenames: Names of resources to load, as accepted by
+                              :py:meth:`~ferenda.ResourceLoader.filename`
+        :type  resourcenames: list
+        :rtype: rdflib.graph.Graph
+        """
+        files = []
+        for resourcename in resourcenames:
+            filename = os.path.abspath(self.resourceloader.filename(resourcename))
+            files.append((filename, os.path.getmtime(filename)))
+        key = tuple(files)
+        data = self._graphcache.get(key)
+        snapshotpath = None
+        if (data is None and 'graphsnapshots' in self.config and
+                self.config.graphsnapshots):
+            snapshotpath = os.sep.join(
+                (self.config.datadir, "rdfcache",
+                 hashlib.md5(repr(key).encode("utf-8")).hexdigest() + ".pickle"))
+            if os.path.exists(snapshotpath):
+                with open(snapshotpath, "rb") as fp:
+                    data = fp.read()
+        if data is None:
+            g = Graph()
+            for filename, mtime in files:
+                with open(filename, "rb") as fp:
+                    g.parse(data=fp.read(), format="turtle")
+            data = pickle.dumps(g, pickle.HIGHEST_PROTOCOL)
+            if snapshotpath:
+                util.ensure_dir(snapshotpath)
+                fd, tmpname = mkstemp(dir=os.path.dirname(snapshotpath))
+                with os.fdopen(fd, "wb") as fp:
+                    fp.write(data)
+                os.replace(tmpname, snapshotpath)
+        self._graphcache[key] = data
+        return pickle.loads(data)
 
     @property
     def config(self):
@@ -493,6 +580,14 @@ class DocumentRepository(object):
             config.datadir + os.sep + self.alias,
             storage_policy=self.storage_policy,
             compression=config.compress)
+        if 'distilledformat' in config:
+            self.store.distilled_format = config.distilledformat
+        if 'serializeformat' in config:
+            self.store.serialized_format = config.serializeformat
+        if 'archivedeltas' in config:
+            self.store.archive_deltas = config.archivedeltas
+        if 'entrytype' in config:
+            self.store.set_entrytype(config.entrytype)
         if downloaded_suffixes and downloaded_suffixes != self.store.downloaded_suffixes:
             self.store.downloaded_suffixes.clear()
             self.store.downloaded_suffixes.extend(downloaded_suffixes)
@@ -509,7 +604,8 @@ class DocumentRepository(object):
         expressed different in different contexts. This method
         therefore performs fuzzy matching (using
         :py:func:`difflib.get_close_matches`) using the cutoff
-        parameter determines exactly how fuzzy this matching is.
+        parameter determines exactly how fuzzy this matching is. The
+        labels are indexed by :py:meth:`label_index`.
 
         If no resource matches the given label, a
         :py:exc:`KeyError` is raised.
@@ -529,23 +625,47 @@ class DocumentRepository(object):
 
         """
 
-        resources = {}
-        for (resource, candidate_label) in self.commondata.subject_objects(predicate):
-            if label == str(candidate_label):
-                return resource
-            else:
-                resources[str(candidate_label)] = resource
+        index = self.label_index(predicate)
+        resource = index.get(label)
+        if resource is not None:
+            return resource
 
-        fuzz = difflib.get_close_matches(label, resources.keys(), 1, cutoff)
+        fuzz = index.closest(label, cutoff)
         if fuzz:
             # even if we want warnings, we don't want warnings for case changes
-            if warn and label.lower() != fuzz[0].lower():
+            if warn and label.lower() != fuzz.lower():
                 self.log.warning("Assuming that '%s' should be '%s'?" %
-                                 (label, fuzz[0]))
-            return URIRef(resources[fuzz[0]])
+                                 (label, fuzz))
+            return URIRef(index.get(fuzz))
         else:
             raise KeyError("No good match for '%s'" % label)
 
+    def label_index(self, predicate=FOAF.name):
+        """Returns a :py:class:`~ferenda.util.LabelIndex` of all labels
+        (objects of *predicate*) in
+        :py:data:`~ferenda.DocumentRepository.commondata`, mapped to
+        the resources that have them. The index is built on first use
+        and rebuilt if ``commondata`` is replaced by another graph
+        object or changes size. If you modify ``commondata`` in place
+        without changing its size, delete ``self._label_indexes`` to
+        force a rebuild.
+
+        :param predicate: The RDF predicate for the labels
+        :type  predicate: rdflib.term.URIRef
+        :rtype: ferenda.util.LabelIndex
+        """
+        graph = self.commondata
+        indexes = self.__dict__.setdefault('_label_indexes', {})
+        # the index is tied to the graph object itself (through a weak
+        # reference, so that a new graph that happens to get the same
+        # id() isn't mistaken for it)
+        if (predicate not in indexes or indexes[predicate][0]() is not graph or
+                indexes[predicate][1] != len(graph)):
+            index = util.LabelIndex((label, resource) for resource, label
+                                    in graph.subject_objects(predicate))
+            indexes[predicate] = (weakref.ref(graph), len(graph), index)
+        return indexes[predicate][2]
+
     @classmethod
     def get_default_options(cls):
         """Returns the class' configuration default configuration
@@ -561,6 +681,8 @@ class DocumentRepository(object):
         """
         return {  # 'loglevel': 'INFO',
             'allversions': False,
+            'archivedeltas': False,
+            'bulkfulltextload': False,
             'bulktripleload': False,
             'class': cls.__module__ + "." + cls.__name__,
             'clientname': '',
@@ -568,26 +690,35 @@ class DocumentRepository(object):
             'conditionalget': True,
             'datadir': 'data',
             'develurl': None,
+            'distilledformat': 'xml',
             'download': True,
+            'downloaddelay': 0,
             'downloadmax': nativeint,
+            'downloadsperhost': 2,
+            'downloadworkers': 1,
+            'entrytype': 'JSON',
             'force': False,
             'frontpagefeed': False,
             'fsmdebug': False,
             'fulltextindex': True,
             'generateforce': False,
+            'graphsnapshots': False,
             'ignorepatch': False,
             'indexlocation': 'data/whooshindex',
             'indextype': 'WHOOSH',
             'lastdownload': datetime,
+            'officeworkers': 1,
             'parseforce': False,
             'patchdir': 'patches',
             'patchformat': 'default',
             'primaryfrontpage': False,
             'processes': '1',
+            'rdfasample': 100,
             'refresh': False,
             'relate': True,
             'removeinvalidlinks': True,
             'republishsource': False,
+            'serializeformat': 'json',
             'serializejson': False,
             'storelocation': 'data/ferenda.sqlite',
             'storerepository': 'ferenda',
@@ -822,67 +953,149 @@ with the *config* object as single parameter.
         else:
             source = resp.text
             
-        for (basefile, params) in self.download_get_basefiles(source):
-            assert isinstance (params, dict), "You need to update your implementation of download_get_basefiles to return a dict instead of a string"
-            link = params['uri']
-            downloaded_path = self.store.downloaded_path(basefile)
-            if (refresh or
-                not os.path.exists(downloaded_path) or
-                os.path.getsize(downloaded_path) == 0):
-                ret = None
-                try:
-                    if 'title' in params:
-                        callback = lambda e: setattr(e, 'title', params['title'])
-                        
-                    else:
-                        callback = None
-                    ret = DocumentEntry.updateentry(self.download_single,
-                                                    'download',
-                                                    self.store.documententry_path,
-                                                    basefile,
-                                                    callback,
-                                                    basefile,
-                                                    link)
-                except requests.exceptions.HTTPError as e:
-                    if self.download_accept_404 and e.response.status_code == 404:
-                        self.log.error("%s: %s %s" % (basefile, link, e))
-                        ret = False
-                    elif self.download_accept_406 and e.response.status_code == 406:
-                        # The Eurlex CELLAR service sometimes return
-                        # this (if a doc is not available in our
-                        # wanted language, I think?) and we'd like to
-                        # distinguish this from a 404 error
-                        self.log.error("%s: %s %s" % (basefile, link, e))
-                        ret = False
-                    elif self.download_accept_400 and e.response.status_code == 400:
-                        # KKV does this for some (malformed) URLs like http://www.konkurrensverket.se/beslut/1_20160922110607_Nordic%20Camping%20&%20Resort%20AB.pdf
-                        self.log.error("%s: %s %s" % (basefile, link, e))
-                        ret = False
-                    else:
-                        raise e
-                except errors.DownloadFileNotFoundError as e:
-                    if self.download_accept_404:
-                        self.log.error("%s: %s %s" % (basefile, link, e))
-                        ret = False
-                    else:
-                        raise e
-                except errors.DocumentRemovedError as e:
-                    # download_single has signalled that a document
-                    # that download_get_basefiles thought would exist
-                    # did not in fact exist. Make a note of this so
-                    # that we don't need to call download_single for
-                    # this basefile ever again:
-                    if e.dummyfile:
-                        util.writefile(e.dummyfile, "")
-                    pass
-                finally:
-                    if reporter:
-                        reporter(basefile)
-                        
-                updated = updated or ret
+        basefiles = self.download_get_basefiles(source)
+        if self.config.downloadworkers > 1:
+            return self.download_concurrently(basefiles, refresh, reporter)
+        for (basefile, params) in basefiles:
+            ret = self.download_basefile(basefile, params, refresh, reporter)
+            updated = updated or ret
         # self.config.lastdownload = datetime.now()
         return updated
 
+    def download_basefile(self, basefile, params, refresh=True, reporter=None):
+        """Downloads a single document found by
+        :py:meth:`~ferenda.DocumentRepository.download_get_basefiles`
+        (unless it's already downloaded and *refresh* is False) by
+        calling :py:meth:`~ferenda.DocumentRepository.download_single`
+        and records the outcome in its entry. HTTP errors that the
+        repository is configured to accept are logged instead of
+        raised.
+
+        :param basefile: The basefile of the document
+        :type  basefile: str
+        :param params: The parameters that
+                       :py:meth:`~ferenda.DocumentRepository.download_get_basefiles`
+                       provided for the document
+        :type  params: dict
+        :param refresh: Whether to download the document even if
+                        it's already been downloaded
+        :type  refresh: bool
+        :param reporter: Called with the basefile when done
+        :type  reporter: callable
+        :returns: ``True`` if the document was downloaded, ``False`` or
+                  ``None`` otherwise
+        """
+        assert isinstance (params, dict), "You need to update your implementation of download_get_basefiles to return a dict instead of a string"
+        link = params['uri']
+        downloaded_path = self.store.downloaded_path(basefile)
+        ret = None
+        if (refresh or
+            not os.path.exists(downloaded_path) or
+            os.path.getsize(downloaded_path) == 0):
+            try:
+                if 'title' in params:
+                    callback = lambda e: setattr(e, 'title', params['title'])
+                    
+                else:
+                    callback = None
+                ret = DocumentEntry.updateentry(self.download_single,
+                                                'download',
+                                                self.store.documententry_path,
+                                                basefile,
+                                                callback,
+                                                basefile,
+                                                link)
+            except requests.exceptions.HTTPError as e:
+                if self.download_accept_404 and e.response.status_code == 404:
+                    self.log.error("%s: %s %s" % (basefile, link, e))
+                    ret = False
+                elif self.download_accept_406 and e.response.status_code == 406:
+                    # The Eurlex CELLAR service sometimes return
+                    # this (if a doc is not available in our
+                    # wanted language, I think?) and we'd like to
+                    # distinguish this from a 404 error
+                    self.log.error("%s: %s %s" % (basefile, link, e))
+                    ret = False
+                elif self.download_accept_400 and e.response.status_code == 400:
+                    # KKV does this for some (malformed) URLs like http://www.konkurrensverket.se/beslut/1_20160922110607_Nordic%20Camping%20&%20Resort%20AB.pdf
+                    self.log.error("%s: %s %s" % (basefile, link, e))
+                    ret = False
+                else:
+                    raise e
+            except errors.DownloadFileNotFoundError as e:
+                if self.download_accept_404:
+                    self.log.error("%s: %s %s" % (basefile, link, e))
+                    ret = False
+                else:
+                    raise e
+            except errors.DocumentRemovedError as e:
+                # download_single has signalled that a document
+                # that download_get_basefiles thought would exist
+                # did not in fact exist. Make a note of this so
+                # that we don't need to call download_single for
+                # this basefile ever again:
+                if e.dummyfile:
+                    util.writefile(e.dummyfile, "")
+                pass
+            finally:
+                if reporter:
+                    reporter(basefile)
+        return ret
+
+    def download_concurrently(self, basefiles, refresh=True, reporter=None):
+        """Downloads all documents in *basefiles* using a pool of
+        ``config.downloadworkers`` threads, each calling
+        :py:meth:`~ferenda.DocumentRepository.download_basefile`. Basefiles
+        are consumed as the workers become available, so documents
+        are downloaded while *basefiles* is still finding new ones.
+
+        While downloading, every request made through
+        :py:data:`~ferenda.DocumentRepository.session` (including any
+        made by *basefiles* itself) is limited to
+        ``config.downloadsperhost`` concurrent requests per host, started
+        at least ``config.downloaddelay`` seconds apart.
+
+        :param basefiles: ``(basefile, params)`` tuples, as generated
+                          by :py:meth:`~ferenda.DocumentRepository.download_get_basefiles`
+        :type  basefiles: iterable
+        :returns: True if any document was downloaded, False otherwise.
+        :rtype: bool
+        """
+        workers = self.config.downloadworkers
+        limiter = util.HostLimiter(self.config.downloadsperhost,
+                                   self.config.downloaddelay)
+        adapter = util.HostLimitedAdapter(limiter, pool_maxsize=workers)
+        oldadapters = dict(self.session.adapters)
+        for prefix in "https://", "http://":
+            self.session.mount(prefix, adapter)
+        updated = False
+        pending = set()
+        try:
+            with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                try:
+                    for (basefile, params) in basefiles:
+                        # don't let discovery get too far ahead of the
+                        # workers
+                        while len(pending) >= workers * 2:
+                            done, pending = futures.wait(
+                                pending, return_when=futures.FIRST_COMPLETED)
+                            for job in done:
+                                updated = job.result() or updated
+                        pending.add(executor.submit(self.download_basefile,
+                                                    basefile, params,
+                                                    refresh, reporter))
+                    for job in futures.as_completed(pending):
+                        updated = job.result() or updated
+                except BaseException:
+                    for job in pending:
+                        job.cancel()
+                    raise
+        finally:
+            adapter.close()
+            for prefix, oldadapter in oldadapters.items():
+                self.session.mount(prefix, oldadapter)
+        return updated
+
     def download_get_first_page(self):
         """TBD"""
         resp = self.session.get(self.start_url)
@@ -988,7 +1201,7 @@ with the *config* object as single parameter.
 
         return updated
 
-    def _addheaders(self, url, filename=None):
+    def _addheaders(self, url, filename=None, basefile=None):
         headers = {"User-agent": self.config.useragent}
         if filename:
             # we set both if-none-match and if-modified-since if we
@@ -996,13 +1209,69 @@ with the *config* object as single parameter.
             # ETags but don't return 304 when the appropriate ETag is
             # returned in a if-none-match header (but return 304 when
             # if-modified-since is used)
-            if os.path.exists(filename + ".etag"):
+            validators = {}
+            if basefile and os.path.exists(filename):
+                validators = self._download_validators(basefile).get(url, {})
+            if validators.get("etag"):
+                headers["If-none-match"] = validators["etag"]
+            elif os.path.exists(filename + ".etag"):
                 headers["If-none-match"] = util.readfile(filename + ".etag")
-            if os.path.exists(filename):
+            if validators.get("last-modified"):
+                headers["If-modified-since"] = validators["last-modified"]
+            elif os.path.exists(filename):
                 stamp = os.stat(filename).st_mtime
                 headers["If-modified-since"] = format_http_date(stamp)
         return headers
 
+    def _download_validators(self, basefile):
+        # the ETag and Last-Modified headers from the latest 200
+        # response for each url of the document, keyed on url
+        entrypath = self.store.documententry_path(basefile)
+        if not DocumentEntry.backend_for(entrypath).exists(entrypath):
+            return {}
+        return getattr(DocumentEntry(entrypath), 'orig_validators', None) or {}
+
+    def _download_digest(self, basefile, filename):
+        # the md5 digest of filename, as recorded in the entry when it
+        # was downloaded, or None if unknown or the file has changed
+        # size since then
+        entrypath = self.store.documententry_path(basefile)
+        if not DocumentEntry.backend_for(entrypath).exists(entrypath):
+            return None
+        digests = getattr(DocumentEntry(entrypath), 'orig_digests', None) or {}
+        known = digests.get(self._download_digest_key(filename))
+        if known and known["size"] == os.path.getsize(filename):
+            return known["md5"]
+
+    def _download_digest_key(self, filename):
+        return os.path.relpath(filename, self.store.datadir).replace(os.sep, "/")
+
+    def _save_download_digest(self, basefile, filename, digest, size):
+        entry = DocumentEntry(self.store.documententry_path(basefile))
+        digests = getattr(entry, 'orig_digests', None) or {}
+        key = self._download_digest_key(filename)
+        if digests.get(key) == {"md5": digest, "size": size}:
+            return
+        digests[key] = {"md5": digest, "size": size}
+        entry.orig_digests = digests
+        entry.save()
+
+    def _save_download_validators(self, basefile, url, response):
+        validators = {}
+        for header in "etag", "last-modified":
+            value = response.headers.get(header)
+            if isinstance(value, bytes):
+                value = value.decode()
+            if isinstance(value, str) and value:
+                validators[header] = value
+        entry = DocumentEntry(self.store.documententry_path(basefile))
+        existing = getattr(entry, 'orig_validators', None) or {}
+        if existing.get(url, {}) == validators:
+            return
+        existing[url] = validators
+        entry.orig_validators = existing
+        entry.save()
+
     def download_if_needed(self, url, basefile, archive=True, filename=None, sleep=1, extraheaders=None):
         """Downloads a remote resource to a local file. If a different
         version is already in place, archive that old version.
@@ -1030,46 +1299,80 @@ with the *config* object as single parameter.
             assumedfilename = filename
 
         if self.config.conditionalget:
-            # sets if-none-match and/or if-modified-since headers
-            headers = self._addheaders(url, assumedfilename)
+            # sets if-none-match and/or if-modified-since headers. The
+            # validators for the main document of the basefile are
+            # kept in its entry.
+            headers = self._addheaders(url, assumedfilename,
+                                       basefile if not filename else None)
         else:
             headers = self._addheaders(url)
         if extraheaders:
             headers.update(extraheaders)
 
-        fileno, tmpfile = mkstemp()
-        fp = os.fdopen(fileno)
-        fp.close()
-
         # Take extra precautions in the event of temporary network
         # failures etc -- try 5 times with 1 second pause inbetween
         # before giving up.
-        
         response = util.robust_fetch(self.session.get, url, self.log,
-                                     sleep=sleep, headers=headers, timeout=10)
-        # response = util.robust_fetch(self.session.get, url, self.log,
-        #                              sleep=sleep, headers=headers, timeout=10)
-
+                                     sleep=sleep, headers=headers, timeout=10,
+                                     stream=True)
         if response is False:  # not modified
             return False
-        with open(tmpfile, "wb") as fp:
-            fp.write(response.content)
 
+        # Stream the body to a temporary file next to the final one
+        # (so that it can be atomically moved into place), computing
+        # its digest on the way
+        util.ensure_dir(assumedfilename)
+        fileno, tmpfile = mkstemp(prefix=".", suffix=".tmp",
+                                  dir=os.path.dirname(assumedfilename) or None)
+        digest = hashlib.md5()
+        size = 0
+        try:
+            with os.fdopen(fileno, "wb") as fp:
+                for chunk in response.iter_content(self.download_chunksize):
+                    fp.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.unlink(tmpfile)
+            raise
+        finally:
+            response.close()
+        digest = digest.hexdigest()
+        if not filename and self.config.conditionalget:
+            self._save_download_validators(basefile, url, response)
+
+        mainfile = not filename
+        # the default comparison is byte for byte, which can be done
+        # with digests instead of reading the existing file
+        bytewise = (getattr(self.download_is_different, '__func__', None) is
+                    DocumentRepository.download_is_different)
         if not filename:
             filename = self.download_name_file(tmpfile,
                                                basefile,
                                                assumedfilename)
         if not os.path.exists(filename):
-            util.robust_rename(tmpfile, filename)
             updated = True
-        elif self.download_is_different(filename, tmpfile):
-            if archive:
+        else:
+            known = self._download_digest(basefile, filename) if mainfile else None
+            if known and bytewise:
+                updated = known != digest
+            else:
+                updated = self.download_is_different(filename, tmpfile)
+            if updated and archive:
                 version = self.get_archive_version(basefile)
                 self.store.archive(basefile, version, overwrite=self.download_archive_overwrite, copy=self.download_archive_copy)
-            util.robust_rename(tmpfile, filename)
-            updated = True
+        if updated:
+            try:
+                os.replace(tmpfile, filename)
+            except OSError:
+                # probably a different filesystem
+                util.robust_rename(tmpfile, filename)
         else:
-            updated = False
+            os.unlink(tmpfile)
+        if mainfile and (updated or bytewise):
+            # the file on disk now has the same contents as the
+            # response
+            self._save_download_digest(basefile, filename, digest, size)
 
         if updated:
             # OK we have a new file in place. Now examine the
@@ -1700,6 +2003,185 @@ with the *config* object as single parameter.
             return "Found over %s resources (%s), that's probably not right" % (self.max_resources, len(resources))
         return None  # no news is good news
 
+    def render_xhtml_graph(self, doc):
+        """Creates the RDF graph that the XHTML+RDFa file for a document
+        expresses, directly from ``doc.meta`` and the ``uri`` and
+        ``meta`` properties of the elements in ``doc.body``, without
+        parsing the rendered file.
+
+        The result is the same as what a RDFa parser would extract
+        from the output of
+        :py:meth:`~ferenda.DocumentRepository.render_xhtml`. This is
+        only possible for documents that consist of elements from
+        :py:mod:`ferenda.elements` that use their stock
+        ``as_xhtml`` implementations. If the document contains other
+        elements, elements with explicit RDFa attributes or RDF lists
+        in ``doc.meta``, None is returned and the caller should use a
+        RDFa parser instead.
+
+        :param doc: The document to extract triples from
+        :type  doc: ferenda.Document
+        :returns: The extracted triples, or None
+        :rtype: rdflib.Graph
+        """
+        graph = self.make_graph()
+        lang = doc.lang.lower() if doc.lang else None
+        try:
+            self._head_graph(graph, doc, doc.uri, lang, True)
+            self._body_graph(graph, doc.body, doc.uri, None, URIRef(doc.uri),
+                             doc.uri, lang)
+        except _NotDistillable as e:
+            self.log.debug("Can't extract triples from the document tree "
+                           "directly: %s" % e)
+            return None
+        return graph
+
+    def _head_graph(self, graph, doc, uri, lang, toplevel):
+        # mirrors render_head in render_xhtml_tree
+        for (s, p, o) in doc.meta:
+            if str(s) != uri and str(o) != uri:
+                continue
+            if isinstance(o, Literal):
+                if p == DCTERMS.title and toplevel:
+                    # rendered as <title>, which loses any datatype
+                    graph.add((s, p, Literal(str(o), lang=o.language and o.language.lower())))
+                else:
+                    graph.add((s, p, self._head_literal(o, None)))
+            elif isinstance(o, URIRef) and str(s) == uri:
+                graph.add((s, p, o))
+                if str(o) != doc.uri:
+                    self._head_graph(graph, doc, str(o), lang, False)
+            elif isinstance(o, URIRef):
+                if toplevel:
+                    graph.add((s, p, o))
+            elif doc.meta.value(o, RDF.first):
+                raise _NotDistillable("RDF list %s in doc.meta" % o.n3())
+            else:
+                graph.add((s, p, o))
+                for (bp, bo) in doc.meta.predicate_objects(o):
+                    if isinstance(bo, URIRef):
+                        graph.add((o, bp, bo))
+                    elif isinstance(bo, Literal):
+                        graph.add((o, bp, self._head_literal(bo, lang)))
+
+    def _head_literal(self, literal, lang):
+        # lang is what the literal gets if it has no datatype or
+        # language of its own
+        if literal.datatype:
+            return Literal(str(literal), datatype=literal.datatype)
+        elif literal.language:
+            return Literal(str(literal), lang=literal.language.lower())
+        else:
+            return Literal(str(literal), lang=lang)
+
+    def _body_graph(self, graph, node, uri, parent_uri, subject, base, lang):
+        # mirrors the as_xhtml implementations of the elements in
+        # ferenda.elements. subject is the RDFa subject that this
+        # node inherits from its ancestors.
+        if not hasattr(node, 'as_xhtml'):
+            return  # plain string
+        impl = type(node).as_xhtml
+        if impl in (AbstractElement.as_xhtml, UnicodeElement.as_xhtml,
+                    Link.as_xhtml, LinkSubject.as_xhtml):
+            if getattr(node, 'role', None):
+                raise _NotDistillable("@role on %r" % node)
+            if (impl == LinkSubject.as_xhtml and str(node).strip() and
+                    getattr(node, 'predicate', None) and hasattr(node, 'uri')):
+                graph.add((subject, self._curie(node.predicate),
+                           URIRef(urljoin(base, node.uri))))
+            return
+        if impl not in (CompoundElement.as_xhtml, LinkMarkup.as_xhtml,
+                        Body.as_xhtml, HTMLBody.as_xhtml,
+                        SectionalElement.as_xhtml):
+            raise _NotDistillable("%s has its own as_xhtml" %
+                                  node.__class__.__name__)
+        for attr in ('typeof', 'datatype', 'property', 'rel', 'about', 'role'):
+            if getattr(node, attr, None):
+                raise _NotDistillable("@%s on %r" % (attr, node))
+        if impl == Body.as_xhtml:
+            parent_uri = uri
+        nodeuri = getattr(node, 'uri', None)
+        if nodeuri and nodeuri != uri and impl in (Body.as_xhtml, HTMLBody.as_xhtml):
+            # as_xhtml replaces its @about with the document uri
+            raise _NotDistillable("%r has its own uri" % node)
+        if nodeuri:
+            subject = URIRef(nodeuri)
+            meta = getattr(node, 'meta', None)
+            if meta:
+                rdftype = title = None
+                for (s, p, o) in sorted(meta, key=itemgetter(1, 0, 2)):
+                    if s != subject:
+                        continue
+                    if p == RDF.type:
+                        rdftype = o
+                    elif p == DCTERMS.title:
+                        title = o
+                    else:
+                        self._span_graph(graph, meta, subject, p, o)
+                if rdftype is not None:
+                    graph.add((subject, RDF.type, rdftype))
+                if title is not None:
+                    graph.add((subject, DCTERMS.title,
+                               Literal(str(title.toPython()), lang=lang)))
+            if node.partrelation and parent_uri:
+                graph.add((subject, self._curie(node._qname(node.partrelation)),
+                           URIRef(parent_uri)))
+        elif impl in (Body.as_xhtml, HTMLBody.as_xhtml):
+            subject = URIRef(uri)
+        elif getattr(node, 'href', None) or getattr(node, 'src', None):
+            subject = URIRef(urljoin(base, getattr(node, 'href', None) or node.src))
+        if (impl == SectionalElement.as_xhtml and
+                not (hasattr(node, 'uri') and hasattr(node, 'meta'))):
+            newuri = nodeuri if hasattr(node, 'uri') else node.compute_uri(uri)
+            subject = URIRef(newuri) if newuri else BNode()
+            graph.add((subject, RDF.type, self._curie("bibo:DocumentPart")))
+            graph.add((subject, DCTERMS.title, Literal(str(node.title), lang=lang)))
+            if newuri:
+                if hasattr(node, 'ordinal'):
+                    graph.add((subject, self._curie("bibo:chapter"),
+                               Literal(str(node.ordinal), lang=lang)))
+                if hasattr(node, 'identifier'):
+                    graph.add((subject, DCTERMS.identifier,
+                               Literal(str(node.identifier), lang=lang)))
+                if node.partrelation:
+                    graph.add((subject, self._curie(node._qname(node.partrelation)),
+                               URIRef(parent_uri)))
+
+        # the same parent_uri that CompoundElement.as_xhtml gives
+        # its children
+        if nodeuri:
+            p = nodeuri
+        elif hasattr(node, 'compute_uri'):
+            p = node.compute_uri(baseuri=uri)
+        elif parent_uri:
+            p = parent_uri
+        else:
+            p = uri
+        for subpart in node:
+            self._body_graph(graph, subpart, uri, p, subject, base, lang)
+
+    def _span_graph(self, graph, meta, subj, pred, obj):
+        # mirrors CompoundElement._span
+        if isinstance(obj, Literal):
+            o_python = obj.toPython()
+            if isinstance(o_python, date):
+                o_python = o_python.isoformat()
+            if obj.datatype:
+                graph.add((subj, pred, Literal(str(o_python), datatype=obj.datatype)))
+            else:
+                graph.add((subj, pred, Literal(str(o_python),
+                                               lang=obj.language and obj.language.lower())))
+        elif isinstance(obj, URIRef):
+            graph.add((subj, pred, obj))
+            for (sub_pred, sub_obj) in sorted(meta.predicate_objects(subject=obj)):
+                self._span_graph(graph, meta, obj, sub_pred, sub_obj)
+
+    def _curie(self, curie):
+        prefix, name = curie.split(":", 1)
+        if prefix not in self.ns:
+            raise _NotDistillable("Unknown prefix in %s" % curie)
+        return URIRef(str(self.ns[prefix]) + name)
+
     def parsed_url(self, basefile):
         """Get the full local url for the parsed file for the
         given basefile.
@@ -1765,6 +2247,7 @@ with the *config* object as single parameter.
                 store.clear(context)
                 log.info("Adding %s to %s" % (dumppath, context))
                 store.add_serialized_file(dumppath, "nt", context)
+                _touch_storestamp(docstore)
             return False  # signals to Manager that no work needs to be done
 
         if config.force:
@@ -1774,6 +2257,7 @@ with the *config* object as single parameter.
                                         config.storelocation,
                                         config.storerepository)
             store.clear(context)
+            _touch_storestamp(docstore)
 
         if 'relate' in config and config.relate is False:
             log.info("%s: Not relating" % cls.alias)
@@ -1844,7 +2328,11 @@ with the *config* object as single parameter.
             with open(temppath, "wb") as fp:
                 filecount = 0
                 for filename in os.listdir(os.path.dirname(dumppath)):
-                    if not filename.endswith(".nt") or filename == "dump.nt":
+                    # only the files written by each process in
+                    # relate_triples (dump.<clientname>.<pid>.nt), not
+                    # the distilled files of documents
+                    if (not filename.startswith("dump.") or
+                            not filename.endswith(".nt") or filename == "dump.nt"):
                         continue
                     filecount += 1
                     filename = os.path.dirname(dumppath) + os.sep + filename
@@ -1856,10 +2344,28 @@ with the *config* object as single parameter.
                               "Loaded %(triplecount)s triples to context %(context)s from %(tempfile)s (%(elapsed).3f sec)",
                               values):
                 store.add_serialized_file(temppath, format="nt", context=context)
+                _touch_storestamp(docstore)
                 # just to report the number of dumped triples -- may be unneccesary
                 values['triplecount'] = sum(1 for line in open(temppath))
                 os.unlink(temppath)
 
+        # If documents were added to the fulltext index in bulk mode
+        # (see _get_fulltext_indexer), merge them into the index.
+        if 'bulkfulltextload' in config and config.bulkfulltextload and config.fulltextindex:
+            values['resources'] = 0
+            with util.logtime(log.info,
+                              "Merged %(resources)s bulk-indexed resources into the fulltext index (%(elapsed).3f sec)",
+                              values):
+                index = FulltextIndex.connect(config.indextype,
+                                              config.indexlocation,
+                                              repos=[])
+                if str(config.processes) == 'auto':
+                    processes = multiprocessing.cpu_count()
+                else:
+                    processes = int(config.processes)
+                values['resources'] = index.merge_bulk(processes)
+                index.close()
+
         # then extract a new dumppath file (which should have the exact
         # same contents as the temppath file, but this comes directly from
         # the triplestore
@@ -1945,11 +2451,10 @@ with the *config* object as single parameter.
                     with util.logtime(self.log.debug,
                                       "Added %(triplecount)s triples to %(nttemp)s (%(elapsed).3f sec)",
                                       values):
-                        data = open(self.store.distilled_path(basefile), "rb").read()
-                        g = Graph().parse(data=data)
+                        data = self.store.read_distilled_as(basefile, "nt")
                         with open(nttemp, "ab") as fp:
-                            fp.write(g.serialize(format="nt"))
-                        values['triplecount'] = len(g)
+                            fp.write(data)
+                        values['triplecount'] = sum(1 for line in data.splitlines() if line.strip())
                 else:
                     start = time.time()
                     if self.config.force:
@@ -1990,9 +2495,13 @@ with the *config* object as single parameter.
                            'dataset': self.dataset_uri(),
                            'rdffile': self.store.distilled_path(basefile),
                            'triplestore': self.config.storelocation}):
-            with open(self.store.distilled_path(basefile), "rb") as fp:
-                data = fp.read()
-            ts.add_serialized(data, format="xml", context=self.dataset_uri())
+            # RDF/XML and N-Triples files can be added as-is
+            fmt = self.store.distilled_file_format(basefile)
+            if fmt not in ("xml", "nt"):
+                fmt = "nt"
+            data = self.store.read_distilled_as(basefile, fmt)
+            ts.add_serialized(data, format=fmt, context=self.dataset_uri())
+            _touch_storestamp(self.store)
             #ts.add_serialized_file(self.store.distilled_path(basefile), format="xml",
             #                       context=self.dataset_uri())
             return len(data)
@@ -2013,6 +2522,12 @@ with the *config* object as single parameter.
             # if 'all' in self.config:
             #     self._fulltextindexer._batchwriter = True
 
+            # When relating all documents, possibly in several
+            # processes, use bulk mode. relate_all_teardown merges the
+            # results.
+            if self.config.bulkfulltextload and 'all' in self.config and self.config.all:
+                idx.bulk = True
+
         return self._fulltextindexer
 
     def relate_dependencies(self, basefile, repos=[]):
@@ -2024,7 +2539,7 @@ parsed document path to that documents dependency file."""
         with util.logtime(self.log.debug,
                           "Registered %(deps)s dependencies (%(elapsed).3f sec)",
                           values):
-            g = Graph().parse(data=util.readfile(self.store.distilled_path(basefile), encoding="utf-8"), format="xml")
+            g = self.store.read_distilled(basefile)
             subjects = set([s for s, p, o in g])
             for (s, p, o) in g:
                 # the graph for a single doc can describe
@@ -2097,11 +2612,7 @@ parsed document path to that documents dependency file."""
                 repos = []
             indexer = self._get_fulltext_indexer(repos)
             tree = etree.parse(self.store.parsed_path(basefile))
-            g = Graph()
-            desc = Describer(
-                g.parse(
-                    data=util.readfile(
-                        self.store.distilled_path(basefile))))
+            desc = Describer(self.store.read_distilled(basefile))
             qname_graph = self.make_graph()
             body = tree.find(".//{http://www.w3.org/1999/xhtml}body")
             resources = self._relate_fulltext_resources(body)
@@ -2245,17 +2756,19 @@ parsed document path to that documents dependency file."""
            facets have ``multiple_values`` set, once for each different
            values that that facet has.
 
+        The result is cached in ``toc/faceted_data.json`` until this
+        repository changes its data in the triple store (through
+        :py:meth:`~ferenda.DocumentRepository.relate` or
+        :py:meth:`~ferenda.DocumentRepository.relate_all_setup`), or
+        ``config.force`` is set.
+
         """
         # use some caching logic around the actual meat of the
         # function (the call to facet_query and facet_select. Custom
         # implementations might prefer to override facet_select
         # (eg. to add additional useful data).
         cachepath = self.store.resourcepath("toc/faceted_data.json")
-        dumppath = self.store.resourcepath("distilled/dump.nt")
-        if ((not self.config.force) and
-                os.path.exists(cachepath) and
-                os.path.getsize(cachepath) > 2 and  # a empty resultset is '[]' ie two bytes
-                util.outfile_is_newer([dumppath], cachepath)):
+        if self._faceted_data_is_cached():
             self.log.debug("Loading faceted_data from %s" % cachepath)
             hook = util.make_json_date_object_hook('dcterms_issued')
             with open(cachepath) as fp:
@@ -2290,6 +2803,38 @@ parsed document path to that documents dependency file."""
                 util.robust_remove(cachepath)
         return data
 
+    def _faceted_data_is_cached(self):
+        # whether toc/faceted_data.json reflects the current contents
+        # of the triple store (as far as this repo has changed it)
+        cachepath = self.store.resourcepath("toc/faceted_data.json")
+        return ((not self.config.force) and
+                os.path.exists(cachepath) and
+                os.path.getsize(cachepath) > 2 and  # a empty resultset is '[]' ie two bytes
+                util.outfile_is_newer([self.store.resourcepath("distilled/dump.nt"),
+                                       self.store.resourcepath("distilled/triplestore.stamp")],
+                                      cachepath))
+
+    def _transform_dependencies(self, resourcedir="xsl"):
+        # the files that a Transformer uses when transforming with a
+        # template in resourcedir: every file in that dir, as found
+        # through the loadpath (see ResourceLoader.extractdir), and
+        # the resources.xml config file
+        found = {}
+        for path in self.resourceloader.loadpath:
+            path = path + os.sep + resourcedir
+            if os.path.isdir(path):
+                for f in sorted(os.listdir(path)):
+                    if f not in found and os.path.isfile(path + os.sep + f):
+                        found[f] = path + os.sep + f
+        conffile = os.sep.join([self.config.datadir, 'rsrc', 'resources.xml'])
+        return [found[f] for f in sorted(found)] + [conffile]
+
+    def _transform_digest(self, resourcedir="xsl"):
+        # changes whenever any of the _transform_dependencies change
+        return repr([(os.path.basename(f), os.path.getmtime(f))
+                     for f in self._transform_dependencies(resourcedir)
+                     if os.path.exists(f)])
+
     def facet_query(self, context):
         """Constructs a SPARQL SELECT query that fetches all
         information needed to create faceted data.
@@ -2831,7 +3376,9 @@ WHERE {
             return
         tocindex = self.store.resourcepath("toc/index.html")
         faceted_data = self.store.resourcepath("toc/faceted_data.json")
-        if (not self.config.force) and util.outfile_is_newer([faceted_data], tocindex):
+        if (self._faceted_data_is_cached() and
+                util.outfile_is_newer([faceted_data] + self._transform_dependencies(),
+                                      tocindex)):
             self.log.debug("Not regenerating TOCs")
             return
 
@@ -3011,13 +3558,49 @@ WHERE {
                          :meth:`~ferenda.DocumentRepository.toc_pagesets`
         :param otherrepos: A list of document repository instances
 
+        Pages whose content (as well as the set of all pages and the
+        XSLT templates) is unchanged since the last time are not
+        regenerated, unless ``config.force`` is set.
+
         """
         paths = []
+        digestpath = self.store.resourcepath("toc/pagedigests.json")
+        olddigests = {}
+        if (not self.config.force) and os.path.exists(digestpath):
+            with open(digestpath) as fp:
+                olddigests = json.load(fp)
+        digests = {}
+        navdigest = repr(pagesets) + self._transform_digest()
         for (binding, value), documents in sorted(pagecontent.items()):
+            key = binding + "/" + value
+            digests[key] = self.toc_page_digest(navdigest, documents)
+            outfile = self.store.resourcepath("toc/%s.html" % key)
+            if olddigests.get(key) == digests[key] and os.path.exists(outfile):
+                paths.append(outfile)
+                continue
             paths.append(self.toc_generate_page(
                 binding, value, documents, pagesets, effective_basefile=None, otherrepos=otherrepos))
+        util.ensure_dir(digestpath)
+        with open(digestpath, "w") as fp:
+            json.dump(digests, fp, indent=4, sort_keys=True)
         return paths
 
+    def toc_page_digest(self, navdigest, documentlist):
+        """Calculate a digest for a single TOC page, used to determine
+        whether the page needs to be regenerated.
+
+        :param navdigest: A string representing the set of all pages
+                          (and the state of the templates used)
+        :param documentlist: Result from
+                       :meth:`~ferenda.DocumentRepository.toc_select_for_pages`
+        :returns: a hex digest
+        :rtype: str
+        """
+        c = hashlib.md5()
+        c.update(navdigest.encode("utf-8"))
+        c.update(serialize(UnorderedList([ListItem(x) for x in documentlist])).encode("utf-8"))
+        return c.hexdigest()
+
     def toc_generate_first_page(self, pagecontent, pagesets, otherrepos=[]):
         """Generate the main page of TOC pages."""
         firstpage = pagesets[0].pages[0]  # has .binding and .value
@@ -3117,11 +3700,15 @@ WHERE {
         repository.
 
         """
-        feedindex = self.store.resourcepath("news/main.atom")
+        feedindex = self.store.resourcepath("feed/main.atom")
         faceted_data = self.store.resourcepath("toc/faceted_data.json")
-        if (not self.config.force) and util.outfile_is_newer([faceted_data], feedindex):
-            self.log.debug("Not regenerating feeds")
-            return
+        if (self._faceted_data_is_cached() and
+                util.outfile_is_newer([faceted_data] + self._transform_dependencies(),
+                                      feedindex)):
+            changed = self.news_changed_basefiles(os.stat(feedindex).st_mtime)
+            if changed is not None and not changed[1]:
+                self.log.debug("Not regenerating feeds")
+                return
 
         params = {}
         # news_facet_entries employs caching
@@ -3166,69 +3753,128 @@ WHERE {
         # is newer than outfile (cachepath) the outfile_is_newer
         # immediately returns false.
         dependencies = chain(
-            [self.store.resourcepath("feed/faceted_entries.json")],
+            [self.store.resourcepath("toc/faceted_data.json")],
             util.list_dirs(self.store.resourcepath("entries"), ".json")
         )
-        if ((not self.config.force) and
-                os.path.exists(cachepath) and
-                util.outfile_is_newer(dependencies, cachepath)):
-
-            self.log.debug("Loading faceted_entries from %s" % cachepath)
-            # FIXME: Individual repos must be responsible for which
-            # fields (apart from published/updated) that might contain
-            # dates/datetimes
-            datehook = util.make_json_date_object_hook('published', 'updated', 'dcterms_issued', 'rpubl_avgorandedatum', 'orig_created', 'orig_updated')
-            ret = json.load(open(cachepath),
-                            object_hook=datehook)
+        # FIXME: Individual repos must be responsible for which
+        # fields (apart from published/updated) that might contain
+        # dates/datetimes
+        datehook = util.make_json_date_object_hook('published', 'updated', 'dcterms_issued', 'rpubl_avgorandedatum', 'orig_created', 'orig_updated')
+        if self._faceted_data_is_cached() and os.path.exists(cachepath):
+            if util.outfile_is_newer(dependencies, cachepath):
+                self.log.debug("Loading faceted_entries from %s" % cachepath)
+                with open(cachepath) as fp:
+                    return json.load(fp, object_hook=datehook)
+
+        # the summary of each entry (the properties we take from the
+        # DocumentEntry object), keyed on basefile. These are cached
+        # separately, since faceted_entries.json only contains the
+        # entries that occurred in faceted_data at the time. If the
+        # cache exists, we only need to load entries that have
+        # changed since it was written.
+        summarypath = self.store.resourcepath("feed/entry_summaries.json")
+        changed = None
+        if (not self.config.force) and os.path.exists(summarypath):
+            changed = self.news_changed_basefiles(os.stat(summarypath).st_mtime)
+        summaries = OrderedDict()
+        if changed is None:
+            entries = self.news_entries()
         else:
-            data = self.faceted_data()
-            # transform list of dicts into a dict with the uri field as
-            # key and teh entire dict as value, for fast lookup in the next step
-            datadict = dict([(x['uri'], x) for x in data])
-
-            ret = []
-            # decorate datadict with entries
-            for entry in self.news_entries():
-                # let's just hope that there always is one?
-                if entry.id not in datadict:
-                    self.log.warning("%s does not occur in faceted_data, "
-                                     "mismatch between data in docentry files "
-                                     "and data in triplestore" % entry.id)
-                    continue   # ie skip this, since we can't decorate
-                               # the row we skip it altogether
-
-                d = datadict[entry.id]
-                # or maybe we should just stash the DocumentEntry object in the
-                # correct row of the faceted data? like:
-                # d['entry'] = entry
-                #
-                # note in particular that the row/dict will have both a
-                # uri and a url field (where the latter should be the URL
-                # where the browser-ready file is published wich may or
-                # may not be identical to the canonical URI of the
-                # document).
-                #
-                # also, orig_updated (the date when the source doc was
-                # last updated) might be more interesting than updated
-                # (the last time anything happended with the entry)
-                for prop in ('updated', 'published', 'basefile', 'title',
-                             'summary', 'content', 'link', 'url', 'orig_updated', 'orig_created'):
-                    d[prop] = getattr(entry, prop)
-                ret.append(d)
-            # is there any point to sorting at this time, as
-            # news_select_for_feeds will sort the entries for each
-            # feed (and that will have access to entries after
-            # news_item have processed each, possibly recreating
-            # missing values needed for sorting...)
-            # ret = sorted(ret, key=keyfunc, reverse=reverse)
-            util.ensure_dir(cachepath)
-            with open(cachepath, "w") as fp:
-                self.log.debug("Saving faceted_entries to %s" % cachepath)
-                s = json.dumps(ret, indent=4, separators=(', ', ': '),
-                               default=util.json_default_date)
-                fp.write(s)
+            current, changed = changed
+            self.log.debug("Updating entry summaries with %s changed entries" % len(changed))
+            with open(summarypath) as fp:
+                for summary in json.load(fp, object_hook=datehook):
+                    if summary['basefile'] in current and summary['basefile'] not in changed:
+                        summaries[summary['basefile']] = summary
+            entries = self.news_entries(sorted(changed))
+        for entry in entries:
+            summary = dict([(prop, getattr(entry, prop)) for prop in self.news_entry_properties])
+            summary['uri'] = entry.id
+            summaries[entry.basefile] = summary
+        util.ensure_dir(summarypath)
+        with open(summarypath, "w") as fp:
+            json.dump(list(summaries.values()), fp, default=util.json_default_date)
+
+        data = self.faceted_data()
+        # transform list of dicts into a dict with the uri field as
+        # key and teh entire dict as value, for fast lookup in the next step
+        datadict = dict([(x['uri'], x) for x in data])
+
+        ret = []
+        # decorate datadict with entries
+        for summary in summaries.values():
+            # let's just hope that there always is one?
+            if summary['uri'] not in datadict:
+                self.log.warning("%s does not occur in faceted_data, "
+                                 "mismatch between data in docentry files "
+                                 "and data in triplestore" % summary['uri'])
+                continue   # ie skip this, since we can't decorate
+                           # the row we skip it altogether
+
+            d = datadict[summary['uri']]
+            # or maybe we should just stash the DocumentEntry object in the
+            # correct row of the faceted data? like:
+            # d['entry'] = entry
+            #
+            # note in particular that the row/dict will have both a
+            # uri and a url field (where the latter should be the URL
+            # where the browser-ready file is published wich may or
+            # may not be identical to the canonical URI of the
+            # document).
+            #
+            # also, orig_updated (the date when the source doc was
+            # last updated) might be more interesting than updated
+            # (the last time anything happended with the entry)
+            for prop in self.news_entry_properties:
+                d[prop] = summary[prop]
+            ret.append(d)
+        # is there any point to sorting at this time, as
+        # news_select_for_feeds will sort the entries for each
+        # feed (and that will have access to entries after
+        # news_item have processed each, possibly recreating
+        # missing values needed for sorting...)
+        # ret = sorted(ret, key=keyfunc, reverse=reverse)
+        util.ensure_dir(cachepath)
+        with open(cachepath, "w") as fp:
+            self.log.debug("Saving faceted_entries to %s" % cachepath)
+            s = json.dumps(ret, indent=4, separators=(', ', ': '),
+                           default=util.json_default_date)
+            fp.write(s)
         return ret
 
+    news_entry_properties = ('updated', 'published', 'basefile', 'title',
+                             'summary', 'content', 'link', 'url',
+                             'orig_updated', 'orig_created')
+    """The properties of each DocumentEntry object that
+    :py:meth:`~ferenda.DocumentRepository.news_facet_entries` uses to
+    decorate rows from
+    :py:meth:`~ferenda.DocumentRepository.faceted_data`."""
+
+    def news_changed_basefiles(self, since):
+        """Find out which entries have been changed since a particular
+        time, so that
+        :py:meth:`~ferenda.DocumentRepository.news_facet_entries` can
+        update its cached data incrementally.
+
+        :param since: A timestamp, as returned by :py:func:`os.stat`
+        :type since: float
+        :returns: A tuple of two sets: all current basefiles, and the
+                  basefiles whose entry has been modified since
+                  *since*. Returns None if this cannot be determined,
+                  which causes all entries to be loaded.
+        :rtype: tuple
+        """
+        current = set()
+        changed = set()
+        for basefile in self.store.list_basefiles_for("news"):
+            current.add(basefile)
+            path = self.store.documententry_path(basefile)
+            mtime = DocumentEntry.backend_for(path).mtime(path)
+            # an entry that doesn't exist (anymore) counts as changed
+            if mtime is None or mtime > since:
+                changed.add(basefile)
+        return current, changed
+
 
     news_feedsets_main_label = "All documents"
     
@@ -3401,19 +4047,18 @@ WHERE {
         # might fiddle with title and summary
         return entry
 
-    def news_entries(self):
+    def news_entries(self, basefiles=None):
         """Return a generator of all available (and published) DocumentEntry
         objects.
 
+        :param basefiles: If provided, only consider entries for these
+                          basefiles, instead of every entry in the
+                          repository.
+        :type basefiles: list
         """
         from ferenda import CompositeRepository
-        directory = os.path.sep.join((self.config.datadir, self.alias, "entries"))
-        for basefile in self.store.list_basefiles_for("news"):
-            path = self.store.documententry_path(basefile)
-            try:
-                entry = DocumentEntry(path)
-            except Exception as e:
-                self.log.warning("%s: Couldn't load entry: %s" % (basefile, e))
+        for basefile, entry in self.store.load_entries(basefiles):
+            if entry is None:
                 continue
             dirty = False
             if not entry.published:
@@ -3452,8 +4097,11 @@ WHERE {
 
             # Set links to RDF metadata and document content
             if not entry.link:
+                # the distilled url is always served as RDF/XML, even
+                # if the distilled file uses another format
                 entry.set_link(self.store.distilled_path(basefile),
-                               self.distilled_url(basefile))
+                               self.distilled_url(basefile),
+                               mimetype="application/rdf+xml")
                 dirty = True
 
             # If we just republish eg. the original PDF file and don't
@@ -3502,8 +4150,28 @@ WHERE {
                 transformargs['develurl'] = self.config.develurl
             urltransform = self.get_url_transform_func(**transformargs)
 
+        # feeds whose entries haven't changed since the last time
+        # don't need to be written again
+        digestpath = self.store.resourcepath("feed/feeddigests.json")
+        olddigests = {}
+        if (not self.config.force) and os.path.exists(digestpath):
+            with open(digestpath) as fp:
+                olddigests = json.load(fp)
+        digests = {}
+        transformdigest = self._transform_digest() if generate_html else ""
         for feedset in feedsets:
             for feed in feedset.feeds:
+                c = hashlib.md5()
+                c.update(json.dumps([feed.title, feed.entries], sort_keys=True,
+                                    default=str).encode("utf-8"))
+                c.update(transformdigest.encode("utf-8"))
+                digests[feed.slug] = c.hexdigest()
+                if (olddigests.get(feed.slug) == digests[feed.slug] and
+                    os.path.exists(self.store.resourcepath("feed/%s.atom" % feed.slug)) and
+                    (not generate_html or
+                     os.path.exists(self.store.resourcepath("feed/%s.html" % feed.slug)))):
+                    self.log.debug("feed %s: unchanged" % feed.slug)
+                    continue
                 # should reverse=True be configurable? For datetime
                 # properties it makes sense to use most recent first, but
                 # maybe other cases?
@@ -3523,6 +4191,9 @@ WHERE {
                     outfile = self.store.resourcepath('feed/%s.html' % feed.slug)
                     transformer.transform_file(infile, outfile,
                                                uritransform=urltransform)
+        util.ensure_dir(digestpath)
+        with open(digestpath, "w") as fp:
+            json.dump(digests, fp, indent=4, sort_keys=True)
 
     def news_write_atom(self, entries, title, slug, archivesize=100):
         """Given a list of Atom entry-like objects, including links to RDF
@@ -4,10 +4,16 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 from contextlib import contextmanager
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from tempfile import NamedTemporaryFile
 from zipfile import ZipFile
+from io import BytesIO, TextIOWrapper
+import difflib
+import hashlib
 import json
+import logging
+import pickle
+import zlib
 try:
     from json.decoder import JSONDecodeError
 except ImportError: # probably on py2.7/py3.4
@@ -35,9 +41,64 @@ except ImportError:
     LZMAFile = None
 
 
+from rdflib import Graph, URIRef, BNode, Literal
+
 from ferenda import util
 from ferenda import errors
 from ferenda import DocumentEntry
+from ferenda.documententry import SQLiteEntryBackend
+
+_BINARY_GRAPH_MAGIC = b"FERENDA-RDF-1\n"
+
+
+def _graph_to_binary(graph):
+    """Encodes all triples (and namespace bindings) of *graph* in a
+    compact binary form: a table of unique terms and a flat list of
+    indexes into that table, pickled and zlib compressed."""
+    index = {}
+    terms = []
+    triples = []
+    for triple in graph:
+        for term in triple:
+            if isinstance(term, Literal):
+                key = ("l", str(term), term.language,
+                       str(term.datatype) if term.datatype else None)
+            elif isinstance(term, BNode):
+                key = ("b", str(term))
+            else:
+                key = ("u", str(term))
+            if key not in index:
+                index[key] = len(terms)
+                terms.append(key)
+            triples.append(index[key])
+    namespaces = [(prefix, str(ns)) for prefix, ns in graph.namespaces()]
+    data = pickle.dumps((namespaces, terms, triples), protocol=2)
+    return _BINARY_GRAPH_MAGIC + zlib.compress(data, 1)
+
+
+def _binary_to_graph(data, graph=None):
+    """Decodes data created by :py:func:`_graph_to_binary`, adding the
+    triples to *graph* (or a new graph), which is returned."""
+    if not data.startswith(_BINARY_GRAPH_MAGIC):
+        raise ValueError("Not a binary graph")
+    namespaces, keys, triples = pickle.loads(
+        zlib.decompress(data[len(_BINARY_GRAPH_MAGIC):]))
+    terms = []
+    for key in keys:
+        if key[0] == "l":
+            terms.append(Literal(key[1], lang=key[2],
+                                 datatype=URIRef(key[3]) if key[3] else None))
+        elif key[0] == "b":
+            terms.append(BNode(key[1]))
+        else:
+            terms.append(URIRef(key[1]))
+    if graph is None:
+        graph = Graph()
+    for prefix, ns in namespaces:
+        graph.bind(prefix, URIRef(ns))
+    graph.addN((terms[triples[i]], terms[triples[i + 1]], terms[triples[i + 2]], graph)
+               for i in range(0, len(triples), 3))
+    return graph
 
 
 def _compressed_suffix(compression):
@@ -50,6 +111,23 @@ def _compressed_suffix(compression):
     else:
         return ""
 
+def _read_delta(deltafile):
+    """Reconstructs the contents (as bytes) of an archived file stored
+    as a delta (see :py:meth:`~ferenda.DocumentStore.archive`)."""
+    with open(deltafile, "rb") as fp:
+        delta = json.loads(fp.read().decode("utf-8"))
+    base = os.path.join(os.path.dirname(deltafile), *delta["base"].split("/"))
+    with open(base, "rb") as fp:
+        lines = fp.read().splitlines(True)
+    chunks = []
+    for op in delta["ops"]:
+        if isinstance(op, list):
+            chunks.extend(lines[op[0]:op[1]])
+        else:
+            chunks.append(op.encode("utf-8", "surrogateescape"))
+    return b"".join(chunks)
+
+
 class _open(object):
     """This class can work both as a context manager and as a substitute
     for a straight open() call. Most of the time you want to use it as
@@ -130,7 +208,16 @@ class _open(object):
             else:
                 tempmode = mode
             util.ensure_dir(filename)
-            self.fp = wrap_fp(open(filename, tempmode))
+            if (mode in ("r", "rb") and not os.path.exists(filename) and
+                    os.path.exists(filename + ".delta")):
+                # an archived version stored as a delta against an
+                # earlier version
+                fp = BytesIO(_read_delta(filename + ".delta"))
+                if "b" not in tempmode:
+                    fp = TextIOWrapper(fp)
+                self.fp = wrap_fp(fp)
+            else:
+                self.fp = wrap_fp(open(filename, tempmode))
 
     def close(self, *args, **kwargs):
         if "w" in self.mode:
@@ -244,18 +331,54 @@ class DocumentStore(object):
                         and
                         :py:meth:`~ferenda.DocumentStore.open_intermediate`.
     :type compression: str
+    :param distilled_format: The format used when writing distilled
+                             RDF files, one of the keys of
+                             :py:data:`~ferenda.DocumentStore.distilled_formats`.
+                             Files in any of these formats can be read
+                             regardless of this setting.
+    :type distilled_format: str
+    :param serialized_format: The format used when writing serialized
+                              document trees, one of the keys of
+                              :py:data:`~ferenda.DocumentStore.serialized_formats`.
+    :type serialized_format: str
+    :param archive_deltas: Whether archived downloaded and parsed text
+                           files may be stored as deltas against an
+                           earlier archived version (see
+                           :py:meth:`~ferenda.DocumentStore.archive`).
+    :type archive_deltas: bool
 
     """
     compression = None
+    distilled_format = "xml"
+    distilled_formats = OrderedDict([("xml", ".rdf"),
+                                     ("nt", ".nt"),
+                                     ("binary", ".rdfb")])
+    """The supported formats for distilled files, and the file suffix
+    used for each. ``xml`` (RDF/XML) is the most interoperable,
+    ``nt`` (N-Triples) and ``binary`` (a compact, ferenda-specific
+    format) are much faster to write and read back."""
+    serialized_format = "json"
+    serialized_formats = OrderedDict([("json", ".json"),
+                                      ("binary", ".elements")])
+    """The supported formats for serialized document trees (see
+    :py:func:`ferenda.elements.serialize`), and the file suffix used
+    for each."""
+    archive_deltas = False
     downloaded_suffixes = [".html"]
     intermediate_suffixes = [".xml"]
     invalid_suffixes = [".invalid"]
     
-    def __init__(self, datadir, storage_policy="file", compression=None, archiving_policy="file"):
+    def __init__(self, datadir, storage_policy="file", compression=None, archiving_policy="file",
+                 distilled_format="xml", serialized_format="json", archive_deltas=False):
         self.datadir = datadir  # docrepo.datadir + docrepo.alias
         self.storage_policy = storage_policy
         assert self.storage_policy in ("dir", "file"), "unknown storage policy %s" % self.storage_policy
         self.compression = compression
+        self.distilled_format = distilled_format
+        assert self.distilled_format in self.distilled_formats, "unknown distilled format %s" % self.distilled_format
+        self.serialized_format = serialized_format
+        assert self.serialized_format in self.serialized_formats, "unknown serialized format %s" % self.serialized_format
+        self.archive_deltas = archive_deltas
         self.archiving_policy = archiving_policy
         assert self.archiving_policy in ("zip", "file"), "unknown archiving policy %s" % self.archiving_policy
 
@@ -419,9 +542,15 @@ dependencies (in the form of source files for the action).
         # if this function is even called, it means that force is not
         # true (or ferenda-build.py has not been called with a single
         # basefile, which is an implied force)
+        def archived(filename):
+            # archived versions may be stored as deltas
+            if version and not os.path.exists(filename) and os.path.exists(filename + ".delta"):
+                return filename + ".delta"
+            return filename
+
         if action == "parse":
-            infile = self.downloaded_path(basefile, version)
-            outfile = self.parsed_path(basefile, version)
+            infile = archived(self.downloaded_path(basefile, version))
+            outfile = archived(self.parsed_path(basefile, version))
             newer = util.outfile_is_newer([infile], outfile)
             if not newer:
                 return Needed(reason=getattr(newer, 'reason', None))
@@ -436,7 +565,7 @@ dependencies (in the form of source files for the action).
                 dependencies=newer(self.dependencies_path(basefile), entry.indexed_dep,
                                    'indexed_dep'))
         elif action == "generate":
-            infile = self.parsed_path(basefile, version)
+            infile = archived(self.parsed_path(basefile, version))
             annotations = self.annotation_path(basefile, version)
             if version is None and os.path.exists(self.dependencies_path(basefile)):
                 deptxt = util.readfile(self.dependencies_path(basefile))
@@ -520,7 +649,7 @@ dependencies (in the form of source files for the action).
             suffixes = prepend_index(self.downloaded_suffixes)
         elif action == "relate":
             directory = os.path.sep.join((basedir, "distilled"))
-            suffixes = [".rdf"]
+            suffixes = list(self.distilled_formats.values())
         elif action == "generate":
             directory = os.path.sep.join((basedir, "parsed"))
             suffixes = prepend_index([".xhtml"])
@@ -536,6 +665,15 @@ dependencies (in the form of source files for the action).
         if not directory:
             raise ValueError("No directory calculated for action %s" % action)
 
+        if action == "news":
+            backend = DocumentEntry.backend_for(directory + os.sep)
+            if not backend.separate_files:
+                for path in backend.list():
+                    if path.endswith((".root.json", ".durations.json")):
+                        continue
+                    yield self.pathfrag_to_basefile(path[len(directory) + 1:-len(".json")])
+                return
+
         if not os.path.exists(directory):
             return
 
@@ -558,6 +696,7 @@ dependencies (in the form of source files for the action).
                 if action in d:
                     durations = d[action]
         yielded_paths = set()
+        yielded_basefiles = set()
         # print("%s: Loaded %s durations" % (datetime.now(), len(durations)))
         for basefile, duration in sorted(durations.items(), key=operator.itemgetter(1), reverse=True):
             # print("Handling %s %s" % (basefile, duration))
@@ -568,6 +707,7 @@ dependencies (in the form of source files for the action).
                 intermediate_path_exists = os.path.exists(self.intermediate_path(basefile))
             elif action == "relate":
                 path = self.distilled_path(basefile)
+                yielded_basefiles.add(basefile)
             elif action == "generate":
                 path = self.parsed_path(basefile)
             # print("basefile %s path %s" % (basefile, path))
@@ -590,6 +730,9 @@ dependencies (in the form of source files for the action).
                 continue
             if not os.path.exists(x) or x.endswith((".root.json", ".durations.json")):
                 continue
+            if (action == "relate" and os.path.dirname(x) == directory and
+                    os.path.basename(x).startswith("dump.")):
+                continue  # N-Triples dumps made by relate_all_*, not distilled files
             # get a pathfrag from full path
             # suffixlen = len(suffix) if self.storage_policy == "file" else len(suffix) + 1
             suffixlen = 0
@@ -601,6 +744,12 @@ dependencies (in the form of source files for the action).
                 raise ValueError("%s doesn't end with a valid suffix (%s)" % x, ", ".join(suffixes))
             pathfrag = x[len(directory) + 1:-suffixlen]
             basefile = self.pathfrag_to_basefile(pathfrag)
+            if action == "relate":
+                # a distilled file might (briefly) exist in more than
+                # one format
+                if basefile in yielded_basefiles:
+                    continue
+                yielded_basefiles.add(basefile)
             # ignore empty files placed by download (which may have
             # done that in order to avoid trying to re-download
             # nonexistent resources) -- but not if there is a viable
@@ -622,6 +771,12 @@ dependencies (in the form of source files for the action).
     def list_versions(self, basefile, action=None):
         """Get all archived versions of a given basefile.
 
+        Versions are listed in the order they were archived, using the
+        version index of the basefile (see
+        :py:meth:`~ferenda.DocumentStore.version_index_path`). If the
+        basefile has no version index, it is created from the archived
+        files.
+
         :param basefile: The basefile to list archived versions for
         :type  basefile: str
         :param action: The type of file to look for (either
@@ -641,10 +796,102 @@ dependencies (in the form of source files for the action).
         else:
             actions = ('downloaded', 'parsed', 'generated')
 
+        methods = {'downloaded': self.downloaded_path,
+                   'parsed': self.parsed_path,
+                   'generated': self.generated_path}
+
+        def exists(action, version):
+            # files may have been created for an archived version
+            # after it was archived (eg. by parsing it)
+            path = methods[action](basefile, version)
+            if self.storage_policy == "dir":
+                path = os.path.dirname(path)
+            return os.path.exists(path) or os.path.exists(path + ".delta")
+
+        for entry in self._version_index(basefile):
+            version = entry["version"]
+            for action in actions:
+                if action in entry["files"] or exists(action, version):
+                    yield version
+                    break
+
+    def version_index_path(self, basefile):
+        """Get the full path for the version index of the given basefile,
+        a JSON file that lists all archived versions of the basefile
+        and the content (sha1) of their downloaded and parsed files.
+
+        :param basefile: The basefile for which to calculate the path
+        :type  basefile: str
+        :returns: The full filesystem path
+        :rtype:   str
+        """
+        return os.sep.join((self.datadir, "archive", ".index",
+                            self.basefile_to_pathfrag(basefile))) + ".json"
+
+    def index_version(self, basefile, version, files=None):
+        """Add a version to the version index of a basefile (or update
+        it, if the version is already indexed). This is done by
+        :py:meth:`~ferenda.DocumentStore.archive`, but needs to be
+        done explicitly by code that creates archived files in other
+        ways.
+
+        :param basefile: The basefile of the archived document
+        :type basefile: str
+        :param version: The archived version id
+        :type version: str
+        :param files: The archived files of the version, by action
+                      (``downloaded``, ``parsed`` or ``generated``).
+                      For downloaded and parsed files,
+                      :py:meth:`~ferenda.DocumentStore.archive`
+                      records the content (sha1) of each file. If the
+                      version is already indexed, these replace the
+                      recorded files for the same actions only.
+        :type files: dict
+        """
+        self.index_versions(basefile, {version: files})
+
+    def index_versions(self, basefile, versions):
+        """Like :py:meth:`~ferenda.DocumentStore.index_version`, but
+        adds several versions of a basefile while only rewriting its
+        version index once.
+
+        :param basefile: The basefile of the archived document
+        :type basefile: str
+        :param versions: The archived files of each version (or None),
+                         keyed by version id
+        :type versions: dict
+        """
+        index = self._version_index(basefile)
+        entries = dict((entry["version"], entry) for entry in index)
+        for version, files in versions.items():
+            if version not in entries:
+                entries[version] = {"version": version, "files": {}}
+                index.append(entries[version])
+            entries[version]["files"].update(files or {})
+        self._write_version_index(basefile, index)
+
+    def _version_index(self, basefile):
+        path = self.version_index_path(basefile)
+        if os.path.exists(path):
+            with _open(path, "r") as fp:
+                return json.load(fp)["versions"]
+        versions = self._find_versions(basefile)
+        if versions:
+            self._write_version_index(basefile, versions)
+        return versions
+
+    def _write_version_index(self, basefile, versions):
+        with _open(self.version_index_path(basefile), "w") as fp:
+            json.dump({"versions": versions}, fp)
+
+    def _find_versions(self, basefile):
+        # find versions by walking the archive directories. This is
+        # only done for basefiles archived before version indexes
+        # were introduced.
         basedir = self.datadir
         pathfrag = self.basefile_to_pathfrag(basefile)
-        yielded_basefiles = []
-        for action in actions:
+        versions = OrderedDict()
+        for action in ('downloaded', 'parsed', 'generated'):
             directory = os.sep.join((basedir, "archive",
                                      action, pathfrag, ".versions"))
             if not os.path.exists(directory):
@@ -658,7 +905,9 @@ dependencies (in the form of source files for the action).
                         # version/index.html => version
                         x = os.sep.join(x.split(os.sep)[:-1])
                     else:
-                        # version.html => version
+                        # version.html(.delta) => version
+                        if x.endswith(".delta"):
+                            x = x[:-len(".delta")]
                         x = os.path.splitext(x)[0]
                     if os.sep in x:
                         # we didn't find an archived file for
@@ -675,11 +924,11 @@ dependencies (in the form of source files for the action).
                         # might need to rethink filenaming here...
                         # continue
                         pass
-                    # print("Found file %r %r" % (x, self.pathfrag_to_basefile(x)))
-                    basefile = self.pathfrag_to_basefile(x)
-                    if basefile not in yielded_basefiles:
-                        yielded_basefiles.append(basefile)
-                        yield basefile
+                    version = self.pathfrag_to_basefile(x)
+                    if version not in versions:
+                        versions[version] = {"version": version, "files": {}}
+                    versions[version]["files"][action] = {}
+        return list(versions.values())
 
     def list_versions_for_basefiles(self, basefiles, action, force=False):
         adjective = {'parse': 'downloaded',
@@ -789,12 +1038,27 @@ dependencies (in the form of source files for the action).
         files related to the document are moved (downloaded, parsed,
         generated files and any existing attachment files).
 
+        If ``archiving_policy`` is ``file``, downloaded and parsed files
+        are stored once per unique content in ``archive/.blobs``, and
+        hardlinked into place, so that versions that share a file
+        don't take up any additional space. If ``archive_deltas`` is
+        set, a text file that is similar to the file archived for an
+        earlier version is instead stored as a delta against that
+        file, in a file with the suffix ``.delta``. Such files are
+        transparently reconstructed by the ``open_*`` methods, but
+        can't be read directly from the filesystem. In both cases,
+        the version is recorded in the version index of the basefile
+        (see :py:meth:`~ferenda.DocumentStore.index_version`).
+
         :param basefile: The basefile of the document to archive
         :type basefile: str
         :param version: The version id to archive under
         :type version: str
         """
-
+        if self.archiving_policy == "file":
+            versions = self._version_index(basefile)
+        files = {}
+        archived = False
         for meth in (self.downloaded_path, self.documententry_path,
                      self.parsed_path, self.serialized_path,
                      self.distilled_path,
@@ -803,6 +1067,13 @@ dependencies (in the form of source files for the action).
             # should be able to be regenerated at any time?
             src = meth(basefile)
             dest = meth(basefile, version)
+            if meth == self.distilled_path:
+                # archive in the same format as the current file
+                dest = meth(basefile, version,
+                            self.distilled_file_format(basefile))
+            elif meth == self.serialized_path:
+                dest = meth(basefile, version,
+                            format=self.serialized_file_format(basefile))
             if self.storage_policy == "dir" and meth in (self.downloaded_path,
                                                          self.parsed_path,
                                                          self.generated_path):
@@ -810,19 +1081,116 @@ dependencies (in the form of source files for the action).
                 dest = os.path.dirname(dest)
             if not os.path.exists(src):
                 continue
-            if os.path.exists(dest):
+            if os.path.exists(dest) or os.path.exists(dest + ".delta"):
                 if overwrite:
                     util.robust_remove(dest)
+                    util.robust_remove(dest + ".delta")
                 else:
                     raise errors.ArchivingError(
                         "Archive destination %s for basefile %s version %s already exists!" % (dest, basefile, version))
             # self.log.debug("Archiving %s to %s" % (src,dest))
             # print("Archiving %s to %s" % (src,dest))
             util.ensure_dir(dest)
-            if copy:
+            action = {self.downloaded_path: "downloaded",
+                      self.parsed_path: "parsed"}.get(meth)
+            if action and self.archiving_policy == "file":
+                files[action] = self._archive_blobs(
+                    src, dest, copy, self._keyframes(versions, action))
+            elif copy:
                 shutil.copy2(src, dest)
             else:
                 shutil.move(src, dest)
+            if meth == self.generated_path:
+                files["generated"] = {}
+            archived = True
+        if archived and self.archiving_policy == "file":
+            self.index_version(basefile, version, files)
+
+    def _keyframes(self, versions, action):
+        # for each archived file (relative to the archived
+        # downloaded/parsed file or directory), the sha1 of the last
+        # archived full copy of it
+        keyframes = {}
+        for entry in versions:
+            for relpath, info in entry["files"].get(action, {}).items():
+                keyframes[relpath] = info.get("base", info["sha1"])
+        return keyframes
+
+    def _blob_path(self, digest):
+        return os.sep.join((self.datadir, "archive", ".blobs",
+                            digest[:2], digest[2:]))
+
+    def _archive_blobs(self, src, dest, copy, keyframes):
+        if os.path.isdir(src):
+            pairs = [(f, dest + f[len(src):]) for f in util.list_dirs(src)]
+        else:
+            pairs = [(src, dest)]
+        files = {}
+        for srcfile, destfile in pairs:
+            relpath = destfile[len(dest) + 1:].replace(os.sep, "/")
+            files[relpath] = self._archive_blob(srcfile, destfile, copy,
+                                                keyframes.get(relpath))
+        if not copy:
+            util.robust_remove(src)
+        return files
+
+    def _archive_blob(self, src, dest, copy, keyframe):
+        h = hashlib.sha1()
+        with open(src, "rb") as fp:
+            for chunk in iter(lambda: fp.read(64 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        blob = self._blob_path(digest)
+        util.ensure_dir(dest)
+        if not os.path.exists(blob):
+            if self.archive_deltas and keyframe and os.path.exists(self._blob_path(keyframe)):
+                delta = self._make_delta(src, self._blob_path(keyframe),
+                                         os.path.dirname(dest))
+                if delta is not None:
+                    with open(dest + ".delta", "wb") as fp:
+                        fp.write(delta)
+                    shutil.copystat(src, dest + ".delta")
+                    if not copy:
+                        os.unlink(src)
+                    return {"sha1": digest, "base": keyframe}
+            util.ensure_dir(blob)
+            if copy:
+                shutil.copy2(src, blob)
+            else:
+                shutil.move(src, blob)
+        elif not copy:
+            os.unlink(src)
+        try:
+            os.link(blob, dest)
+        except (AttributeError, OSError):
+            # no hardlink support (or too many links to blob)
+            shutil.copy2(blob, dest)
+        return {"sha1": digest}
+
+    def _make_delta(self, src, base, destdir):
+        # Returns a delta that recreates src from the lines of base,
+        # or None if src isn't text or the delta wouldn't be much
+        # smaller than src itself.
+        with open(src, "rb") as fp:
+            new = fp.read()
+        if b"\0" in new[:8192]:
+            return None
+        with open(base, "rb") as fp:
+            old = fp.read()
+        oldlines = old.splitlines(True)
+        newlines = new.splitlines(True)
+        ops = []
+        matcher = difflib.SequenceMatcher(None, oldlines, newlines)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                ops.append([i1, i2])
+            elif j2 > j1:
+                ops.append(b"".join(newlines[j1:j2]).decode("utf-8", "surrogateescape"))
+        delta = json.dumps({"base": os.path.relpath(base, destdir).replace(os.sep, "/"),
+                            "ops": ops}).encode("utf-8")
+        if len(delta) * 2 > len(new):
+            return None
+        return delta
 
     def remove(self, basefile):
         """Like archive, but doesn't actually archive anything, just removes the current version"""
@@ -861,7 +1229,7 @@ dependencies (in the form of source files for the action).
         """
         for suffix in self.downloaded_suffixes:
             path = self.path(basefile, "downloaded", suffix, version, attachment)
-            if os.path.exists(path):
+            if os.path.exists(path) or (version and os.path.exists(path + ".delta")):
                 return path
         else:
             return self.path(basefile, 'downloaded', self.downloaded_suffixes[0], version, attachment)
@@ -891,6 +1259,75 @@ dependencies (in the form of source files for the action).
         return self.path(basefile, 'entries', '.json', version,
                          storage_policy="file")
 
+    def set_entrytype(self, entrytype):
+        """Selects how the documententry data for this store is saved:
+        either as one JSON file per basefile (``JSON``, the default)
+        or in a single SQLite database file (``SQLITE``). Switching to
+        ``SQLITE`` for the first time imports all existing JSON files
+        into the database. Paths returned by
+        :py:meth:`~ferenda.DocumentStore.documententry_path` are used
+        as keys regardless of type.
+
+        :param entrytype: ``JSON`` or ``SQLITE``
+        :type  entrytype: str
+        """
+        directory = os.path.join(self.datadir, "entries")
+        if entrytype == "SQLITE":
+            dbpath = os.path.join(self.datadir, "entries.sqlite")
+            exists = os.path.exists(dbpath)
+            backend = SQLiteEntryBackend(dbpath, directory)
+            if not exists and os.path.exists(directory):
+                backend.import_json()
+            DocumentEntry.register_backend(directory, backend)
+        elif entrytype == "JSON":
+            DocumentEntry.register_backend(directory, None)
+        else:
+            raise ValueError("unknown entry type %s" % entrytype)
+
+    def load_entries(self, basefiles=None):
+        """Loads the documententry data for many basefiles at once,
+        which for some entry types is a lot faster than creating
+        separate :py:class:`~ferenda.DocumentEntry` objects.
+
+        :param basefiles: The basefiles to load entries for. If not
+                          provided, loads all entries.
+        :type basefiles: iterable
+        :returns: ``(basefile, entry)`` tuples, where entry is
+                  None if no entry exists for the basefile (or it
+                  couldn't be loaded)
+        :rtype: generator
+        """
+        if basefiles is None:
+            basefiles = self.list_basefiles_for("news")
+        paths = OrderedDict((self.documententry_path(b), b) for b in basefiles)
+        if not paths:
+            return
+        backend = DocumentEntry.backend_for(next(iter(paths)))
+        loaded = set()
+        try:
+            for path, d in backend.load_many(paths):
+                loaded.add(path)
+                yield paths[path], DocumentEntry.from_dict(d, path)
+        except ValueError:
+            # a single broken entry spoils the rest of the batch, so
+            # load the remaining ones one by one
+            for path, basefile in paths.items():
+                if path in loaded:
+                    continue
+                loaded.add(path)
+                if not backend.exists(path):
+                    yield basefile, None
+                    continue
+                try:
+                    yield basefile, DocumentEntry(path)
+                except ValueError as e:
+                    logging.getLogger("documententry").error(
+                        "%s: %s %s" % (path, e.__class__.__name__, e))
+                    yield basefile, None
+        for path, basefile in paths.items():
+            if path not in loaded:
+                yield basefile, None
+
     def intermediate_path(self, basefile, version=None, attachment=None, suffix=None):
         """Get the full path for the main intermediate file for the given
         basefile (and optionally archived version).
@@ -955,19 +1392,51 @@ dependencies (in the form of source files for the action).
         filename = self.parsed_path(basefile, version, attachment)
         return _open(filename, mode)
 
-    def serialized_path(self, basefile, version=None, attachment=None):
-        """Get the full path for the serialized JSON file for the given
-        basefile.
+    def serialized_path(self, basefile, version=None, attachment=None,
+                        format=None):
+        """Get the full path for the serialized document tree file for
+        the given basefile. If a serialized file exists in any of the
+        :py:data:`~ferenda.DocumentStore.serialized_formats`, its path
+        is returned, otherwise the path for the configured
+        :py:attr:`serialized_format`.
 
         :param basefile: The basefile for which to calculate the path
         :type  basefile: str
         :param  version: Optional. The archived version id
         :type   version: str
+        :param   format: Optional. Get the path for this format
+                         regardless of whether the file exists.
+        :type    format: str
         :returns: The full filesystem path
         :rtype:   str
         """
-        return self.path(basefile, 'serialized', '.json',
-                         version, storage_policy="file")
+        if format:
+            return self.path(basefile, 'serialized', self.serialized_formats[format],
+                             version, storage_policy="file")
+        formats = [self.serialized_format] + [f for f in self.serialized_formats
+                                              if f != self.serialized_format]
+        paths = [self.serialized_path(basefile, version, format=fmt) for fmt in formats]
+        for path in paths:
+            if os.path.exists(path):
+                return path
+        return paths[0]
+
+    def serialized_file_format(self, basefile, version=None):
+        """Get the format (one of the keys of
+        :py:data:`~ferenda.DocumentStore.serialized_formats`) of the
+        serialized file for the given basefile, or the configured
+        format if no such file exists.
+
+        :param basefile: The basefile of the serialized file
+        :type  basefile: str
+        :param  version: Optional. The archived version id
+        :type   version: str
+        :rtype: str
+        """
+        path = self.serialized_path(basefile, version)
+        for fmt, suffix in self.serialized_formats.items():
+            if path.endswith(suffix):
+                return fmt
 
     def open_serialized(self, basefile, mode="r", version=None):
         """Opens files for reading and writing,
@@ -975,23 +1444,108 @@ dependencies (in the form of source files for the action).
         the same as for
         :meth:`~ferenda.DocumentStore.serialized_path`.
 
+        Note that the serialized file might not be JSON, see
+        :meth:`~ferenda.DocumentStore.read_serialized`.
+
         """
         filename = self.serialized_path(basefile, version)
         return _open(filename, mode)
 
-    def distilled_path(self, basefile, version=None):
-        """Get the full path for the distilled RDF/XML file for the given
-        basefile.
+    def read_serialized(self, basefile, version=None):
+        """Read the serialized document tree for the given basefile, in
+        whatever format it is stored.
+
+        :param basefile: The basefile of the serialized file
+        :type  basefile: str
+        :param  version: Optional. The archived version id
+        :type   version: str
+        :returns: The deserialized document tree
+        """
+        from ferenda.elements import deserialize
+        fmt = self.serialized_file_format(basefile, version)
+        with open(self.serialized_path(basefile, version), "rb") as fp:
+            data = fp.read()
+        if fmt == "json":
+            data = data.decode("utf-8")
+        return deserialize(data, format=fmt)
+
+    def write_serialized(self, basefile, doc, version=None):
+        """Serialize the document tree *doc* to the serialized file for
+        the given basefile, in the configured
+        :py:attr:`serialized_format`. Serialized files for the same
+        basefile in other formats are removed.
+
+        :param basefile: The basefile of the serialized file
+        :type  basefile: str
+        :param      doc: The document tree to serialize
+        :param  version: Optional. The archived version id
+        :type   version: str
+        :returns: The path of the written file
+        :rtype:   str
+        """
+        from ferenda.elements import serialize
+        data = serialize(doc, format=self.serialized_format)
+        if self.serialized_format == "json":
+            data = data.encode("utf-8")
+        path = self.serialized_path(basefile, version, format=self.serialized_format)
+        with _open(path, "wb") as fp:
+            fp.write(data)
+        for fmt in self.serialized_formats:
+            if fmt != self.serialized_format:
+                other = self.serialized_path(basefile, version, format=fmt)
+                if os.path.exists(other):
+                    util.robust_remove(other)
+        return path
+
+    def distilled_path(self, basefile, version=None, format=None):
+        """Get the full path for the distilled RDF file for the given
+        basefile. If a distilled file exists in any of the
+        :py:data:`~ferenda.DocumentStore.distilled_formats`, its path
+        is returned, otherwise the path for a file in the configured
+        format.
 
         :param basefile: The basefile for which to calculate the path
         :type  basefile: str
         :param  version: Optional. The archived version id
         :type   version: str
+        :param   format: Optional. Get the path for a file in this
+                         format, regardless of which files exist.
+        :type    format: str
         :returns: The full filesystem path
         :rtype:   str
         """
-        return self.path(basefile, 'distilled', '.rdf',
-                         version, storage_policy="file")
+        if format:
+            return self.path(basefile, 'distilled', self.distilled_formats[format],
+                             version, storage_policy="file")
+        paths = [self.distilled_path(basefile, version, fmt) for fmt in
+                 self._distilled_format_order()]
+        for path in paths:
+            if os.path.exists(path):
+                return path
+        return paths[0]
+
+    def _distilled_format_order(self):
+        # the configured format first, since that file is probably the
+        # most recent one if there are several
+        return [self.distilled_format] + [f for f in self.distilled_formats
+                                          if f != self.distilled_format]
+
+    def distilled_file_format(self, basefile, version=None):
+        """Get the format (one of the keys of
+        :py:data:`~ferenda.DocumentStore.distilled_formats`) of the
+        distilled file for the given basefile, or the configured format
+        if no such file exists.
+
+        :param basefile: The basefile of the distilled file
+        :type  basefile: str
+        :param  version: Optional. The archived version id
+        :type   version: str
+        :rtype: str
+        """
+        path = self.distilled_path(basefile, version)
+        for fmt, suffix in self.distilled_formats.items():
+            if path.endswith(suffix):
+                return fmt
 
     def open_distilled(self, basefile, mode="r", version=None):
         """Opens files for reading and writing,
@@ -999,10 +1553,85 @@ dependencies (in the form of source files for the action).
         the same as for
         :meth:`~ferenda.DocumentStore.distilled_path`.
 
+        Note that the distilled file might not be RDF/XML, see
+        :meth:`~ferenda.DocumentStore.read_distilled`.
+
         """
         filename = self.distilled_path(basefile, version)
         return _open(filename, mode)
 
+    def read_distilled(self, basefile, version=None, graph=None):
+        """Read the distilled RDF file for the given basefile, in
+        whatever format it is stored.
+
+        :param basefile: The basefile of the distilled file
+        :type  basefile: str
+        :param  version: Optional. The archived version id
+        :type   version: str
+        :param    graph: Optional. Add the triples to this graph instead
+                         of a new one.
+        :type     graph: rdflib.Graph
+        :returns: The graph with the distilled triples
+        :rtype:   rdflib.Graph
+        """
+        if graph is None:
+            graph = Graph()
+        fmt = self.distilled_file_format(basefile, version)
+        with open(self.distilled_path(basefile, version), "rb") as fp:
+            data = fp.read()
+        if fmt == "binary":
+            return _binary_to_graph(data, graph)
+        return graph.parse(data=data, format=fmt)
+
+    def read_distilled_as(self, basefile, format, version=None):
+        """Get the content of the distilled file for the given basefile
+        as a byte string in the given RDF serialization format (like
+        ``xml`` or ``nt``). The file is only parsed and re-serialized
+        if it isn't already in that format.
+
+        :param basefile: The basefile of the distilled file
+        :type  basefile: str
+        :param   format: Any rdflib serialization format
+        :type    format: str
+        :param  version: Optional. The archived version id
+        :type   version: str
+        :rtype: bytes
+        """
+        if self.distilled_file_format(basefile, version) == format:
+            with open(self.distilled_path(basefile, version), "rb") as fp:
+                return fp.read()
+        return self.read_distilled(basefile, version).serialize(format=format)
+
+    def write_distilled(self, basefile, graph, version=None):
+        """Write *graph* to the distilled file for the given basefile, in
+        the configured :py:attr:`distilled_format`. Distilled files for
+        the same basefile in other formats are removed.
+
+        :param basefile: The basefile of the distilled file
+        :type  basefile: str
+        :param    graph: The triples to write
+        :type     graph: rdflib.Graph
+        :param  version: Optional. The archived version id
+        :type   version: str
+        :returns: The path of the written file
+        :rtype:   str
+        """
+        path = self.distilled_path(basefile, version, self.distilled_format)
+        util.ensure_dir(path)
+        with open(path, "wb") as fp:
+            if self.distilled_format == "binary":
+                fp.write(_graph_to_binary(graph))
+            elif self.distilled_format == "xml":
+                graph.serialize(fp, format="pretty-xml")
+            else:
+                graph.serialize(fp, format=self.distilled_format)
+        for fmt in self.distilled_formats:
+            if fmt != self.distilled_format:
+                other = self.distilled_path(basefile, version, fmt)
+                if os.path.exists(other):
+                    util.robust_remove(other)
+        return path
+
     def generated_path(self, basefile, version=None, attachment=None):
         """Get the full path for the generated file for the given
         basefile (and optionally archived version and/or attachment
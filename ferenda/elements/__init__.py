@@ -1,6 +1,7 @@
 # flake8: noqa
 from .elements import serialize
 from .elements import deserialize
+from .elements import iterdeserialize
 from .elements import AbstractElement
 from .elements import UnicodeElement
 from .elements import CompoundElement
@@ -22,22 +22,24 @@ standard_library.install_aliases()
 import builtins
 from future.utils import native
 
+from array import array
 from operator import itemgetter
 import ast
 import datetime
 import json
 import logging
 import re
-import inspect
+import struct
 import unicodedata
 import xml.etree.cElementTree as ET
 import sys
+import zlib
 from collections import OrderedDict
 
 
 from layeredconfig import LayeredConfig
 from lxml.builder import ElementMaker
-from rdflib import Graph, Namespace, Literal, URIRef
+from rdflib import Graph, Namespace, Literal, URIRef, BNode
 import pyparsing
 
 from ferenda import util
@@ -54,6 +56,13 @@ def serialize(root, format="xml"):
     """Given any :py:class:`~ferenda.elements.AbstractElement` *root*
     object, returns a XML serialization of *root*, recursively.
 
+    With ``format="json"``, a JSON serialization is returned
+    instead. With ``format="binary"``, a compact binary
+    serialization (as a byte string) is returned, which deserializes
+    to the same objects as the JSON serialization but is smaller and
+    faster to deserialize, and which allows subtrees to be
+    deserialized separately with :py:func:`iterdeserialize`.
+
     """
     if format == "xml":
         t = __serialize_xml(root)
@@ -63,6 +72,8 @@ def serialize(root, format="xml"):
         t = __serialize_json(root)
         r = json.dumps(t, indent=4, ensure_ascii=False, sort_keys=True)
         return r
+    elif format == "binary":
+        return __serialize_binary(__serialize_json(root, graphformat="triples"))
     else:
         raise ValueError("Invalid serialization format: %s" % format)
 
@@ -91,6 +102,41 @@ def deserialize(xmlstr, format="xml", caller_globals=None):
         root = json.loads(xmlstr)
         t = __deserialize_json(root)
         return t
+    elif format == "binary":
+        return _BinaryReader(xmlstr).deserialize(0)[0]
+    else:
+        raise ValueError("Invalid serialization format: %s" % format)
+
+
+def iterdeserialize(data, path=()):
+    """Given a byte string created by :py:func:`serialize` with
+    ``format="binary"``, yields the children of a node in the
+    serialized tree one at a time, without deserializing the rest of
+    the tree.
+
+    :param data: The binary serialization
+    :type  data: bytes
+    :param path: The position of the node whose children should be
+                 yielded, as a sequence of child indexes and/or
+                 attribute names starting at the root node. The
+                 default, ``()``, means the root node itself, ``(2,
+                 0)`` means the first child of the third child of the
+                 root node and ``("body", 3)`` means the fourth child
+                 of the ``body`` attribute of the root node (eg. a
+                 :py:class:`~ferenda.Document`).
+    :type  path: tuple
+    :raises IndexError: if *path* doesn't point to a node with children
+
+    .. note::
+
+       This function is as insecure as :py:func:`deserialize`
+
+    """
+    reader = _BinaryReader(data)
+    count, pos = reader.children(path)
+    for i in range(count):
+        child, pos = reader.deserialize(pos)
+        yield child
 
 
 class AbstractElement(object):
@@ -717,7 +763,10 @@ class ListItem(CompoundElement, OrdinalElement):
     tagname = 'li'
 
 
-def __serialize_json(node):
+def __serialize_json(node, graphformat="xml"):
+    # graphformat is the RDF serialization used for rdflib.Graph
+    # objects, or "triples" for the plain list used by the binary
+    # format (see _graph_to_list)
     # some native datatypes should be returned as-is, ie not wrapped
     # in a dict. Note that types derived from these gets handled
     # differently. 
@@ -726,9 +775,9 @@ def __serialize_json(node):
     # lists and dicts gets returned as-is, but the values in those
     # containers are transformed if need be
     elif type(node) == list:
-        return [__serialize_json(x) for x in node]
+        return [__serialize_json(x, graphformat) for x in node]
     elif type(node) == dict or type(node).__name__ == "dict":
-        return native(dict([(k, __serialize_json(v)) for k, v in node.items()]))
+        return native(dict([(k, __serialize_json(v, graphformat)) for k, v in node.items()]))
     else:
         if node.__class__.__module__ in ('builtins', '__builtin__'):
             # py2 workaround -- we want a str to be known as 'str' always, but py2
@@ -755,12 +804,12 @@ def __serialize_json(node):
                     continue
                 elif isinstance(val, logging.Logger):
                     continue
-                e[key] = __serialize_json(val)
+                e[key] = __serialize_json(val, graphformat)
         if isinstance(node, list) or isinstance(node, tuple):
             # convert derived list to plain list
-            e['@content'] = __serialize_json(list(node))
+            e['@content'] = __serialize_json(list(node), graphformat)
         elif isinstance(node, dict):
-            e['@content'] = __serialize_json(dict(node))
+            e['@content'] = __serialize_json(dict(node), graphformat)
         elif isinstance(node, bytes):
             # assume that all bytestrings are ascii only. When this
             # assumption does not hold, convert them into something
@@ -773,7 +822,10 @@ def __serialize_json(node):
             e['@content'] = repr(node)
         elif isinstance(node, Graph):
             i = node.identifier
-            e['@content'] = node.serialize().decode('utf-8')  # default compact RDF/XML
+            if graphformat == "triples":
+                e['@content'] = _graph_to_list(node)
+            else:
+                e['@content'] = node.serialize().decode('utf-8')  # default compact RDF/XML
             e['identifier'] = {'@class': i.__class__.__module__ + "." + i.__class__.__name__,
                                '@content': str(i)}
         else:
@@ -782,29 +834,109 @@ def __serialize_json(node):
         return e
 
 _state = {'fontspec': None}
+_classes = {}
+_kinds = {}
 
 
-def __deserialize_json(node):
+def _deserialize_class(nodetype):
+    # a document tree usually only contains a handful of different
+    # classes, so each class is only looked up once
+    try:
+        return _classes[nodetype]
+    except KeyError:
+        pass
+    try:
+        modulename, classname = nodetype.rsplit(".", 1)
+        __import__(modulename)
+        cls = getattr(sys.modules[modulename], classname)
+    # "need more than 1 value to unpack": we have a builtin type like str, int, bool
+    except ValueError:
+        cls = {'str': str,
+               'int': int,
+               'bool': bool,
+               'bytes': bytes}[nodetype]
+    _classes[nodetype] = cls
+    return cls
+
+
+def _deserialize_kind(cls):
+    # returns (kind, is_pdfreader), where kind determines how
+    # _deserialize_object creates the object
+    try:
+        return _kinds[cls]
+    except KeyError:
+        pass
     from ferenda.pdfreader import PDFReader, Textbox
     from ferenda import Document
+    for kind, base in (("textbox", Textbox),
+                       ("list", list),
+                       ("dict", dict),
+                       ("bytes", bytes),
+                       ("datetime", datetime.datetime),
+                       ("date", datetime.date),
+                       ("parseresults", pyparsing.ParseResults),
+                       ("graph", Graph),
+                       ("document", Document)):
+        if issubclass(cls, base):
+            break
+    else:
+        kind = "other"
+    _kinds[cls] = kind, issubclass(cls, PDFReader)
+    return _kinds[cls]
+
+
+def _deserialize_object(cls, kind, content, attribs, graphformat="xml"):
+    # content is a list of already deserialized objects for list
+    # kinds, a dict or list of (key, deserialized object) pairs for
+    # dict kinds, and a str for everything else
+    if kind == "textbox":
+        attribs['fontspec'] = _state['fontspec']
+        o = cls(content, **attribs)
+    elif kind in ("list", "dict"):
+        o = cls(content, **attribs)
+    elif kind == "bytes":
+        # assume only ascii
+        o = cls(content.encode(), **attribs)
+    elif kind == "datetime":
+        m = re.match(r'[\w\.]+\((\d+), (\d+), (\d+), (\d+), (\d+)(|, (\d+)\))', content)
+        seconds = m.group(6) or '0'
+        o = cls(int(m.group(1)), int(m.group(2)), int(m.group(3)),
+                int(m.group(4)), int(m.group(5)), int(seconds), **attribs)
+    elif kind == "date":
+        m = re.match(r'[\w\.]+\((\d+), (\d+), (\d+)\)', content)
+        o = cls(int(m.group(1)), int(m.group(2)), int(m.group(3)), **attribs)
+    elif kind == "parseresults":
+        # attempt to reconstruct a pyparsing.ParseResult object from
+        # its repr() serialization. It's not 100 %, but good enough to
+        # be usable.
+        tocdict = ast.literal_eval(content)
+        o = cls([])
+        parent = None
+        accumNames = {}
+        name = attribs['name']
+        o.__setstate__((tocdict[0], (tocdict[1], parent, accumNames, name)))
+    elif kind == "graph":
+        # the graph identifier (BNode or URIRef object) has already
+        # been deserialized as an attribute
+        o = cls(identifier=attribs['identifier'])
+        if graphformat == "triples":
+            _list_to_graph(content, o)
+        else:
+            o.parse(data=content, format=graphformat)
+    elif kind == "document":
+        o = cls(**attribs)  # no actual content, only attributes/properties
+    else:
+        o = cls(content, **attribs)
+    return o
+
+
+def __deserialize_json(node):
     nodetype = None
     if hasattr(node, 'get'):
         nodetype = node.get("@class")
     # 1. get the appropriate class object
     if nodetype:
-        try:
-            modulename, classname = nodetype.rsplit(".", 1)
-            __import__(modulename)
-            m = sys.modules[modulename]
-            for name, cls in inspect.getmembers(m, inspect.isclass):
-                if name == classname:
-                    break  # setting cls to what we want
-        # "need more than 1 value to unpack": we have a builtin type like str, int, bool
-        except ValueError:
-            cls = {'str': str,
-                   'int': int,
-                   'bool': bool,
-                   'bytes': bytes}[nodetype]
+        cls = _deserialize_class(nodetype)
         content = node['@content']
     else:
         # native objects (int, str, bool, list, dict (which is
@@ -812,6 +944,7 @@ def __deserialize_json(node):
         # of '@type'))
         cls = node.__class__
         content = node
+    kind, is_pdfreader = _deserialize_kind(cls)
 
     # 2. get any possible attributes
     attribs = {}
@@ -822,48 +955,280 @@ def __deserialize_json(node):
     # hack for deserializing pdfreader objects -- store the current
     # fontspecs dict as soon as we see it, we'll be needing it every
     # time we create a pdfreader.Textbox
-
-    if issubclass(cls, PDFReader):
+    if is_pdfreader:
         _state['fontspec'] = attribs['fontspec']
 
     # 3. initialize the class
-
-    if issubclass(cls, list):
-        if issubclass(cls, Textbox):
-            attribs['fontspec'] = _state['fontspec']
-        o = cls([__deserialize_json(x) for x in content], **attribs)
-    elif issubclass(cls, dict):
-        o = cls([(k, __deserialize_json(v)) for k, v in content.items()], **attribs)
-    elif issubclass(cls, bytes):
-        # assume only ascii
-        o = cls(content.encode(), **attribs)
-    elif issubclass(cls, datetime.datetime):
-        m = re.match(r'[\w\.]+\((\d+), (\d+), (\d+), (\d+), (\d+)(|, (\d+)\))', content)
-        seconds = m.group(6) or '0'
-        o = cls(int(m.group(1)), int(m.group(2)), int(m.group(3)),
-                int(m.group(4)), int(m.group(5)), int(seconds), **attribs)
-    elif issubclass(cls, datetime.date):
-        m = re.match(r'[\w\.]+\((\d+), (\d+), (\d+)\)', content)
-        o = cls(int(m.group(1)), int(m.group(2)), int(m.group(3)), **attribs)
-    elif issubclass(cls, pyparsing.ParseResults):
-        # attempt to reconstruct a pyparsing.ParseResult object from
-        # its repr() serialization. It's not 100 %, but good enough to
-        # be usable.
-        tocdict = ast.literal_eval(content)
-        o = cls([])
-        parent = None
-        accumNames = {}
-        name = node['name']
-        o.__setstate__((tocdict[0], (tocdict[1], parent, accumNames, name)))
-    elif issubclass(cls, Graph):
-        # first create the graph identifier (BNode or URIRef object)
-        i = __deserialize_json(node['identifier'])
-        o = cls(identifier=i).parse(data=content)
-    elif issubclass(cls, Document):
-        o = cls(**attribs)  # no actual content, only attributes/properties
-    else:
-        o = cls(content, **attribs)
-    return o
+    if kind in ("list", "textbox"):
+        content = [__deserialize_json(x) for x in content]
+    elif kind == "dict":
+        content = [(k, __deserialize_json(v)) for k, v in content.items()]
+    return _deserialize_object(cls, kind, content, attribs)
+
+
+# The binary serialization format is a direct encoding of the data
+# structure that __serialize_json creates (so that both formats
+# always deserialize to the same objects), except that rdflib.Graph
+# objects are serialized as plain lists of namespaces and terms
+# instead of RDF/XML, which is much faster to read back (see
+# _graph_to_list). After the magic line, the
+# rest is zlib compressed and consists of:
+#
+# 1. A header with the number of types, strings and records
+#    (three little-endian uint32)
+# 2. The type table: for each type, the index of its "@class" name
+#    in the string table (uint32)
+# 3. The string table: the utf-8 encoded length of each string
+#    (uint32), followed by all strings concatenated
+# 4. The node records: a flat list of uint32, where each node is
+#    encoded (in document order) as a tag followed by tag-specific
+#    values:
+#    _NONE, _FALSE, _TRUE: nothing
+#    _INT: the value (for integers 0 <= n < 2**32)
+#    _BIGINT, _STR: string table index (of the integer as a decimal string)
+#    _LIST: item count, span, items
+#    _DICT: item count, span, (key string index, value) for each item
+#    _OBJECT: type index, attribute count, span, (key string
+#             index, value) for each attribute, "@content" value
+#    where span is the number of records used by the items, so
+#    that a subtree can be skipped without decoding it.
+_BINARY_MAGIC = b"FERENDA-ELEMENTS-1\n"
+_TERMTYPES = {URIRef: 0, BNode: 1, Literal: 2}
+_NONE, _FALSE, _TRUE, _INT, _BIGINT, _STR, _LIST, _DICT, _OBJECT = range(9)
+
+
+def _graph_to_list(graph):
+    # [number of namespaces, (prefix, namespace)..., (termtype, value,
+    # language or datatype) for each term of each triple...]
+    namespaces = list(graph.namespaces())
+    res = [len(namespaces)]
+    for prefix, namespace in namespaces:
+        res.extend((str(prefix), str(namespace)))
+    for triple in graph:
+        for term in triple:
+            extra = ""
+            if isinstance(term, Literal):
+                if term.language:
+                    extra = "@" + term.language
+                elif term.datatype:
+                    extra = "^" + str(term.datatype)
+            res.extend((_TERMTYPES[type(term)], str(term), extra))
+    return res
+
+
+def _list_to_graph(items, graph):
+    count = items[0]
+    for i in range(1, count * 2, 2):
+        graph.bind(items[i], items[i + 1])
+    terms = []
+    for i in range(count * 2 + 1, len(items), 3):
+        termtype, value, extra = items[i:i + 3]
+        if termtype == 0:
+            terms.append(URIRef(value))
+        elif termtype == 1:
+            terms.append(BNode(value))
+        elif extra.startswith("@"):
+            terms.append(Literal(value, lang=extra[1:]))
+        elif extra:
+            terms.append(Literal(value, datatype=URIRef(extra[1:])))
+        else:
+            terms.append(Literal(value))
+    add = graph.add
+    for i in range(0, len(terms), 3):
+        add((terms[i], terms[i + 1], terms[i + 2]))
+    return graph
+
+
+def __serialize_binary(node):
+    strings = OrderedDict()
+    types = OrderedDict()
+    records = array("I")
+
+    def string(s):
+        idx = strings.get(s)
+        if idx is None:
+            idx = strings[s] = len(strings)
+        return idx
+
+    def encode(node):
+        if node is None:
+            records.append(_NONE)
+        elif isinstance(node, bool):
+            records.append(_TRUE if node else _FALSE)
+        elif isinstance(node, int):
+            if 0 <= node < 2 ** 32:
+                records.extend((_INT, node))
+            else:
+                records.extend((_BIGINT, string(str(node))))
+        elif isinstance(node, str):
+            records.extend((_STR, string(node)))
+        elif isinstance(node, list):
+            records.extend((_LIST, len(node), 0))
+            start = len(records)
+            for item in node:
+                encode(item)
+            records[start - 1] = len(records) - start
+        elif '@class' in node:
+            typename = node['@class']
+            if typename not in types:
+                types[typename] = len(types)
+            keys = sorted(k for k in node if not k.startswith("@"))
+            records.extend((_OBJECT, types[typename], len(keys), 0))
+            start = len(records)
+            for key in keys:
+                records.append(string(key))
+                encode(node[key])
+            encode(node['@content'])
+            records[start - 1] = len(records) - start
+        else:
+            # keys are converted to strings the same way json.dumps
+            # does it
+            items = sorted((key if isinstance(key, str) else
+                            json.dumps(key).strip('"'), value)
+                           for key, value in node.items())
+            records.extend((_DICT, len(items), 0))
+            start = len(records)
+            for key, value in items:
+                records.append(string(key))
+                encode(value)
+            records[start - 1] = len(records) - start
+
+    encode(node)
+    typeidx = array("I", [string(t) for t in types])
+    encoded = [s.encode("utf-8") for s in strings]
+    lengths = array("I", [len(s) for s in encoded])
+    if sys.byteorder == "big":
+        for a in (typeidx, lengths, records):
+            a.byteswap()
+    payload = b"".join([struct.pack("<3I", len(typeidx), len(lengths), len(records)),
+                        typeidx.tobytes(), lengths.tobytes()] +
+                       encoded + [records.tobytes()])
+    return _BINARY_MAGIC + zlib.compress(payload, 1)
+
+
+class _BinaryReader(object):
+    # Decodes the tables of a binary serialization, and deserializes
+    # nodes (and their subtrees) at given record positions
+
+    def __init__(self, data):
+        if not data.startswith(_BINARY_MAGIC):
+            raise ValueError("Not a binary serialization")
+        payload = zlib.decompress(data[len(_BINARY_MAGIC):])
+        ntypes, nstrings, nrecords = struct.unpack_from("<3I", payload)
+        offset = 12
+
+        def uints(count):
+            a = array("I")
+            a.frombytes(payload[offset:offset + count * 4])
+            if sys.byteorder == "big":
+                a.byteswap()
+            return a.tolist()
+
+        typeidx = uints(ntypes)
+        offset += ntypes * 4
+        lengths = uints(nstrings)
+        offset += nstrings * 4
+        self.strings = []
+        for length in lengths:
+            self.strings.append(payload[offset:offset + length].decode("utf-8"))
+            offset += length
+        self.records = uints(nrecords)
+        self.typenames = [self.strings[i] for i in typeidx]
+        self.types = [None] * ntypes
+
+    def typeinfo(self, idx):
+        if self.types[idx] is None:
+            cls = _deserialize_class(self.typenames[idx])
+            self.types[idx] = (cls,) + _deserialize_kind(cls)
+        return self.types[idx]
+
+    def deserialize(self, pos):
+        # returns the deserialized node at pos, and the position of
+        # the next node
+        records = self.records
+        tag = records[pos]
+        if tag == _STR:
+            return self.strings[records[pos + 1]], pos + 2
+        elif tag == _OBJECT:
+            cls, kind, is_pdfreader = self.typeinfo(records[pos + 1])
+            attribs = {}
+            pos += 4
+            for i in range(records[pos - 2]):
+                attribs[self.strings[records[pos]]], pos = self.deserialize(pos + 1)
+            if is_pdfreader:
+                _state['fontspec'] = attribs['fontspec']
+            content, pos = self.deserialize(pos)
+            return _deserialize_object(cls, kind, content, attribs, "triples"), pos
+        elif tag == _LIST:
+            items = []
+            pos += 3
+            for i in range(records[pos - 2]):
+                item, pos = self.deserialize(pos)
+                items.append(item)
+            return items, pos
+        elif tag == _DICT:
+            items = {}
+            pos += 3
+            for i in range(records[pos - 2]):
+                items[self.strings[records[pos]]], pos = self.deserialize(pos + 1)
+            return items, pos
+        elif tag == _INT:
+            return records[pos + 1], pos + 2
+        elif tag == _BIGINT:
+            return int(self.strings[records[pos + 1]]), pos + 2
+        else:
+            return {_NONE: None, _FALSE: False, _TRUE: True}[tag], pos + 1
+
+    def skip(self, pos):
+        # returns the position of the node following the node at pos
+        tag = self.records[pos]
+        if tag in (_LIST, _DICT):
+            return pos + 3 + self.records[pos + 2]
+        elif tag == _OBJECT:
+            return pos + 4 + self.records[pos + 3]
+        elif tag in (_INT, _BIGINT, _STR):
+            return pos + 2
+        else:
+            return pos + 1
+
+    def attributes(self, pos):
+        # yields (key, position) for each attribute of the object at pos
+        records = self.records
+        cls, kind, is_pdfreader = self.typeinfo(records[pos + 1])
+        count = records[pos + 2]
+        pos += 4
+        for i in range(count):
+            key = self.strings[records[pos]]
+            if is_pdfreader and key == 'fontspec':
+                # needed for any pdfreader.Textbox below this node
+                _state['fontspec'] = self.deserialize(pos + 1)[0]
+            yield key, pos + 1
+            pos = self.skip(pos + 1)
+        yield "@content", pos
+
+    def children(self, path):
+        # returns the number of children of the node at path, and the
+        # position of the first child
+        pos = 0
+        for step in list(path) + [None]:
+            if self.records[pos] == _OBJECT:
+                attributes = dict(self.attributes(pos))
+                if isinstance(step, str):
+                    if step not in attributes:
+                        raise IndexError("Node has no attribute %s" % step)
+                    pos = attributes[step]
+                    continue
+                pos = attributes["@content"]
+            if self.records[pos] != _LIST:
+                raise IndexError("Node has no children")
+            if step is None:
+                break
+            if not 0 <= step < self.records[pos + 1]:
+                raise IndexError("Child index %s out of range" % step)
+            pos += 3
+            for i in range(step):
+                pos = self.skip(pos)
+        return self.records[pos + 1], pos + 3
 
 
 def __serialize_xml(node, serialize_hidden_attrs=False):
@@ -11,8 +11,11 @@ from copy import deepcopy
 import itertools
 import json
 import math
+import os
+import pickle
 import re
 import shutil
+import socket
 import tempfile
 
 import requests
@@ -154,6 +157,26 @@ class FulltextIndex(object):
         """Commit all pending updates to the fulltext index."""
         raise NotImplementedError  # pragma: no cover
 
+    bulk = False
+    """If True, :meth:`~ferenda.FulltextIndex.update` may add resources
+    in a way that is faster when indexing many documents from several
+    processes at once, but which requires a final call to
+    :meth:`~ferenda.FulltextIndex.merge_bulk` (by a single process)
+    before the resources can be queried. Resources added in bulk mode
+    must not already be present in the index more than once."""
+
+    def merge_bulk(self, processes=1):
+        """Make all resources added in bulk mode (by any process) part
+        of the fulltext index. The default implementation does
+        nothing, since bulk mode is only needed for some backends.
+
+        :param processes: The number of processes that may be used
+        :type processes: int
+        :returns: The number of merged resources
+        :rtype: int
+        """
+        return 0
+
     def close(self):
         """Commits all pending updates and closes the index."""
         raise NotImplementedError  # pragma: no cover
@@ -414,6 +437,7 @@ class WhooshIndex(FulltextIndex):
 
     def __init__(self, location, repos):
         self._writer = None
+        self._spooled = []
         super(WhooshIndex, self).__init__(location, repos)
         self._multiple = {}
         # Initialize self._multiple so that we know which fields may
@@ -453,8 +477,15 @@ class WhooshIndex(FulltextIndex):
             used_schema[fieldname] = self.from_native_field(field_object)
         return used_schema
 
+    def _spool_path(self):
+        # in bulk mode, each process appends the documents to its own
+        # spool file, so that no process need to wait for the lock of
+        # the main index. merge_bulk indexes the spooled documents.
+        return os.sep.join((self.location, ".spool",
+                            "%s-%s.pickle" % (socket.gethostname(), os.getpid())))
+
     def update(self, uri, repo, basefile, text, **kwargs):
-        if not self._writer:
+        if not self._writer and not self.bulk:
             self._writer = self.index.writer()
 
         s = self.schema()
@@ -480,13 +511,24 @@ class WhooshIndex(FulltextIndex):
                                            kwargs[key].month,
                                            kwargs[key].day)
 
-        self._writer.update_document(uri=uri,
-                                     repo=repo,
-                                     basefile=basefile,
-                                     text=text,
-                                     **kwargs)
+        if self.bulk:
+            kwargs.update(uri=uri, repo=repo, basefile=basefile, text=text)
+            self._spooled.append(kwargs)
+        else:
+            self._writer.update_document(uri=uri,
+                                         repo=repo,
+                                         basefile=basefile,
+                                         text=text,
+                                         **kwargs)
 
     def commit(self):
+        if self._spooled:
+            path = self._spool_path()
+            util.ensure_dir(path)
+            with open(path, "ab") as fp:
+                for doc in self._spooled:
+                    pickle.dump(doc, fp, pickle.HIGHEST_PROTOCOL)
+            self._spooled = []
         if self._writer:
             self._writer.commit()
             if not isinstance(self._writer, whoosh.writing.BufferedWriter):
@@ -497,6 +539,55 @@ class WhooshIndex(FulltextIndex):
         self.commit()
         self.index.close()
 
+    def merge_bulk(self, processes=1):
+        """Index all documents spooled in bulk mode. With more than
+        one process, whoosh's multiprocessing writer is used, where
+        each process writes a separate segment, and these are merged
+        into the index once.
+
+        :param processes: The number of indexing processes to use
+        :type processes: int
+        :returns: The number of indexed resources
+        :rtype: int
+        """
+        spooldir = os.sep.join((self.location, ".spool"))
+        if not os.path.exists(spooldir):
+            return 0
+        merged = 0
+        # if the index was freshly cleared, spooled resources can't
+        # replace any existing resources, and can just be added
+        replace = self.index.doc_count() > 0
+        if processes > 1:
+            writer = self.index.writer(procs=processes)
+        else:
+            writer = self.index.writer()
+        try:
+            for filename in sorted(os.listdir(spooldir)):
+                for doc in self._read_spool(spooldir + os.sep + filename):
+                    if replace:
+                        writer.delete_by_term("uri", doc["uri"])
+                    writer.add_document(**doc)
+                    merged += 1
+            writer.commit()
+        except:
+            writer.cancel()
+            raise
+        shutil.rmtree(spooldir)
+        return merged
+
+    def _read_spool(self, path):
+        with open(path, "rb") as fp:
+            while True:
+                try:
+                    yield pickle.load(fp)
+                except EOFError:
+                    return
+                except pickle.UnpicklingError as e:
+                    # the process writing the spool file crashed
+                    # halfway through a document
+                    self.log.warning("%s: Truncated spool file: %s" % (path, e))
+                    return
+
     def doccount(self):
         return self.index.doc_count()
 
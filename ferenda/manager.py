@@ -25,7 +25,7 @@ from io import StringIO
 from logging import getLogger as getlog
 from multiprocessing.managers import SyncManager, RemoteError
 from queue import Queue
-from time import sleep
+from time import sleep, time
 from urllib.parse import urlsplit
 
 from contextlib import contextmanager
@@ -330,7 +330,7 @@ def status(repo, samplesize=3):
         # parsed: None (143 needs parsing)
         # generated: None (143 needs generating)
     
-def make_wsgi_app(config, enabled=None, repos=None):
+def make_wsgi_app(config, enabled=None, repos=None, preload=False):
     """Creates a callable object that can act as a WSGI application by
     mod_wsgi, gunicorn, the built-in webserver, or any other
     WSGI-compliant webserver.
@@ -341,12 +341,17 @@ def make_wsgi_app(config, enabled=None, repos=None):
     :type enabled: dict
     :param repos: A list of initialized document repositoriees (used in embedded scenarios, including testing)
     :type enabled: list
-    :param wsgiappclass: The name of the class to be used to create the WSGI app
-    :type wsgiappclass: str
+    :param preload: Whether to do all expensive setup up front and
+                    prepare the app for being shared by forked worker
+                    processes (see :py:meth:`~ferenda.WSGIApp.preload`).
+                    Use this when the app is created in the master
+                    process of a pre-forking WSGI server.
+    :type preload: bool
     :returns: A WSGI application
     :rtype: callable
 
     """
+    start = time()
     if config is None:
         config = LayeredConfig(Defaults(DEFAULT_CONFIG))
     if repos is None:
@@ -354,7 +359,13 @@ def make_wsgi_app(config, enabled=None, repos=None):
             enabled = enabled_classes()
         repos = [_instantiate_class(cls, config) for cls in _classes_from_classname(enabled, 'all')]
     cls = _load_class(config.wsgiappclass)
-    return cls(repos, config)
+    app = cls(repos, config)
+    if preload:
+        app.preload()
+    app.startup_time = time() - start
+    getlog().info("WSGI app created in %.3f s%s" % (app.startup_time,
+                                                    " (preloaded)" if preload else ""))
+    return app
 
 
 loglevels = {'DEBUG': logging.DEBUG,
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+
+from pathlib import Path
+from queue import LifoQueue
+import atexit
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+try:
+    import uno
+    from com.sun.star.beans import PropertyValue
+    from com.sun.star.connection import NoConnectException
+except ImportError:
+    uno = None
+
+from ferenda import errors, util
+
+
+class OfficeConverter(object):
+
+    """Converts office documents (.doc, .docx, .wpd and the like) to other
+    formats (typically PDF) using a bounded pool of headless
+    LibreOffice/OpenOffice (``soffice``) processes.
+
+    Each worker uses its own user profile, so that several
+    conversions can run at the same time without the processes
+    colliding. If the ``uno`` python module is available, each worker
+    is a long-running ``soffice`` process that jobs are sent to over
+    a named pipe, which avoids paying the startup cost for every
+    document. A worker that crashes is restarted and the job retried
+    once, and a job that runs for longer than *timeout* seconds is
+    aborted (and its worker restarted). Without ``uno``, each job
+    runs ``soffice --convert-to`` in the worker's profile instead.
+
+    Workers are started on first use, and an idle worker that was
+    used recently is preferred over one that has not been started
+    yet, so a process that converts one document at a time only ever
+    starts a single ``soffice``.
+
+    Most code should use the process-wide instance returned by
+    :py:func:`get_converter` rather than creating its own.
+
+    :param workers: The max number of concurrent conversions (defaults
+                    to the number of CPUs, but at most 4)
+    :type  workers: int
+    :param timeout: Max number of seconds for a single conversion
+    :type  timeout: int
+    :param use_uno: Whether to use persistent processes through UNO
+                    (defaults to True if the ``uno`` module is available)
+    :type  use_uno: bool
+    """
+
+    filters = {"pdf": "writer_pdf_Export",
+               "docx": "MS Word 2007 XML",
+               "odt": "writer8"}
+    """The soffice export filters used for each output format, when
+    converting through UNO."""
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, workers=None, timeout=300, use_uno=None):
+        if workers is None:
+            workers = min(4, os.cpu_count() or 1)
+        if use_uno is None:
+            use_uno = uno is not None
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self.basedir = tempfile.mkdtemp(prefix="ferenda-office-")
+        self.workers = [_OfficeWorker(self.basedir + os.sep + str(i), use_uno)
+                        for i in range(max(1, workers))]
+        # a stack, so that the most recently used worker is reused
+        # (and the others never started) unless conversions overlap
+        self.idle = LifoQueue()
+        for worker in reversed(self.workers):
+            self.idle.put(worker)
+
+    def convert(self, infile, outdir, format="pdf", timeout=None):
+        """Convert *infile* to *format*, placing the result in *outdir*
+        with the same name as *infile* but a new suffix. Blocks until a
+        worker is available.
+
+        :param infile: The document to convert
+        :param outdir: The directory for the converted document
+        :param format: The suffix of the output format, like ``pdf``
+        :param timeout: Overrides the timeout given to the constructor
+        :returns: The path to the converted document
+        :rtype: str
+        """
+        outfile = os.path.join(
+            outdir, os.path.splitext(os.path.basename(infile))[0] + "." + format)
+        util.ensure_dir(outfile)
+        worker = self.idle.get()
+        try:
+            self.log.debug("%s: Converting to %s using %s" %
+                           (infile, format, worker.profiledir))
+            worker.convert(infile, outfile, format, self.filters.get(format),
+                           timeout or self.timeout)
+        finally:
+            self.idle.put(worker)
+        return outfile
+
+    def close(self):
+        """Stop all worker processes and remove their profiles."""
+        if os.getpid() != self.pid:
+            return  # a forked copy, the processes aren't ours
+        for worker in self.workers:
+            worker.stop()
+        shutil.rmtree(self.basedir, ignore_errors=True)
+
+
+class _OfficeWorker(object):
+
+    log = logging.getLogger(__name__)
+
+    def __init__(self, profiledir, use_uno):
+        self.profiledir = profiledir
+        self.use_uno = use_uno
+        self.pipename = "ferenda_%s_%s" % (os.getpid(),
+                                           os.path.basename(profiledir))
+        self.process = None
+        self.desktop = None
+
+    def command(self, *args):
+        profileurl = Path(os.path.abspath(self.profiledir)).as_uri()
+        return (["soffice", "--headless", "--invisible", "--nologo",
+                 "--norestore", "-env:UserInstallation=%s" % profileurl] +
+                list(args))
+
+    def start(self):
+        connection = "pipe,name=%s;urp;StarOffice.ComponentContext" % self.pipename
+        try:
+            self.process = subprocess.Popen(self.command("--accept=%s" % connection),
+                                            stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            raise errors.ExternalCommandNotFound("soffice")
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local)
+        # the first start with a fresh profile can be slow
+        deadline = time.time() + 120
+        while True:
+            try:
+                ctx = resolver.resolve("uno:" + connection)
+                break
+            except NoConnectException:
+                if self.process.poll() is not None or time.time() > deadline:
+                    self.stop()
+                    raise errors.ExternalCommandError(
+                        "Could not start soffice with profile %s" % self.profiledir)
+                time.sleep(0.5)
+        self.desktop = ctx.ServiceManager.createInstanceWithContext(
+            "com.sun.star.frame.Desktop", ctx)
+
+    def stop(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:
+                pass  # probably already dead
+            self.desktop = None
+        if self.process is not None:
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+    def convert(self, infile, outfile, format, filtername, timeout):
+        if not self.use_uno:
+            return self._convert_cmdline(infile, outfile, format, timeout)
+        for attempt in (1, 2):
+            if self.process is None or self.process.poll() is not None:
+                self.stop()
+                self.start()
+            error = []
+            job = threading.Thread(target=self._convert_uno,
+                                   args=(infile, outfile, filtername, error))
+            job.start()
+            job.join(timeout)
+            if job.is_alive():
+                # killing soffice makes the hung UNO call fail, which
+                # ends the thread
+                self.process.kill()
+                job.join()
+                self.stop()
+                raise errors.ExternalCommandError(
+                    "Converting %s timed out after %s s" % (infile, timeout))
+            if not error:
+                return
+            self.log.warning(
+                "%s: Conversion failed (%s), restarting soffice" % (infile, error[0]))
+            if self.process is not None:
+                self.process.kill()
+            self.stop()
+        raise errors.ExternalCommandError("Converting %s failed: %s" % (infile, error[0]))
+
+    def _convert_uno(self, infile, outfile, filtername, error):
+        def props(**kwargs):
+            res = []
+            for k, v in kwargs.items():
+                p = PropertyValue()
+                p.Name = k
+                p.Value = v
+                res.append(p)
+            return tuple(res)
+        try:
+            doc = self.desktop.loadComponentFromURL(
+                uno.systemPathToFileUrl(os.path.abspath(infile)), "_blank", 0,
+                props(Hidden=True, ReadOnly=True))
+            if doc is None:
+                raise errors.ExternalCommandError("soffice could not load %s" % infile)
+            try:
+                doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(outfile)),
+                               props(FilterName=filtername))
+            finally:
+                doc.close(True)
+        except Exception as e:
+            error.append(e)
+
+    def _convert_cmdline(self, infile, outfile, format, timeout):
+        cmd = self.command("--convert-to", format, "--outdir",
+                           os.path.dirname(outfile), infile)
+        try:
+            proc = subprocess.run(cmd, stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            raise errors.ExternalCommandError(
+                "Converting %s timed out after %s s" % (infile, timeout))
+        except FileNotFoundError:
+            raise errors.ExternalCommandNotFound("soffice")
+        if proc.returncode != 0 or not os.path.exists(outfile):
+            raise errors.ExternalCommandError(
+                "Converting %s failed: %s" % (infile,
+                                              proc.stderr.decode("utf-8", "replace").strip()))
+
+
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def get_converter(workers=None):
+    """Returns the process-wide :py:class:`OfficeConverter`, creating it
+    on first use (and again in a forked child process, since the
+    workers of the parent can't be shared).
+
+    :param workers: The max number of concurrent conversions
+                    (typically the ``officeworkers`` config option). If
+                    the existing converter has a different number of
+                    workers, it is replaced.
+    :type  workers: int
+    """
+    global _converter
+    with _converter_lock:
+        if (_converter is None or _converter.pid != os.getpid() or
+                (workers and len(_converter.workers) != workers)):
+            if _converter is not None and _converter.pid == os.getpid():
+                _converter.close()
+            _converter = OfficeConverter(workers)
+            atexit.register(_converter.close)
+        return _converter
@@ -23,6 +23,7 @@ from cached_property import cached_property
 
 from ferenda import util, errors
 from ferenda.fsmparser import Peekable
+from ferenda.officeconverter import get_converter
 from ferenda.elements import serialize
 from ferenda.elements import UnicodeElement, CompoundElement, OrdinalElement
 
@@ -74,7 +75,8 @@ class PDFReader(CompoundElement):
                  ocr_lang=None,
                  fontspec=None,
                  textdecoder=None,
-                 legacy_tesseract=False):
+                 legacy_tesseract=False,
+                 office_workers=None):
         """Initializes a PDFReader object from an existing PDF file. After
         initialization, the PDFReader contains a list of
         :py:class:`~ferenda.pdfreader.Page` objects.
@@ -115,6 +117,10 @@ class PDFReader(CompoundElement):
         :param legacy_tesseract: Specify True if the available tesseract
                                  version is older than 3.05.
         :type legacy_tesseract: bool
+        :param office_workers: The max number of ``soffice`` processes
+                               used for ``convert_to_pdf`` (see
+                               :py:func:`~ferenda.officeconverter.get_converter`)
+        :type office_workers: int
 
         """
         self.log = logging.getLogger('pdfreader')
@@ -145,11 +151,8 @@ class PDFReader(CompoundElement):
                 os.path.splitext(os.path.basename(filename))[0] + ".pdf"
             if not os.path.exists(newfilename):
                 util.ensure_dir(newfilename)
-                cmdline = "soffice --headless --convert-to pdf --outdir '%s' %s" % (
-                    workdir, filename)
-                self.log.debug("%s: Converting to PDF: %s" % (filename, cmdline))
-                (ret, stdout, stderr) = util.runcmd(
-                    cmdline, require_success=True)
+                self.log.debug("%s: Converting to PDF" % filename)
+                get_converter(office_workers).convert(filename, workdir, "pdf")
             filename = newfilename
 
         assert os.path.exists(filename), "PDF %s not found" % filename
@@ -1090,9 +1093,12 @@ class StreamingPDFReader(PDFReader):
               ocr_lang=None,
               fontspec=None,
               legacy_tesseract=False,
-              textdecoder=None):
+              textdecoder=None,
+              office_workers=None):
         self.read(self.convert(filename, workdir, images, convert_to_pdf,
-                               keep_xml, ocr_lang), textdecoder=textdecoder)
+                               keep_xml, ocr_lang,
+                               office_workers=office_workers),
+                  textdecoder=textdecoder)
 
     def intermediate_filename(self, filename, ocr_lang, keep_xml):
         basename = os.path.basename(filename)
@@ -1109,7 +1115,8 @@ class StreamingPDFReader(PDFReader):
         return real_convertedfile
 
     def convert(self, filename, workdir=None, images=True,
-                convert_to_pdf=False, keep_xml=True, ocr_lang=None, legacy_tesseract=False):
+                convert_to_pdf=False, keep_xml=True, ocr_lang=None, legacy_tesseract=False,
+                office_workers=None):
         self.filename=filename
         self.workdir = workdir
         if self.workdir is None:
@@ -1120,11 +1127,8 @@ class StreamingPDFReader(PDFReader):
                 os.path.splitext(os.path.basename(filename))[0] + ".pdf"
             if not os.path.exists(newfilename):
                 util.ensure_dir(newfilename)
-                cmdline = "soffice --headless --convert-to pdf --outdir '%s' %s" % (
-                    workdir, filename)
-                self.log.debug("%s: Converting to PDF: %s" % (filename, cmdline))
-                (ret, stdout, stderr) = util.runcmd(
-                    cmdline, require_success=True)
+                self.log.debug("%s: Converting to PDF" % filename)
+                get_converter(office_workers).convert(filename, workdir, "pdf")
             filename = newfilename
 
         assert os.path.exists(filename), "PDF %s not found" % filename
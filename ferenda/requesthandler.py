@@ -13,9 +13,11 @@ from urllib.parse import urlparse, unquote, parse_qsl
 import mimetypes
 import traceback
 from copy import deepcopy
+from difflib import SequenceMatcher
 
 from lxml import etree
 from lxml.etree import XMLSyntaxError
+from lxml.html import fragment_fromstring
 from rdflib import Graph
 from cached_property import cached_property
 from werkzeug.routing import Rule, BaseConverter, Map
@@ -401,6 +403,11 @@ class RequestHandler(object):
             # method = repo.store.generated_path
             return None
 
+        if (method == repo.store.distilled_path and
+                repo.store.distilled_file_format(basefile) != "xml"):
+            # the static file isn't RDF/XML, so it has to be converted
+            return None
+
         if "attachment" in params:
             method = partial(method, attachment=params["attachment"])
 
@@ -430,8 +437,7 @@ class RequestHandler(object):
         if not pathfunc:
             # no static file exists, we need to call code to produce data
             if contenttype in self._rdfformats or suffix in self._rdfsuffixes:
-                g = Graph()
-                g.parse(self.repo.store.distilled_path(basefile))
+                g = self.repo.store.read_distilled(basefile)
                 if 'extended' in params:
                     if os.path.exists(self.repo.store.annotation_path(basefile)):
                         annotation_graph = self.repo.annotation_file_to_graph(
@@ -441,7 +447,7 @@ class RequestHandler(object):
             if contenttype in self._rdfformats:
                 data = g.serialize(format=self._rdfformats[contenttype])
             elif suffix in self._rdfsuffixes:
-                data = g.serialize(format=rdfsuffixes[suffix])
+                data = g.serialize(format=self._rdfsuffixes[suffix])
             elif 'diff' in params and params.get('from') != "None":
                 data = self.diff_versions(basefile, params.get('from'), params.get('to'))
             else:
@@ -453,6 +459,21 @@ class RequestHandler(object):
         return path, data
 
     def diff_versions(self, basefile, from_version, to_version):
+        """Create a HTML page showing the differences between two
+        archived versions of a generated document.
+
+        The documents are first aligned on their structure (elements
+        identified by ``about`` or ``id`` attributes, like sections
+        and paragraphs), and only the parts that differ are diffed on
+        a word level. The result is cached and re-used for as long as
+        it's newer than both generated files."""
+        from_path = self.repo.store.generated_path(basefile, version=from_version)
+        to_path = self.repo.store.generated_path(basefile, version=to_version)
+        cache_path = self.diff_path(basefile, from_version, to_version)
+        if util.outfile_is_newer([from_path, to_path], cache_path):
+            with open(cache_path, "rb") as fp:
+                return fp.read()
+
         def cleantree(tree, savednodes=None):
             for xpath, save in (("//div[@class='docversions']", False),
                                 ("//div[@role='tablist']", True)):
@@ -463,14 +484,12 @@ class RequestHandler(object):
                     parent.remove(node)
             return tree
         # 1 load the from_version, cleaning away some parts that we won't diff
-        from_tree = cleantree(etree.parse(
-            self.repo.store.generated_path(basefile, version=from_version)))
+        from_tree = cleantree(etree.parse(from_path))
 
         # 2 load the to_version, making a deep copy to be used for the
         # final template, then cleaning awy the same parts as for the
         # from_version, but storing these parts for later use.
-        to_tree = etree.parse(
-            self.repo.store.generated_path(basefile, version=to_version))
+        to_tree = etree.parse(to_path)
         template_tree = deepcopy(to_tree)
         savednodes = {}
         to_tree = cleantree(to_tree, savednodes=savednodes)
@@ -479,12 +498,13 @@ class RequestHandler(object):
         from_area = from_tree.find("//article")
         to_area = to_tree.find("//article")
 
-        # 4 diff the content areas
-        diffstr = '<article class="col-sm-9">' + htmldiff(from_area, to_area, include_hrefs=False) + '</article>'
-        diff_tree = etree.HTML(diffstr)[0][0]
+        # 4 diff the content areas, section by section
+        diff_tree = etree.Element("article", {"class": "col-sm-9"})
+        self._diff_children(from_area, to_area, diff_tree)
+
         # 5 re-insert the stored-away parts
-        for parent in to_area.xpath("//div[@class='row']"):
-            if parent.get("about") in savednodes:
+        for parent in diff_tree.iter("div"):
+            if parent.get("class") == "row" and parent.get("about") in savednodes:
                 # the saved nodes always appear last amongst its
                 # siblings, so we can always just append to the parent
                 parent.append(savednodes[parent.get("about")])
@@ -492,7 +512,93 @@ class RequestHandler(object):
         # 6 insert resunt into doc area for 1
         area = template_tree.find("//article")
         area.getparent().replace(area, diff_tree)
-        return etree.tostring(template_tree)
+        data = etree.tostring(template_tree)
+        util.ensure_dir(cache_path)
+        with open(cache_path, "wb") as fp:
+            fp.write(data)
+        return data
+
+    def diff_path(self, basefile, from_version, to_version):
+        """Get the path of the cached diff between two versions of a
+        basefile. The diff is cached as a plain file below
+        ``archive/diff`` regardless of the archiving policy of the
+        store, since archived version paths might point into a zip
+        file."""
+        store = self.repo.store
+        path = "/".join([store.datadir, "archive", "diff",
+                         store.basefile_to_pathfrag(basefile),
+                         "%s-%s.html" % (store.basefile_to_pathfrag(from_version),
+                                         store.basefile_to_pathfrag(to_version))])
+        if os.sep != "/":
+            path = path.replace("/", os.sep)
+        return path
+
+    def _diff_key(self, el):
+        # elements that identify themselves are aligned on that
+        # identity, other elements on their entire content (meaning
+        # that they only align if they're identical)
+        if isinstance(el.tag, str):
+            key = el.get("about") or el.get("id")
+            if key:
+                return ("id", key)
+        return ("content", etree.tostring(el, with_tail=False))
+
+    def _is_structured(self, el):
+        # an element can be diffed child by child if it contains no
+        # running text of its own, and at least some of its children
+        # identify themselves
+        if not len(el) or (el.text and el.text.strip()):
+            return False
+        if [child for child in el if child.tail and child.tail.strip()]:
+            return False
+        return any(isinstance(child.tag, str) and (child.get("about") or child.get("id"))
+                   for child in el)
+
+    def _diff_children(self, from_el, to_el, parent):
+        if not (self._is_structured(from_el) and self._is_structured(to_el)):
+            wrapper = fragment_fromstring(htmldiff(from_el, to_el, include_hrefs=False),
+                                          create_parent="div")
+            parent.text = wrapper.text
+            parent.extend(wrapper)
+            return
+        from_children = list(from_el)
+        to_children = list(to_el)
+        matcher = SequenceMatcher(None,
+                                  [self._diff_key(x) for x in from_children],
+                                  [self._diff_key(x) for x in to_children],
+                                  autojunk=False)
+        for op, i1, i2, j1, j2 in matcher.get_opcodes():
+            # a replaced block of anonymous elements is diffed element
+            # by element if possible, but elements that identify
+            # themselves differently are never considered the same
+            if op == "replace" and i2 - i1 == j2 - j1:
+                keys = matcher.a[i1:i2] + matcher.b[j1:j2]
+                pairwise = all(k[0] == "content" for k in keys)
+            else:
+                pairwise = op == "equal"
+            if pairwise:
+                for a, b in zip(from_children[i1:i2], to_children[j1:j2]):
+                    if (etree.tostring(a, with_tail=False) ==
+                            etree.tostring(b, with_tail=False)):
+                        parent.append(deepcopy(b))
+                    else:
+                        parent.append(self._diff_element(a, b))
+            else:
+                for tag, children in (("del", from_children[i1:i2]),
+                                      ("ins", to_children[j1:j2])):
+                    for child in children:
+                        wrapper = etree.SubElement(parent, tag)
+                        wrapper.append(deepcopy(child))
+                        wrapper.tail, wrapper[0].tail = wrapper[0].tail, None
+
+    def _diff_element(self, from_el, to_el):
+        if not isinstance(to_el.tag, str):
+            # comments and processing instructions aren't diffed
+            return deepcopy(to_el)
+        el = etree.Element(to_el.tag, to_el.attrib)
+        el.tail = to_el.tail
+        self._diff_children(from_el, to_el, el)
+        return el
 
     def lookup_dataset(self, environ, params, contenttype, suffix):
         # FIXME: This should also make use of pathfunc
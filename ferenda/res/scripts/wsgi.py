@@ -7,7 +7,7 @@ sys.path.append("..")
 
 try:
     from ferenda.manager import make_wsgi_app, find_config_file, load_config
-    application = make_wsgi_app(load_config(find_config_file()))
+    application = make_wsgi_app(load_config(find_config_file()), preload=True)
 except ImportError as e:
     exception_data = str(e)
 
@@ -9,20 +9,23 @@
 		extension-element-prefixes="date"
 		exclude-result-prefixes="xhtml rdf atom">
 
-  <!-- assume a statusreport.xml like this:
+  <!-- assume a statusreport.xml like this (for status.html, repo
+       elements only contain page elements):
   <status>
-    <repo alias="propregeringen">
-      <action id="parse">
-        <basefile id="2013/14:40" success="true" duration="4.2532" time="2015-05-26 12:33:32"/>
-        <basefile id="2013/14:41" success="true" duration="4.2532">
+    <repo alias="propregeringen" total="3" failed="1" warnings="2" duration="12.7596" page="1">
+      <page n="1" href="1.html"/>
+      <basefile id="2013/14:41">
+        <action id="parse" success="True" duration="4.2532" date="2015-05-26 12:33:32">
           <warnings>Warning text here...</warnings>
-        </basefile>
-        <basefile id="2013/14:42" success="true" duration="4.2532">
+        </action>
+      </basefile>
+      <basefile id="2013/14:42">
+        <action id="parse" success="False" duration="4.2532" date="2015-05-26 12:33:32">
           <warnings>Warning text here...</warnings>
           <error>InvalidTreeError: xyz</error>
-          <traceback>File "foo.py" line 123 ...</traceback>      
-        </basefile>
-      </action>
+          <traceback>File "foo.py" line 123 ...</traceback>
+        </action>
+      </basefile>
     </repo>
   </status>
   -->
@@ -35,9 +38,9 @@
   <xsl:template name="headmetadata"/>
   <xsl:template name="bodyclass">statusreport</xsl:template>
   <xsl:template name="pagetitle">
-    <xsl:variable name="total" select="count(//basefile)"/>
-    <xsl:variable name="failed" select="count(//basefile[action/@success='False'])"/>
-    <xsl:variable name="warnings" select="count(//basefile[action/warnings])"/>
+    <xsl:variable name="total" select="sum(//repo/@total)"/>
+    <xsl:variable name="failed" select="sum(//repo/@failed)"/>
+    <xsl:variable name="warnings" select="sum(//repo/@warnings)"/>
     <h1>Status report
     <small><xsl:value-of select="date:date-time()"/>-
 
@@ -61,7 +64,7 @@
       </small>
     </p>
     <div class="control-panel">
-      <!-- <button onclick="$('div.alert-success').toggle()">show/hide successes</button> -->
+      <button onclick="$('div.alert-success').toggle()">show/hide successes</button>
       <button onclick="$('div.alert-warning').toggle()">show/hide warnings</button>
       <button onclick="$('div.alert-danger').toggle()">show/hide errors</button>
     </div>
@@ -80,10 +83,10 @@
 
 
   <xsl:template match="repo">
-    <xsl:variable name="total" select="count(basefile)"/>
-    <xsl:variable name="failed" select="count(basefile[action/@success='False'])"/>
-    <xsl:variable name="warnings" select="count(basefile[action/warnings])"/>
-    <xsl:variable name="duration" select="sum(basefile/action/@duration)"/>
+    <xsl:variable name="total" select="@total"/>
+    <xsl:variable name="failed" select="@failed"/>
+    <xsl:variable name="warnings" select="@warnings"/>
+    <xsl:variable name="duration" select="@duration"/>
     <h2>
       <xsl:value-of select="@alias"/>
     </h2>
@@ -94,14 +97,29 @@
 	<xsl:value-of select="round($duration * 100 div $total) div 100"/> s avg parse time
     </small>
     </p>
-    <div class="basefiles">
-      <xsl:apply-templates/>
-    </div>
+    <xsl:if test="@page">
+      <p><a href="../status.html">All repos</a></p>
+      <div class="basefiles">
+	<xsl:apply-templates select="basefile"/>
+      </div>
+    </xsl:if>
+    <xsl:if test="page">
+      <ul class="pagination">
+	<xsl:apply-templates select="page"/>
+      </ul>
+    </xsl:if>
     <p><xsl:value-of select="$total"/> processed, 
     <xsl:value-of select="$failed"/> failed,
     <xsl:value-of select="$warnings"/> had warnings</p>
   </xsl:template>
 
+  <xsl:template match="page">
+    <li>
+      <xsl:if test="@n = ../@page"><xsl:attribute name="class">active</xsl:attribute></xsl:if>
+      <a href="{@href}"><xsl:value-of select="@n"/></a>
+    </li>
+  </xsl:template>
+
   <xsl:template match="action">
     <xsl:variable name="alerttype">
       <xsl:choose>
@@ -128,22 +146,19 @@
   </xsl:template>
 
   <xsl:template match="basefile">
-    <xsl:if test="action[@success='False'] or action/warnings">
-      <xsl:variable name="alerttype">
-	<xsl:choose>
-	  <xsl:when test="action[@success='False']">alert-danger</xsl:when>
-	  <xsl:when test="action[@success='True'] and action/warnings">alert-warning</xsl:when>
-	  <xsl:when test="action[@success='True']">alert-success</xsl:when>
-	</xsl:choose>
-      </xsl:variable> 
-      <div class="basefile alert {$alerttype}">
-	<!-- can't happen now that we don't render any alert-success divs
-	    <xsl:if test="$alerttype = 'alert-success'"><xsl:attribute name="style">display: none;</xsl:attribute></xsl:if>
-	-->
-	<b><xsl:value-of select="@id"/></b><br/>
-	<xsl:apply-templates/>
-      </div>
-    </xsl:if>
+    <xsl:variable name="alerttype">
+      <xsl:choose>
+	<xsl:when test="action[@success='False']">alert-danger</xsl:when>
+	<xsl:when test="action[@success='True'] and action/warnings">alert-warning</xsl:when>
+	<xsl:when test="action[@success='True']">alert-success</xsl:when>
+      </xsl:choose>
+    </xsl:variable> 
+    <div class="basefile alert {$alerttype}">
+      <!-- successful docs are listed too, but hidden until toggled -->
+      <xsl:if test="$alerttype = 'alert-success'"><xsl:attribute name="style">display: none;</xsl:attribute></xsl:if>
+      <b><xsl:value-of select="@id"/></b><br/>
+      <xsl:apply-templates/>
+    </div>
   </xsl:template>
 
   <xsl:template match="repo" mode="toc"/>
@@ -14,37 +14,191 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import os
+import pickle
 import subprocess
 from datetime import datetime
 from operator import itemgetter
 from pprint import pprint
 
 from lxml import etree as ET
-from rdflib import Graph, Literal, BNode, URIRef, Collection, Namespace, RDF
+from rdflib import Graph, Literal, BNode, URIRef, Namespace, RDF
+from rdflib.collection import Collection
 from whoosh import analysis, fields, query, scoring
 from whoosh.filedb.filestore import RamStorage, FileStorage
 
 try:
     import matplotlib.pyplot as plt
     import matplotlib.cm as cm
-    import numpy.array as na
-    import networkx
-    from networkx.algorithms.link_analysis.pagerank_alg import pagerank
-    from networkx.algorithms.link_analysis.hits_alg import hits
+    from numpy import array as na
 except ImportError:
     plt = None
     cm = None
     na = None
+
+try:
+    import networkx
+    from networkx.algorithms.link_analysis.pagerank_alg import pagerank
+    from networkx.algorithms.link_analysis.hits_alg import hits
+except ImportError:
     networkx = None
     pagerank = None
     hits = None
 
+# CitationMatrix needs numpy and scipy. Without them, citation graphs
+# are built and ranked with networkx instead.
+try:
+    import numpy
+    import scipy.sparse
+except ImportError:
+    numpy = None
+    scipy = None
+
 from ferenda import TripleStore
 from ferenda import util
-from rdflib.namespace import DCTERMS
+from rdflib.namespace import DCTERMS, OWL
 from ferenda.sources.legal.se import RINFOEX
 
 
+class CitationMatrix(object):
+    """The citation graph between cases, stored as a sparse adjacency
+    matrix (row: citing case, column: cited case), together with the
+    articles cited by each case. Subgraphs restricted to a particular
+    article and/or year are created by masking the matrix, and ranked
+    with matrix implementations of the algorithms used through
+    networkx by :py:meth:`GraphAnalyze.eval_rank_graph`.
+
+    :param cites: Dicts with the keys ``subj`` (the citing case),
+                  ``obj`` (a cited case or article) and ``celexnum``
+                  (of the citing case), like the rows of a SPARQL
+                  result.
+    :param sameas: A graph of owl:sameAs statements, mapping each
+                   article to its equivalents.
+    :type  sameas: rdflib.Graph
+    """
+
+    caseprefix = "http://lagen.nu/ext/celex/6"
+
+    def __init__(self, cites, sameas=None):
+        self.nodes = []
+        self.index = {}
+        canonical = {}
+        if sameas:
+            for (article, equiv) in sameas.subject_objects(OWL.sameAs):
+                canonical[str(equiv)] = str(article)
+        celexnums = {}
+        rows = []
+        cols = []
+        self.articles = {}  # article -> set of citing nodes
+        for cite in cites:
+            citing = self._node(str(cite['subj']))
+            celexnums[citing] = str(cite['celexnum'])
+            obj = str(cite['obj'])
+            if obj.startswith(self.caseprefix):
+                # remove pinpoints
+                rows.append(citing)
+                cols.append(self._node(obj.split("-")[0]))
+            else:
+                self.articles.setdefault(canonical.get(obj, obj), set()).add(citing)
+        size = len(self.nodes)
+        self.celexnums = numpy.array([celexnums.get(i, "") for i in range(size)])
+        self.matrix = scipy.sparse.csr_matrix(
+            (numpy.ones(len(rows)), (rows, cols)), shape=(size, size))
+        # several citations (eg to different pinpoints) are one edge
+        self.matrix.sum_duplicates()
+        self.matrix.data[:] = 1
+
+    def _node(self, uri):
+        if uri not in self.index:
+            self.index[uri] = len(self.nodes)
+            self.nodes.append(uri)
+        return self.index[uri]
+
+    def restrict(self, article=None, year=None, restrict_citing=True,
+                 restrict_cited=False):
+        """Returns the adjacency matrix with only those citations made by
+        cases decided before *year*, and (if *article* is given) made
+        by cases that cite *article* (if *restrict_citing*) and/or to
+        cases that cite *article* (if *restrict_cited*)."""
+        size = len(self.nodes)
+        citingmask = numpy.ones(size, dtype=bool)
+        citedmask = numpy.ones(size, dtype=bool)
+        if article:
+            citesarticle = numpy.zeros(size, dtype=bool)
+            citesarticle[list(self.articles.get(article, ()))] = True
+            if restrict_citing:
+                citingmask &= citesarticle
+            if restrict_cited:
+                citedmask &= citesarticle
+        if year:
+            citingmask &= self.celexnums < "6%s" % year
+        graph = (scipy.sparse.diags(citingmask.astype(float)) @ self.matrix @
+                 scipy.sparse.diags(citedmask.astype(float))).tocsr()
+        graph.eliminate_zeros()
+        return graph
+
+    def edges(self, graph):
+        """Returns the (citing, cited) URIs of all citations in *graph*."""
+        graph = graph.tocoo()
+        return [(self.nodes[i], self.nodes[j]) for (i, j) in zip(graph.row, graph.col)]
+
+    def rank(self, graph, algorithm="pagerank"):
+        """Rank the cases in *graph* (a matrix returned by
+        :py:meth:`restrict`) using ``pagerank``, ``hits`` (authority
+        scores) or ``indegree``. Like networkx, only cases with at
+        least one citation in *graph* are ranked.
+
+        :returns: (uri, score) tuples, highest score first
+        :rtype: list
+        """
+        active = numpy.flatnonzero(graph.getnnz(axis=0) + graph.getnnz(axis=1))
+        graph = graph[active][:, active]
+        if algorithm == "pagerank":
+            scores = self.pagerank(graph)
+        elif algorithm == "hits":
+            scores = self.hits(graph)
+        elif algorithm == "indegree":
+            scores = numpy.asarray(graph.sum(axis=0)).ravel()
+        else:
+            raise ValueError("Unknown ranking algorithm %s specified" % algorithm)
+        order = numpy.argsort(-scores, kind="stable")
+        return [(self.nodes[active[i]], float(scores[i])) for i in order]
+
+    @staticmethod
+    def pagerank(graph, alpha=0.85, max_iter=100, tol=1.0e-6):
+        """Same as :py:func:`networkx.pagerank` with default arguments."""
+        size = graph.shape[0]
+        outdegree = numpy.asarray(graph.sum(axis=1)).ravel()
+        dangling = outdegree == 0
+        weights = numpy.zeros(size)
+        weights[~dangling] = 1.0 / outdegree[~dangling]
+        transitions = (scipy.sparse.diags(weights) @ graph).T.tocsr()
+        uniform = numpy.full(size, 1.0 / size)
+        x = uniform
+        for i in range(max_iter):
+            xlast = x
+            x = alpha * (transitions @ xlast + xlast[dangling].sum() * uniform) + \
+                (1 - alpha) * uniform
+            if numpy.abs(x - xlast).sum() < size * tol:
+                return x
+        raise ValueError("pagerank failed to converge in %s iterations" % max_iter)
+
+    @staticmethod
+    def hits(graph, max_iter=10000, tol=1.0e-8):
+        """Same as the authority scores from :py:func:`networkx.hits`."""
+        size = graph.shape[0]
+        hubs = numpy.full(size, 1.0 / size)
+        transposed = graph.T.tocsr()
+        for i in range(max_iter):
+            hubslast = hubs
+            authorities = transposed @ hubslast
+            hubs = graph @ authorities
+            hubs = hubs / hubs.max()
+            authorities = authorities / authorities.max()
+            if numpy.abs(hubs - hubslast).sum() < tol:
+                return authorities / authorities.sum()
+        raise ValueError("hits failed to converge in %s iterations" % max_iter)
+
+
 class GraphAnalyze(object):
 
     def prep_annotation_file(self, basefile):
@@ -168,11 +322,12 @@ class GraphAnalyze(object):
         #        yield el.attrib['about']
 
     # returns a RDFLib.Graph
+    def _sameas_path(self):
+        return os.path.relpath(os.path.dirname(__file__) + "/../res/eut/sameas.n3")
+
     def _sameas(self):
         sameas = Graph()
-        sameas_rdf = util.relpath(
-            os.path.dirname(__file__) + "/../res/eut/sameas.n3")
-        sameas.load(sameas_rdf, format="n3")
+        sameas.load(self._sameas_path(), format="n3")
         return sameas
 
     def _query_cases(self, article, sameas):
@@ -196,7 +351,7 @@ SELECT DISTINCT ?subj WHERE {
     # Returns a python list of dicts
     def _query_cites(self, article, sameas, restrict_citing, restrict_cited, year=None):
         if not year:
-            year = datetime.datetime.today().year
+            year = datetime.today().year
         pred = util.ns['owl'] + "sameAs"
         q = ""
         if restrict_citing:
@@ -207,7 +362,7 @@ SELECT DISTINCT ?subj WHERE {
         if restrict_cited:
             if q:
                 q += ".\n"
-            q = "{?obj eurlex:cites <%s>}\n" % article
+            q += "{?obj eurlex:cites <%s>}\n" % article
             for equiv in sameas.objects(URIRef(article), URIRef(pred)):
                 q += "    UNION { ?obj eurlex:cites <%s> }\n" % equiv
 
@@ -224,6 +379,48 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
 }
 """ % (q, year)
 
+    def _query_all_cites(self):
+        return """
+PREFIX eurlex:<http://lagen.nu/eurlex#>
+SELECT DISTINCT ?subj ?obj ?celexnum WHERE {
+    ?subj eurlex:cites ?obj .
+    ?subj eurlex:celexnum ?celexnum .
+}
+"""
+
+    def citation_matrix(self, rebuild=False):
+        """Returns the citation graph of all cases as a
+        :py:class:`CitationMatrix`, or None if numpy and scipy aren't
+        available. It's built from a single query against the triple
+        store and cached on disk. The cache is rebuilt if *rebuild* is
+        True, or if any distilled file (which is what the triple
+        store is loaded from) or the sameas data is newer than it."""
+        if scipy is None:
+            return None
+        if '_citationmatrix' in self.__dict__ and not rebuild:
+            return self.__dict__['_citationmatrix']
+        cachefile = self.generic_path("citationmatrix", "analyzed", ".pickle")
+        deps = [self._sameas_path()]
+        deps.extend(self.store.distilled_path(basefile) for basefile in
+                    self.store.list_basefiles_for("relate"))
+        if not rebuild and util.outfile_is_newer(deps, cachefile):
+            with open(cachefile, "rb") as fp:
+                matrix = pickle.load(fp)
+        else:
+            store = TripleStore(self.config.storetype,
+                                self.config.storelocation,
+                                self.config.storerepository)
+            with util.logtime(self.log.info,
+                              "Built citation matrix (%(elapsed).3f sec)"):
+                matrix = CitationMatrix(store.select(self._query_all_cites(),
+                                                     format="python"),
+                                        self._sameas())
+            util.ensure_dir(cachefile)
+            with open(cachefile, "wb") as fp:
+                pickle.dump(matrix, fp, pickle.HIGHEST_PROTOCOL)
+        self.__dict__['_citationmatrix'] = matrix
+        return matrix
+
     def temp_analyze(self):
         store = TripleStore(self.config.storetype,
                             self.config.storelocation,
@@ -260,6 +457,9 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
         return
 
     def analyze(self):
+        # the triple store might have been reloaded since the last
+        # analysis
+        self.citation_matrix(rebuild=True)
         articles = self.analyze_article_citations(num_of_articles=10)
         # articles = self._articles('tfeu')
         self.analyze_baseline_queries(articles)
@@ -416,11 +616,12 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
             articles = [None]
         if None not in articles:
             articles.append(None)
-        this_year = datetime.datetime.today().year
+        this_year = datetime.today().year
         store = TripleStore(self.config.storetype,
                             self.config.storelocation,
                             self.config.storerepository)
         sameas = self._sameas()
+        matrix = self.citation_matrix()
         distributions = []
 
         # For each article (and also for no article = the entire citation graph)
@@ -435,36 +636,30 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
 
             self.log.info(
                 "Creating graphs for %s (%s cases)" % (article, len(cases)))
-            # Step 1. SPARQL the graph on the form ?citing ?cited
+            # Step 1. Get the graph on the form ?citing ?cited
             # (optionally restricting on citing a particular article)
-            if article:
-                sq = self._query_cites(
-                    article, sameas, True, False, this_year + 1)
+            # without pinpoints
+            if matrix:
+                cites = matrix.edges(matrix.restrict(article, this_year + 1,
+                                                     restrict_citing=True))
             else:
-                sq = self._query_cites(
-                    None, sameas, False, False, this_year + 1)
-
-            cites = store.select(sq, format="python")
+                sq = self._query_cites(article, sameas, bool(article), False,
+                                       this_year + 1)
+                cites = [(cite['subj'], cite['obj'].split("-")[0])
+                         for cite in store.select(sq, format="python")]
             self.log.debug(
                 "    Citation graph contains %s citations" % (len(cites)))
 
-            # remove duplicate citations, self-citations and pinpoints
-            # in citations
+            # remove self-citations and citations of unknown cases
             citedict = {}
             missingcases = {}
-            for cite in cites:
-                # print repr(cite)
-                if "-" in cite['obj']:
-                    cite['obj'] = cite['obj'].split("-")[0]
-
-                if not cite['obj'] in cases:
-                    # print "Case %s (cited in %s) does not exist!\n" % (cite['obj'],
-                    # cite['subj'])
-                    missingcases[cite['obj']] = True
+            for (citing, cited) in cites:
+                if cited not in cases:
+                    missingcases[cited] = True
                     continue
 
-                if (cite['subj'] != cite['obj']):
-                    citedict[(cite['subj'], cite['obj'])] = True
+                if citing != cited:
+                    citedict[(citing, cited)] = True
 
             self.log.debug(
                 "    Normalized graph contains %s citations (%s cited cases not found)" %
@@ -805,8 +1000,6 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
     def eval_calc_map(self, average_precision_set):
         return sum(average_precision_set) / float(len(average_precision_set))
 
-    _graph_cache = {}
-
     def eval_get_ranked_set(self, basefile, algorithm="pagerank",
                             age_compensation=False, restrict_cited=True):
         # * algorithm: can be "indegree", "hits" or "pagerank".
@@ -818,10 +1011,12 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
         #   use all citations from all cases that cite the TFEU
         #   article, regardless of whether the cited case also cites
         #   the same TFEU article)
-        sameas = self._sameas()
-        store = TripleStore(self.config.storetype,
-                            self.config.storelocation,
-                            self.config.storerepository)
+        matrix = self.citation_matrix()
+        if not matrix:
+            sameas = self._sameas()
+            store = TripleStore(self.config.storetype,
+                                self.config.storelocation,
+                                self.config.storerepository)
         res = {}
 
         self.log.debug("Creating ranked set (%s,age_compensation=%s,restrict_cited=%s)" %
@@ -830,7 +1025,7 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
         for article in self._articles(basefile):
             article_celex = article.split("/")[-1]
             self.log.debug("    Creating ranking for %s" % (article_celex))
-            this_year = datetime.datetime.today().year
+            this_year = datetime.today().year
             if age_compensation:
                 years = list(range(1954, this_year + 1))
                 # years = range(this_year-3,this_year) # testing
@@ -838,31 +1033,23 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
                 years = list(range(this_year, this_year + 1))
 
             result_by_years = []
+            ranked = []
             for year in years:
-                restrict_citing = True  # always performs better
-                if (article, year, restrict_cited) in self._graph_cache:
-                    # self.log.debug("Resuing cached graph (%s) for %s in %s" %
-                    #               (restrict_cited, article_celex,year))
-                    graph = self._graph_cache[(article, year, restrict_cited)]
+                # restricting on the citing cases always performs better
+                if matrix:
+                    graph = matrix.restrict(article, year, restrict_citing=True,
+                                            restrict_cited=restrict_cited)
+                    if graph.nnz == 0:
+                        continue
+                    ranked = matrix.rank(graph, algorithm)
                 else:
-                    # self.log.debug("Calculating graph for %s in %s" %
-                    #               (article_celex,year))
-                    sq = self._query_cites(article, sameas, restrict_citing,
+                    sq = self._query_cites(article, sameas, True,
                                            restrict_cited, year)
-                    links = store.select(sq, format="python")
-                    graph = self.eval_build_nx_graph(links)
-                    self._graph_cache[(article, year, restrict_cited)] = graph
-                    self.log.debug("      Citegraph for %s in %s has %s edges, %s nodes" %
-                                   (article_celex, year, len(graph.edges()),
-                                    len(graph.nodes())))
-
-                if len(graph.nodes()) == 0:
-                    continue
-
-                ranked = self.eval_rank_graph(graph, algorithm)
-                result_by_years.append({})
-                for result, score in ranked:
-                    result_by_years[-1][result] = score
+                    graph = self.eval_build_nx_graph(store.select(sq, format="python"))
+                    if len(graph.nodes()) == 0:
+                        continue
+                    ranked = self.eval_rank_graph(graph, algorithm)
+                result_by_years.append(dict(ranked))
 
             if age_compensation:
                 compensated_ranking = {}
@@ -912,7 +1099,7 @@ SELECT DISTINCT ?subj ?pred ?obj ?celexnum WHERE {
         elif algorithm == "hits":
             ranked = hits(graph, max_iter=10000)[1]  # 0: hubs, 1: authorities
         elif algorithm == "indegree":
-            ranked = graph.in_degree()
+            ranked = dict(graph.in_degree())
         else:
             self.log.error(
                 "Unknown ranking algorithm %s specified" % algorithm)
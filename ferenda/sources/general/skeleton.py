@@ -125,8 +125,7 @@ class Skeleton(DocumentRepository):
                 skelbase = repo.basefile_from_uri(repo)
                 if skelbase:
                     skel = repo.triples_from_uri(o)  # need to impl
-                    with self.store.open_distilled(skelbase, "wb") as fp:
-                        fp.write(skel.serialize(format="pretty-xml"))
+                    self.store.write_distilled(skelbase, skel)
 
                     self.log.info("Created skel for %s" % o)
         return True
@@ -7,7 +7,7 @@ import os
 
 from bs4 import BeautifulSoup
 from docutils.core import publish_string
-from rdflib import URIRef, Graph, Literal, Namespace
+from rdflib import URIRef, Literal, Namespace
 from rdflib.namespace import DCTERMS, RDF
 OLO = Namespace("http://purl.org/ontology/olo/core#")
 PROV = Namespace("http://www.w3.org/ns/prov#")
@@ -168,8 +168,7 @@ class Static(DocumentRepository):
         res = {}
         for basefile in self.store.list_basefiles_for("generate"):
             uri = self.canonical_uri(basefile)
-            g = Graph()
-            g.parse(self.store.distilled_path(basefile))
+            g = self.store.read_distilled(basefile)
             # only return those files that have olo:index metadata, in
             # that order
             if g.value(URIRef(uri), OLO['index']):
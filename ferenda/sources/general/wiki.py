@@ -4,6 +4,8 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 # system
+import hashlib
+import json
 import re
 import os
 
@@ -15,6 +17,7 @@ import requests
 # mine
 from ferenda import DocumentRepository, DocumentStore
 from ferenda import util
+from ferenda.errors import ConfigurationError
 from ferenda.sources.general import Keyword
 # from keywords import Keyword
 
@@ -93,66 +96,82 @@ class MediaWiki(DocumentRepository):
     def download(self, basefile=None):
 
         def write_doc(basefile, page_el):
-            writefile = False
             p = self.store.downloaded_path(basefile)
-            newcontent = etree.tostring(page_el, encoding="utf-8")
-            if not os.path.exists(p):
-                writefile = True
-            else:
-                oldcontent = util.readfile(p, "rb")
-                if newcontent != oldcontent:
-                    writefile = True
-            if writefile:
+            newcontent = etree.tostring(page_el, encoding="utf-8", with_tail=False)
+            digest = hashlib.md5(newcontent).hexdigest()
+            if basefile not in digests and os.path.exists(p):
+                # no recorded digest (eg. the first time around), so
+                # compare with what we've got on disk once
+                digests[basefile] = hashlib.md5(util.readfile(p, "rb")).hexdigest()
+            if digests.get(basefile) != digest or not os.path.exists(p):
                 util.ensure_dir(p)
                 with open(p, "wb") as fp:
                     fp.write(newcontent)
                     self.log.info("%s: extracting from XML dump" % basefile)
-            if basefile in basefiles:
-                del basefiles[basefiles.index(basefile)]
+                digests[basefile] = digest
+            basefiles.discard(basefile)
+
+        def page_basefile(page_el):
+            MW_NS = "{%s}" % etree.QName(page_el).namespace
+            basefile = page_el.find(MW_NS + "title").text
+            if basefile == "Huvudsida":  # FIXME: generalize/make configurable
+                return None
+            # skip redirecting pages entirely
+            if page_el.find(MW_NS+"redirect") is not None:
+                return None
+            if ":" in basefile and basefile.split(":")[0] in wikinamespaces:
+                (namespace, localtitle) = basefile.split(":", 1)
+                if namespace not in self.config.mediawikinamespaces:
+                    return None
+                basefile = localtitle
+            return basefile
 
         if basefile:
             return self.download_single(basefile)
         if self.config.mediawikidump:
             xmldumppath = self.store.path('dump', 'downloaded', '.xml')
-            resp = requests.get(self.config.mediawikidump)
-            self.log.debug("Loaded XML dump from %s" % self.config.mediawikidump)
+            resp = requests.get(self.config.mediawikidump, stream=True)
             from ferenda.documentstore import _open
             with _open(xmldumppath, mode="wb") as fp:
-                fp.write(resp.content)
-            xml = etree.parse(xmldumppath)
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    fp.write(chunk)
+            self.log.debug("Loaded XML dump from %s" % self.config.mediawikidump)
         else:
             raise ConfigurationError("config.mediawikidump not set")
 
-        MW_NS = "{%s}" % xml.getroot().nsmap[None]
-        wikinamespaces = []
-        for ns_el in xml.findall("//" + MW_NS + "namespace"):
-            wikinamespaces.append(ns_el.text)
-
         # Get list of existing basefiles - if any of those
         # does not appear in the XML dump, remove them afterwards
-        basefiles = list(self.store.list_basefiles_for("parse"))
-        total = written = 0
-        deferred = {}
-        for page_el in xml.findall(MW_NS + "page"):
-            basefile = page_el.find(MW_NS + "title").text
-            if basefile == "Huvudsida":  # FIXME: generalize/make configurable
-                continue
-            # skip redirecting pages entirely
-            if page_el.find(MW_NS+"redirect") is not None:
-                continue
-            if ":" in basefile and basefile.split(":")[0] in wikinamespaces:
-                (namespace, localtitle) = basefile.split(":", 1)
-                if namespace not in self.config.mediawikinamespaces:
-                    continue
-                basefile = localtitle
-            write_doc(basefile, page_el)
-
-        if 'dump' in basefiles:  # never remove
-            del basefiles[basefiles.index('dump')]
+        basefiles = set(self.store.list_basefiles_for("parse"))
+        digestpath = self.store.resourcepath("dumpdigests.json")
+        if os.path.exists(digestpath):
+            with open(digestpath) as fp:
+                digests = json.load(fp)
+        else:
+            digests = {}
+        wikinamespaces = []
+        # walk the dump one element at a time and throw away each page
+        # when we're done with it, so that memory use doesn't depend
+        # on the size of the dump
+        for event, el in etree.iterparse(xmldumppath):
+            localname = etree.QName(el).localname
+            if localname == "namespace":
+                wikinamespaces.append(el.text)
+            elif localname == "page":
+                basefile = page_basefile(el)
+                if basefile:
+                    write_doc(basefile, el)
+                el.clear()
+                while el.getprevious() is not None:
+                    del el.getparent()[0]
+
+        basefiles.discard('dump')  # never remove
         for b in basefiles:
             self.log.info("%s: removing stale document" % b)
             util.robust_remove(self.store.downloaded_path(b))
-        # self.log.info("Examined %s documents, wrote %s of them" % (total, written))
+            digests.pop(b, None)
+        util.ensure_dir(digestpath)
+        with open(digestpath, "w") as fp:
+            json.dump(digests, fp)
 
     def download_single(self, basefile):
         # download a single term, for speed
@@ -77,6 +77,11 @@ class EURLex(DocumentRepository):
     namespaces = ['rdf', 'rdfs', 'xsd', 'dcterms', 'prov',
                   ('cdm', str(CDM))]
     sparql_annotations = None
+    webservice_endpoint = "https://eur-lex.europa.eu/EURLexWebService"
+    sparql_endpoint = "http://publications.europa.eu/webapi/rdf/sparql"
+    cellar_base = "http://publications.europa.eu/resource/cellar/"
+    language_base = "http://publications.europa.eu/resource/authority/language/"
+    manifestation_types = ("xhtml", "fmx4", "html", "pdf", "pdfa1a", "unknown")
     
     @classmethod
     def get_default_options(cls):
@@ -85,6 +90,11 @@ class EURLex(DocumentRepository):
         opts['curl'] = True  # if True, the web service is called
                               # with command-line curl, not the
                               # requests module (avoids timeouts)
+        # manifestations are found for a whole result page at a time,
+        # after which the documents can be fetched concurrently from
+        # the Cellar
+        opts['downloadworkers'] = 4
+        opts['downloadsperhost'] = 4
         return opts
 
     def dump_graph(self, celexid, graph):
@@ -96,7 +106,7 @@ class EURLex(DocumentRepository):
         # this is the only soap template we'll need, so we include it
         # verbatim to avoid having a dependency on a soap module like
         # zeep.
-        endpoint = 'https://eur-lex.europa.eu/EURLexWebService'
+        endpoint = self.webservice_endpoint
         envelope = """<soap-env:Envelope xmlns:soap-env="http://www.w3.org/2003/05/soap-envelope">
   <soap-env:Header>
     <wsse:Security xmlns:wsse="http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd">
@@ -192,7 +202,7 @@ class EURLex(DocumentRepository):
         if isinstance(target_languages, str):
             target_languages = target_languages.split()
 
-        cellarurl = "http://publications.europa.eu/resource/cellar/%s?language=%s" % (cellarid, target_languages[0])
+        cellarurl = "%s%s?language=%s" % (self.cellar_base, cellarid, target_languages[0])
         graph = self.get_treenotice_graph(cellarurl, celexid)
         if graph is None:
             return None, None, None, None
@@ -259,10 +269,7 @@ class EURLex(DocumentRepository):
                     
                     # Gissa typ från URL
                     if not mtype:
-                        if ".xhtml" in man_str: mtype = "xhtml"
-                        elif ".fmx4" in man_str: mtype = "fmx4"
-                        elif ".pdf" in man_str: mtype = "pdf"
-                        else: mtype = "unknown"
+                        mtype = self.guess_manifestation_type(man_str)
 
                     # Välj URL
                     selected_url = None
@@ -286,25 +293,123 @@ class EURLex(DocumentRepository):
                         candidateitem[mtype] = selected_url
 
                 # Prioritera format och returnera
-                if candidateitem:
-                    for t in ("xhtml", "fmx4", "html", "pdf", "pdfa1a", "unknown"):
-                        if t in candidateitem:
-                            url = candidateitem[t]
-                            
-                            mimetype = "application/octet-stream"
-                            if t == "xhtml": mimetype = "application/xhtml+xml"
-                            elif t == "fmx4": mimetype = "application/xml"
-                            elif t == "pdf": mimetype = "application/pdf"
-                            elif t == "html": mimetype = "text/html"
-                            
-                            self.log.info("%s: Has manifestation %s (%s) in language %s (URL: %s)" % (celexid, t, mimetype, lang, url))
-                            self.dump_graph(celexid, graph) 
-                            return lang, t, mimetype, url
+                chosen = self.choose_manifestation(celexid, lang, candidateitem)
+                if chosen:
+                    self.dump_graph(celexid, graph) 
+                    return chosen
         
         self.log.warning("%s: Failed to find manifestation for %s" % (celexid, target_languages))
         self.dump_graph(celexid, graph)
         return None, None, None, None
 
+    def choose_manifestation(self, celexid, lang, candidateitem):
+        """Given *candidateitem*, a dict mapping manifestation types to
+        URLs for the expression of *celexid* in *lang*, pick the
+        preferred type according to ``manifestation_types``. Returns a
+        (lang, type, mimetype, url) tuple, or None if none of the
+        types are usable."""
+        for t in self.manifestation_types:
+            if t in candidateitem:
+                url = candidateitem[t]
+
+                mimetype = "application/octet-stream"
+                if t == "xhtml": mimetype = "application/xhtml+xml"
+                elif t == "fmx4": mimetype = "application/xml"
+                elif t == "pdf": mimetype = "application/pdf"
+                elif t == "html": mimetype = "text/html"
+
+                self.log.info("%s: Has manifestation %s (%s) in language %s (URL: %s)" % (celexid, t, mimetype, lang, url))
+                return lang, t, mimetype, url
+
+    @staticmethod
+    def guess_manifestation_type(url):
+        if ".xhtml" in url: return "xhtml"
+        elif ".fmx4" in url: return "fmx4"
+        elif ".pdf" in url: return "pdf"
+        else: return "unknown"
+
+    def find_manifestations(self, works):
+        """Find the preferred manifestation for each of *works* (a list
+        of (cellarid, celexid) tuples) using a single query to the
+        Cellar SPARQL endpoint, instead of fetching the tree notice of
+        each work like :py:meth:`find_manifestation` does.
+
+        Returns a dict mapping celexid to (lang, type, mimetype, url)
+        tuples. Works for which no manifestation was found (or all
+        works, if the query failed) are left out.
+        """
+        if not works:
+            return {}
+        target_languages = self.config.languages
+        if isinstance(target_languages, str):
+            target_languages = target_languages.split()
+        celexids = dict((self.cellar_base + cellarid, celexid) for (cellarid, celexid) in works)
+        query = """PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
+PREFIX owl: <http://www.w3.org/2002/07/owl#>
+SELECT ?work ?lang ?manif ?type ?item ?itemalias WHERE {
+  VALUES ?work { %s }
+  VALUES ?lang { %s }
+  ?expr cdm:expression_belongs_to_work ?work ;
+        cdm:expression_uses_language ?lang .
+  ?manif cdm:manifestation_manifests_expression ?expr .
+  OPTIONAL { ?manif cdm:type ?type }
+  OPTIONAL { ?item cdm:item_belongs_to_manifestation ?manif .
+             OPTIONAL { ?item owl:sameAs ?itemalias } }
+}""" % (" ".join("<%s>" % uri for uri in sorted(celexids)),
+        " ".join("<%s%s>" % (self.language_base, lang.upper()) for lang in target_languages))
+        try:
+            resp = util.robust_fetch(self.session.post, self.sparql_endpoint, self.log,
+                                     data={'query': query},
+                                     headers={'Accept': 'application/sparql-results+json'},
+                                     timeout=60)
+            rows = resp.json()['results']['bindings']
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            self.log.warning("Could not find manifestations of %s works using SPARQL (%s), "
+                             "fetching tree notices instead" % (len(works), e))
+            return {}
+
+        # celexid -> lang -> manifestation -> {'type': ..., 'items': {item: aliases}}
+        found = {}
+        for row in rows:
+            celexid = celexids.get(row['work']['value'])
+            if not celexid:
+                continue
+            lang = row['lang']['value'].rsplit("/", 1)[-1].lower()
+            manifestation = found.setdefault(celexid, {}).setdefault(lang, {}).setdefault(
+                row['manif']['value'], {'type': None, 'items': {}})
+            if 'type' in row:
+                manifestation['type'] = row['type']['value']
+            if 'item' in row:
+                aliases = manifestation['items'].setdefault(row['item']['value'], set())
+                if 'itemalias' in row:
+                    aliases.add(row['itemalias']['value'])
+
+        res = {}
+        for celexid, languages in found.items():
+            for lang in target_languages:
+                if lang not in languages:
+                    continue
+                candidateitem = {}
+                for uri, manifestation in sorted(languages[lang].items()):
+                    mtype = manifestation['type'] or self.guess_manifestation_type(uri)
+                    items = sorted(manifestation['items'])
+                    if not items:
+                        # Fallback: Använd manifestationen direkt
+                        candidateitem[mtype] = uri
+                        continue
+                    best_item = items[0]
+                    for item in items:
+                        if any(alias.endswith(".xml") and not alias.endswith(".doc.xml")
+                               for alias in manifestation['items'][item]):
+                            best_item = item
+                            break
+                    candidateitem[mtype] = best_item
+                chosen = self.choose_manifestation(celexid, lang, candidateitem)
+                if chosen:
+                    res[celexid] = chosen
+                    break
+        return res
+
     
     def download_single(self, basefile, url=None):
         if url is None:
@@ -350,11 +455,13 @@ class EURLex(DocumentRepository):
                 self.log.info("Total hits: %s" % totalhits)
             results = tree.findall(".//{http://eur-lex.europa.eu/search}result")
             self.log.info("Page %s: %s results" % (page, len(results)))
+            works = []
             for idx, result in enumerate(results):
                 processedhits += 1
                 cellarid = result.find(".//{http://eur-lex.europa.eu/search}reference").text
                 cellarid = re.split("[:_]", cellarid)[2]
                 celex = result.find(".//{http://eur-lex.europa.eu/search}ID_CELEX")[0].text
+                title = None
                 try:
                     title = result.find(".//{http://eur-lex.europa.eu/search}EXPRESSION_TITLE")[0].text
                 except TypeError:
@@ -365,7 +472,15 @@ class EURLex(DocumentRepository):
                     continue
                 celex = match.group(1)
                 self.log.debug("%3s: %s %.55s %s" % (idx + 1, celex, title, cellarid))
-                lang, filetype, mimetype, url = self.find_manifestation(cellarid, celex)
+                works.append((cellarid, celex, title))
+            # one query for the whole page, then a tree notice for
+            # each work that it couldn't resolve
+            manifestations = self.find_manifestations([(cellarid, celex) for (cellarid, celex, title) in works])
+            for (cellarid, celex, title) in works:
+                if celex in manifestations:
+                    lang, filetype, mimetype, url = manifestations[celex]
+                else:
+                    lang, filetype, mimetype, url = self.find_manifestation(cellarid, celex)
                 if filetype:
                     # FIXME: This is an ugly way of making sure the downloaded
                     # file gets the right suffix (due to
@@ -374,7 +489,10 @@ class EURLex(DocumentRepository):
                     downloaded_path = self.store.path(celex, 'downloaded', '.'+filetype)
                     if not os.path.exists(downloaded_path):
                         util.writefile(downloaded_path, "")
-                    yield celex, url
+                    params = {'uri': url}
+                    if title:
+                        params['title'] = title
+                    yield celex, params
             page += 1
             done = processedhits >= totalhits
             if not done:
@@ -8,6 +8,7 @@ hämtas fran DV:s (ickepublika) FTP-server, eller fran lagen.nu."""
 # system libraries (incl six-based renames)
 from bz2 import BZ2File
 from collections import defaultdict
+from concurrent import futures
 from datetime import datetime, timedelta, date
 from ftplib import FTP
 from io import BytesIO
@@ -18,8 +19,10 @@ import itertools
 import logging
 import os
 import re
+import shutil
 import tempfile
 import zipfile
+import zlib
 
 # 3rdparty libs
 from ferenda.requesthandler import UnderscoreConverter
@@ -99,6 +102,48 @@ class KeywordContainsDescription(errors.FerendaException):
 class DuplicateReferatDoc(errors.DocumentRemovedError):
     pass
 
+class ExtractionPool(object):
+    """Runs zip extraction jobs in a thread pool. Jobs that touch the
+    same keys (typically the path of a downloaded file) run in the
+    order they were submitted, so that eg. a later BYTUT or TABORT
+    member always acts on what an earlier member created."""
+
+    def __init__(self, workers):
+        self.executor = futures.ThreadPoolExecutor(max_workers=max(1, workers))
+        self.pending = {}
+        self.futures = []
+
+    def submit(self, keys, func, *args):
+        after = [self.pending[k][0] for k in keys if k in self.pending]
+
+        def run():
+            # all jobs in after were submitted before this one, and
+            # the executor starts jobs in order, so this can't deadlock
+            for f in after:
+                f.result()
+            return func(*args)
+        future = self.executor.submit(run)
+        for k in keys:
+            self.pending[k] = (future, func, args)
+        self.futures.append(future)
+        return future
+
+    def pending_job(self, key):
+        """Returns ``(func, args)`` for the latest job submitted for
+        *key*, or None if there is no such job or it has finished."""
+        if key in self.pending and not self.pending[key][0].done():
+            return self.pending[key][1:]
+        return None
+
+    def wait(self):
+        """Wait for all submitted jobs, re-raising the first error."""
+        try:
+            for f in self.futures:
+                f.result()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
         
 class DV(SwedishLegalSource):
 
@@ -192,6 +237,7 @@ class DV(SwedishLegalSource):
         opts['ftpuser'] = ''  # None  # Doesn't work great since Defaults is a typesource...
         opts['ftppassword'] = ''  # None
         opts['mapfiletype'] = 'apache' # or nginx
+        opts['extractworkers'] = 4  # threads used for unpacking zip files
         return opts
 
     def canonical_uri(self, basefile, version=None):
@@ -209,8 +255,7 @@ class DV(SwedishLegalSource):
         if not os.path.exists(p):
             raise ValueError("No distilled file for basefile %s at %s" % (basefile, p))
 
-        with self.store.open_distilled(basefile) as fp:
-            g = Graph().parse(data=fp.read())
+        g = self.store.read_distilled(basefile)
         for uri, rdftype in g.subject_objects(predicate=RDF.type):
             if rdftype in (RPUBL.Rattsfallsreferat,
                            RPUBL.Rattsfallsnotis):
@@ -403,14 +448,25 @@ class DV(SwedishLegalSource):
         # etc), then in numerics-only order.
         mykey = lambda v: (-len(v.split(os.sep)), "".join(c for c in v if c.isnumeric()))
         zipfiles = sorted(util.list_dirs(zippath, suffix=".zip"), key=mykey)
-        for zipfilename in zipfiles:
-            self.log.info("%s: Processing..." % zipfilename)
-            self.process_zipfile(zipfilename)
+        # archives are read in order, but unpacked concurrently
+        pool = ExtractionPool(self.config.extractworkers)
+        try:
+            for zipfilename in zipfiles:
+                self.log.info("%s: Processing..." % zipfilename)
+                self.process_zipfile(zipfilename, pool)
+        finally:
+            pool.wait()
 
     @action
-    def process_zipfile(self, zipfilename):
-        """Extract a named zipfile into appropriate documents"""
-        removed = replaced = created = untouched = 0
+    def process_zipfile(self, zipfilename, pool=None):
+        """Extract a named zipfile into appropriate documents.
+
+        Members are unpacked by jobs in a :py:class:`ExtractionPool`
+        (if none is given, a new one is created and waited for before
+        returning). Members whose size and CRC matches the already
+        downloaded file are not unpacked at all.
+        """
+        counts = {'removed': 0, 'replaced': 0, 'created': 0, 'untouched': 0}
         if not hasattr(self, 'downloadcount'):
             self.downloadcount = 0
         try:
@@ -418,31 +474,29 @@ class DV(SwedishLegalSource):
         except zipfile.BadZipfile as e:
             self.log.error("%s is not a valid zip file: %s" % (zipfilename, e))
             return
-        for bname in zipf.namelist():
-            if not isinstance(bname, str):  # py2
-                # Files in the zip file are encoded using codepage 437
-                name = bname.decode('cp437')
-            else:
-                name = bname
-            if "_notis_" in name:
-                base, suffix = os.path.splitext(name)
-                segments = base.split("_")
-                coll, year = segments[0], segments[1]
-                # Extract this doc as a temp file -- we won't be
-                # creating an actual permanent file, but let
-                # extract_notis extract individual parts of this file
-                # to individual basefiles
-                fp = tempfile.NamedTemporaryFile("wb", suffix=suffix, delete=False)
-                filebytes = zipf.read(bname)
-                fp.write(filebytes)
-                fp.close()
-                tempname = fp.name
-                r = self.extract_notis(tempname, year, coll)
-                assert r[0] + r[1], "No notices extracted from %s in %s" % (bname, zipfilename)
-                created += r[0]
-                untouched += r[1]
-                os.unlink(tempname)
-            else:
+        ownpool = pool is None
+        if ownpool:
+            pool = ExtractionPool(self.config.extractworkers)
+        jobs = []
+        notisjobs = []
+        try:
+            for zi in zipf.infolist():
+                bname = zi.filename
+                if not isinstance(bname, str):  # py2
+                    # Files in the zip file are encoded using codepage 437
+                    name = bname.decode('cp437')
+                else:
+                    name = bname
+                if "_notis_" in name:
+                    base, suffix = os.path.splitext(name)
+                    segments = base.split("_")
+                    coll, year = segments[0], segments[1]
+                    # notis files for the same year must be extracted
+                    # in order, see extract_notis.find_month_in_previous
+                    notisjobs.append(pool.submit([("notis", coll, year)],
+                                                 self._extract_notis_member,
+                                                 zipf, zi, zipfilename, year, coll))
+                    continue
                 name = os.path.split(name)[1]
                 if 'BYTUT' in name:
                     m = self.re_bytut_malnr.match(name)
@@ -465,39 +519,50 @@ class DV(SwedishLegalSource):
                     basefile = basefile.strip()  # to avoid spurious trailing spaces in the filename before the file suffix
 
                     outfile = self.store.path(basefile, 'downloaded', suffix)
+                    # if an earlier member is still being unpacked to
+                    # or removed from the same file, we can't look at
+                    # the file yet
+                    pending = pool.pending_job(outfile)
 
                     if "TABORT" in name:
                         self.log.info("%s: Removing" % basefile)
-                        if not os.path.exists(outfile):
+                        if not pending and not os.path.exists(outfile):
                             self.log.warning("%s: %s doesn't exist" % (basefile,
                                                                        outfile))
                         else:
-                            os.unlink(outfile)
-                        removed += 1
+                            jobs.append(pool.submit([outfile], util.robust_remove,
+                                                    outfile))
+                        counts['removed'] += 1
                     elif "BYTUT" in name:
-                        self.log.info("%s: download OK (replacing with new)" % basefile)
-                        if not os.path.exists(outfile):
+                        if not pending and not os.path.exists(outfile):
                             self.log.warning("%s: %s doesn't exist" %
                                              (basefile, outfile))
-                        replaced += 1
+                        elif not pending and self._same_as_member(outfile, zi):
+                            self.log.debug("%s: BYTUT file is unchanged" % basefile)
+                            counts['untouched'] += 1
+                            continue
+                        self.log.info("%s: download OK (replacing with new)" % basefile)
+                        counts['replaced'] += 1
                     else:
                         self.log.info("%s: download OK (unpacking)" % basefile)
-                        if os.path.exists(outfile):
-                            untouched += 1
+                        if pending:
+                            # only skip if the pending job unpacks
+                            # this very content, not if it eg. removes
+                            # the file
+                            (func, args) = pending
+                            exists = (func == self._extract_member and
+                                      args[1].CRC == zi.CRC and
+                                      args[1].file_size == zi.file_size)
+                        else:
+                            exists = os.path.exists(outfile)
+                        if exists:
+                            counts['untouched'] += 1
                             continue
                         else:
-                            created += 1
+                            counts['created'] += 1
                     if not "TABORT" in name:
-                        data = zipf.read(bname)
-                        with self.store.open(basefile, "downloaded", suffix, "wb") as fp:
-                            fp.write(data)
-
-                        # Make the unzipped files have correct timestamp
-                        zi = zipf.getinfo(bname)
-                        dt = datetime(*zi.date_time)
-                        ts = mktime(dt.timetuple())
-                        os.utime(outfile, (ts, ts))
-
+                        jobs.append(pool.submit([outfile], self._extract_member,
+                                                zipf, zi, basefile, suffix))
                         self.downloadcount += 1
                     # fix HERE
                     if ('downloadmax' in self.config and
@@ -507,8 +572,65 @@ class DV(SwedishLegalSource):
                 else:
                     self.log.warning('Could not interpret filename %r i %s' %
                                      (name, os.path.relpath(zipfilename)))
+        finally:
+            # once every member is handled, close the zip file and
+            # report what we did
+            pool.submit([], self._finish_zipfile, zipf, zipfilename,
+                        counts, jobs, notisjobs)
+            if ownpool:
+                pool.wait()
+
+    def _same_as_member(self, outfile, zi):
+        # compare using the size and CRC from the zip directory, so
+        # that the member itself doesn't need to be decompressed
+        if os.path.getsize(outfile) != zi.file_size:
+            return False
+        crc = 0
+        with open(outfile, "rb") as fp:
+            for chunk in iter(lambda: fp.read(64 * 1024), b""):
+                crc = zlib.crc32(chunk, crc)
+        return (crc & 0xffffffff) == zi.CRC
+
+    def _extract_member(self, zipf, zi, basefile, suffix):
+        # stream the member straight to its final location
+        with zipf.open(zi) as src:
+            with self.store.open(basefile, "downloaded", suffix, "wb") as fp:
+                shutil.copyfileobj(src, fp)
+        # Make the unzipped files have correct timestamp
+        dt = datetime(*zi.date_time)
+        ts = mktime(dt.timetuple())
+        os.utime(self.store.path(basefile, 'downloaded', suffix), (ts, ts))
+
+    def _extract_notis_member(self, zipf, zi, zipfilename, year, coll):
+        # Extract this doc as a temp file -- we won't be
+        # creating an actual permanent file, but let
+        # extract_notis extract individual parts of this file
+        # to individual basefiles
+        suffix = os.path.splitext(zi.filename)[1]
+        fp = tempfile.NamedTemporaryFile("wb", suffix=suffix, delete=False)
+        with zipf.open(zi) as src:
+            shutil.copyfileobj(src, fp)
+        fp.close()
+        tempname = fp.name
+        try:
+            r = self.extract_notis(tempname, year, coll)
+        finally:
+            os.unlink(tempname)
+        assert r[0] + r[1], "No notices extracted from %s in %s" % (zi.filename, zipfilename)
+        return r
+
+    def _finish_zipfile(self, zipf, zipfilename, counts, jobs, notisjobs):
+        # jobs were submitted before this one, so waiting for them
+        # can't deadlock (see ExtractionPool.submit)
+        futures.wait(jobs + notisjobs)
+        zipf.close()
+        for job in notisjobs:
+            created, untouched = job.result()
+            counts['created'] += created
+            counts['untouched'] += untouched
         self.log.debug('Processed %s, created %s, replaced %s, removed %s, untouched %s files' %
-                       (os.path.relpath(zipfilename), created, replaced, removed, untouched))
+                       (os.path.relpath(zipfilename), counts['created'],
+                        counts['replaced'], counts['removed'], counts['untouched']))
 
     def extract_notis(self, docfile, year, coll="HDO"):
         def find_month_in_previous(basefile):
@@ -1586,8 +1708,7 @@ class DV(SwedishLegalSource):
         if not os.path.exists(p):
             raise ValueError("No distilled file for basefile %s at %s" % (basefile, p))
 
-        with self.store.open_distilled(basefile) as fp:
-            g = Graph().parse(data=fp.read())
+        g = self.store.read_distilled(basefile)
         uri = self.canonical_uri(basefile)
         return str(g.value(URIRef(uri), DCTERMS.identifier))
         
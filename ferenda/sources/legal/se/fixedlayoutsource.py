@@ -155,6 +155,7 @@ class FixedLayoutSource(SwedishLegalSource):
                                   workdir=intermediate_dir,
                                   images=self.config.pdfimages,
                                   convert_to_pdf=convert_to_pdf,
+                                  office_workers=self.config.officeworkers,
                                   keep_xml=keep_xml,
                                   ocr_lang=ocr_lang,
                                   legacy_tesseract=self.config.legacytesseract)
@@ -166,6 +167,7 @@ class FixedLayoutSource(SwedishLegalSource):
                                       workdir=intermediate_dir,
                                       images=self.config.pdfimages,
                                       convert_to_pdf=convert_to_pdf,
+                                      office_workers=self.config.officeworkers,
                                       keep_xml=keep_xml,
                                       ocr_lang=ocr_lang)
             else:
@@ -24,7 +24,7 @@ from bs4 import BeautifulSoup
 import requests
 import lxml.html
 import datetime
-from rdflib import RDF, Graph
+from rdflib import RDF
 from rdflib.resource import Resource
 from rdflib.namespace import DCTERMS, SKOS
 from layeredconfig import LayeredConfig, Defaults
@@ -177,8 +177,9 @@ class MyndFskrBase(FixedLayoutSource):
 
     def remote_url(self, basefile):
         # if we already know the remote url, don't go to the landing page
-        if os.path.exists(self.store.documententry_path(basefile)):
-            entry = DocumentEntry(self.store.documententry_path(basefile))
+        entrypath = self.store.documententry_path(basefile)
+        if DocumentEntry.backend_for(entrypath).exists(entrypath):
+            entry = DocumentEntry(entrypath)
             return entry.orig_url
         else:
             return super(MyndFskrBase, self).remote_url(basefile)
@@ -830,8 +831,7 @@ class MyndFskrBase(FixedLayoutSource):
         if not os.path.exists(p):
             raise ValueError("No distilled file for basefile %s at %s" % (basefile, p))
 
-        with self.store.open_distilled(basefile) as fp:
-            g = Graph().parse(data=fp.read())
+        g = self.store.read_distilled(basefile)
         uri = self.canonical_uri(basefile)
         return str(g.value(URIRef(uri), DCTERMS.identifier))
 
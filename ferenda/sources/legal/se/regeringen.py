@@ -702,6 +702,7 @@ class Regeringen(Offtryck):
                         workdir=intermediatedir,
                         images=self.config.pdfimages,
                         convert_to_pdf=convert_to_pdf,
+                        office_workers=self.config.officeworkers,
                         keep_xml=keep_xml,
                         textdecoder=decoding_class(decoder_arg))
         if pdf.is_empty():
@@ -288,6 +288,7 @@ class Riksdagen(Offtryck, FixedLayoutSource):
                                      workdir=intermediate_dir,
                                      images=self.config.pdfimages,
                                      convert_to_pdf=convert_to_pdf,
+                                     office_workers=self.config.officeworkers,
                                      keep_xml=keep_xml)
             except (errors.PDFFileIsEmpty, errors.ExternalCommandError) as e:
                 if isinstance(e, errors.ExternalCommandError):
@@ -303,6 +304,7 @@ class Riksdagen(Offtryck, FixedLayoutSource):
                                      workdir=intermediate_dir,
                                      images=self.config.pdfimages,
                                      convert_to_pdf=convert_to_pdf,
+                                     office_workers=self.config.officeworkers,
                                      keep_xml=keep_xml,
                                      ocr_lang="swe")
                 # now the intermediate path endswith .hocr.html.bz2, not .xml.bz2 
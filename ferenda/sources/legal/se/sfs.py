@@ -981,8 +981,8 @@ class SFS(Trips):
                 # updated this document (since we do it all the time)
                 basefile = str(attributes['SFS-nummer'])
                 entrypath = self.store.documententry_path(basefile)
-                if os.path.exists(entrypath):
-                    entry = DocumentEntry(self.store.documententry_path(basefile))
+                if DocumentEntry.backend_for(entrypath).exists(entrypath):
+                    entry = DocumentEntry(entrypath)
                     if entry.orig_updated:
                         issued = entry.orig_updated.date()
             if not issued:
@@ -1405,7 +1405,7 @@ class SFS(Trips):
                 (self.find_definitions, False))
 
     def generate_set_params(self, basefile, version, params):
-        resource = Graph().parse(self.store.distilled_path(basefile, version)).resource(self.canonical_uri(basefile))
+        resource = self.store.read_distilled(basefile, version).resource(self.canonical_uri(basefile))
         upph = resource.value(RPUBL.upphavandedatum)
         if upph and upph.value < date.today():
             params['expired'] = 'true'
@@ -1672,7 +1672,7 @@ class SFS(Trips):
 
         # 7. all forfattnigskommentar
         canonical_uri = self.canonical_uri(basefile)
-        g = Graph().parse(self.store.distilled_path(basefile))
+        g = self.store.read_distilled(basefile)
         title = str(g.value(URIRef(self.canonical_uri(basefile)), DCTERMS.title))
         tempuri = self.temp_sfs_uri(title)
         tempsfs = tempuri.rsplit("/", 1)[1]
@@ -2019,8 +2019,7 @@ class SFS(Trips):
                     # the metadata hasn't been placed in the triple store yet. but maybe it exists on disk in a RDF file?
                     title = None
                     if os.path.exists(self.store.distilled_path(basefile)):
-                        with self.store.open_distilled(basefile, "rb") as fp:
-                            g = Graph().parse(fp)
+                        g = self.store.read_distilled(basefile)
                         title = g.value(URIRef(self.canonical_uri(basefile)), DCTERMS.title)
                     if not title:
                         title = "SFS %s" % parts['law']
@@ -16,12 +16,15 @@ from cached_property import cached_property
 import ast
 import codecs
 import collections
+import json
 import logging
+import mmap
 import operator
 import os
 import re
 import shutil
 import sys
+import tempfile
 import unicodedata
 
 # 3rd party
@@ -109,6 +112,86 @@ def lazyread(f):
         fp = Lazyfile(p)
         return fp
     return wrapper
+
+class ParseOptions(object):
+    """Read-only, dict-like view of a compiled ``options/options.py``
+    file.
+
+    The python literal source is compiled (once, or whenever it
+    changes) into a file with one ``key<TAB>value`` line per entry,
+    both parts JSON-encoded and the lines sorted by key. Lookups
+    memory-map that file and do a binary search over it, so that no
+    process ever needs to eval or keep the entire mapping in memory.
+
+    :param sourcefile: The python literal file with the options
+    :param indexfile: Where to store the compiled lookup file
+    """
+
+    def __init__(self, sourcefile, indexfile):
+        if not util.outfile_is_newer([sourcefile], indexfile):
+            self.compile(sourcefile, indexfile)
+        self.size = os.path.getsize(indexfile)
+        if self.size:
+            with open(indexfile, "rb") as fp:
+                self.map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.map = b""  # mmap can't map empty files
+
+    @staticmethod
+    def encodekey(key):
+        if isinstance(key, tuple):
+            key = list(key)
+        return json.dumps(key, sort_keys=True).encode("utf-8")
+
+    @classmethod
+    def compile(cls, sourcefile, indexfile):
+        with codecs.open(sourcefile, encoding="utf-8") as fp:
+            options = ast.literal_eval(fp.read())
+        lines = sorted(cls.encodekey(k) + b"\t" + json.dumps(v).encode("utf-8")
+                       for k, v in options.items())
+        util.ensure_dir(indexfile)
+        # several processes may compile at the same time, so each
+        # writes to a file of its own before moving it into place
+        fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(indexfile))
+        with os.fdopen(fd, "wb") as fp:
+            for line in lines:
+                fp.write(line + b"\n")
+        # other processes might be reading the old index through
+        # their own mmap, so replace the file instead of rewriting it
+        os.replace(tmpfile, indexfile)
+
+    def _lookup(self, key):
+        # find the first line whose key is >= the wanted key
+        key = self.encodekey(key)
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = self.map.rfind(b"\n", 0, mid) + 1
+            end = self.map.find(b"\n", start)
+            if self.map[start:self.map.find(b"\t", start, end)] < key:
+                lo = end + 1
+            else:
+                hi = start
+        if lo < self.size:
+            end = self.map.find(b"\n", lo)
+            linekey, value = self.map[lo:end].split(b"\t", 1)
+            if linekey == key:
+                return True, json.loads(value.decode("utf-8"))
+        return False, None
+
+    def get(self, key, default=None):
+        found, value = self._lookup(key)
+        return value if found else default
+
+    def __getitem__(self, key):
+        found, value = self._lookup(key)
+        if not found:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self._lookup(key)[0]
+
     
 class SwedishLegalHandler(RequestHandler):
 
@@ -145,7 +228,7 @@ class SwedishLegalHandler(RequestHandler):
             # remote/upstream server though) -- serve the page,
             # but make sure that status is 404
             return super(SwedishLegalHandler, self).prep_response(request, path+".404", data, contenttype, params)
-        elif os.path.exists(entrypath):
+        elif DocumentEntry.backend_for(entrypath).exists(entrypath):
             # We have the resource but cannot for some reason
             # serve it -- return 500
             entry = DocumentEntry(entrypath)
@@ -529,13 +612,27 @@ class SwedishLegalSource(DocumentRepository):
                     basefile = basefile.rsplit(".", 1)[0]
                 return basefile
 
+    _parse_options = {}
+
     @cached_property
     def parse_options(self):
         # we use a file with python literals rather than json because
-        # comments
+        # comments. But as the file is large, it's compiled into a
+        # sorted index that can be queried without loading it all.
+        #
+        # All repos read the same options file, so the index is kept
+        # in one place directly under the datadir instead of in every
+        # repo's own resource directory, and the object (with its
+        # mmap) is shared by all repos in this process -- until the
+        # options file is changed (eg. by Devel.handle_change_options).
         if self.resourceloader.exists("options/options.py"):
-            with self.resourceloader.open("options/options.py") as fp:
-                return ast.literal_eval(fp.read())
+            sourcefile = self.resourceloader.filename("options/options.py")
+            indexfile = os.sep.join([self.config.datadir, "options", "options.idx"])
+            key = (sourcefile, indexfile)
+            mtime = os.path.getmtime(sourcefile)
+            if key not in self._parse_options or self._parse_options[key][0] != mtime:
+                self._parse_options[key] = (mtime, ParseOptions(sourcefile, indexfile))
+            return self._parse_options[key][1]
         else:
             return {}
     
@@ -989,7 +1086,7 @@ class SwedishLegalSource(DocumentRepository):
         # variable. This is needed for parse-bench.py and its
         # RepoTest.createtest() method.
         if 'serializeunparsed' in self.config and self.config.serializeunparsed:
-            serialized_path = self.store.serialized_path(basefile) + ".unparsed"
+            serialized_path = self.store.serialized_path(basefile, format="json") + ".unparsed"
             serialized_path = serialized_path.replace(self.store.datadir + "/serialized", self.config.serializeunparsed + "/serialized/" + self.alias)
             with self.store._open(serialized_path, "wb") as fp:
                 r = serialize(body, format="json")
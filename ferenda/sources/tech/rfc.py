@@ -10,7 +10,7 @@ from itertools import islice
 import requests
 import requests.exceptions
 
-from rdflib import URIRef, Graph, XSD
+from rdflib import URIRef, XSD
 from rdflib.term import _PythonToXSD
 from pyparsing import Word, CaselessLiteral, Optional, nums
 
@@ -675,9 +675,7 @@ class RFC(DocumentRepository):
         # selector function for the NewsCriteria objects.
         def selector_for(category):
             def selector(entry):
-                graph = Graph()
-                with self.store.open_distilled(entry.basefile) as fp:
-                    graph.parse(data=fp.read())
+                graph = self.store.read_distilled(entry.basefile)
                 desc = Describer(graph, entry.id)
                 return desc.getrel(self.ns['dcterms'].subject) == category
             return selector
@@ -700,9 +698,7 @@ class RFC(DocumentRepository):
         from rdflib import URIRef
         items = ""
         for entry in islice(self.news_entries(), 5):
-            graph = Graph()
-            with self.store.open_distilled(entry.basefile) as fp:
-                graph.parse(data=fp.read())
+            graph = self.store.read_distilled(entry.basefile)
 
             data = {
                 'identifier': graph.value(URIRef(entry.id), self.ns['dcterms'].identifier).toPython(),
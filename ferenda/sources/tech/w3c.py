@@ -9,7 +9,7 @@ import os
 import re
 import sys
 
-from rdflib import Literal, Graph, URIRef, RDF, Namespace
+from rdflib import Literal, URIRef, RDF, Namespace
 
 from .rfc import PreambleSection
 from ferenda import Describer, DocumentRepository, FSMParser, Facet
@@ -69,8 +69,7 @@ class W3Standards(DocumentRepository):
         """Stats of amount of triples and things (RDF classes) within each parsed document."""
         stuff = []
         for basefile in self.store.list_basefiles_for("generate"):
-            g = Graph()
-            g = g.parse(self.store.distilled_path(basefile))
+            g = self.store.read_distilled(basefile)
             uri = self.canonical_uri(basefile)
             stuff.append((basefile,
                           g.value(URIRef(uri), self.ns['dcterms'].issued),
@@ -657,14 +657,13 @@ class RepoTester(unittest.TestCase, FerendaTestCase):
         print = builtins.print
         if 'FERENDA_SET_TESTFILE' in os.environ:
             print("Overwriting '%s' with result of parse ('%s')" % (rdf_file, basefile))
-            g = rdflib.Graph()
-            g.parse(data=util.readfile(self.repo.store.distilled_path(basefile)))
+            g = self.repo.store.read_distilled(basefile)
             util.robust_rename(rdf_file, rdf_file + "~")
             with open(rdf_file, "wb") as fp:
                 fp.write(g.serialize(format="turtle"))
             return
         self.assertEqualGraphs(rdf_file,
-                               self.repo.store.distilled_path(basefile),
+                               self.repo.store.read_distilled(basefile),
                                exact=False)
 
     def parse_test(self, downloaded_file, xhtml_file, docroot):
@@ -8,6 +8,7 @@ install_aliases()
 
 import codecs
 import datetime
+import difflib
 import filecmp
 import locale
 import logging
@@ -19,17 +20,19 @@ import socket
 import string
 import subprocess
 import sys
+import threading
 import time
 import gc
 import select
 import signal
-from collections import Counter
+from collections import Counter, OrderedDict
 from contextlib import contextmanager
 from email.utils import parsedate_tz
 from ast import literal_eval
 from urllib.parse import urlsplit, urlunsplit
 
 from docutils.utils import roman
+import requests.adapters
 import requests.exceptions
 
 from . import errors
@@ -76,6 +79,127 @@ class TopCounter(Counter):
     def top(self):
         return self.most_common(1)[0][0]
 
+class LabelIndex(object):
+    """Index of textual labels, mapped to some value each (typically the
+    URI of the resource that has the label), that supports both
+    exact and fuzzy lookups.
+
+    Fuzzy lookups give the same result as
+    :py:func:`difflib.get_close_matches` with the same *cutoff*, but
+    use an inverted index of the trigrams of each label to find the
+    labels that share the most trigrams with the sought label, and
+    only score those that could possibly beat the best match found
+    so far. Results of fuzzy lookups are cached.
+
+    :param items: (label, value) pairs. If a label occurs more than
+                  once, the first value is used.
+    :param cachesize: The max number of fuzzy lookups to cache
+    """
+
+    def __init__(self, items, cachesize=1024):
+        self.labels = {}
+        self.lengths = {}
+        self.trigrams = {}
+        for label, value in items:
+            label = str(label)
+            if label in self.labels:
+                continue
+            self.labels[label] = value
+            self.lengths.setdefault(len(label), []).append(label)
+            for trigram, count in self._trigrams(label).items():
+                self.trigrams.setdefault(trigram, []).append((label, count))
+        self.cache = OrderedDict()
+        self.cachesize = cachesize
+
+    @staticmethod
+    def _trigrams(label):
+        return Counter(label[i:i + 3] for i in range(len(label) - 2))
+
+    @staticmethod
+    def _bound(shared, length, n):
+        # An upper bound of the ratio between a label of length
+        # *length* and one of length *n* that have *shared* trigrams
+        # in common. With T = length + n, M matching characters in k
+        # matching blocks and U = T - 2M unmatched characters:
+        #
+        # * the length of the shorter label limits M (this is what
+        #   real_quick_ratio checks)
+        # * a block of s characters contains s - 2 shared trigrams,
+        #   so M <= shared + 2k
+        # * adjacent blocks are separated by at least one unmatched
+        #   character, so k <= U + 1
+        #
+        # which gives M <= (shared + 2(T + 1)) / 5
+        total = length + n
+        if not total:
+            return 1.0
+        m = min(length, n, (shared + 2.0 * (total + 1)) / 5)
+        return 2.0 * m / total
+
+    def get(self, label, default=None):
+        """Return the value for the exact *label*, or *default*."""
+        return self.labels.get(label, default)
+
+    def closest(self, label, cutoff=0.8):
+        """Return the known label that best matches *label* if its
+        similarity ratio is at least *cutoff*, otherwise ``None``."""
+        if label in self.labels:
+            return label
+        key = (label, cutoff)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        match = self._closest(label, cutoff)
+        self.cache[key] = match
+        if len(self.cache) > self.cachesize:
+            self.cache.popitem(last=False)
+        return match
+
+    def _closest(self, label, cutoff):
+        length = len(label)
+        shared = Counter()
+        for trigram, count in self._trigrams(label).items():
+            for candidate, candcount in self.trigrams.get(trigram, ()):
+                shared[candidate] += min(count, candcount)
+        # get_close_matches returns the label with the highest ratio,
+        # and of those, the one that sorts last
+        best = [cutoff, None]
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(label)
+
+        def score(candidate, bound):
+            # a small margin, so that float rounding never makes us
+            # skip a label whose ratio is exactly the best one
+            if bound + 1e-9 < best[0]:
+                return False
+            matcher.set_seq1(candidate)
+            if (matcher.real_quick_ratio() >= best[0] and
+                    matcher.quick_ratio() >= best[0]):
+                ratio = matcher.ratio()
+                if ratio >= best[0] and (best[1] is None or
+                                         (ratio, candidate) > tuple(best)):
+                    best[:] = [ratio, candidate]
+            return True
+
+        # first the labels that share the most trigrams with the
+        # sought label, in order of how well they could match...
+        candidates = sorted(((self._bound(cnt, length, len(c)), cnt, c)
+                             for c, cnt in shared.items()), reverse=True)
+        for bound, cnt, candidate in candidates:
+            if not score(candidate, bound):
+                break
+        # ...then any label that shares no trigram, which is only
+        # possible for lengths that are close enough and if nothing
+        # good enough has been found yet
+        for n, labels in self.lengths.items():
+            if self._bound(0, length, n) + 1e-9 < best[0]:
+                continue
+            for candidate in labels:
+                if candidate not in shared:
+                    score(candidate, self._bound(0, length, n))
+        return best[1]
+
+
 # util.Namespaces
 # Set up common namespaces and suitable prefixes for them
 ns = {'dc': 'http://purl.org/dc/elements/1.1/',
@@ -431,20 +555,32 @@ def outfile_is_newer(infiles, outfile):
 
 
 def link_or_copy(src, dst):
-    """Create a symlink at *dst* pointing back to *src* on systems that support it. On other systems (i.e. Windows), copy *src* to *dst* (using :py:func:`copy_if_different`)
+    """Create a symlink at *dst* pointing back to *src* on systems that
+    support it. On other systems (i.e. Windows), or if the filesystem
+    doesn't support symlinks, create a hard link instead, and if that
+    isn't possible either (eg. *src* and *dst* are on different
+    filesystems), copy *src* to *dst* (using
+    :py:func:`copy_if_different`)
     """
     ensure_dir(dst)
     if os.path.lexists(dst):
         os.unlink(dst)
-    if sys.platform == 'win32':
+    if sys.platform != 'win32':
         # windows python have no working sumlink
-        copy_if_different(src, dst)
-    else:
+        #
         # The semantics of symlink are not identical to copy. The
         # source must be relative to the dstination, not relative to
         # cwd at creation time.
         relsrc = os.path.relpath(src, os.path.dirname(dst))
-        os.symlink(relsrc, dst)
+        try:
+            os.symlink(relsrc, dst)
+            return
+        except OSError:
+            pass
+    try:
+        os.link(src, dst)
+    except (OSError, AttributeError):
+        copy_if_different(src, dst)
 
 
 # util.string
@@ -665,6 +801,40 @@ def logtime(method, format="The operation took %(elapsed).3f sec", values={}):
     method(format % values)
 
 
+def memory_usage():
+    """Returns the resident set size of the current process and the
+    part of it that is private to the process (ie. not shared
+    copy-on-write with a parent or sibling process), both in kB.
+
+    Either value is None if it can't be determined. The private size
+    requires ``/proc/self/smaps_rollup`` (Linux 4.14 or later), the
+    resident set size requires ``/proc/self/status``.
+
+    :returns: ``(rss, private)``
+    :rtype: tuple
+    """
+    rss = private = None
+    try:
+        with open("/proc/self/smaps_rollup") as fp:
+            for line in fp:
+                key, value = line.split(":", 1)
+                if key == "Rss":
+                    rss = int(value.split()[0])
+                elif key in ("Private_Clean", "Private_Dirty"):
+                    private = (private or 0) + int(value.split()[0])
+    except (IOError, OSError, ValueError):
+        pass
+    if rss is None:
+        try:
+            with open("/proc/self/status") as fp:
+                for line in fp:
+                    if line.startswith("VmRSS:"):
+                        rss = int(line.split()[1])
+        except (IOError, OSError, ValueError):
+            pass
+    return rss, private
+
+
 @contextmanager
 def switch_locale(newlocale="C", category=locale.LC_TIME):
     # Python docs recommends against this. Eh, what are you going to do?
@@ -905,6 +1075,73 @@ def robust_fetch(method, url, logger, attempts=5, sleep=1, raise_for_status=True
     else:
         return response
 
+
+class HostLimiter(object):
+    """Limits the number of requests that are made concurrently to each
+    host, and makes sure that requests to the same host are started
+    at least *delay* seconds apart.
+
+    >>> limiter = HostLimiter(concurrency=2, delay=0.5)
+    >>> with limiter.limit("http://example.org/doc/1"):
+    ...     pass # fetch the url
+
+    :param concurrency: Max number of concurrent requests per host
+    :type  concurrency: int
+    :param delay: Min number of seconds between the start of two
+                  requests to the same host
+    :type  delay: float
+    """
+
+    def __init__(self, concurrency=1, delay=0):
+        self.concurrency = max(1, concurrency)
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._hosts = {}
+
+    def _host(self, host):
+        with self._lock:
+            if host not in self._hosts:
+                # semaphore, lock for the start time, start time of
+                # latest request
+                self._hosts[host] = [threading.BoundedSemaphore(self.concurrency),
+                                     threading.Lock(), 0]
+            return self._hosts[host]
+
+    @contextmanager
+    def limit(self, url):
+        """Blocks until a request to the host of *url* may be made."""
+        hostinfo = self._host(urlsplit(url).netloc)
+        semaphore, startlock = hostinfo[0], hostinfo[1]
+        with semaphore:
+            if self.delay:
+                with startlock:
+                    wait = hostinfo[2] + self.delay - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                    hostinfo[2] = time.time()
+            yield
+
+
+class HostLimitedAdapter(requests.adapters.HTTPAdapter):
+    """A transport adapter for :py:class:`requests.Session` that sends
+    every request through a :py:class:`HostLimiter`. The limit applies
+    until the response headers are received.
+
+    :param limiter: The limiter to use
+    :type  limiter: HostLimiter
+
+    Any other arguments are passed to
+    :py:class:`requests.adapters.HTTPAdapter` (eg ``pool_maxsize``).
+    """
+
+    def __init__(self, limiter, *args, **kwargs):
+        self.limiter = limiter
+        super(HostLimitedAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, *args, **kwargs):
+        with self.limiter.limit(request.url):
+            return super(HostLimitedAdapter, self).send(request, *args, **kwargs)
+
 def handler(signum, frame):
     print("SIGALRM delivered")
 
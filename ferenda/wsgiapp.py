@@ -11,6 +11,7 @@ from io import BytesIO
 from operator import itemgetter
 from wsgiref.util import FileWrapper, request_uri
 from urllib.parse import parse_qsl, urlencode
+import gc
 import inspect
 import json
 import logging
@@ -32,8 +33,8 @@ from werkzeug.middleware.shared_data import SharedDataMiddleware
 from werkzeug.utils import redirect
 from werkzeug.wsgi import wrap_file
 
-from ferenda import (DocumentRepository, FulltextIndex, Transformer,
-                     Facet, ResourceLoader)
+from ferenda import (DocumentRepository, DocumentEntry, FulltextIndex,
+                     Transformer, Facet, ResourceLoader)
 from ferenda import fulltextindex, util, elements
 from ferenda.elements import html
 
@@ -59,10 +60,23 @@ class WSGIApp(object):
     #
     # SETUP
     # 
+
+    startup_time = None
+    """The number of seconds spent creating (and preloading) this app in
+    the current process, as measured by
+    :py:func:`~ferenda.manager.make_wsgi_app`. In worker processes
+    forked from a process that has called :py:meth:`preload`, this is
+    0."""
+
+    preload_attributes = ("ontologies", "commondata")
+    """Lazily computed attributes of each repo that :py:meth:`preload`
+    computes up front."""
+
     def __init__(self, repos, config):
         self.repos = repos
         self.config = config
         self.log = logging.getLogger("wsgi")
+        self._reported_pid = None
         # at this point, we should build our routing map
         rules = [
             Rule("/", endpoint="frontpage"),
@@ -106,7 +120,60 @@ class WSGIApp(object):
                 })
         self.wsgi_app = SharedDataMiddleware(self.wsgi_app, exports)
 
+    def preload(self):
+        """Does the expensive, read-only setup that otherwise would be done
+        lazily by each worker process when handling its first
+        requests (see :py:data:`preload_attributes`), and prepares the
+        app to be shared by forked worker processes.
+
+        This should be called once, before a pre-forking WSGI server
+        (eg. uWSGI without ``lazy-apps``, or gunicorn with
+        ``--preload``) forks its workers. Any open triple store and
+        entry database connections are closed, to be reopened by
+        each worker as needed, and all objects created so far are
+        exempted from garbage collection (see :py:func:`gc.freeze`)
+        so that workers can keep sharing the memory they occupy
+        copy-on-write.
+        """
+        for repo in self.repos:
+            for attr in self.preload_attributes:
+                if not hasattr(type(repo), attr):
+                    continue
+                try:
+                    getattr(repo, attr)
+                except Exception as e:
+                    self.log.warning("%s: Couldn't preload %s: %s: %s" %
+                                     (repo.alias, attr, e.__class__.__name__, e))
+            if hasattr(repo, '_triplestore'):
+                repo._triplestore.close()
+                del repo._triplestore
+        for directory, backend in DocumentEntry.backends:
+            if hasattr(backend, 'close'):
+                backend.close()
+        gc.collect()
+        if hasattr(gc, 'freeze'):  # py 3.7+
+            gc.freeze()
+        if hasattr(os, 'register_at_fork'):  # py 3.7+
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.startup_time = 0
+
+    def log_worker_stats(self):
+        """Logs the startup time (see :py:data:`startup_time`) and memory
+        usage of the current process. This is done automatically when
+        each process handles its first request."""
+        rss, private = util.memory_usage()
+        self.log.info("worker %s: startup %s s, RSS %s kB (%s kB private)" %
+                      (os.getpid(),
+                       "%.3f" % self.startup_time if self.startup_time is not None else "?",
+                       rss if rss is not None else "?",
+                       private if private is not None else "?"))
+
     def __call__(self, environ, start_response):
+        if self._reported_pid != os.getpid():
+            self._reported_pid = os.getpid()
+            self.log_worker_stats()
         try:
             return self.wsgi_app(environ, start_response)
         except Exception as e:
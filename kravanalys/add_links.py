@@ -2,12 +2,16 @@ import os
 import re
 import sys
 from lxml import etree
+import argparse
 from datetime import date
 
-# Kör med: python3 add_links.py [filnamn eller katalog]
+from batchrunner import build_manifest, run_batch
+
+# Kör med: python3 add_links.py [--workers N] [--force] [filnamn eller katalog]
 # Konstanter
 PARSED_DIR = "data/eurlexacts/parsed"
 LOG_FILE = "link_processing.log"
+CHECKPOINT_FILE = "add_links.checkpoint.json"
 
 # --- GLOBALA VARIABLER FÖR RAPPORTERING ---
 INVALID_CELEX_HITS = []
@@ -39,6 +43,10 @@ FULL_PATTERN = re.compile(
     re.IGNORECASE | re.UNICODE | re.VERBOSE
 )
 
+# Varje träff innehåller ett nummer av formen "1025/2012". Texter utan ett
+# sådant behöver inte testas mot det betydligt dyrare FULL_PATTERN.
+QUICK_CHECK = re.compile(r'\d/\d')
+
 # --- 2. REGEX FÖR BORTTAGNING AV GAMLA NOTER ---
 # Scenario 1: Parenteserna är inuti länken, t.ex. <a>(1)</a>
 STRICT_FOOTNOTE_PATTERN = re.compile(r'^\(\d+\)$', re.UNICODE)
@@ -162,11 +170,10 @@ def make_celex_uri(match):
             
     return f"http://localhost:8000/res/eurlexacts/{celex}{fragment}"
 
-def process_text_segment(text, parent, insert_index=0):
-    if not text: return 0, None
-    matches = list(FULL_PATTERN.finditer(text))
-    if not matches: return 0, None
-
+def build_links(text, matches):
+    """Skapar <a>-element för matchningarna i text. Returnerar texten
+    före första matchningen och listan med element (där varje elements
+    tail är texten fram till nästa matchning)."""
     created_elems = []
     prefix_text = text[:matches[0].start()]
     
@@ -184,31 +191,60 @@ def process_text_segment(text, parent, insert_index=0):
         a.tail = text[match.end():start_next]
         created_elems.append(a)
 
+    return prefix_text, created_elems
+
+def process_text_segment(text, parent, insert_index=0):
+    if not text: return 0, None
+    matches = list(FULL_PATTERN.finditer(text))
+    if not matches: return 0, None
+
+    prefix_text, created_elems = build_links(text, matches)
     for elem in reversed(created_elems):
         parent.insert(insert_index, elem)
 
     return len(created_elems), prefix_text
 
 def linkify_tree(elem):
+    """Länkar alla CELEX-referenser i text och tail under elem (men inte
+    inuti befintliga <a>-element).
+
+    Trädet gås igenom en gång med iterwalk, och bara de textnoder som
+    innehåller en träff sparas. Ändringarna görs först efteråt, i omvänd
+    dokumentordning, så att trädet aldrig ändras under genomgången."""
+    hits = []
+    walker = etree.iterwalk(elem, events=("start", "comment", "pi"))
+    for event, node in walker:
+        # Kommentarer och processinstruktioner har ingen text att länka,
+        # men väl en tail
+        if isinstance(node.tag, str):
+            is_link = etree.QName(node).localname.lower() == 'a'
+            if is_link and node is not elem:
+                walker.skip_subtree()
+            elif node.text and QUICK_CHECK.search(node.text):
+                matches = list(FULL_PATTERN.finditer(node.text))
+                if matches:
+                    hits.append((node, False, matches))
+        if node is not elem and node.tail and QUICK_CHECK.search(node.tail):
+            matches = list(FULL_PATTERN.finditer(node.tail))
+            if matches:
+                hits.append((node, True, matches))
+
     total_links = 0
-    if elem.text:
-        count, prefix = process_text_segment(elem.text, elem, 0)
-        if count > 0:
-            elem.text = prefix
-            total_links += count
-
-    children = list(elem)
-    for i in range(len(children) - 1, -1, -1):
-        child = children[i]
-        tag_local = etree.QName(child).localname.lower()
-        if tag_local != 'a':
-            total_links += linkify_tree(child)
-
-        if child.tail:
-            count, prefix = process_text_segment(child.tail, elem, i + 1)
-            if count > 0:
-                child.tail = prefix
-                total_links += count
+    for node, is_tail, matches in reversed(hits):
+        if is_tail:
+            prefix, created_elems = build_links(node.tail, matches)
+            node.tail = prefix
+            # (addnext skulle flytta nodens tail, så vi använder insert)
+            parent = node.getparent()
+            index = parent.index(node) + 1
+            for a in reversed(created_elems):
+                parent.insert(index, a)
+        else:
+            prefix, created_elems = build_links(node.text, matches)
+            node.text = prefix
+            for a in reversed(created_elems):
+                node.insert(0, a)
+        total_links += len(created_elems)
     return total_links
 
 def clean_old_links(root):
@@ -280,25 +316,37 @@ def clean_old_links(root):
     return removed_count
 
 def process_file(filepath):
-    try:
-        parser = etree.XMLParser(encoding="utf-8", remove_comments=True, recover=True)
-        tree = etree.parse(filepath, parser)
-        root = tree.getroot()
-        
-        # Kör rensning först för att undvika konflikter
-        removed = clean_old_links(root)
-        created = linkify_tree(root)
-        
-        if removed > 0 or created > 0:
-            with open(filepath, 'wb') as f:
-                tree.write(f, encoding='utf-8', method='xml', 
-                           xml_declaration=False,
-                           pretty_print=False)
-            return created, removed
-        return 0, 0
-    except Exception as e:
-        print(f"Fel vid {filepath}: {e}")
-        return 0, 0
+    """Länkar filen på plats. Fel (t.ex. filer som inte går att tolka)
+    skickas vidare, så att batchkörningen kan markera filen som CRASH
+    och köra om den nästa gång."""
+    parser = etree.XMLParser(encoding="utf-8", remove_comments=True, recover=True)
+    tree = etree.parse(filepath, parser)
+    root = tree.getroot()
+    if root is None:
+        raise ValueError("kunde inte tolka filen")
+    
+    # Kör rensning först för att undvika konflikter
+    removed = clean_old_links(root)
+    created = linkify_tree(root)
+    
+    if removed > 0 or created > 0:
+        with open(filepath, 'wb') as f:
+            tree.write(f, encoding='utf-8', method='xml', 
+                       xml_declaration=False,
+                       pretty_print=False)
+        return created, removed
+    return 0, 0
+
+def process_path(filepath):
+    """Körs i arbetsprocesserna vid batch-bearbetning. De globala
+    rapportvariablerna återställs för varje fil och skickas tillbaka
+    med resultatet."""
+    global CURRENT_PROCESSING_FILE
+    CURRENT_PROCESSING_FILE = os.path.basename(filepath)
+    del INVALID_CELEX_HITS[:]
+    created, removed = process_file(filepath)
+    return {"file": filepath, "created": created, "removed": removed,
+            "invalid": list(INVALID_CELEX_HITS)}
 
 def find_file_recursive(base_dir, search_name):
     candidates = {search_name, search_name + ".xhtml", search_name + ".xml"}
@@ -309,9 +357,15 @@ def find_file_recursive(base_dir, search_name):
     return None
 
 if __name__ == '__main__':
-    
-    if len(sys.argv) > 1:
-        arg = sys.argv[1]
+    parser = argparse.ArgumentParser(description="Lägg till CELEX-länkar i parsade rättsakter.")
+    parser.add_argument("target", nargs="?", help="Fil (eller filnamn att leta efter i PARSED_DIR) att bearbeta")
+    parser.add_argument("--workers", help="Antal parallella processer (standard: antal kärnor)", type=int)
+    parser.add_argument("--force", help="Bearbeta alla filer, även de som inte ändrats sedan förra körningen", action="store_true")
+    parser.add_argument("--checkpoint", help=f"Checkpoint-fil för att återuppta körningar (standard: {CHECKPOINT_FILE})", default=CHECKPOINT_FILE)
+    args = parser.parse_args()
+
+    if args.target:
+        arg = args.target
         target_file = None
         if os.path.exists(arg):
             target_file = arg
@@ -322,9 +376,12 @@ if __name__ == '__main__':
         if target_file:
             print(f"Bearbetar: {target_file}")
             CURRENT_PROCESSING_FILE = os.path.basename(target_file)
-            created, removed = process_file(target_file)
-            print("-" * 40)
-            print(f"Resultat: +{created} skapade, -{removed} borttagna")
+            try:
+                created, removed = process_file(target_file)
+                print("-" * 40)
+                print(f"Resultat: +{created} skapade, -{removed} borttagna")
+            except Exception as e:
+                print(f"Fel vid {target_file}: {e}")
         else:
             print(f"Kunde inte hitta filen '{arg}'.")
 
@@ -333,29 +390,33 @@ if __name__ == '__main__':
             print(f"Målmappen {PARSED_DIR} saknas.")
         else:
             print(f"Startar massbearbetning av mapp: {PARSED_DIR}")
-            total_created = 0
-            total_removed = 0
+            manifest = build_manifest(PARSED_DIR, (".xhtml", ".xml"))
             files_modified = 0
-            
+
             with open(LOG_FILE, 'w', encoding='utf-8') as log:
                 log.write("FIL;SKAPADE;BORTTAGNA\n")
-                
-                for root, dirs, files in os.walk(PARSED_DIR):
-                    for filename in files:
-                        if filename.endswith(".xhtml") or filename.endswith(".xml"):
-                            filepath = os.path.join(root, filename)
-                            CURRENT_PROCESSING_FILE = filename
-                            created, removed = process_file(filepath)
-                            
-                            if created > 0 or removed > 0:
-                                print(f"  -> {filename}: +{created}, -{removed}")
-                                log.write(f"{filepath};{created};{removed}\n")
-                                total_created += created
-                                total_removed += removed
-                                files_modified += 1
+
+                def on_result(path, row, skipped):
+                    global files_modified
+                    # Träffar från oförändrade filer finns kvar i
+                    # checkpoint-filen och rapporteras igen
+                    INVALID_CELEX_HITS.extend(tuple(hit) for hit in row.get("invalid", []))
+                    if row.get("status") == "CRASH":
+                        print(f"Fel vid {path}: {row['flags']}")
+                    elif not skipped and (row["created"] > 0 or row["removed"] > 0):
+                        print(f"  -> {os.path.basename(path)}: +{row['created']}, -{row['removed']}")
+                        log.write(f"{path};{row['created']};{row['removed']}\n")
+                        log.flush()
+                        files_modified += 1
+
+                processed, skipped = run_batch(process_path, manifest,
+                                               checkpoint=args.checkpoint,
+                                               workers=args.workers,
+                                               force=args.force,
+                                               on_result=on_result)
 
             print("-" * 40)
-            print(f"Klar. Ändrade filer: {files_modified}")
+            print(f"Klar. Ändrade filer: {files_modified} (oförändrade, ej omkörda: {skipped})")
 
     if INVALID_CELEX_HITS:
         print("\n" + "="*50)
@@ -0,0 +1,197 @@
+import os
+import csv
+import json
+import hashlib
+import tempfile
+from concurrent import futures
+
+# Gemensam batch-körning för parse_to_json.py och add_links.py.
+#
+# Flödet:
+# 1. Bygg ett manifest (sorterad lista) över alla indatafiler.
+# 2. Hoppa över filer vars innehåll (sha1) inte ändrats sedan förra
+#    lyckade körningen enligt checkpoint-filen.
+# 3. Kör resten i en processpool med ett begränsat antal jobb i kö.
+# 4. Skriv varje resultatrad till rapporten (CSV eller JSON lines) så
+#    fort den blir klar, och spara checkpoint-filen med jämna mellanrum
+#    så att en avbruten körning kan fortsätta där den slutade.
+
+CHECKPOINT_INTERVAL = 50  # antal färdiga filer mellan varje sparning
+
+
+def file_digest(path, chunksize=64 * 1024):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_manifest(source, suffixes):
+    """Returnerar en sorterad lista med sökvägar till alla filer under
+    source (eller bara source, om det är en fil) med rätt filändelse."""
+    if os.path.isfile(source):
+        return [source]
+    manifest = []
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for filename in files:
+            if filename.endswith(tuple(suffixes)):
+                manifest.append(os.path.join(root, filename))
+    manifest.sort()
+    return manifest
+
+
+def _run_job(func, path):
+    # Körs i arbetsprocessen. Digest räknas efter bearbetningen, så att
+    # filer som skrivs om på plats (add_links) inte körs igen nästa gång.
+    # Rader med status CRASH sparas inte i checkpoint-filen, så att de
+    # körs om nästa gång.
+    try:
+        row = func(path)
+    except Exception as e:
+        row = {"file": path, "status": "CRASH", "flags": str(e)}
+    ok = row.get("status") != "CRASH"
+    stat = os.stat(path)
+    return path, ok, row, file_digest(path), stat.st_size, stat.st_mtime
+
+
+class Checkpoint:
+    """Håller reda på digest och senaste resultatrad för varje bearbetad
+    fil. Sparas atomärt (via en temporärfil) som JSON."""
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = 0
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.entries = json.load(f).get("files", {})
+
+    def is_unchanged(self, path):
+        entry = self.entries.get(path)
+        if not entry or not os.path.exists(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size != entry["size"]:
+            return False
+        if stat.st_mtime == entry["mtime"]:
+            return True
+        # Ändrad tidsstämpel men kanske samma innehåll (t.ex. efter kopiering)
+        if file_digest(path) == entry["digest"]:
+            entry["mtime"] = stat.st_mtime
+            self.dirty += 1
+            return True
+        return False
+
+    def row(self, path):
+        return self.entries[path]["row"]
+
+    def update(self, path, digest, size, mtime, row):
+        self.entries[path] = {"digest": digest, "size": size,
+                              "mtime": mtime, "row": row}
+        self.dirty += 1
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        dirname = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=dirname)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"files": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self.dirty = 0
+
+
+class Report:
+    """Skriver resultatrader löpande till en CSV-fil eller (om filnamnet
+    slutar på .json/.jsonl) till en fil med en JSON-rad per fil."""
+
+    def __init__(self, path, fieldnames):
+        self.path = path
+        self.jsonl = path.endswith((".json", ".jsonl"))
+        if self.jsonl:
+            self.fp = open(path, 'w', encoding='utf-8')
+        else:
+            self.fp = open(path, 'w', newline='', encoding='utf-8-sig')
+            self.writer = csv.DictWriter(self.fp, fieldnames, restval="",
+                                         extrasaction='ignore')
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.jsonl:
+            self.fp.write(json.dumps(row, ensure_ascii=False) + "\n")
+        else:
+            self.writer.writerow(row)
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+
+def run_batch(func, manifest, report=None, fieldnames=None, checkpoint=None,
+              workers=None, force=False, on_result=None):
+    """Kör func(path) för varje fil i manifest och returnerar antalet
+    bearbetade respektive överhoppade filer.
+
+    func måste vara en funktion på modulnivå (så att den kan skickas till
+    arbetsprocesserna) och returnera en dict. Filer som inte ändrats sedan
+    förra lyckade körningen hoppas över (om inte force anges), och deras
+    tidigare resultatrad skrivs till rapporten i stället. on_result, om
+    angiven, anropas i huvudprocessen med (path, row, skipped) för varje
+    fil (resultaten samlas inte i minnet)."""
+    if workers is None:
+        workers = os.cpu_count() or 1
+    state = Checkpoint(checkpoint)
+    out = Report(report, fieldnames) if report else None
+    counts = [0, 0]
+
+    def handle(path, row, skipped):
+        if out:
+            out.write(row)
+        if on_result:
+            on_result(path, row, skipped)
+        counts[skipped] += 1
+
+    todo = []
+    for path in manifest:
+        if not force and state.is_unchanged(path):
+            handle(path, state.row(path), True)
+        else:
+            todo.append(path)
+
+    try:
+        if workers > 1 and len(todo) > 1:
+            with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                pending = set()
+                jobs = iter(todo)
+                while True:
+                    # Håll som mest 2*workers jobb i kö, så att manifestet
+                    # inte behöver skickas till poolen på en gång
+                    for path in jobs:
+                        pending.add(executor.submit(_run_job, func, path))
+                        if len(pending) >= workers * 2:
+                            break
+                    if not pending:
+                        break
+                    done, pending = futures.wait(
+                        pending, return_when=futures.FIRST_COMPLETED)
+                    for job in done:
+                        _finish(job.result(), state, handle)
+        else:
+            for path in todo:
+                _finish(_run_job(func, path), state, handle)
+    finally:
+        state.save()
+        if out:
+            out.close()
+    return tuple(counts)
+
+
+def _finish(result, state, handle):
+    path, ok, row, digest, size, mtime = result
+    if ok:
+        state.update(path, digest, size, mtime, row)
+        if state.dirty >= CHECKPOINT_INTERVAL:
+            state.save()
+    handle(path, row, False)
@@ -0,0 +1,131 @@
+import os
+import sys
+import copy
+import time
+import random
+import argparse
+from lxml import etree
+
+import add_links
+from parse_to_json import LegalActParser, SOURCE_DIR
+from batchrunner import build_manifest
+
+# Kör med: python3 benchmark.py [--sample 200] [--repeat 3] [katalog]
+#
+# Jämför formatdetekteringen i LegalActParser och länkningen i add_links
+# med de tidigare implementationerna (fyra XPath-sökningar respektive
+# rekursiv genomgång), på ett slumpmässigt urval av akter. Kontrollerar
+# också att resultaten är identiska.
+
+def legacy_detect_format(tree):
+    has_eli = len(tree.xpath("//*[contains(@class, 'eli-container')]")) > 0
+    has_title_article_norm = len(tree.xpath("//*[contains(@class, 'title-article-norm')]")) > 0
+    has_ti_art = len(tree.xpath("//*[contains(@class, 'ti-art')]")) > 0
+    has_grey_preamble = len(tree.xpath("//div[contains(@style, '#CCCCCC')]")) > 0
+    if has_eli:
+        return "eli"
+    elif has_title_article_norm:
+        return "flat"
+    elif has_grey_preamble:
+        return "consolidated_inline"
+    elif has_ti_art:
+        return "transitional"
+    else:
+        return "legacy"
+
+def legacy_linkify_tree(elem):
+    total_links = 0
+    if elem.text:
+        count, prefix = add_links.process_text_segment(elem.text, elem, 0)
+        if count > 0:
+            elem.text = prefix
+            total_links += count
+
+    children = list(elem)
+    for i in range(len(children) - 1, -1, -1):
+        child = children[i]
+        tag_local = etree.QName(child).localname.lower()
+        if tag_local != 'a':
+            total_links += legacy_linkify_tree(child)
+
+        if child.tail:
+            count, prefix = add_links.process_text_segment(child.tail, elem, i + 1)
+            if count > 0:
+                child.tail = prefix
+                total_links += count
+    return total_links
+
+def timed(func, arg, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def timed_linkify(func, tree, repeat):
+    # Länkningen ändrar trädet, så varje körning får en egen kopia (som
+    # skapas utanför tidtagningen)
+    best = None
+    for _ in range(repeat):
+        root = copy.deepcopy(tree.getroot())
+        start = time.perf_counter()
+        count = func(root)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return (count, etree.tostring(root, encoding='utf-8')), best
+
+def main():
+    parser = argparse.ArgumentParser(description="Mät formatdetektering och länkning.")
+    parser.add_argument("source", nargs="?", default=SOURCE_DIR, help=f"Katalog med akter (standard: {SOURCE_DIR})")
+    parser.add_argument("--sample", type=int, default=200, help="Antal akter att mäta på")
+    parser.add_argument("--repeat", type=int, default=3, help="Antal körningar per akt (bästa tiden räknas)")
+    parser.add_argument("--seed", type=int, default=0, help="Slumpfrö för urvalet")
+    args = parser.parse_args()
+
+    manifest = build_manifest(args.source, (".xhtml", ".html", ".xml"))
+    if not manifest:
+        print(f"Inga akter hittades i {args.source}.")
+        return
+    random.Random(args.seed).shuffle(manifest)
+    sample = manifest[:args.sample]
+    print(f"Mäter på {len(sample)} av {len(manifest)} akter...")
+
+    totals = {"detect_old": 0, "detect_new": 0, "link_old": 0, "link_new": 0}
+    mismatches = []
+    for path in sample:
+        extractor = LegalActParser(path)
+        old_fmt, t = timed(legacy_detect_format, extractor.tree, args.repeat)
+        totals["detect_old"] += t
+        new_fmt, t = timed(lambda tree: extractor.detect_format(), extractor.tree, args.repeat)
+        totals["detect_new"] += t
+        if old_fmt != new_fmt:
+            mismatches.append((path, f"format {old_fmt} != {new_fmt}"))
+
+        xml_parser = etree.XMLParser(encoding="utf-8", remove_comments=True, recover=True)
+        tree = etree.parse(path, xml_parser)
+        old_links, t = timed_linkify(legacy_linkify_tree, tree, args.repeat)
+        totals["link_old"] += t
+        new_links, t = timed_linkify(add_links.linkify_tree, tree, args.repeat)
+        totals["link_new"] += t
+        if old_links != new_links:
+            mismatches.append((path, f"länkar {old_links[0]} != {new_links[0]} eller olika träd"))
+
+    print("\n" + "="*50)
+    print(f"{'STEG':<20} {'FÖRE (s)':>10} {'EFTER (s)':>10} {'FAKTOR':>7}")
+    print("-" * 50)
+    for label, key in (("Formatdetektering", "detect"), ("Länkning", "link")):
+        old, new = totals[key + "_old"], totals[key + "_new"]
+        factor = old / new if new else float("inf")
+        print(f"{label:<20} {old:>10.3f} {new:>10.3f} {factor:>6.1f}x")
+    print("="*50)
+    if mismatches:
+        print(f"\nVARNING: {len(mismatches)} avvikande resultat:")
+        for path, msg in mismatches:
+            print(f"  {os.path.basename(path)}: {msg}")
+        sys.exit(1)
+    print("Resultaten är identiska för alla akter.")
+
+if __name__ == "__main__":
+    main()
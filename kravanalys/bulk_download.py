@@ -1,7 +1,11 @@
 import csv
 import sys
 import os
+import json
 import time
+import tempfile
+import threading
+from concurrent import futures
 import requests
 
 # --- INSTÄLLNINGAR --- 
@@ -11,6 +15,12 @@ CSV_DELIMITER = ','
 TIMEOUT_SECONDS = 60 
 SPARQL_ENDPOINT = "https://publications.europa.eu/webapi/rdf/sparql"
 OVERWRITE_EXISTING = False  # Sätt till False för att kunna återuppta nedladdning
+STATE_FILE = "bulk_download.state.json"  # Färdiga akter, för att kunna återuppta
+BATCH_SIZE = 50  # Antal CELEX-nummer per SPARQL-fråga (VALUES-block)
+SPARQL_RETRIES = 2  # Antal omförsök för en SPARQL-fråga som misslyckas
+MAX_WORKERS = 4  # Antal samtidiga nedladdningar
+REQUESTS_PER_SECOND = 2.0  # Sammanlagt för alla trådar, inkl. SPARQL-frågor
+PRIORITY = ['xhtml', 'xhtml_simplified', 'html']
 
 # --- SETUP (Mock/Imports) ---
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../'))
@@ -33,78 +43,139 @@ except ImportError:
     util = MockUtil()
 
 session = requests.Session()
-adapter = requests.adapters.HTTPAdapter(max_retries=3)
+adapter = requests.adapters.HTTPAdapter(max_retries=3, pool_maxsize=MAX_WORKERS)
 session.mount("http://", adapter)
 session.mount("https://", adapter)
 session.headers.update({
     'User-Agent': 'Mozilla/5.0 (compatible; Ferenda-BulkLoader/4.2)',
 })
 
+# --- HASTIGHETSBEGRÄNSNING ---
+
+class RateLimiter:
+    """Ser till att alla trådar tillsammans gör högst rate anrop per sekund."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
 # --- SPARQL-FUNKTIONER ---
 
-def get_consolidation_history(basic_celex):
-    """
-    Hämtar en lista på ALLA konsoliderade versioner som är BASERADE PÅ denna akt.
-    Sorterat nyast först.
-    """
-    query = f"""
+SPARQL_PREFIXES = """
         PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
         PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-        
-        SELECT ?cons_celex
+        PREFIX lang: <http://publications.europa.eu/resource/authority/language/>
+"""
+
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def celex_values(var, celex_ids):
+    values = " ".join(f'"{c}"^^xsd:string' for c in celex_ids)
+    return f"VALUES ?{var} {{ {values} }}"
+
+def sparql_select(query):
+    """Kör en SELECT-fråga (som POST, eftersom VALUES-blocken kan bli
+    långa) och returnerar listan med bindningar."""
+    rate_limiter.wait()
+    headers = {'Accept': 'application/sparql-results+json'}
+    r = session.post(SPARQL_ENDPOINT, data={'query': query}, headers=headers, timeout=TIMEOUT_SECONDS)
+    r.raise_for_status()
+    return r.json().get('results', {}).get('bindings', [])
+
+def sparql_select_retry(query, what):
+    """Som sparql_select, men gör om frågan upp till SPARQL_RETRIES
+    gånger. Returnerar None om den fortfarande misslyckas."""
+    for attempt in range(SPARQL_RETRIES + 1):
+        try:
+            return sparql_select(query)
+        except Exception as e:
+            print(f"   [SPARQL ERROR] {what} (försök {attempt + 1}): {e}")
+    return None
+
+def get_consolidation_histories(basic_celexes):
+    """
+    Hämtar ALLA konsoliderade versioner som är BASERADE PÅ var och en av
+    akterna, med en fråga per BATCH_SIZE akter. Returnerar en dict
+    grundakt -> lista med konsoliderade versioner, sorterad nyast först.
+    Akter vars fråga misslyckades har värdet None.
+    """
+    histories = {}
+    failed = set()
+    for batch in chunks(list(basic_celexes), BATCH_SIZE):
+        query = SPARQL_PREFIXES + f"""
+        SELECT ?basic_celex ?cons_celex
         WHERE {{
-            ?basic_act cdm:resource_legal_id_celex "{basic_celex}"^^xsd:string .
+            {celex_values("basic_celex", batch)}
+            ?basic_act cdm:resource_legal_id_celex ?basic_celex .
             ?cons_act cdm:act_consolidated_based_on_resource_legal ?basic_act .
             ?cons_act cdm:resource_legal_id_celex ?cons_celex .
         }}
-        ORDER BY DESC(?cons_celex)
-    """
-    try:
-        headers = {'Accept': 'application/sparql-results+json'}
-        r = session.get(SPARQL_ENDPOINT, params={'query': query}, headers=headers, timeout=20)
-        
-        if r.status_code == 200:
-            bindings = r.json().get('results', {}).get('bindings', [])
-            return [b['cons_celex']['value'] for b in bindings]
-            
-    except Exception as e:
-        print(f"   [SPARQL ERROR] Historik-sökning: {e}")
-    
-    return []
-
-def get_manifestation_url(celex_id):
-    """Hämtar URL om det finns en svensk HTML/XHTML-fil."""
-    query = f"""
-        PREFIX cdm: <http://publications.europa.eu/ontology/cdm#>
-        PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
-        PREFIX lang: <http://publications.europa.eu/resource/authority/language/>
+        """
+        bindings = sparql_select_retry(query, "Historik-sökning")
+        if bindings is None:
+            failed.update(batch)
+            continue
+        for b in bindings:
+            histories.setdefault(b['basic_celex']['value'], set()).add(b['cons_celex']['value'])
+    res = {celex: sorted(cons, reverse=True) for celex, cons in histories.items()}
+    res.update(dict.fromkeys(failed))
+    return res
 
-        SELECT ?manifestation_uri ?type
+def get_manifestation_urls(celex_ids):
+    """Hämtar URL och typ för den bästa svenska HTML/XHTML-filen för
+    vart och ett av CELEX-numren, med en fråga per BATCH_SIZE nummer.
+    CELEX-nummer som saknar en sådan fil finns inte med i resultatet,
+    CELEX-nummer vars fråga misslyckades har värdet None."""
+    found = {}
+    for batch in chunks(list(celex_ids), BATCH_SIZE):
+        query = SPARQL_PREFIXES + f"""
+        SELECT ?celex ?manifestation_uri ?type
         WHERE {{
-            ?work cdm:resource_legal_id_celex "{celex_id}"^^xsd:string .
+            {celex_values("celex", batch)}
+            ?work cdm:resource_legal_id_celex ?celex .
             ?expression cdm:expression_belongs_to_work ?work .
             ?expression cdm:expression_uses_language lang:SWE .
             ?manifestation_uri cdm:manifestation_manifests_expression ?expression .
             OPTIONAL {{ ?manifestation_uri cdm:manifestation_type ?type . }}
         }}
-    """
-    try:
-        headers = {'Accept': 'application/sparql-results+json'}
-        r = session.get(SPARQL_ENDPOINT, params={'query': query}, headers=headers, timeout=20)
-        
-        if r.status_code == 200:
-            bindings = r.json().get('results', {}).get('bindings', [])
-            PRIORITY = ['xhtml', 'xhtml_simplified', 'html']
-            
-            for p in PRIORITY:
-                for b in bindings:
-                    if b.get('type', {}).get('value') == p:
-                        return b['manifestation_uri']['value'], p
-    except Exception: pass
-    return None, None
+        """
+        bindings = sparql_select_retry(query, "Manifestationssökning")
+        if bindings is None:
+            found.update(dict.fromkeys(batch))
+            continue
+        for b in bindings:
+            ftype = b.get('type', {}).get('value')
+            if ftype not in PRIORITY:
+                continue
+            celex = b['celex']['value']
+            url = b['manifestation_uri']['value']
+            if celex not in found or PRIORITY.index(ftype) < PRIORITY.index(found[celex][1]):
+                found[celex] = (url, ftype)
+    return found
+
+def get_consolidation_history(basic_celex):
+    """Som get_consolidation_histories, för en enskild akt."""
+    return get_consolidation_histories([basic_celex]).get(basic_celex) or []
+
+def get_manifestation_url(celex_id):
+    """Hämtar URL om det finns en svensk HTML/XHTML-fil."""
+    return get_manifestation_urls([celex_id]).get(celex_id) or (None, None)
 
 def download_file(url, target_path_base):
     try:
+        rate_limiter.wait()
         headers = {'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'}
         r = session.get(url, headers=headers, allow_redirects=True, timeout=TIMEOUT_SECONDS)
         
@@ -113,107 +184,153 @@ def download_file(url, target_path_base):
             ext = ".html" if "html" in ct and "xhtml" not in ct else ".xhtml"
             final_path = target_path_base.replace(".xhtml", ext)
             
-            with open(final_path, "wb") as f:
+            # Skriv till en temporärfil först, så att en avbruten körning
+            # aldrig lämnar en halv fil efter sig
+            fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(final_path))
+            with os.fdopen(fd, "wb") as f:
                 f.write(r.content)
+            os.replace(tmp_path, final_path)
             return True, final_path
     except Exception: pass
     return False, None
 
-# --- MAIN ---
+# --- TILLSTÅND (för att kunna återuppta) ---
 
-def run():
-    repo = EURLexActs()
-    if not os.path.exists(CSV_FILE):
-        print(f"FEL: {CSV_FILE} saknas.")
+def load_state(state_file):
+    if state_file and os.path.exists(state_file):
+        with open(state_file, encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def save_state(state, state_file):
+    if not state_file:
         return
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".tmp", dir=os.path.dirname(os.path.abspath(state_file)))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_path, state_file)
 
-    stats = {'total': 0, 'success_cons': 0, 'success_basic': 0, 'failed': 0, 'skipped': 0}
-    
-    with open(CSV_FILE, 'r', encoding='utf-8-sig') as f:
+# --- MAIN ---
+
+def read_celex_numbers(csv_file):
+    with open(csv_file, 'r', encoding='utf-8-sig') as f:
         reader = csv.DictReader(f, delimiter=CSV_DELIMITER)
         celex_col = next((c for c in reader.fieldnames if "celex" in c.lower()), None)
         
         if not celex_col:
             print("FEL: Ingen CELEX-kolumn hittades i CSV.")
-            return
+            return None
 
+        celexes = []
         for row in reader:
             original_celex = row.get(celex_col, '').strip()
-            if not original_celex: continue
-            stats['total'] += 1
-            print(f"\n[{stats['total']}] Bearbetar {original_celex}...")
+            if original_celex and original_celex not in celexes:
+                celexes.append(original_celex)
+        return celexes
 
-            base_path = repo.store.path(original_celex, 'downloaded', '.xhtml')
-            alt_path = base_path.replace('.xhtml', '.html')
-            
-            # --- START NY HOPPA-ÖVER LOGIK ---
-            # Vi kollar om filen finns OCH att den har innehåll (> 0 bytes)
-            file_exists_and_valid = False
-            
-            # Kolla .xhtml
-            if os.path.exists(base_path) and os.path.getsize(base_path) > 0:
-                file_exists_and_valid = True
-            # Kolla .html (fallback-namn)
-            elif os.path.exists(alt_path) and os.path.getsize(alt_path) > 0:
-                file_exists_and_valid = True
-
-            if not OVERWRITE_EXISTING and file_exists_and_valid:
-                print("   -> Finns redan (och verkar hel). Hoppar över.")
-                stats['skipped'] += 1
+def already_downloaded(base_path):
+    # Vi kollar om filen finns OCH att den har innehåll (> 0 bytes),
+    # både som .xhtml och som .html (fallback-namn)
+    for path in (base_path, base_path.replace('.xhtml', '.html')):
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            return True
+    return False
+
+def find_candidates(celexes):
+    """Returnerar en dict grundakt -> lista med (celex, url, typ, konsoliderad)
+    i den ordning de ska provas: konsoliderade versioner nyast först,
+    sist grundakten själv. Akter som inte gick att slå upp (för att en
+    fråga misslyckades) har värdet None, i stället för att falla
+    tillbaka på grundakten."""
+    histories = get_consolidation_histories(celexes)
+    wanted = {}
+    for celex in celexes:
+        if histories.get(celex, []) is None:
+            wanted[celex] = None
+            continue
+        # Skapa ett "säkert" ID-mönster för att dubbelkolla
+        safe_id_pattern = celex[1:] # Tar bort första tecknet ('3')
+        ids = []
+        for cons_id in histories.get(celex, []):
+            # SÄKERHETSKONTROLL
+            if safe_id_pattern not in cons_id:
+                print(f"   -> [VARNING] Ignorerar {cons_id} för {celex} (Verkar tillhöra annan akt).")
                 continue
-            # --- SLUT NY LOGIK ---
+            ids.append((cons_id, True))
+        ids.append((celex, False))
+        wanted[celex] = ids
+    urls = get_manifestation_urls(sorted({i for ids in wanted.values() if ids
+                                          for i, cons in ids}))
+    res = {}
+    for celex, ids in wanted.items():
+        if ids is None or any(i in urls and urls[i] is None for i, cons in ids):
+            res[celex] = None
+        else:
+            res[celex] = [(i, urls[i][0], urls[i][1], cons) for i, cons in ids if i in urls]
+    return res
 
-            util.ensure_dir(base_path)
+def fetch_act(celex, candidates, base_path):
+    """Körs i en arbetstråd. Provar kandidaterna i tur och ordning och
+    returnerar (celex, resultat, sökväg, källa)."""
+    util.ensure_dir(base_path)
+    for source, url, ftype, consolidated in candidates:
+        ok, path = download_file(url, base_path)
+        if ok:
+            return celex, 'success_cons' if consolidated else 'success_basic', path, source
+        print(f"   -> {celex}: Misslyckades med {source} ({ftype}).")
+    return celex, 'failed', None, None
 
-            # 1. Hämta historia (med striktare sökning)
-            history = get_consolidation_history(original_celex)
-            download_success = False
-            
-            # Skapa ett "säkert" ID-mönster för att dubbelkolla
-            safe_id_pattern = original_celex[1:] # Tar bort första tecknet ('3')
-            
-            if history:
-                print(f"   -> Hittade {len(history)} konsoliderade versioner.")
-                
-                for cons_id in history:
-                    # SÄKERHETSKONTROLL
-                    if safe_id_pattern not in cons_id:
-                        print(f"   -> [VARNING] Ignorerar {cons_id} (Verkar tillhöra annan akt).")
-                        continue
-
-                    url, ftype = get_manifestation_url(cons_id)
-                    if url:
-                        print(f"   -> URL hittad för {cons_id} ({ftype}). Laddar ner...")
-                        ok, path = download_file(url, base_path)
-                        if ok:
-                            print(f"   -> KLAR! (Sparad som {os.path.basename(path)})")
-                            stats['success_cons'] += 1
-                            download_success = True
-                            break 
-                    else:
-                        print(f"   -> [INFO] Ingen svensk fil för {cons_id}. Backar...")
-            else:
-                print("   -> Ingen konsolideringshistorik hittad.")
-
-            # 2. FALLBACK
-            if not download_success:
-                print("   -> Fallback: Försöker hämta grundakten.")
-                url, ftype = get_manifestation_url(original_celex)
-                
-                if url:
-                    print(f"   -> Laddar ner grundakt ({ftype})...")
-                    ok, path = download_file(url, base_path)
-                    if ok:
-                        print(f"   -> KLAR! (GRUNDAKT)")
-                        stats['success_basic'] += 1
-                    else:
-                        print("   -> FEL: Misslyckades med grundakten också.")
-                        stats['failed'] += 1
-                else:
-                    print("   -> FEL: Varken konsoliderad eller grundakt hittades.")
+def run(csv_file=CSV_FILE, repo=None, workers=MAX_WORKERS, state_file=STATE_FILE):
+    if repo is None:
+        repo = EURLexActs()
+    if not os.path.exists(csv_file):
+        print(f"FEL: {csv_file} saknas.")
+        return
+
+    stats = {'total': 0, 'success_cons': 0, 'success_basic': 0, 'failed': 0, 'skipped': 0}
+    celexes = read_celex_numbers(csv_file)
+    if celexes is None:
+        return
+    state = load_state(state_file)
+
+    todo = []
+    for original_celex in celexes:
+        stats['total'] += 1
+        base_path = repo.store.path(original_celex, 'downloaded', '.xhtml')
+        if not OVERWRITE_EXISTING and (original_celex in state or already_downloaded(base_path)):
+            stats['skipped'] += 1
+            continue
+        todo.append(original_celex)
+    print(f"{stats['total']} akter, {stats['skipped']} finns redan. Hämtar {len(todo)}...")
+
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch in chunks(todo, BATCH_SIZE):
+            print(f"\nSlår upp {len(batch)} akter ({batch[0]}-{batch[-1]})...")
+            candidates = find_candidates(batch)
+            jobs = []
+            for celex in batch:
+                if candidates[celex] is None:
+                    # sparas inte i tillståndet, så att akten slås upp
+                    # igen nästa körning
+                    print(f"   -> {celex}: FEL: Kunde inte slås upp.")
                     stats['failed'] += 1
-            
-            time.sleep(0.5)
+                    continue
+                if not candidates[celex]:
+                    print(f"   -> {celex}: FEL: Varken konsoliderad eller grundakt hittades.")
+                    stats['failed'] += 1
+                    continue
+                base_path = repo.store.path(celex, 'downloaded', '.xhtml')
+                jobs.append(executor.submit(fetch_act, celex, candidates[celex], base_path))
+            for job in futures.as_completed(jobs):
+                celex, result, path, source = job.result()
+                stats[result] += 1
+                if path:
+                    kind = "GRUNDAKT" if result == 'success_basic' else source
+                    print(f"   -> {celex}: KLAR! ({kind}, sparad som {os.path.basename(path)})")
+                    state[celex] = {"source": source, "path": path}
+            # Spara efter varje batch, så att en avbruten körning kan
+            # fortsätta där den slutade
+            save_state(state, state_file)
 
     print("\n" + "="*30 + "\nSLUTRAPPORT\n" + "="*30)
     print(f"Totalt: {stats['total']}")
@@ -221,6 +338,7 @@ def run():
     print(f"Grundakter:    {stats['success_basic']}")
     print(f"Misslyckade:   {stats['failed']}")
     print(f"Hoppade över:  {stats['skipped']}")
+    return stats
 
 if __name__ == '__main__':
     run()
\ No newline at end of file
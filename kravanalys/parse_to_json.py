@@ -3,13 +3,16 @@ import re
 import json
 import argparse
 import unicodedata
-import csv
 from lxml import etree
 
+from batchrunner import build_manifest, run_batch
+
 # Konfiguration
 SOURCE_DIR = "data/eurlexacts/parsed"
 DEST_DIR = "data/eurlexacts/json"
 LOG_FILE = "validation_report.csv"
+CHECKPOINT_FILE = "parse_to_json.checkpoint.json"
+REPORT_FIELDS = ["celex", "parser", "status", "original_len", "json_len", "diff", "flags"]
 
 class Validator:
     def __init__(self):
@@ -738,19 +741,45 @@ class LegalActParser:
         if current_annex: self.data['document']['annexes'].append(current_annex)
 
 
+    def detect_format(self):
+        """Avgör vilken parser som ska användas genom att gå igenom trädet
+        en gång, i stället för en XPath-sökning över hela trädet per
+        kännetecken. ELI-formatet har högst prioritet, så vi kan sluta
+        leta så fort vi hittat det."""
+        has_title_article_norm = has_ti_art = has_grey_preamble = False
+        root = self.tree.getroot()
+        if root is None:
+            return "legacy"
+        for elem in root.iter(etree.Element):
+            cls = elem.get("class")
+            if cls:
+                if "eli-container" in cls:
+                    return "eli"
+                if not has_title_article_norm and "title-article-norm" in cls:
+                    has_title_article_norm = True
+                if not has_ti_art and "ti-art" in cls:
+                    has_ti_art = True
+            if not has_grey_preamble and elem.tag == "div" and "#CCCCCC" in elem.get("style", ""):
+                has_grey_preamble = True
+
+        if has_title_article_norm:
+            return "flat"
+        elif has_grey_preamble:
+            return "consolidated_inline"
+        elif has_ti_art:
+            return "transitional"
+        else:
+            return "legacy"
+
     def run(self):
-        has_eli = len(self.tree.xpath("//*[contains(@class, 'eli-container')]")) > 0
-        has_title_article_norm = len(self.tree.xpath("//*[contains(@class, 'title-article-norm')]")) > 0
-        has_ti_art = len(self.tree.xpath("//*[contains(@class, 'ti-art')]")) > 0
-        has_grey_preamble = len(self.tree.xpath("//div[contains(@style, '#CCCCCC')]")) > 0
-        
-        if has_eli:
+        fmt = self.detect_format()
+        if fmt == "eli":
             self.parse_modern_eli()
-        elif has_title_article_norm:
+        elif fmt == "flat":
             self.parse_modern_flat() 
-        elif has_grey_preamble:
+        elif fmt == "consolidated_inline":
             self.parse_consolidated_inline()
-        elif has_ti_art:
+        elif fmt == "transitional":
             self.parse_transitional()
         else:
             self.parse_legacy()
@@ -765,13 +794,31 @@ def save_json(data, celex_id):
         json.dump(data, f, ensure_ascii=False, indent=2)
     return dest_path
 
+def process_path(filepath):
+    """Körs i arbetsprocesserna vid batch-bearbetning."""
+    try:
+        extractor = LegalActParser(filepath)
+        data = extractor.run()
+        val_res = Validator().validate(extractor, data)
+        save_json(data, extractor.celex_id)
+        return val_res
+    except Exception as e:
+        return {
+            "celex": os.path.basename(filepath),
+            "status": "CRASH",
+            "flags": str(e)
+        }
+
 def main():
     parser = argparse.ArgumentParser(description="Konvertera EU-rättsakter till JSON.")
     parser.add_argument("--file", help="Sökväg till en enskild fil att testa", type=str)
+    parser.add_argument("--workers", help="Antal parallella processer (standard: antal kärnor)", type=int)
+    parser.add_argument("--force", help="Bearbeta alla filer, även de som inte ändrats sedan förra körningen", action="store_true")
+    parser.add_argument("--report", help=f"Valideringsrapport, .csv eller .jsonl (standard: {LOG_FILE})", default=LOG_FILE)
+    parser.add_argument("--checkpoint", help=f"Checkpoint-fil för att återuppta körningar (standard: {CHECKPOINT_FILE})", default=CHECKPOINT_FILE)
     args = parser.parse_args()
     
     validator = Validator()
-    results = []
 
     if args.file:
         if not os.path.exists(args.file):
@@ -795,46 +842,40 @@ def main():
             traceback.print_exc()
     else:
         print(f"Startar batch-bearbetning från {SOURCE_DIR}...")
-        count = 0
-        for root, dirs, files in os.walk(SOURCE_DIR):
-            for filename in files:
-                if filename.endswith((".xhtml", ".html", ".xml")):
-                    filepath = os.path.join(root, filename)
-                    try:
-                        extractor = LegalActParser(filepath)
-                        data = extractor.run()
-                        
-                        val_res = validator.validate(extractor, data)
-                        results.append(val_res)
-                        
-                        save_json(data, extractor.celex_id)
-                        count += 1
-                        if count % 100 == 0:
-                            print(f"Bearbetat {count} filer...")
-                    except Exception as e:
-                        print(f"Fel med {filename}: {e}")
-                        results.append({
-                            "celex": filename, 
-                            "status": "CRASH", 
-                            "flags": str(e)
-                        })
-
-        if results:
-            keys = results[0].keys()
-            with open(LOG_FILE, 'w', newline='', encoding='utf-8-sig') as f:
-                dict_writer = csv.DictWriter(f, keys)
-                dict_writer.writeheader()
-                dict_writer.writerows(results)
-            
-            crashes = [r for r in results if r['status'] == 'CRASH']
-            failures = [r for r in results if r['status'] == 'FAIL']
-            
+        manifest = build_manifest(SOURCE_DIR, (".xhtml", ".html", ".xml"))
+        # Bara kraschade filer och filer med varningar sparas för
+        # sammanfattningen, resten skrivs direkt till rapporten
+        crashes = []
+        failures = []
+
+        def on_result(path, row, skipped):
+            if row['status'] == 'CRASH':
+                row.setdefault('celex', os.path.basename(path))
+                print(f"Fel med {os.path.basename(path)}: {row['flags']}")
+                crashes.append(row)
+            elif row['status'] == 'FAIL':
+                failures.append(row)
+            if not skipped:
+                on_result.done += 1
+                if on_result.done % 100 == 0:
+                    print(f"Bearbetat {on_result.done} filer...")
+        on_result.done = 0
+
+        count, skipped = run_batch(process_path, manifest, report=args.report,
+                                   fieldnames=REPORT_FIELDS,
+                                   checkpoint=args.checkpoint,
+                                   workers=args.workers, force=args.force,
+                                   on_result=on_result)
+        count += skipped
+
+        if count:
             print("\n" + "="*50)
             print(f"SAMMANFATTNING AV KÖRNING ({count} filer)")
             print("="*50)
             print(f"✅ Lyckade:   {count - len(crashes) - len(failures)}")
             print(f"⚠️  Varningar: {len(failures)}")
             print(f"❌ Kraschar:  {len(crashes)}")
+            print(f"⏭️  Oförändrade (ej omkörda): {skipped}")
             print("-" * 50)
             
             if crashes:
@@ -847,7 +888,7 @@ def main():
                 for f in failures:
                      print(f"  {f['celex']}: {f['flags']}")
             
-            print(f"\nValideringsrapport sparad till: {LOG_FILE}")
+            print(f"\nValideringsrapport sparad till: {args.report}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -25,7 +25,7 @@ class FacadeSource(CompositeRepository):
     def relate_all_setup(cls, config, *args, **kwargs):
         return False
     
-    def news_entries(self):
+    def news_entries(self, basefiles=None):
         """reach into subrepos docentries, as subrepos are responsible for
         generating documents and marking them as published."""
         # just munging list_basefiles_for won't do, we need basefile +
@@ -33,9 +33,14 @@ class FacadeSource(CompositeRepository):
 
         for cls in self.subrepos:
             inst = self.get_instance(cls)
-            for entry in inst.news_entries():
+            for entry in inst.news_entries(basefiles):
                 yield entry
 
+    def news_changed_basefiles(self, since):
+        # entries live in the subrepos, not in our own store, so we
+        # can't tell which have changed
+        return None
+
     def facet_query(self, context):
         # Override the standard query in order to ignore the default
         # context (provided by .dataset_uri()) since we're going to
@@ -20,7 +20,7 @@ from werkzeug.routing import Rule, BaseConverter
 
 from ferenda.sources.legal.se import myndfskr
 from ferenda import (CompositeRepository, CompositeStore, Facet, TocPageset,
-                     TocPage, RequestHandler)
+                     TocPage, RequestHandler, DocumentEntry)
 from ferenda import util, fulltextindex
 from ferenda.elements import Body, Link, html
 from ferenda.sources.legal.se import (SwedishLegalSource, SwedishLegalStore)
@@ -211,13 +211,19 @@ class MyndFskr(CompositeRepository, SwedishLegalSource):
                 finally:
                     inst.log.setLevel(subrepo_loglevel)
                     for b in basefiles:
-                        util.link_or_copy(inst.store.documententry_path(b),
-                                          self.store.documententry_path(b))
+                        self.copy_entry(inst.store.documententry_path(b),
+                                        self.store.documententry_path(b))
                     # msbfs/entries/.root.json -> myndfs/entries/msbfs.json
-                    util.link_or_copy(inst.store.documententry_path(".root"),
-                                      self.store.documententry_path(inst.alias))
+                    self.copy_entry(inst.store.documententry_path(".root"),
+                                    self.store.documententry_path(inst.alias))
         if not found:
             self.log.error("Couldn't find any subrepo with alias %s" % subrepoalias)
+
+    def copy_entry(self, src, dst):
+        # the entries of the subrepo and of this repo might use
+        # different backends, so go through DocumentEntry
+        if DocumentEntry.backend_for(src).exists(src):
+            DocumentEntry(src).save(dst)
             
 
     # This custom implementation of parse is able to select a
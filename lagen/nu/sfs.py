@@ -3,14 +3,16 @@ from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 from builtins import *
 
+import json
 import os
 import re
 import shutil
+from collections import OrderedDict
 from datetime import datetime
 from urllib.parse import quote, unquote
 
 from html import unescape # on py2, use from HTMLParser import HTMLParser; unescape = HTMLParser().unescape
-from rdflib import URIRef
+from rdflib import URIRef, Graph
 from rdflib.namespace import DCTERMS, OWL, RDF, RDFS
 from werkzeug.routing import Rule, BaseConverter
 
@@ -190,6 +192,63 @@ class SFS(OrigSFS, SameAs):
         # the facets we could do better
         return "%s författningar" % len(set([row['uri'] for row in self.faceted_data()]))
 
+    @classmethod
+    def relate_all_teardown(cls, config, *args, **kwargs):
+        ret = super(SFS, cls).relate_all_teardown(config, *args, **kwargs)
+        cls(config).make_autocomplete_metadata()
+        return ret
+
+    def autocomplete_metadata_path(self):
+        return self.store.resourcepath("autocomplete.json")
+
+    def make_autocomplete_metadata(self):
+        """Creates the tables of law abbreviations and names that the
+        lagen.nu WSGI app uses for autocompletion, so that it won't
+        have to compute them at startup. This is done after relating
+        all documents.
+
+        The tables are ``abbreviations`` (longest first), ``names``
+        and ``paragraflag``, the (lowercased) abbreviations of laws
+        whose sections are numbered without chapters (ie. laws that
+        have a ``#P1`` resource).
+
+        """
+        graph = Graph().parse(self.resourceloader.filename("extra/sfs.ttl"), format="turtle")
+        abbreviations = []
+        paragraflag = []
+        for s, o in graph.subject_objects(DCTERMS.alternate):
+            abbreviations.append(str(o))
+            basefile = self.basefile_from_uri(str(s))
+            if not basefile or not os.path.exists(self.store.distilled_path(basefile)):
+                continue
+            distilled = self.store.read_distilled(basefile)
+            if (URIRef(str(s) + "#P1"), RDF.type, RPUBL.Paragraf) in distilled:
+                paragraflag.append(str(o).lower())
+        metadata = {'abbreviations': sorted(abbreviations, key=len, reverse=True),
+                    'names': [str(o) for s, o in graph.subject_objects(RDFS.label)],
+                    'paragraflag': sorted(paragraflag)}
+        path = self.autocomplete_metadata_path()
+        util.ensure_dir(path)
+        with open(path, "w", encoding="utf-8") as fp:
+            json.dump(metadata, fp, ensure_ascii=False)
+        self.log.info("Wrote autocomplete metadata for %s laws (%s without chapters) to %s" %
+                      (len(abbreviations), len(paragraflag), path))
+        return metadata
+
+    def autocomplete_metadata(self):
+        """Returns the tables created by
+        :py:meth:`make_autocomplete_metadata`. If they haven't been
+        created, the tables are empty.
+
+        """
+        path = self.autocomplete_metadata_path()
+        if not os.path.exists(path):
+            self.log.warning("%s doesn't exist, autocompletion of law abbreviations "
+                             "won't work until sfs relate has been run" % path)
+            return {'abbreviations': [], 'names': [], 'paragraflag': []}
+        with open(path, encoding="utf-8") as fp:
+            return json.load(fp)
+
 
     templ = ['(?P<type>sfs[tr])/(?P<byear>\d+)/(?P<bnum>[^\-]+).html',
              '(?P<type>sfs[tr])/(?P<byear>\d+)/(?P<bnum>[^\-]+)-(?P<vfirst>first-version).html',
@@ -229,6 +288,8 @@ class SFS(OrigSFS, SameAs):
         recent_versions = {}  # records the current version of every
                               # basefile for which we have any archive
                               # file
+        extracted = OrderedDict()  # basefile -> the versions extracted
+                                   # for it, to be indexed at the end
         for f in util.list_dirs(archivedir, ".html"):
             if "downloaded/sfst" not in f:
                 continue
@@ -316,10 +377,15 @@ class SFS(OrigSFS, SameAs):
                                   (basefile, this_version, f, dest))
                     util.ensure_dir(dest)
                     shutil.copy2(f, dest)
+                    # the file is a plain copy, so there's no content
+                    # (sha1) to record for it
+                    extracted.setdefault(basefile, OrderedDict())[this_version] = {"downloaded": {}}
                     archived += 1
                 break
             else:
                 self.log.warning("Couldn't process %s" % f)
+        for basefile, versions in extracted.items():
+            self.store.index_versions(basefile, versions)
         self.log.info("Extracted %s current versions and %s archived versions (skipped %s files that already existed, and couldn't handle %s invalid versions)"
                       % (current, archived, skipped, invalid))
 
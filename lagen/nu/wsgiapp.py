@@ -6,6 +6,10 @@ from builtins import *
 # sys
 import os
 import re
+try:
+    from functools import lru_cache
+except ImportError:
+    from backports.functools_lru_cache import lru_cache
 from urllib.parse import urlencode, quote_plus
 from wsgiref.util import request_uri
 from datetime import datetime
@@ -31,6 +35,8 @@ class WSGIApp(OrigWSGIApp):
     """
 
     snippet_length = 160
+    preload_attributes = OrigWSGIApp.preload_attributes + ("minter",)
+
     def __init__(self, repos, config):
         super(WSGIApp, self).__init__(repos, config)
         sfsrepo = [repo for repo in repos if repo.alias == "sfs"]
@@ -41,19 +47,14 @@ class WSGIApp(OrigWSGIApp):
                 sfsrepo.minter,
                 sfsrepo.commondata,
                 allow_relative=True)
-            graph = Graph().parse(sfsrepo.resourceloader.filename("extra/sfs.ttl"), format="turtle")
-            self.lagforkortningar = [str(o) for s, o in graph.subject_objects(DCTERMS.alternate)]
-            self.paragraflag = []
-            for s, o in graph.subject_objects(DCTERMS.alternate):
-                basefile = sfsrepo.basefile_from_uri(str(s))
-                distilledpath = sfsrepo.store.distilled_path(basefile)
-                firstpara_uri = str(s) + "#P1"
-                needle = '<rpubl:Paragraf rdf:about="%s">' % firstpara_uri
-                if os.path.exists(distilledpath) and needle in util.readfile(distilledpath):
-                    self.paragraflag.append(str(o).lower())
-            self.lagnamn = [str(o) for s, o in graph.subject_objects(RDFS.label)]
-            self.lagforkortningar_regex = "|".join(sorted(self.lagforkortningar, key=len, reverse=True))
-            
+            # precomputed by sfsrepo.make_autocomplete_metadata
+            # during relate, so that we don't have to read any
+            # distilled files here
+            metadata = sfsrepo.autocomplete_metadata()
+            self.lagforkortningar = metadata['abbreviations']
+            self.paragraflag = metadata['paragraflag']
+            self.lagnamn = metadata['names']
+            self.lagforkortningar_regex = "|".join(self.lagforkortningar)
 
     def parse_parameters(self, request, idx):
         options = super(WSGIApp, self).parse_parameters(request, idx)
@@ -95,6 +96,9 @@ class WSGIApp(OrigWSGIApp):
             options["q"] = None # or del options["q"]?
         return options
 
+    # the same partial references are typed over and over (by
+    # everyone looking up the same law), so remember the results
+    @lru_cache(maxsize=4096)
     def expand_partial_ref(self, partial_ref):
         if partial_ref.lower().startswith(("prop", "ds", "sou", "dir")):
             q = partial_ref
@@ -159,6 +163,8 @@ class WSGIApp(OrigWSGIApp):
             # (https://lagen.nu/1998:204#P3" <- "PUL 3 §"
 
 
+            if not self.lagforkortningar_regex:
+                return
             m = re.match("(%s) *(\d*\:?\d*)$" % self.lagforkortningar_regex, partial_ref, re.IGNORECASE) 
             if not m:
                 return
@@ -6,13 +6,18 @@ from builtins import *
 from ferenda.testutil import RepoTester, parametrize_repotester
 from ferenda.testutil import Py23DocChecker
 import doctest
+import os
+import threading
+import time
 import unittest
+import zipfile
 from datetime import date
 
 # SUT
 from ferenda.sources.legal.se import DV
-from ferenda.sources.legal.se.dv import KeywordContainsDescription 
+from ferenda.sources.legal.se.dv import KeywordContainsDescription, ExtractionPool
 from ferenda import fsmparser
+from ferenda import util
 
 class TestDVParserBase(unittest.TestCase):
     maxDiff = None
@@ -654,3 +659,75 @@ avslag)"""
                              cm.exception.descriptions)
 
 
+class TestExtractionPool(unittest.TestCase):
+
+    def test_order(self):
+        res = []
+        def job(name, delay):
+            time.sleep(delay)
+            res.append(name)
+        pool = ExtractionPool(4)
+        pool.submit(["a"], job, "a1", 0.2)
+        pool.submit(["b"], job, "b1", 0)
+        pool.submit(["a", "b"], job, "ab", 0)
+        pool.wait()
+        # jobs for the same key run in order, others don't wait
+        self.assertEqual(["b1", "a1", "ab"], res)
+
+    def test_pending_job(self):
+        blocker = threading.Event()
+        pool = ExtractionPool(2)
+        pool.submit(["a"], blocker.wait, 10)
+        self.assertEqual((blocker.wait, (10,)), pool.pending_job("a"))
+        self.assertIsNone(pool.pending_job("b"))
+        blocker.set()
+        pool.wait()
+        self.assertIsNone(pool.pending_job("a"))
+
+    def test_wait_raises(self):
+        pool = ExtractionPool(2)
+        pool.submit(["a"], int, "not a number")
+        with self.assertRaises(ValueError):
+            pool.wait()
+
+
+class ProcessZipfile(RepoTester):
+    repoclass = DV
+
+    def makezip(self, members):
+        zipname = self.datadir + "/test.zip"
+        with zipfile.ZipFile(zipname, "w") as zipf:
+            for name, data in members:
+                zipf.writestr(name, data)
+        return zipname
+
+    def downloaded(self, basefile, data=None):
+        path = self.repo.store.path(basefile, "downloaded", ".doc")
+        if data is not None:
+            util.writefile(path, data)
+            os.utime(path, (1000000000, 1000000000))
+        return path
+
+    def test_bytut_unchanged(self):
+        unchanged = self.downloaded("HDO/T1-10", "same content")
+        changed = self.downloaded("HDO/T2-10", "old content")
+        self.repo.process_zipfile(self.makezip(
+            [("HDO_T1-10_BYTUT_2010-03-17.doc", "same content"),
+             ("HDO_T2-10_BYTUT_2010-03-17.doc", "new content")]))
+        # a member with the same size and CRC isn't unpacked again
+        self.assertEqual(1000000000, os.path.getmtime(unchanged))
+        self.assertEqual("new content", util.readfile(changed))
+        self.assertNotEqual(1000000000, os.path.getmtime(changed))
+
+    def test_removed_and_readded(self):
+        path = self.downloaded("HDO/T1-10", "old content")
+        zipname = self.makezip([("HDO_T1-10_TABORT_2010-03-17.doc", ""),
+                                ("HDO_T1-10.doc", "new content")])
+        # keep the removal pending while the second member is handled
+        blocker = threading.Event()
+        pool = ExtractionPool(2)
+        pool.submit([path], blocker.wait, 10)
+        self.repo.process_zipfile(zipname, pool)
+        blocker.set()
+        pool.wait()
+        self.assertEqual("new content", util.readfile(path))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import json
+import re
+import threading
+import time
+
+from ferenda import util
+from ferenda.testutil import RepoTester
+from ferenda.sources.legal.eu import EURLexCaselaw
+
+
+class Download(RepoTester):
+    # downloads from a local mock of the EUR-Lex search web service
+    # (SOAP), the Cellar SPARQL endpoint and the Cellar itself
+    repoclass = EURLexCaselaw
+    repoconfig = {'username': 'user',
+                  'password': 'secret',
+                  'curl': False}
+
+    # (celex, cellar id, available manifestation types)
+    works = [("62015CJ0001", "aaaa-0001", ("xhtml", "pdf")),
+             ("32017R0642", "aaaa-0002", ("xhtml",)), # not caselaw
+             ("62015CJ0003", "aaaa-0003", ("pdf",)),
+             ("62015CC0004", "aaaa-0004", ("pdf", "xhtml"))]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+            if self.path == "/EURLexWebService":
+                page = int(re.search(r"<sear:page>(\d+)</sear:page>", body).group(1))
+                return self.respond(200, self.server.test.searchresults(page),
+                                    "application/soap+xml")
+            elif self.path == "/sparql":
+                query = parse_qs(body)['query'][0]
+                self.server.test.sparqlqueries.append(query)
+                return self.respond(200, self.server.test.sparqlresults(query),
+                                    "application/sparql-results+json")
+            self.respond(404)
+
+        def do_GET(self):
+            server = self.server
+            if not self.path.startswith("/items/"):
+                server.test.otherrequests.append(self.path)
+                return self.respond(404)
+            with server.lock:
+                server.active += 1
+                server.maxactive = max(server.active, server.maxactive)
+            time.sleep(0.1)
+            with server.lock:
+                server.active -= 1
+            self.respond(200, "content of %s" % self.path[7:])
+
+        def respond(self, status, body="", contenttype="text/plain"):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", contenttype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def setUp(self):
+        super(Download, self).setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.Handler)
+        self.server.test = self
+        self.server.lock = threading.Lock()
+        self.server.active = self.server.maxactive = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.baseurl = "http://127.0.0.1:%s" % self.server.server_port
+        self.sparqlqueries = []
+        self.otherrequests = []
+        self.repo.pagesize = 2
+        self.repo.webservice_endpoint = self.baseurl + "/EURLexWebService"
+        self.repo.sparql_endpoint = self.baseurl + "/sparql"
+        self.repo.cellar_base = self.baseurl + "/cellar/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(Download, self).tearDown()
+
+    def searchresults(self, page):
+        results = ""
+        for celex, cellarid, types in self.works[(page - 1) * 2:page * 2]:
+            results += """<result><reference>eng_cellar:%s_en</reference><content><NOTICE>
+<WORK><ID_CELEX><VALUE>%s</VALUE></ID_CELEX></WORK>
+<EXPRESSION><EXPRESSION_TITLE><VALUE>Case %s</VALUE></EXPRESSION_TITLE></EXPRESSION>
+</NOTICE></content></result>""" % (cellarid, celex, celex)
+        return """<S:Envelope xmlns:S="http://www.w3.org/2003/05/soap-envelope"><S:Body>
+<searchResults xmlns="http://eur-lex.europa.eu/search">
+<numhits>2</numhits><totalhits>%s</totalhits>%s
+</searchResults></S:Body></S:Envelope>""" % (len(self.works), results)
+
+    def sparqlresults(self, query):
+        def uri(value):
+            return {"type": "uri", "value": value}
+        bindings = []
+        cellarids = re.findall("<%s([^>]+)>" % re.escape(self.repo.cellar_base), query)
+        for celex, cellarid, types in self.works:
+            if cellarid not in cellarids:
+                continue
+            for idx, mtype in enumerate(types):
+                manif = "%s%s.0001.0%s" % (self.repo.cellar_base, cellarid, idx)
+                item = "%s/items/%s.%s" % (self.baseurl, cellarid, mtype)
+                bindings.append({"work": uri(self.repo.cellar_base + cellarid),
+                                 "lang": uri(self.repo.language_base + "ENG"),
+                                 "manif": uri(manif),
+                                 "type": {"type": "literal", "value": mtype},
+                                 "item": uri(item),
+                                 "itemalias": uri(item + ".xml")})
+        return json.dumps({"head": {"vars": []},
+                           "results": {"bindings": bindings}})
+
+    def test_download(self):
+        self.repo.download()
+        # one query for each of the two result pages, and no tree
+        # notices
+        self.assertEqual(2, len(self.sparqlqueries))
+        self.assertIn("aaaa-0001", self.sparqlqueries[0])
+        self.assertNotIn("aaaa-0002", self.sparqlqueries[0])
+        self.assertIn("aaaa-0004", self.sparqlqueries[1])
+        self.assertEqual([], self.otherrequests)
+        for (celex, cellarid, suffix) in (("62015CJ0001", "aaaa-0001", "xhtml"),
+                                          ("62015CJ0003", "aaaa-0003", "pdf"),
+                                          ("62015CC0004", "aaaa-0004", "xhtml")):
+            path = self.repo.store.downloaded_path(celex)
+            self.assertTrue(path.endswith("." + suffix), path)
+            self.assertEqual("content of %s.%s" % (cellarid, suffix),
+                             util.readfile(path))
+        self.assertNotIn("32017R0642", list(self.repo.store.list_basefiles_for("parse")))
+        self.assertGreater(self.server.maxactive, 1)
@@ -4,6 +4,7 @@ from __future__ import (absolute_import, division,
 from builtins import *
 
 import sys, os
+import multiprocessing
 from ferenda.compat import unittest
 
 from datetime import datetime
@@ -133,6 +134,16 @@ class DocRepo2(DocumentRepository):
                 Facet(DCTERMS.references),
                 Facet(DC.subject)]
 
+def bulk_update(location, docs):
+    # used by WhooshBasicIndex.test_bulk_multiprocess, run in a
+    # separate process
+    index = FulltextIndex.connect("WHOOSH", location, [DocumentRepository()])
+    index.bulk = True
+    for doc in docs:
+        index.update(**doc)
+    index.commit()
+    index.close()
+
 #----------------------------------------------------------------
 #
 # The actual test -- note that these do not derive from
@@ -422,6 +433,43 @@ class WhooshBasicIndex(BasicIndex, WhooshBase):
         # need mock docrepo
         self.index = FulltextIndex.connect("WHOOSH", self.location, [DocumentRepository()])
 
+
+    def test_bulk(self):
+        self.index.bulk = True
+        self.index.update(**basic_dataset[0])
+        self.index.update(**basic_dataset[1])
+        self.index.commit()
+        # not visible until merged
+        self.assertEqual(self.index.doccount(), 0)
+        self.assertEqual(self.index.merge_bulk(), 2)
+        self.assertEqual(self.index.doccount(), 2)
+        self.assertFalse(os.path.exists(self.location + os.sep + ".spool"))
+        # resources already in the index are replaced when merged
+        self.index.update(**basic_dataset[2])
+        self.index.update(**basic_dataset[3])
+        self.index.commit()
+        self.assertEqual(self.index.merge_bulk(), 2)
+        self.assertEqual(self.index.doccount(), 3)
+        res, pager = self.index.query("updated")
+        self.assertEqual(1, len(res))
+        self.assertEqual('First section', res[0]['dcterms_title'])
+        # nothing to merge
+        self.assertEqual(self.index.merge_bulk(), 0)
+
+    def test_bulk_multiprocess(self):
+        procs = [multiprocessing.Process(target=bulk_update,
+                                         args=(self.location, docs))
+                 for docs in (basic_dataset[:2], basic_dataset[2:3], basic_dataset[4:])]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+            self.assertEqual(0, proc.exitcode)
+        self.assertEqual(self.index.merge_bulk(processes=2), 4)
+        self.assertEqual(self.index.doccount(), 4)
+        res, pager = self.index.query("document")
+        self.assertEqual(2, len(res))
+
        
 class WhooshBasicQuery(BasicQuery, WhooshBase): pass
 
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+
+from ferenda.compat import unittest
+
+# SUT
+from ferenda.sources.general import graphanalyze
+from ferenda.sources.general.graphanalyze import CitationMatrix, GraphAnalyze
+
+
+@unittest.skipIf(graphanalyze.scipy is None or graphanalyze.networkx is None,
+                 "Needs numpy, scipy and networkx")
+class Rank(unittest.TestCase):
+    # a small citation graph between cases (celex numbers starting
+    # with 6), where some citations have pinpoints and some cases
+    # also cite an article (celex numbers starting with 1)
+    citations = [("61990J0001", "61985J0001"),
+                 ("61990J0001", "61985J0002-01"),
+                 ("61990J0001", "61985J0002-02"),
+                 ("61992J0003", "61990J0001"),
+                 ("61992J0003", "61985J0001"),
+                 ("61995J0004", "61992J0003"),
+                 ("61995J0004", "61990J0001-05"),
+                 ("61995J0004", "61995J0004"),
+                 ("61998J0005", "61985J0001"),
+                 ("61998J0005", "61999J0006"),
+                 ("61999J0006", "61998J0005"),
+                 ("61999J0006", "12008E101")]
+
+    def setUp(self):
+        prefix = "http://lagen.nu/ext/celex/"
+        self.cites = [{'subj': prefix + subj,
+                       'obj': prefix + obj,
+                       'celexnum': subj} for (subj, obj) in self.citations]
+        self.matrix = CitationMatrix(self.cites)
+        # the networkx graph only gets citations of cases, like the
+        # result of GraphAnalyze._query_cites
+        self.analyzer = GraphAnalyze()
+        self.nxgraph = self.analyzer.eval_build_nx_graph(
+            [c for c in self.cites if c['obj'].startswith(prefix + "6")])
+
+    def assertSameRanking(self, algorithm):
+        want = dict(self.analyzer.eval_rank_graph(self.nxgraph, algorithm))
+        got = dict(self.matrix.rank(self.matrix.restrict(), algorithm))
+        self.assertEqual(set(want), set(got))
+        for uri in want:
+            self.assertAlmostEqual(want[uri], got[uri], places=6, msg=uri)
+
+    def test_pagerank(self):
+        self.assertSameRanking("pagerank")
+
+    def test_hits(self):
+        self.assertSameRanking("hits")
+
+    def test_indegree(self):
+        self.assertSameRanking("indegree")
+
+    def test_restrict(self):
+        # only citations made by cases that cite the article (and
+        # are decided before 2000)
+        graph = self.matrix.restrict("http://lagen.nu/ext/celex/12008E101", 2000)
+        self.assertEqual([("http://lagen.nu/ext/celex/61999J0006",
+                           "http://lagen.nu/ext/celex/61998J0005")],
+                         self.matrix.edges(graph))
+        # only citations made by cases decided before 1995, with
+        # citations of different pinpoints in the same case merged
+        graph = self.matrix.restrict(year=1995)
+        self.assertEqual(4, len(self.matrix.edges(graph)))
@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+from lxml import etree
+
+from ferenda import util
+from ferenda.compat import unittest
+from ferenda.testutil import RepoTester
+from ferenda.sources.legal.eu import EURLexActs
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "kravanalys"))
+import add_links
+import bulk_download
+import batchrunner
+
+
+def upcase(path):
+    # module level, so that it can be sent to the worker processes
+    if "crash" in util.readfile(path):
+        raise ValueError("cannot handle %s" % path)
+    return {"file": path, "status": "OK", "flags": util.readfile(path).upper()}
+
+
+class LinkifyTree(unittest.TestCase):
+    def test_linkify(self):
+        root = etree.fromstring("<div><p>Se förordning (EU) nr 1025/2012.</p>"
+                                "<p><a>direktiv 2011/83/EU</a> och direktiv 2011/83/EU</p></div>")
+        self.assertEqual(2, add_links.linkify_tree(root))
+        links = root.xpath("//a[@class='celex-ref']")
+        self.assertEqual([" förordning (EU) nr 1025/2012", " direktiv 2011/83/EU"],
+                         [a.text for a in links])
+        self.assertTrue(links[0].get("href").endswith("/32012R1025"))
+        self.assertTrue(links[1].get("href").endswith("/32011L0083"))
+
+    def test_comment_tail(self):
+        # the text following a comment or processing instruction is
+        # linked as well
+        root = etree.fromstring("<p>Se <!-- c --> förordning (EU) nr 1025/2012 "
+                                "<?pi x?> och direktiv 2011/83/EU</p>")
+        self.assertEqual(2, add_links.linkify_tree(root))
+        self.assertEqual(["/32012R1025", "/32011L0083"],
+                         [a.get("href")[-11:] for a in root.iter("a")])
+        self.assertEqual(1, len(root.xpath("//comment()")))
+        self.assertEqual(1, len(root.xpath("//processing-instruction()")))
+
+    def test_unparseable(self):
+        # files that cannot be parsed are reported as crashed and are
+        # not recorded in the checkpoint, so that they are run again
+        datadir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, datadir)
+        good = datadir + os.sep + "good.xhtml"
+        bad = datadir + os.sep + "bad.xhtml"
+        util.writefile(good, "<p>Se förordning (EU) nr 1025/2012.</p>")
+        util.writefile(bad, "")
+        checkpoint = datadir + os.sep + "checkpoint.json"
+        rows = {}
+        def on_result(path, row, skipped):
+            rows[path] = row
+        manifest = [bad, good]
+        self.assertEqual((2, 0), batchrunner.run_batch(add_links.process_path, manifest,
+                                                       checkpoint=checkpoint, workers=1,
+                                                       on_result=on_result))
+        self.assertEqual("CRASH", rows[bad]["status"])
+        self.assertEqual(1, rows[good]["created"])
+        util.writefile(bad, "<p>Se direktiv 2011/83/EU</p>")
+        self.assertEqual((1, 1), batchrunner.run_batch(add_links.process_path, manifest,
+                                                       checkpoint=checkpoint, workers=1,
+                                                       on_result=on_result))
+        self.assertEqual(1, rows[bad]["created"])
+
+
+class RunBatch(unittest.TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.checkpoint = self.datadir + os.sep + "checkpoint.json"
+        self.report = self.datadir + os.sep + "report.jsonl"
+        for name in ("a", "b", "c"):
+            util.writefile(self.source(name), "text %s" % name)
+        self.manifest = batchrunner.build_manifest(self.datadir + os.sep + "src",
+                                                   [".txt"])
+        self.called = []
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def source(self, name):
+        return os.sep.join([self.datadir, "src", name + ".txt"])
+
+    def func(self, path):
+        self.called.append(os.path.basename(path))
+        return upcase(path)
+
+    def run_batch(self, func=None, workers=1, **kwargs):
+        return batchrunner.run_batch(func or self.func, self.manifest,
+                                     report=self.report, checkpoint=self.checkpoint,
+                                     workers=workers, **kwargs)
+
+    def rows(self):
+        with open(self.report) as fp:
+            return [json.loads(line) for line in fp]
+
+    def status(self, name):
+        return dict((row["file"], row["status"]) for row in self.rows())[self.source(name)]
+
+    def test_manifest(self):
+        util.writefile(os.sep.join([self.datadir, "src", "sub", "d.txt"]), "d")
+        util.writefile(os.sep.join([self.datadir, "src", "e.csv"]), "e")
+        self.assertEqual([self.source("a"), self.source("b"), self.source("c"),
+                          os.sep.join([self.datadir, "src", "sub", "d.txt"])],
+                         batchrunner.build_manifest(self.datadir + os.sep + "src",
+                                                    [".txt"]))
+        self.assertEqual([self.source("a")],
+                         batchrunner.build_manifest(self.source("a"), [".txt"]))
+
+    def test_run(self):
+        self.assertEqual((3, 0), self.run_batch())
+        self.assertEqual(["a.txt", "b.txt", "c.txt"], self.called)
+        self.assertEqual(["TEXT A", "TEXT B", "TEXT C"],
+                         [row["flags"] for row in self.rows()])
+
+    def test_parallel(self):
+        results = []
+        self.assertEqual((3, 0), self.run_batch(upcase, workers=2,
+                                                on_result=lambda *args: results.append(args)))
+        self.assertEqual(self.manifest, sorted(path for (path, row, skipped) in results))
+        self.assertEqual(["TEXT A", "TEXT B", "TEXT C"],
+                         sorted(row["flags"] for row in self.rows()))
+        # the checkpoint was written by the main process
+        self.assertEqual((0, 3), self.run_batch(upcase, workers=2))
+
+    def test_resume(self):
+        self.run_batch()
+        self.called[:] = []
+        # unchanged files are skipped, and their previous result
+        # rows are reported again
+        self.assertEqual((0, 3), self.run_batch())
+        self.assertEqual([], self.called)
+        self.assertEqual(["TEXT A", "TEXT B", "TEXT C"],
+                         [row["flags"] for row in self.rows()])
+        # a file with a new timestamp but the same content is still
+        # skipped, a file with new content is not
+        util.writefile(self.source("a"), "text a")
+        os.utime(self.source("a"), (time.time() + 2, time.time() + 2))
+        util.writefile(self.source("b"), "text bb")
+        self.assertEqual((1, 2), self.run_batch())
+        self.assertEqual(["b.txt"], self.called)
+        # force runs everything
+        self.assertEqual((3, 0), self.run_batch(force=True))
+
+    def test_resume_interrupted(self):
+        # the checkpoint is saved every CHECKPOINT_INTERVAL files, and
+        # when the run is aborted
+        def interrupt(path):
+            if path.endswith("c.txt"):
+                raise KeyboardInterrupt
+            return self.func(path)
+        old = batchrunner.CHECKPOINT_INTERVAL
+        batchrunner.CHECKPOINT_INTERVAL = 1
+        self.addCleanup(setattr, batchrunner, "CHECKPOINT_INTERVAL", old)
+        with self.assertRaises(KeyboardInterrupt):
+            self.run_batch(interrupt)
+        self.called[:] = []
+        self.assertEqual((1, 2), self.run_batch())
+        self.assertEqual(["c.txt"], self.called)
+
+    def test_crash(self):
+        util.writefile(self.source("b"), "crash")
+        self.assertEqual((3, 0), self.run_batch())
+        row = self.rows()[1]
+        self.assertEqual(("CRASH", self.source("b")), (row["status"], row["file"]))
+        self.assertIn("cannot handle", row["flags"])
+        # crashed files are not recorded in the checkpoint, so they
+        # are run again
+        self.called[:] = []
+        self.assertEqual((1, 2), self.run_batch())
+        self.assertEqual(["b.txt"], self.called)
+        self.assertEqual("CRASH", self.status("b"))
+        util.writefile(self.source("b"), "text b")
+        self.assertEqual((1, 2), self.run_batch())
+        self.assertEqual("OK", self.status("b"))
+        self.assertEqual((0, 3), self.run_batch())
+
+
+class BulkDownload(RepoTester):
+    # runs kravanalys/bulk_download.py against a local stub of the
+    # Cellar SPARQL endpoint
+    repoclass = EURLexActs
+
+    # basic act -> consolidated versions
+    consolidations = {"32010R0001": ["02010R0001-20150101", "02010R0001-20200101"],
+                      "32011L0002": ["02011L0002-20120101"],
+                      "32012R0003": []}
+    # celex -> available swedish manifestation types
+    manifestations = {"32010R0001": ["pdf", "xhtml"],
+                      "02010R0001-20150101": ["html"],
+                      "02010R0001-20200101": ["xhtml", "html"],
+                      "32011L0002": ["html", "xhtml"],
+                      "02011L0002-20120101": ["pdf"],
+                      "32012R0003": ["xhtml"]}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+            query = parse_qs(body)['query'][0]
+            self.server.test.queries.append(query)
+            if self.server.test.failures.get("?cons_celex" in query):
+                # a failing history (True) or manifestation (False) query
+                self.server.test.failures["?cons_celex" in query] -= 1
+                return self.respond(500)
+            self.respond(200, json.dumps(self.server.test.sparqlresults(query)),
+                         "application/sparql-results+json")
+
+        def do_GET(self):
+            server = self.server
+            with server.lock:
+                server.active += 1
+                server.maxactive = max(server.active, server.maxactive)
+                server.gets.append(self.path)
+            time.sleep(0.05)
+            with server.lock:
+                server.active -= 1
+            if self.path.endswith(".missing"):
+                return self.respond(404)
+            ctype = "text/html" if self.path.endswith(".html") else "application/xhtml+xml"
+            self.respond(200, "content of %s" % self.path[7:], ctype)
+
+        def respond(self, status, body="", contenttype="text/plain"):
+            body = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", contenttype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def setUp(self):
+        super(BulkDownload, self).setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.Handler)
+        self.server.test = self
+        self.server.lock = threading.Lock()
+        self.server.active = self.server.maxactive = 0
+        self.server.gets = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.baseurl = "http://127.0.0.1:%s" % self.server.server_port
+        self.queries = []
+        self.failures = {}
+        self.csvfile = self.datadir + os.sep + "eurlex.csv"
+        self.statefile = self.datadir + os.sep + "state.json"
+        util.writefile(self.csvfile, "Title,CELEX number\n" +
+                       "".join("Act %s,%s\n" % (c, c) for c in sorted(self.consolidations)))
+        self.patch("SPARQL_ENDPOINT", self.baseurl + "/sparql")
+        self.patch("rate_limiter", bulk_download.RateLimiter(50))
+        self.patch("BATCH_SIZE", 50)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super(BulkDownload, self).tearDown()
+
+    def patch(self, name, value):
+        old = getattr(bulk_download, name)
+        setattr(bulk_download, name, value)
+        self.addCleanup(setattr, bulk_download, name, old)
+
+    def sparqlresults(self, query):
+        def literal(value):
+            return {"type": "literal", "value": value}
+        values = re.findall(r'"([^"]+)"\^\^xsd:string', query)
+        bindings = []
+        if "?cons_celex" in query:
+            for basic in values:
+                for cons in self.consolidations.get(basic, []):
+                    bindings.append({"basic_celex": literal(basic),
+                                     "cons_celex": literal(cons)})
+        else:
+            for celex in values:
+                for mtype in self.manifestations.get(celex, []):
+                    url = "%s/items/%s.%s" % (self.baseurl, celex, mtype)
+                    if celex == "02010R0001-20200101":
+                        url += ".missing"  # the newest version can't be fetched
+                    bindings.append({"celex": literal(celex),
+                                     "manifestation_uri": {"type": "uri", "value": url},
+                                     "type": literal(mtype)})
+        return {"head": {"vars": []}, "results": {"bindings": bindings}}
+
+    def run_download(self, workers=4):
+        with redirect_stdout(StringIO()):
+            return bulk_download.run(self.csvfile, self.repo, workers=workers,
+                                     state_file=self.statefile)
+
+    def test_download(self):
+        stats = self.run_download()
+        # one query for all consolidation histories and one for all
+        # manifestations
+        self.assertEqual(2, len(self.queries))
+        self.assertIn("?cons_celex", self.queries[0])
+        self.assertEqual(6, len(re.findall(r'\^\^xsd:string', self.queries[1])))
+        self.assertEqual({'total': 3, 'success_cons': 1, 'success_basic': 2,
+                          'failed': 0, 'skipped': 0}, stats)
+        # the newest consolidated version failed, so the next one was
+        # used. The consolidated version of the directive has no
+        # html/xhtml manifestation, so the basic act was used
+        for celex, source, suffix in (("32010R0001", "02010R0001-20150101.html", ".html"),
+                                      ("32011L0002", "32011L0002.xhtml", ".xhtml"),
+                                      ("32012R0003", "32012R0003.xhtml", ".xhtml")):
+            path = self.repo.store.path(celex, 'downloaded', suffix)
+            self.assertEqual("content of " + source, util.readfile(path))
+        self.assertGreater(self.server.maxactive, 1)
+        with open(self.statefile) as fp:
+            self.assertEqual(["32010R0001", "32011L0002", "32012R0003"],
+                             sorted(json.load(fp)))
+
+        # a second run is resumed from the state file and makes no
+        # requests at all
+        self.queries[:] = []
+        self.server.gets[:] = []
+        stats = self.run_download()
+        self.assertEqual(3, stats['skipped'])
+        self.assertEqual([], self.queries)
+        self.assertEqual([], self.server.gets)
+
+    def test_failed_lookup(self):
+        # a failed query is retried...
+        self.failures = {True: 1, False: 2}
+        stats = self.run_download()
+        self.assertEqual(2 + 3, len(self.queries))
+        self.assertEqual(3, stats['success_cons'] + stats['success_basic'])
+
+    def test_failed_lookup_state(self):
+        # ...and if it keeps failing, the acts are not downloaded (by
+        # falling back to the basic act) or recorded as done
+        self.failures = {True: 3}
+        stats = self.run_download()
+        self.assertEqual(3, stats['failed'])
+        self.assertEqual([], self.server.gets)
+        with open(self.statefile) as fp:
+            self.assertEqual({}, json.load(fp))
+        self.failures = {False: 3}
+        stats = self.run_download()
+        self.assertEqual(3, stats['failed'])
+        self.assertEqual([], self.server.gets)
+        # the next run looks them up again
+        stats = self.run_download()
+        self.assertEqual({'total': 3, 'success_cons': 1, 'success_basic': 2,
+                          'failed': 0, 'skipped': 0}, stats)
+
+    def test_ratelimit(self):
+        self.patch("rate_limiter", bulk_download.RateLimiter(20))
+        start = time.time()
+        self.run_download()
+        # 2 queries and 4 downloads, at most 20 per second in total
+        self.assertEqual(6, len(self.queries) + len(self.server.gets))
+        self.assertGreaterEqual(time.time() - start, 5 / 20)
@@ -626,8 +626,11 @@ class TestACExpand(unittest.TestCase):
         config.wsgiappclass = 'lagen.nu.wsgiapp.WSGIApp'
         self.rootdir = os.environ.get("FERENDA_TESTDATA", "tng.lagen.nu/data")
         self.assertTrue(os.path.exists(self.rootdir), "You probably need to set the FERENDA_TESTDATA environment variable")
-        self.wsgiapp = manager.make_wsgi_app(config=config,
-                                             repos=[SFS(datadir=self.rootdir)])
+        repo = SFS(datadir=self.rootdir)
+        if not os.path.exists(repo.autocomplete_metadata_path()):
+            # normally created by sfs relate
+            repo.make_autocomplete_metadata()
+        self.wsgiapp = manager.make_wsgi_app(config=config, repos=[repo])
 
     def test_expand_shortname(self):
         self.assertEqual("https://lagen.nu/1949:105#K",
@@ -655,6 +658,13 @@ class TestACExpand(unittest.TestCase):
         self.assertEqual("https://lagen.nu/1998:204#P3",
                          self.wsgiapp.expand_partial_ref("PUL 3"))
 
+    def test_expand_memoized(self):
+        self.wsgiapp.expand_partial_ref.cache_clear()
+        self.wsgiapp.expand_partial_ref("TF 1:1")
+        self.assertEqual("https://lagen.nu/1949:105#K1P1",
+                         self.wsgiapp.expand_partial_ref("TF 1:1"))
+        self.assertEqual(1, self.wsgiapp.expand_partial_ref.cache_info().hits)
+
     def test_prop_start(self):
         self.assertEqual("https://lagen.nu/prop/",
                          self.wsgiapp.expand_partial_ref("prop"))
@@ -5,8 +5,14 @@ from builtins import *
 
 import unittest
 import datetime
+import os
+import shutil
+import tempfile
+import time
 
+from ferenda import util
 from ferenda.sources.legal.se import SwedishLegalSource
+from ferenda.sources.legal.se.swedishlegalsource import ParseOptions
 
 
 class TestSwedishLegalSource(unittest.TestCase):
@@ -28,3 +34,82 @@ class TestSwedishLegalSource(unittest.TestCase):
         # handle spurious spaces
         self.assertEqual(repo.parse_iso_date("2010- 02 -03"),
                          datetime.date(2010, 2, 3))
+
+
+class TestParseOptions(unittest.TestCase):
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.sourcefile = self.datadir + os.sep + "options.py"
+        self.indexfile = self.datadir + os.sep + "options.idx"
+        util.writefile(self.sourcefile, """{
+    # a comment
+    ("sfs", "1998:204"): "default",
+    ("prop", "1997/98:44"): "metadataonly",
+    ("sou", "2008:35"): "skip",
+}""")
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_lookup(self):
+        opts = ParseOptions(self.sourcefile, self.indexfile)
+        self.assertTrue(os.path.exists(self.indexfile))
+        self.assertEqual("default", opts.get(("sfs", "1998:204")))
+        self.assertEqual("metadataonly", opts[("prop", "1997/98:44")])
+        self.assertEqual("skip", opts.get(("sou", "2008:35")))
+        self.assertIsNone(opts.get(("sou", "2008:36")))
+        self.assertEqual("x", opts.get(("aaa", ""), "x"))
+        self.assertNotIn(("zzz", "1"), opts)
+        with self.assertRaises(KeyError):
+            opts[("sfs", "1998:205")]
+
+    def test_recompile(self):
+        ParseOptions(self.sourcefile, self.indexfile)
+        util.writefile(self.sourcefile, '{("sfs", "1998:204"): "skip"}')
+        os.utime(self.sourcefile, (time.time() + 2, time.time() + 2))
+        opts = ParseOptions(self.sourcefile, self.indexfile)
+        self.assertEqual("skip", opts.get(("sfs", "1998:204")))
+        self.assertIsNone(opts.get(("sou", "2008:35")))
+
+    def test_shared_index(self):
+        # all repos use the same options file, so they should share
+        # a single compiled index under the datadir
+        resdir = self.datadir + os.sep + "res"
+        util.copy_if_different(self.sourcefile,
+                               os.sep.join([resdir, "options", "options.py"]))
+
+        class Foo(SwedishLegalSource):
+            alias = "foo"
+            loadpath = [resdir]
+
+        class Bar(Foo):
+            alias = "bar"
+
+        foo = Foo(datadir=self.datadir)
+        bar = Bar(datadir=self.datadir)
+        self.assertIs(foo.parse_options, bar.parse_options)
+        self.assertEqual("skip", bar.parse_options.get(("sou", "2008:35")))
+        self.assertTrue(os.path.exists(
+            os.sep.join([self.datadir, "options", "options.idx"])))
+        self.assertEqual([], [f for f in os.listdir(self.datadir + os.sep + "options")
+                              if f != "options.idx"])
+
+    def test_changed_source(self):
+        # an edit to the options file (like the one made by
+        # Devel.handle_change_options) is picked up as soon as the
+        # cached property is invalidated
+        resdir = self.datadir + os.sep + "res"
+        sourcefile = os.sep.join([resdir, "options", "options.py"])
+        util.copy_if_different(self.sourcefile, sourcefile)
+
+        class Foo(SwedishLegalSource):
+            alias = "foo"
+            loadpath = [resdir]
+
+        repo = Foo(datadir=self.datadir)
+        self.assertIsNone(repo.parse_options.get(("foo", "2010:1")))
+        util.writefile(sourcefile, '{("foo", "2010:1"): "skip"}')
+        os.utime(sourcefile, (time.time() + 2, time.time() + 2))
+        del repo.__dict__['parse_options']
+        self.assertEqual("skip", repo.parse_options.get(("foo", "2010:1")))
+        self.assertIs(repo.parse_options, Foo(datadir=self.datadir).parse_options)
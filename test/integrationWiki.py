@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+
+import json
+import os
+import shutil
+import tempfile
+
+from ferenda.compat import unittest, patch, Mock
+from ferenda import util
+
+# SUT
+from ferenda.sources.general import MediaWiki
+
+
+class Download(unittest.TestCase):
+    dump = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+  <siteinfo>
+    <namespaces>
+      <namespace key="0" />
+      <namespace key="2">User</namespace>
+      <namespace key="14">Category</namespace>
+    </namespaces>
+  </siteinfo>
+  <page>
+    <title>Foo</title>
+    <revision><text>Text about foo</text></revision>
+  </page>
+  <page>
+    <title>Bar</title>
+    <revision><text>%s</text></revision>
+  </page>
+  <page>
+    <title>Category:Baz</title>
+    <revision><text>Text about baz</text></revision>
+  </page>
+  <page>
+    <title>User:Someone</title>
+    <revision><text>Not extracted</text></revision>
+  </page>
+  <page>
+    <title>Quux</title>
+    <redirect title="Foo" />
+    <revision><text>#REDIRECT [[Foo]]</text></revision>
+  </page>
+  %s
+</mediawiki>"""
+
+    extrapage = """<page>
+    <title>Old</title>
+    <revision><text>Text about old</text></revision>
+  </page>"""
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.repo = MediaWiki(datadir=self.datadir,
+                              mediawikidump="http://localhost/dump.xml")
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def download(self, dump):
+        resp = Mock()
+        resp.iter_content.return_value = [dump.encode("utf-8")]
+        with patch("ferenda.sources.general.wiki.requests.get",
+                   return_value=resp):
+            self.repo.download()
+
+    def test_download_twice(self):
+        self.download(self.dump % ("Text about bar", self.extrapage))
+        self.assertEqual(["Bar", "Baz", "Foo", "Old", "dump"],
+                         sorted(self.repo.store.list_basefiles_for("parse")))
+        self.assertIn("Text about baz",
+                      util.readfile(self.repo.store.downloaded_path("Baz")))
+        digestpath = self.repo.store.resourcepath("dumpdigests.json")
+        with open(digestpath) as fp:
+            self.assertEqual(["Bar", "Baz", "Foo", "Old"], sorted(json.load(fp)))
+
+        # a new dump where one page has changed and one is gone. The
+        # unchanged pages should not be rewritten.
+        for basefile in ("Foo", "Bar", "Baz"):
+            os.utime(self.repo.store.downloaded_path(basefile), (0, 0))
+        self.download(self.dump % ("New text about bar", ""))
+        self.assertEqual(0, os.path.getmtime(self.repo.store.downloaded_path("Foo")))
+        self.assertEqual(0, os.path.getmtime(self.repo.store.downloaded_path("Baz")))
+        self.assertNotEqual(0, os.path.getmtime(self.repo.store.downloaded_path("Bar")))
+        self.assertIn("New text about bar",
+                      util.readfile(self.repo.store.downloaded_path("Bar")))
+        self.assertFalse(os.path.exists(self.repo.store.downloaded_path("Old")))
+        with open(digestpath) as fp:
+            self.assertEqual(["Bar", "Baz", "Foo"], sorted(json.load(fp)))
@@ -156,6 +156,46 @@ class TestComposite(RepoTester):
         self.assertEqual(set(["1", "3"]),
                          set(self.repo.store.list_basefiles_for("generate")))
 
+    def test_downloadsperhost(self):
+        # the same default as for any other repo
+        self.assertEqual(DocumentRepository.get_default_options()['downloadsperhost'],
+                         CompositeExample.get_default_options()['downloadsperhost'])
+
+    def test_subrepo_index(self):
+        # downloading writes an index of which subrepos have which
+        # basefiles
+        self.repo.download()
+        self.assertTrue(os.path.exists(self.repo.store.subrepo_index_path()))
+        # a new instance (like the one in a worker process) uses the
+        # index instead of checking for downloaded files
+        repo = CompositeExample(datadir=self.datadir)
+        checked = []
+        for c in repo.subrepos:
+            store = repo.get_instance(c).store
+            def downloaded_path(basefile, orig=store.downloaded_path, alias=c.alias,
+                                **kwargs):
+                checked.append(alias)
+                return orig(basefile, **kwargs)
+            store.downloaded_path = downloaded_path
+        self.assertEqual(["b", "a"], [inst.alias for inst in
+                                      repo.get_preferred_instances("1")])
+        self.assertEqual(["b"], [inst.alias for inst in
+                                 repo.get_preferred_instances("2")])
+        self.assertEqual(["a"], [inst.alias for inst in
+                                 repo.get_preferred_instances("3")])
+        self.assertEqual([], list(repo.get_preferred_instances("4")))
+        self.assertEqual([], checked)
+        # without an index, the downloaded files are checked (unless
+        # this process already knows that the subrepo has the basefile)
+        self.repo.store.invalidate_subrepo_index()
+        self.assertEqual(["a"], [inst.alias for inst in
+                                 repo.get_preferred_instances("3")])
+        self.assertEqual(["b"], checked)
+        # listing basefiles for parse writes the index as well
+        self.assertEqual(set(["3", "2", "1"]),
+                         set(self.repo.store.list_basefiles_for("parse")))
+        self.assertTrue(os.path.exists(self.repo.store.subrepo_index_path()))
+
     def test_config(self):
         # test it with self.repo being initialized with some kwargs parameters
         self.repo.download()
@@ -267,8 +267,9 @@ class Decorators(unittest.TestCase):
         # is called with 1 argument
         mockrepo.create_external_resources.assert_called_with(mockdoc)
         
-        # 3 ensure that a Graph object is created, its parse and
-        # serialize methods called
+        # 3 ensure that a Graph object is created, its parse method
+        # called, and the result written by the docstore
+        self.assertTrue(mockrepo.store.write_distilled.called)
 
         # FIXME: Why doesn't the patching work?!
         # self.assertTrue(mock_graph().parse.called)
@@ -284,7 +285,6 @@ class Decorators(unittest.TestCase):
             testfunc(mockrepo, mockdoc)
         self.assertTrue(mockrepo.log.warning.called)
         os.remove("parsed_path.xhtml")
-        os.remove("distilled_path.xhtml")
         os.remove("entry_path.json")
 
     def test_handleerror(self):
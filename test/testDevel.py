@@ -8,6 +8,8 @@ import os
 import tempfile
 import re
 import shutil
+import json
+from datetime import datetime
 from tempfile import mkstemp
 
 
@@ -17,7 +19,7 @@ DCTERMS = Namespace("http://purl.org/dc/terms/")
 
 
 from ferenda.compat import unittest, patch, call,  Mock, MagicMock
-from ferenda import DocumentRepository, DocumentStore, util
+from ferenda import DocumentRepository, DocumentStore, DocumentEntry, util
 
 # SUT
 from ferenda import Devel
@@ -392,3 +394,86 @@ class Mkpatch(unittest.TestCase):
         patchcontent = util.readfile(patchpath, encoding="koi8_r")
         self.assertIn("+Бойцовский клуб", patchcontent)
         
+
+
+class StatusReport(unittest.TestCase):
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        globalconf = LayeredConfig(
+            Defaults({'datadir': self.datadir,
+                      'devel': {'class': 'ferenda.Devel'},
+                      'compress': '',
+                      'base': {'class': 'ferenda.DocumentRepository'}}),
+            cascade=True)
+        self.d = Devel()
+        self.d.config = globalconf.devel
+        self.repo = DocumentRepository(datadir=self.datadir)
+        util.writefile(self.datadir + "/rsrc/resources.xml",
+                       "<configuration><sitename>Test</sitename></configuration>")
+        for basefile, success, warnings in (("1", True, None),
+                                            ("2", True, "Minor issue"),
+                                            ("3", False, None),
+                                            ("4", "removed", None)):
+            self.save_entry(basefile, success, 2.0, warnings)
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def save_entry(self, basefile, success, duration, warnings=None):
+        entry = DocumentEntry(self.repo.store.documententry_path(basefile))
+        entry.status['parse'] = {'success': success,
+                                 'date': datetime(2016, 1, 1),
+                                 'duration': duration}
+        if warnings:
+            entry.status['parse']['warnings'] = warnings
+        entry.save()
+
+    def durations(self):
+        with open(self.datadir + "/base/entries/.durations.json") as fp:
+            return json.load(fp)
+
+    def test_report(self):
+        self.d.statusreport("base")
+        index = util.readfile(self.datadir + "/status/status.html")
+        self.assertIn("3 processed", index)
+        self.assertIn("1 failed", index)
+        self.assertIn('href="base/1.html"', index)
+        page = util.readfile(self.datadir + "/status/base/1.html")
+        self.assertIn("Minor issue", page)
+        # all docs are listed, not only those with warnings or errors
+        self.assertIn("<b>1</b>", page)
+        self.assertNotIn("<b>4</b>", page)
+        self.assertEqual({'parse': {'1': 2.0, '2': 2.0, '3': 2.0, '4': -1}},
+                         self.durations())
+
+    def test_pagination(self):
+        self.d.statusreport_pagesize = 1
+        self.d.statusreport("base")
+        self.assertEqual(["1.html", "2.html", "3.html"],
+                         sorted(f for f in os.listdir(self.datadir + "/status/base")
+                                if f.endswith(".html")))
+        self.assertIn("<b>1</b>", util.readfile(self.datadir + "/status/base/1.html"))
+        self.assertIn("<b>2</b>", util.readfile(self.datadir + "/status/base/2.html"))
+        self.assertIn("<b>3</b>", util.readfile(self.datadir + "/status/base/3.html"))
+
+    def test_incremental(self):
+        self.d.statusreport("base")
+        # only the entries saved since the last report should be read
+        self.save_entry("1", False, 5.0)
+        os.unlink(self.repo.store.documententry_path("3"))
+        with patch.object(self.repo.store.__class__, 'load_entries',
+                          side_effect=self.repo.store.load_entries) as load:
+            self.d.statusreport("base")
+        self.assertEqual(["1"], list(load.call_args[0][0]))
+        self.assertEqual({'parse': {'1': 5.0, '2': 2.0, '4': -1}},
+                         self.durations())
+        page = util.readfile(self.datadir + "/status/base/1.html")
+        self.assertIn("<b>1</b>", page)
+        self.assertNotIn("<b>3</b>", page)
+        # an unchanged repo is neither reread nor rerendered
+        mtime = os.stat(self.datadir + "/status/base/1.html").st_mtime
+        with patch.object(self.repo.store.__class__, 'load_entries') as load:
+            self.d.statusreport("base")
+        self.assertEqual([], list(load.call_args[0][0]))
+        self.assertEqual(mtime, os.stat(self.datadir + "/status/base/1.html").st_mtime)
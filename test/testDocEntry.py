@@ -6,6 +6,7 @@ from builtins import *
 import tempfile
 import shutil
 import os
+import threading
 from datetime import datetime
 from io import StringIO
 
@@ -230,3 +231,115 @@ class DocEntry(unittest.TestCase):
         self.assertEqual("2018-08-14T18:18:00", d.status['generate']['not_a_date'])
 
         
+
+
+class SQLiteEntries(DocEntry):
+    # runs all DocEntry tests with entries stored in a SQLite
+    # database, plus some that are specific to that backend
+
+    def setUp(self):
+        super(SQLiteEntries, self).setUp()
+        self.repo = DocumentRepository(datadir=self.datadir, entrytype="SQLITE")
+
+    def tearDown(self):
+        self.repo.store.set_entrytype("JSON")
+        super(SQLiteEntries, self).tearDown()
+
+    def _entrydata(self, path):
+        backend = DocumentEntry.backend_for(path)
+        return backend.conn.execute("SELECT data FROM entries WHERE path = ?",
+                                    (backend._key(path),)).fetchone()[0]
+
+    def _write(self, path, data):
+        DocumentEntry.backend_for(path).save(path, data)
+
+    def test_load(self):
+        path = self.repo.store.documententry_path("123/a")
+        self._write(path, self.basic_json)
+        d = DocumentEntry(path=path)
+        self.assertEqual(d.orig_checked, datetime(2013,3,27,20,46,37))
+        self.assertEqual(d.id,'http://example.org/123/a')
+        self.assertFalse(os.path.exists(path))
+
+    def test_save_db(self):
+        path = self.repo.store.documententry_path("123/a")
+        d = DocumentEntry()
+        d.orig_checked = datetime(2013,3,27,20,46,37)
+        d.orig_url = 'http://source.example.org/doc/123/a'
+        d.save(path=path)
+        self.assertFalse(os.path.exists(path))
+        self.assertIn('"orig_url": "http://source.example.org/doc/123/a"',
+                      self._entrydata(path))
+        self.assertEqual(datetime(2013,3,27,20,46,37),
+                         DocumentEntry(path).orig_checked)
+
+    def test_modify(self):
+        path = self.repo.store.documententry_path("123/a")
+        self._write(path, self.basic_json)
+        d = DocumentEntry(path=path)
+        d.orig_updated = datetime(2013, 3, 27, 20, 59, 42, 325067)
+        with open(self.datadir+"/xhtml","w") as f:
+            f.write("<div>xhtml fragment</div>")
+        d.set_content(self.datadir+"/xhtml", "http://example.org/test",
+                      mimetype="xhtml", inline=True)
+        d.save()
+        self.assertEqual(self.d2u(self._entrydata(path)), self.modified_json)
+
+    def test_load_status(self):
+        path = self.repo.store.documententry_path("123/a")
+        self._write(path, self.status_json)
+        d = DocumentEntry(path=path)
+        self.assertEqual(datetime(2018,8,14,18,18,00), d.status['generate']['date'])
+
+    def test_threads(self):
+        # each thread needs a connection of its own
+        paths = [self.repo.store.documententry_path(str(i)) for i in range(4)]
+        errors = []
+        def update(path):
+            try:
+                for i in range(5):
+                    d = DocumentEntry(path)
+                    d.orig_url = "http://source.example.org/doc/%s" % i
+                    d.save(path)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=update, args=(path,)) for path in paths]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        for path in paths:
+            self.assertEqual("http://source.example.org/doc/4",
+                             DocumentEntry(path).orig_url)
+
+    def test_import_json(self):
+        self.repo.store.set_entrytype("JSON")
+        path = self.repo.store.documententry_path("123/a")
+        util.writefile(path, self.basic_json)
+        self.repo.store.set_entrytype("SQLITE")
+        os.unlink(path)
+        self.assertEqual(DocumentEntry(path).id, 'http://example.org/123/a')
+        DocumentEntry.backend_for(path).export_json()
+        self.assertEqual(self.d2u(util.readfile(path)), self.basic_json)
+
+    def test_load_entries(self):
+        for basefile in ("123/a", "123/b", "124/a"):
+            d = DocumentEntry()
+            d.id = "http://example.org/" + basefile
+            d.save(path=self.repo.store.documententry_path(basefile))
+        self.assertEqual(["123/a", "123/b", "124/a"],
+                         list(self.repo.store.list_basefiles_for("news")))
+        entries = dict(self.repo.store.load_entries(["124/a", "123/a", "125/a"]))
+        self.assertEqual("http://example.org/123/a", entries["123/a"].id)
+        self.assertEqual("http://example.org/124/a", entries["124/a"].id)
+        self.assertIsNone(entries["125/a"])
+
+        # a broken entry makes load_entries load the rest one by one,
+        # which must still report missing entries as None
+        path = self.repo.store.documententry_path("123/b")
+        DocumentEntry.backend_for(path).save(path, "{broken")
+        entries = dict(self.repo.store.load_entries(["123/b", "124/a", "125/a"]))
+        self.assertEqual("http://example.org/124/a", entries["124/a"].id)
+        self.assertIsNone(entries["123/b"])
+        self.assertIsNone(entries["125/a"])
@@ -3,18 +3,25 @@ from __future__ import (absolute_import, division,
                         print_function, unicode_literals)
 from builtins import *
 
+import json
 import os
 import sys
 import shutil
 import tempfile
 import time
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
 from zipfile import ZipFile
 
-from ferenda.compat import unittest
+from rdflib import Graph, URIRef, BNode, Literal
+from rdflib.compare import isomorphic
+from rdflib.namespace import DCTERMS
+
+from ferenda.compat import unittest, patch
 
 #SUT
 from ferenda import DocumentStore, DocumentEntry
+from ferenda.elements import Body, Section, Paragraph
 from ferenda import util
 from ferenda.errors import *
 
@@ -399,6 +406,265 @@ class XzCompression(Compression):
     
 
 
+class DistilledFormat(unittest.TestCase):
+    distilled_format = "xml"
+    expected_suffix = ".rdf"
+
+    def p(self,path):
+        path = self.datadir+"/"+path
+        return path.replace('/', '\\') if os.sep == '\\' else path
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.store = DocumentStore(self.datadir, distilled_format=self.distilled_format)
+        self.graph = Graph()
+        self.graph.bind("dcterms", DCTERMS)
+        uri = URIRef("http://example.org/123/a")
+        node = BNode()
+        self.graph.add((uri, DCTERMS.title, Literal("Tïtle", lang="sv")))
+        self.graph.add((uri, DCTERMS.issued, Literal(date(2012, 3, 4))))
+        self.graph.add((uri, DCTERMS.isPartOf, node))
+        self.graph.add((node, DCTERMS.identifier, Literal("1")))
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_write_read(self):
+        path = self.store.write_distilled("123/a", self.graph)
+        self.assertEqual(self.p("distilled/123/a" + self.expected_suffix), path)
+        self.assertEqual(path, self.store.distilled_path("123/a"))
+        self.assertEqual(self.distilled_format,
+                         self.store.distilled_file_format("123/a"))
+        self.assertTrue(isomorphic(self.graph, self.store.read_distilled("123/a")))
+        nt = self.store.read_distilled_as("123/a", "nt")
+        self.assertTrue(isomorphic(self.graph, Graph().parse(data=nt, format="nt")))
+        self.assertEqual(["123/a"], list(self.store.list_basefiles_for("relate")))
+
+    def test_other_format(self):
+        # files in any format can be read, regardless of the
+        # configured one, and are replaced when written
+        other = [f for f in self.store.distilled_formats if f != self.distilled_format][0]
+        otherstore = DocumentStore(self.datadir, distilled_format=other)
+        otherpath = otherstore.write_distilled("123/a", self.graph)
+        self.assertEqual(otherpath, self.store.distilled_path("123/a"))
+        self.assertEqual(other, self.store.distilled_file_format("123/a"))
+        self.assertTrue(isomorphic(self.graph, self.store.read_distilled("123/a")))
+        self.store.write_distilled("123/a", self.graph)
+        self.assertFalse(os.path.exists(otherpath))
+        self.assertEqual(self.distilled_format,
+                         self.store.distilled_file_format("123/a"))
+
+    def test_archive(self):
+        self.store.write_distilled("123/a", self.graph)
+        self.store.archive("123/a", "1")
+        self.assertTrue(os.path.exists(
+            self.p("archive/distilled/123/a/.versions/1" + self.expected_suffix)))
+        self.assertTrue(isomorphic(self.graph, self.store.read_distilled("123/a", "1")))
+
+
+class NTriplesDistilledFormat(DistilledFormat):
+    distilled_format = "nt"
+    expected_suffix = ".nt"
+
+
+class BinaryDistilledFormat(DistilledFormat):
+    distilled_format = "binary"
+    expected_suffix = ".rdfb"
+
+
+class SerializedFormat(unittest.TestCase):
+    serialized_format = "json"
+    expected_suffix = ".json"
+
+    def p(self,path):
+        path = self.datadir+"/"+path
+        return path.replace('/', '\\') if os.sep == '\\' else path
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.store = DocumentStore(self.datadir, serialized_format=self.serialized_format)
+        self.tree = Body([Section([Paragraph(["Hello"]),
+                                   Paragraph(["World"])],
+                                  ordinal="1", title="Main section")])
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def test_write_read(self):
+        path = self.store.write_serialized("123/a", self.tree)
+        self.assertEqual(self.p("serialized/123/a" + self.expected_suffix), path)
+        self.assertEqual(path, self.store.serialized_path("123/a"))
+        self.assertEqual(self.serialized_format,
+                         self.store.serialized_file_format("123/a"))
+        self.assertEqual(self.tree, self.store.read_serialized("123/a"))
+
+    def test_other_format(self):
+        other = [f for f in self.store.serialized_formats if f != self.serialized_format][0]
+        otherstore = DocumentStore(self.datadir, serialized_format=other)
+        otherpath = otherstore.write_serialized("123/a", self.tree)
+        self.assertEqual(otherpath, self.store.serialized_path("123/a"))
+        self.assertEqual(self.tree, self.store.read_serialized("123/a"))
+        self.store.write_serialized("123/a", self.tree)
+        self.assertFalse(os.path.exists(otherpath))
+
+    def test_archive(self):
+        self.store.write_serialized("123/a", self.tree)
+        self.store.archive("123/a", "1")
+        self.assertTrue(os.path.exists(
+            self.p("archive/serialized/123/a/.versions/1" + self.expected_suffix)))
+        self.assertEqual(self.tree, self.store.read_serialized("123/a", "1"))
+
+
+class BinarySerializedFormat(SerializedFormat):
+    serialized_format = "binary"
+    expected_suffix = ".elements"
+
+
+class Archive(unittest.TestCase):
+    def p(self,path):
+        path = self.datadir+"/"+path
+        return path.replace('/', '\\') if os.sep == '\\' else path
+
+    def setUp(self):
+        self.datadir = tempfile.mkdtemp()
+        self.store = DocumentStore(self.datadir)
+        # a document where only one line changes between versions
+        self.text = "".join("Line %s of the document\n" % i for i in range(200))
+
+    def tearDown(self):
+        shutil.rmtree(self.datadir)
+
+    def version_text(self, version):
+        return self.text.replace("Line 100 ", "Line 100 (version %s) " % version)
+
+    def archive_versions(self, versions, copy=False):
+        for version in versions:
+            util.writefile(self.store.downloaded_path("123/a"),
+                           self.version_text(version))
+            util.writefile(self.store.parsed_path("123/a"),
+                           "This is the parsed document")
+            util.writefile(self.store.generated_path("123/a"),
+                           "This is version %s (generated)" % version)
+            self.store.archive("123/a", version, copy=copy)
+
+    def test_deduplicate(self):
+        self.archive_versions(["1", "2"], copy=True)
+        parsed1 = self.store.parsed_path("123/a", version="1")
+        parsed2 = self.store.parsed_path("123/a", version="2")
+        self.assertTrue(os.path.samefile(parsed1, parsed2))
+        self.assertFalse(os.path.samefile(parsed1, self.store.parsed_path("123/a")))
+        self.assertFalse(os.path.samefile(self.store.downloaded_path("123/a", version="1"),
+                                          self.store.downloaded_path("123/a", version="2")))
+        self.assertEqual("This is version 2 (generated)",
+                         util.readfile(self.store.generated_path("123/a", version="2")))
+
+    def test_deduplicate_dir(self):
+        self.store.storage_policy = "dir"
+        for version in ("1", "2"):
+            util.writefile(self.store.downloaded_path("123/a"), self.version_text(version))
+            util.writefile(self.store.downloaded_path("123/a", attachment="appendix.txt"),
+                           "An unchanged appendix")
+            self.store.archive("123/a", version)
+        self.assertFalse(os.path.exists(self.store.downloaded_path("123/a")))
+        self.assertTrue(os.path.samefile(
+            self.store.downloaded_path("123/a", version="1", attachment="appendix.txt"),
+            self.store.downloaded_path("123/a", version="2", attachment="appendix.txt")))
+        self.assertEqual(["appendix.txt"],
+                         list(self.store.list_attachments("123/a", "downloaded", "2")))
+        with self.store.open_downloaded("123/a", version="1") as fp:
+            self.assertEqual(self.version_text("1"), fp.read())
+
+    def test_version_index(self):
+        # versions are listed in the order they were archived, not
+        # in the order of their filenames
+        self.archive_versions(["b", "a"])
+        util.writefile(self.store.generated_path("123/a"), "generated only")
+        self.store.archive("123/a", "c")
+        self.assertTrue(os.path.exists(self.store.version_index_path("123/a")))
+        self.assertEqual(["b", "a", "c"], list(self.store.list_versions("123/a")))
+        self.assertEqual(["b", "a"], list(self.store.list_versions("123/a", "downloaded")))
+        self.assertEqual(["b", "a", "c"], list(self.store.list_versions("123/a", "generated")))
+        # files created for an archived version after archiving it
+        # are found as well
+        util.writefile(self.store.parsed_path("123/a", version="c"), "parsed later")
+        self.assertEqual(["b", "a", "c"], list(self.store.list_versions("123/a", "parsed")))
+        
+    def test_unindexed_versions(self):
+        # archives without a version index (or archived files created
+        # without using archive) are found by walking the archive
+        util.writefile(self.p("archive/downloaded/123/a/.versions/1.html"), "version 1")
+        util.writefile(self.p("archive/parsed/123/a/.versions/2.xhtml"), "version 2")
+        self.assertEqual(["1", "2"], list(self.store.list_versions("123/a")))
+        self.assertTrue(os.path.exists(self.store.version_index_path("123/a")))
+        util.writefile(self.p("archive/downloaded/123/a/.versions/3.html"), "version 3")
+        self.store.index_version("123/a", "3")
+        self.assertEqual(["1", "2", "3"], list(self.store.list_versions("123/a")))
+
+    def test_index_versions(self):
+        self.archive_versions(["1", "2"])
+        with open(self.store.version_index_path("123/a")) as fp:
+            before = json.load(fp)["versions"]
+        # re-indexing an archived version keeps what's recorded for
+        # its files, and several versions are indexed with a single
+        # write of the index
+        with patch.object(self.store, '_write_version_index',
+                          wraps=self.store._write_version_index) as write:
+            self.store.index_versions("123/a", OrderedDict([("2", None),
+                                                             ("3", {"downloaded": {}})]))
+        self.assertEqual(1, write.call_count)
+        with open(self.store.version_index_path("123/a")) as fp:
+            after = json.load(fp)["versions"]
+        self.assertEqual(before, after[:2])
+        self.assertEqual({"version": "3", "files": {"downloaded": {}}}, after[2])
+        self.store.index_version("123/a", "1", {"generated": {}})
+        with open(self.store.version_index_path("123/a")) as fp:
+            self.assertEqual(before[0], json.load(fp)["versions"][0])
+
+    def test_deltas(self):
+        self.store.archive_deltas = True
+        self.archive_versions(["1", "2", "3"])
+        path = self.store.downloaded_path("123/a", version="2")
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(path + ".delta"))
+        self.assertLess(os.path.getsize(path + ".delta"), len(self.text) / 2)
+        self.assertEqual(["1", "2", "3"], list(self.store.list_versions("123/a", "downloaded")))
+        for version in ("1", "2", "3"):
+            with self.store.open_downloaded("123/a", version=version) as fp:
+                self.assertEqual(self.version_text(version), fp.read())
+        with self.store.open_downloaded("123/a", mode="rb", version="3") as fp:
+            self.assertEqual(self.version_text("3").encode("utf-8"), fp.read())
+        # the parsed file is identical in all versions, and is
+        # hardlinked instead
+        self.assertTrue(os.path.samefile(self.store.parsed_path("123/a", version="1"),
+                                         self.store.parsed_path("123/a", version="3")))
+        # re-parsing an archived version replaces its hardlink
+        with self.store.open_parsed("123/a", "w", version="2") as fp:
+            fp.write("This is the re-parsed document")
+        self.assertFalse(self.store.needed("123/a", "parse", version="2"))
+        with self.store.open_parsed("123/a", version="3") as fp:
+            self.assertEqual("This is the parsed document", fp.read())
+
+    def test_deltas_dissimilar(self):
+        self.store.archive_deltas = True
+        util.writefile(self.store.downloaded_path("123/a"), self.text)
+        self.store.archive("123/a", "1")
+        util.writefile(self.store.downloaded_path("123/a"), "Something else entirely")
+        self.store.archive("123/a", "2")
+        self.assertTrue(os.path.exists(self.store.downloaded_path("123/a", version="2")))
+
+    def test_overwrite(self):
+        self.store.archive_deltas = True
+        self.archive_versions(["1", "2"])
+        util.writefile(self.store.downloaded_path("123/a"), "A new version 2")
+        with self.assertRaises(ArchivingError):
+            self.store.archive("123/a", "2")
+        self.store.archive("123/a", "2", overwrite=True)
+        path = self.store.downloaded_path("123/a", version="2")
+        self.assertFalse(os.path.exists(path + ".delta"))
+        self.assertEqual("A new version 2", util.readfile(path))
+        self.assertEqual(["1", "2"], list(self.store.list_versions("123/a")))
+
+
 class Needed(unittest.TestCase):
     def setUp(self):
         self.datadir = tempfile.mkdtemp()
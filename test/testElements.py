@@ -9,13 +9,15 @@ from ferenda.compat import unittest
 from lxml import etree
 from lxml.builder import ElementMaker
 from rdflib import Graph, Namespace
+from rdflib.compare import isomorphic
 import os
 
 from ferenda.citationpatterns import url as urlparser
 from ferenda.testutil import FerendaTestCase
 from ferenda import util
 # SUT
-from ferenda.elements import (serialize, deserialize, AbstractElement,
+from ferenda.elements import (serialize, deserialize, iterdeserialize,
+                              AbstractElement,
                               UnicodeElement, CompoundElement,
                               TemporalElement, OrdinalElement,
                               PredicateElement, Body, Section, Paragraph,
@@ -72,6 +74,64 @@ class Main(unittest.TestCase):
         newtree[2][0] = util.parseresults_as_xml(newtree[2][0])
         self.assertEqual(tree, newtree)
 
+    def test_binary_roundtrip(self):
+        graph = Graph().parse(data="""@prefix dcterms: <http://purl.org/dc/terms/> .
+
+<http://example.org/1> dcterms:title "Hello world"@en ;
+                       dcterms:issued "2013-11-27"^^<http://www.w3.org/2001/XMLSchema#date> ;
+                       dcterms:isPartOf [ dcterms:identifier "1" ] .
+""", format="turtle")
+        tree = Body([Section([Paragraph(["Hello"]),
+                              Paragraph(["World"])],
+                             ordinal="1",
+                             title="Main section"),
+                     Section([42,
+                              -1,
+                              2**40,
+                              True,
+                              date(2013,11,27),
+                              datetime(2013,11,27,12,0,0),
+                              b'bytestring',
+                              {'foo': 'bar',
+                               'x': {'y': [1, 2]}}],
+                             ordinal=2,
+                             title="Native types"),
+                     Section([graph], meta=graph)])
+        serialized = serialize(tree, format="binary")
+        self.assertIsInstance(serialized, bytes)
+        newtree = deserialize(serialized, format="binary")
+        # the binary format should deserialize to exactly the same
+        # objects as the JSON format
+        jsontree = deserialize(serialize(tree, format="json"), format="json")
+        self.assertEqual(jsontree, newtree)
+        self.assertEqual(tree, newtree)
+        for newgraph in newtree[2].meta, newtree[2][0]:
+            self.assertTrue(isomorphic(graph, newgraph))
+            self.assertEqual(dict(graph.namespaces()),
+                             dict(newgraph.namespaces()))
+        with self.assertRaises(ValueError):
+            deserialize(serialize(tree, format="json").encode("utf-8"),
+                        format="binary")
+
+    def test_iterdeserialize(self):
+        tree = Body([Section([Paragraph(["Hello"]),
+                              Paragraph(["World"])],
+                             ordinal="1"),
+                     Section([Section([Paragraph(["Nested"])])],
+                             ordinal="2")])
+        serialized = serialize(tree, format="binary")
+        self.assertEqual(list(tree), list(iterdeserialize(serialized)))
+        self.assertEqual(Paragraph(["World"]),
+                         list(iterdeserialize(serialized, (0,)))[1])
+        self.assertEqual([Paragraph(["Nested"])],
+                         list(iterdeserialize(serialized, (1, 0))))
+        self.assertEqual(["Nested"],
+                         list(iterdeserialize(serialized, (1, 0, 0))))
+        with self.assertRaises(IndexError):
+            list(iterdeserialize(serialized, (2,)))
+        with self.assertRaises(IndexError):
+            list(iterdeserialize(serialized, (0, 0, 0)))
+
     def test_serialize_newstr(self):
         # really a test for future.types.newstr.newstr, here aliased
         # to str() -- this is only ever an issue on py2.
@@ -94,6 +154,15 @@ class Main(unittest.TestCase):
         newdoc.version = None
         self.assertEqual(doc, newdoc)
 
+        # the binary format handles the same hairy parts, and allows
+        # individual pages to be deserialized from the document body
+        bindoc = serialize(doc, format="binary")
+        newdoc = deserialize(bindoc, format="binary")
+        newdoc.version = None
+        self.assertEqual(doc, newdoc)
+        pages = list(iterdeserialize(bindoc, ("body", 0)))
+        self.assertEqual(list(doc.body[0]), pages)
+
     def test_serialize_pyparsing(self):
         # these objects can't be roundtripped
         from ferenda.citationpatterns import url
@@ -8,7 +8,8 @@ import os
 import doctest
 import rdflib
 
-from ferenda.compat import patch
+from ferenda.compat import patch, Mock
+from ferenda import util
 from ferenda.testutil import RepoTester
 
 # SUT
@@ -65,6 +66,26 @@ WHERE {
             faceted_data = self.repo.faceted_data()
         self.assertEqual(faceted_data, canned)
 
+    def test_faceted_data_relate(self):
+        canned = [{"uri": "http://example.org/books/A_Tale_of_Two_Cities",
+                   "dcterms_title": "A Tale of Two Cities"}]
+        cachepath = self.datadir + "/base/toc/faceted_data.json"
+        with patch('ferenda.DocumentRepository.facet_select', return_value=canned) as mock:
+            self.repo.faceted_data()
+            self.repo.faceted_data()
+            self.assertEqual(1, mock.call_count)
+            # when the repo changes its data in the triple store, the
+            # cache is no longer used
+            os.utime(cachepath, (0, 0))
+            util.writefile(self.repo.store.distilled_path("a"),
+                           "<http://example.org/a> <http://example.org/p> \"A\" .\n")
+            self.repo._triplestore = Mock()
+            self.repo.relate_triples("a")
+            self.repo.faceted_data()
+            self.assertEqual(2, mock.call_count)
+            self.repo.faceted_data()
+            self.assertEqual(2, mock.call_count)
+
     def test_year(self):
         self.assertEqual('2014',
                          Facet.year({'dcterms_issued': '2014-06-05T12:00:00'}))
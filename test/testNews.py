@@ -7,13 +7,14 @@ from datetime import datetime, timedelta
 from operator import attrgetter, itemgetter
 import json
 import os
+import shutil
 
 from lxml import etree
 import rdflib
 from rdflib import RDF
 from rdflib.namespace import DCTERMS
 
-from ferenda.compat import Mock, MagicMock
+from ferenda.compat import Mock, MagicMock, patch
 from ferenda import util
 from ferenda.testutil import RepoTester
 
@@ -130,6 +131,96 @@ class News(RepoTester):
         self.assertEqual(faceted_entries[-1]['updated'],
                          datetime(2013, 1, 1, 12, 40))
 
+    def test_news_facet_entries_incremental(self):
+        self.repo.faceted_data = Mock(return_value=self.faceted_data)
+        self.assertEqual(25, len(self.repo.news_facet_entries()))
+        cachepath = self.repo.store.resourcepath("feed/entry_summaries.json")
+        # modify one entry, remove another and make sure that the
+        # cache is newer than all other entries
+        later = os.stat(cachepath).st_mtime + 1
+        entry = DocumentEntry(self.repo.store.documententry_path("1"))
+        entry.title = "Doc #1, updated"
+        entry.save()
+        os.utime(self.repo.store.documententry_path("1"), (later, later))
+        os.unlink(self.repo.store.documententry_path("2"))
+        self.repo.news_entries = Mock(wraps=self.repo.news_entries)
+        faceted_entries = self.repo.news_facet_entries()
+        # only the changed entry should have been re-loaded
+        self.assertEqual((["1"],), self.repo.news_entries.call_args[0])
+        self.assertEqual(24, len(faceted_entries))
+        titles = dict((x['basefile'], x['title']) for x in faceted_entries)
+        self.assertEqual("Doc #1, updated", titles["1"])
+        self.assertEqual("Doc #3", titles["3"])
+        self.assertNotIn("2", titles)
+        # cached entries keep their datetime values
+        updated = dict((x['basefile'], x['updated']) for x in faceted_entries)
+        self.assertEqual(datetime(2013, 1, 1, 15, 40), updated["3"])
+
+    def test_news_facet_entries_undecorated(self):
+        # an entry that isn't in faceted_data (yet) isn't part of
+        # the result, but its summary is still cached
+        self.repo.faceted_data = Mock(return_value=self.faceted_data[1:])
+        self.assertEqual(24, len(self.repo.news_facet_entries()))
+        cachepath = self.repo.store.resourcepath("feed/entry_summaries.json")
+        later = os.stat(cachepath).st_mtime + 1
+        os.utime(self.repo.store.documententry_path("1"), (later, later))
+        self.repo.faceted_data = Mock(return_value=self.faceted_data)
+        self.repo.news_entries = Mock(wraps=self.repo.news_entries)
+        faceted_entries = self.repo.news_facet_entries()
+        self.assertEqual((["1"],), self.repo.news_entries.call_args[0])
+        self.assertEqual(25, len(faceted_entries))
+        titles = dict((x['basefile'], x['title']) for x in faceted_entries)
+        self.assertEqual("Doc #0", titles["0"])
+
+    def test_news_changed_basefiles(self):
+        since = os.stat(self.repo.store.documententry_path("24")).st_mtime
+        with patch.object(self.repo.store, 'list_basefiles_for',
+                          return_value=["23", "24", "25"]):
+            current, changed = self.repo.news_changed_basefiles(since)
+        self.assertEqual({"23", "24", "25"}, current)
+        # there is no entry for 25 (eg. it was removed after being
+        # listed), which should count as a change
+        self.assertEqual({"25"}, changed)
+
+    def test_generate_feeds_unchanged(self):
+        self.repo.faceted_data = Mock(return_value=self.faceted_data)
+        entries = self.repo.news_facet_entries()
+        feedsets = [Feedset(label="All",
+                            feeds=[Feed(slug="main", title="All documents",
+                                        binding=None, value=None)])]
+        feedsets[0].feeds[0].entries = entries
+        self.repo.news_write_atom = Mock(wraps=self.repo.news_write_atom)
+        self.repo.news_generate_feeds(feedsets, generate_html=False)
+        self.assertEqual(1, self.repo.news_write_atom.call_count)
+        # the same entries shouldn't cause the feed to be written again
+        self.repo.news_generate_feeds(feedsets, generate_html=False)
+        self.assertEqual(1, self.repo.news_write_atom.call_count)
+        # but changed entries should
+        feedsets[0].feeds[0].entries = entries[1:]
+        self.repo.news_generate_feeds(feedsets, generate_html=False)
+        self.assertEqual(2, self.repo.news_write_atom.call_count)
+
+    def test_generate_feeds_template_changed(self):
+        resources = self.datadir + os.sep + "rsrc" + os.sep + "resources.xml"
+        util.ensure_dir(resources)
+        shutil.copy2("%s/files/base/rsrc/resources.xml" % os.path.dirname(__file__),
+                     resources)
+        self.repo.faceted_data = Mock(return_value=self.faceted_data)
+        feedsets = [Feedset(label="All",
+                            feeds=[Feed(slug="main", title="All documents",
+                                        binding=None, value=None)])]
+        feedsets[0].feeds[0].entries = self.repo.news_facet_entries()
+        self.repo.news_write_atom = Mock(wraps=self.repo.news_write_atom)
+        self.repo.news_generate_feeds(feedsets)
+        self.repo.news_generate_feeds(feedsets)
+        self.assertEqual(1, self.repo.news_write_atom.call_count)
+        # a changed template (or resources.xml) means that the HTML
+        # version must be regenerated
+        mtime = os.path.getmtime(resources) + 10
+        os.utime(resources, (mtime, mtime))
+        self.repo.news_generate_feeds(feedsets)
+        self.assertEqual(2, self.repo.news_write_atom.call_count)
+
     def test_news_entries(self):
         unsorted_entries = self.repo.news_entries() # not guaranteed particular order
         # sort so that most recently updated first
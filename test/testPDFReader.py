@@ -11,18 +11,19 @@ from bz2 import BZ2File
 import re
 import os
 import shutil
+import sys
 import tempfile
 from io import BytesIO
 
 from lxml import etree
 
-from ferenda.compat import unittest
+from ferenda.compat import unittest, patch
 from ferenda import errors, util
 from ferenda.testutil import FerendaTestCase
 from ferenda.elements import serialize, LinkSubject
 
 # SUT
-from ferenda import PDFReader
+from ferenda import PDFReader, OfficeConverter
 from ferenda.pdfreader import Textbox, Textelement, BaseTextDecoder, LinkedTextelement
 
 class Read(unittest.TestCase):
@@ -152,9 +153,79 @@ class Read(unittest.TestCase):
                            workdir=self.datadir,
                            keep_xml="bz2")
 
+    @unittest.skipIf(sys.platform == "win32", "Needs a shell script as fake soffice")
     def test_convert(self):
-        # how to test this when soffice isnt available and on $PATH?
-        pass
+        # soffice usually isn't available, so use a fake one that
+        # records which profile it was called with and "converts" by
+        # copying the sample pdf
+        bindir = self.datadir + os.sep + "bin"
+        util.writefile(bindir + os.sep + "soffice", """#!/bin/sh
+for arg; do
+  case "$arg" in
+    -env:UserInstallation=*) echo "$arg" >> %s/profiles.txt;;
+  esac
+  if [ "$prev" = "--outdir" ]; then outdir="$arg"; fi
+  prev="$arg"
+  infile="$arg"
+done
+name=$(basename "$infile")
+cp %s "$outdir/${name%%.*}.pdf"
+""" % (self.datadir, os.path.abspath("test/files/pdfreader/sample.pdf")))
+        os.chmod(bindir + os.sep + "soffice", 0o755)
+        util.writefile(self.datadir + os.sep + "in.doc", "")
+        with patch.dict(os.environ, {'PATH': bindir + os.pathsep + os.environ['PATH']}):
+            converter = OfficeConverter(workers=2, use_uno=False)
+            try:
+                outfile = converter.convert(self.datadir + os.sep + "in.doc",
+                                            self.datadir + os.sep + "out")
+            finally:
+                converter.close()
+        self.assertEqual(self.datadir + os.sep + "out" + os.sep + "in.pdf", outfile)
+        self.assertTrue(os.path.exists(outfile))
+        self.assertIn("file://" + converter.basedir,
+                      util.readfile(self.datadir + os.sep + "profiles.txt"))
+
+    @unittest.skipIf(sys.platform == "win32", "Needs a shell script as fake soffice")
+    def test_convert_reuse(self):
+        # conversions that don't overlap all use the same (most
+        # recently used) worker, so that only one soffice is started
+        bindir = self.datadir + os.sep + "bin"
+        util.writefile(bindir + os.sep + "soffice", """#!/bin/sh
+for arg; do
+  case "$arg" in
+    -env:UserInstallation=*) echo "$arg" >> %s/profiles.txt;;
+  esac
+  if [ "$prev" = "--outdir" ]; then outdir="$arg"; fi
+  prev="$arg"
+done
+touch "$outdir/in.pdf"
+""" % self.datadir)
+        os.chmod(bindir + os.sep + "soffice", 0o755)
+        util.writefile(self.datadir + os.sep + "in.doc", "")
+        with patch.dict(os.environ, {'PATH': bindir + os.pathsep + os.environ['PATH']}):
+            converter = OfficeConverter(workers=3, use_uno=False)
+            try:
+                for i in range(3):
+                    converter.convert(self.datadir + os.sep + "in.doc",
+                                      self.datadir + os.sep + "out")
+            finally:
+                converter.close()
+        profiles = util.readfile(self.datadir + os.sep + "profiles.txt").split()
+        self.assertEqual(3, len(profiles))
+        self.assertEqual(1, len(set(profiles)))
+
+    def test_get_converter(self):
+        from ferenda import officeconverter
+        self.addCleanup(setattr, officeconverter, "_converter", None)
+        officeconverter._converter = None
+        converter = officeconverter.get_converter(1)
+        self.assertEqual(1, len(converter.workers))
+        self.assertIs(converter, officeconverter.get_converter())
+        self.assertIs(converter, officeconverter.get_converter(1))
+        other = officeconverter.get_converter(2)
+        self.assertIsNot(converter, other)
+        self.assertEqual(2, len(other.workers))
+        other.close()
 
     def test_ocr(self):
         try:
@@ -373,7 +444,9 @@ class ParseXML(unittest.TestCase):
     def test_whitespace_normalization(self):
         pdf = self._parse_xml("""
 <fontspec id="0" size="21" family="CCQUSK+Calibri-Bold" color="#345a8a"/>
-<text top="146" left="135" width="155" height="29" font="0"><b>Document	  title	  </b></text>""")
+<text top="146" left="135" width="155" height="29" font="0"><b>Document	
+  title	
+  </b></text>""")
         self.assertEqual("Document title ", str(pdf[0][0]))
 
 
@@ -234,6 +234,34 @@ class TOC(RepoTester):
         for path in paths:
             self.assertTrue(os.path.exists(path))
 
+    def test_generate_pages_unchanged(self):
+        self.repo.toc_generate_page = Mock(wraps=self.repo.toc_generate_page)
+        self.repo.toc_generate_pages(self.documentlists, self.pagesets)
+        self.assertEqual(10, self.repo.toc_generate_page.call_count)
+        # nothing has changed, no page should be regenerated
+        paths = self.repo.toc_generate_pages(self.documentlists, self.pagesets)
+        self.assertEqual(10, self.repo.toc_generate_page.call_count)
+        self.assertEqual(10, len(paths))
+        # a single page has changed, only that one should be regenerated
+        documentlists = dict(self.documentlists)
+        documentlists[('dcterms_issued', '1791')] = [[Link("Dream of the Red Chamber, revised",
+                                                           uri='http://example.org/books/Dream_of_the_Red_Chamber')]]
+        self.repo.toc_generate_pages(documentlists, self.pagesets)
+        self.assertEqual(11, self.repo.toc_generate_page.call_count)
+        self.assertEqual(('dcterms_issued', '1791'),
+                         self.repo.toc_generate_page.call_args[0][:2])
+
+    def test_generate_pages_template_changed(self):
+        self.repo.toc_generate_page = Mock(wraps=self.repo.toc_generate_page)
+        self.repo.toc_generate_pages(self.documentlists, self.pagesets)
+        self.assertEqual(10, self.repo.toc_generate_page.call_count)
+        # a changed template or resources.xml changes every page
+        resources = self.datadir+os.sep+"rsrc"+os.sep+"resources.xml"
+        mtime = os.path.getmtime(resources) + 10
+        os.utime(resources, (mtime, mtime))
+        self.repo.toc_generate_pages(self.documentlists, self.pagesets)
+        self.assertEqual(20, self.repo.toc_generate_page.call_count)
+
     def test_generate_first_page(self):
         path = self.repo.toc_generate_first_page(self.documentlists,self.pagesets)
         self.assertEqual(path, self.p("base/toc/index.html"))
@@ -137,6 +137,59 @@ class Main(unittest.TestCase):
         # test 3: dst does exist, is identical
         self.assertFalse(util.copy_if_different(self.fname, self.fname2))
 
+    def test_labelindex(self):
+        import difflib
+        labels = ["Justitiedepartementet", "Finansdepartementet",
+                  "Socialdepartementet", "Högsta domstolen",
+                  "Högsta förvaltningsdomstolen", "Arbetsdomstolen"]
+        idx = util.LabelIndex((l, i) for i, l in enumerate(labels))
+        self.assertEqual(0, idx.get("Justitiedepartementet"))
+        self.assertIsNone(idx.get("justitiedepartementet"))
+        self.assertEqual("Justitiedepartementet",
+                         idx.closest("justitiedepartementet"))
+        for label in ("Högsta domstolenn", "Finansdept", "Arbetsdomstolen ",
+                      "Förvaltningsdomstolen", "xyz", "Social", "HD",
+                      "departement", "Högsta", "Justitiedep. i Sthlm"):
+            for cutoff in (0.0, 0.2, 0.3, 0.4, 0.6, 0.8):
+                want = difflib.get_close_matches(label, labels, 1, cutoff)
+                self.assertEqual(want[0] if want else None,
+                                 idx.closest(label, cutoff))
+        # cached lookups give the same answer
+        self.assertEqual("Högsta domstolen", idx.closest("Högsta domstolenn"))
+
+    def test_labelindex_random(self):
+        import difflib
+        import random
+        rnd = random.Random(42)
+        def word():
+            return "".join(rnd.choice("abcde ") for i in range(rnd.randint(0, 12)))
+        labels = list(set(word() for i in range(200)))
+        idx = util.LabelIndex((l, i) for i, l in enumerate(labels))
+        for i in range(300):
+            label = word()
+            for cutoff in (0.0, 0.5, 0.7, 0.9):
+                want = difflib.get_close_matches(label, labels, 1, cutoff)
+                self.assertEqual(want[0] if want else None,
+                                 idx.closest(label, cutoff),
+                                 "%r, cutoff %s" % (label, cutoff))
+
+    def test_labelindex_candidates(self):
+        import difflib
+        labels = ["Myndighet nr %04d för skatter" % i for i in range(1000)]
+        idx = util.LabelIndex((l, i) for i, l in enumerate(labels))
+        scored = []
+        realmatcher = difflib.SequenceMatcher
+        class CountingMatcher(realmatcher):
+            def ratio(self):
+                scored.append(self.a)
+                return realmatcher.ratio(self)
+        with patch("ferenda.util.difflib.SequenceMatcher", CountingMatcher):
+            self.assertEqual("Myndighet nr 0123 för skatter",
+                             idx.closest("Myndighet nr 0123 för skatterna"))
+        # only the few labels sharing the most trigrams are scored,
+        # not all 1000
+        self.assertLess(len(scored), 20)
+
 
 from ferenda import util
 import doctest
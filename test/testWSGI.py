@@ -91,6 +91,60 @@ class Pathresolve(RepoTester):
         
 
 
+class Diff(RepoTester):
+
+    def put_version(self, version, paragraphs):
+        body = "".join('<div class="row" about="http://example.org/base/1#%s">'
+                       '<section id="%s" class="col-sm-7"><p>%s</p></section></div>' %
+                       (key, key, text) for (key, text) in paragraphs)
+        util.writefile(self.repo.store.generated_path("1", version=version),
+                       '<html><body><div class="docversions"/>'
+                       '<article>%s</article></body></html>' % body)
+
+    def setUp(self):
+        super(Diff, self).setUp()
+        self.put_version("1", [("P1", "Första paragrafen."),
+                               ("P2", "Andra paragrafen lyder så."),
+                               ("P3", "Tredje paragrafen.")])
+        self.put_version("2", [("P1", "Första paragrafen."),
+                               ("P2", "Andra paragrafen lyder nu så."),
+                               ("P4", "Fjärde paragrafen.")])
+
+    def test_diff(self):
+        tree = etree.fromstring(self.repo.requesthandler.diff_versions("1", "1", "2"))
+        rows = tree.findall(".//article/*")
+        self.assertEqual(4, len(rows))
+        # unchanged section is copied without markup
+        self.assertEqual("P1", rows[0].get("about").split("#")[1])
+        self.assertIsNone(rows[0].find(".//ins"))
+        # changed section is diffed on word level
+        self.assertIn("nu", rows[1].find(".//ins").text)
+        # removed and added sections are wrapped in del/ins
+        self.assertEqual("del", rows[2].tag)
+        self.assertEqual("ins", rows[3].tag)
+        self.assertEqual("P4", rows[3][0].get("about").split("#")[1])
+
+    def test_cache(self):
+        self.repo.requesthandler.diff_versions("1", "1", "2")
+        cache_path = self.repo.requesthandler.diff_path("1", "1", "2")
+        self.assertTrue(os.path.exists(cache_path))
+        util.writefile(cache_path, "<html>cached</html>")
+        self.assertEqual(b"<html>cached</html>",
+                         self.repo.requesthandler.diff_versions("1", "1", "2"))
+        # a newer version file invalidates the cache
+        later = os.stat(cache_path).st_mtime + 1
+        os.utime(self.repo.store.generated_path("1", version="2"), (later, later))
+        self.assertNotEqual(b"<html>cached</html>",
+                            self.repo.requesthandler.diff_versions("1", "1", "2"))
+
+    def test_cache_path(self):
+        # the cached diff is a plain file, even if archived versions
+        # are stored in zip files
+        self.repo.store.archiving_policy = "zip"
+        self.assertEqual(self.datadir + "/base/archive/diff/1/1-2.html",
+                         self.repo.requesthandler.diff_path("1", "1", "2"))
+
+
 class WSGI(RepoTester): # base class w/o tests
     storetype = 'SQLITE'
     storelocation = 'data/ferenda.sqlite' # append self.datadir
@@ -358,6 +412,25 @@ indexlocation = data/whooshindex
 """)
         res = manager.make_wsgi_app(manager.load_config(inifile), repos=[])
         self.assertTrue(callable(res))
+
+    def test_preload(self):
+        # don't exempt all objects in the test process from garbage
+        # collection
+        with patch('ferenda.wsgiapp.gc') as gc:
+            self.app = manager.make_wsgi_app(self.app.config, repos=[self.repo],
+                                             preload=True)
+        self.assertTrue(gc.freeze.called)
+        self.assertIn('commondata', self.repo.__dict__)
+        self.assertGreater(self.app.startup_time, 0)
+        # the first request in each process logs startup time and
+        # memory usage
+        with patch.object(self.app.log, 'info') as info:
+            status, headers, content = self.call_wsgi()
+            self.call_wsgi()
+        self.assertEqual("200 OK", status)
+        stats = [c[0][0] for c in info.call_args_list if "worker" in c[0][0]]
+        self.assertEqual(1, len(stats))
+        self.assertIn("worker %s: startup" % os.getpid(), stats[0])
     
 class Parameters(WSGI):
 
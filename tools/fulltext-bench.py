@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+# 1 stdlib
+import sys
+import os
+import time
+import random
+import shutil
+import tempfile
+import multiprocessing
+
+# 2 third party
+
+# 3 own code
+sys.path.append(os.path.normpath(os.getcwd() + os.sep + os.pardir))
+from ferenda import FulltextIndex, DocumentRepository
+
+# Compares the throughput of indexing documents into a WHOOSH
+# fulltext index the regular way (update_document and one commit per
+# basefile, as relate_fulltext does) with bulk mode (each process
+# spools its documents, which are indexed by merge_bulk at the end),
+# using synthetic documents, eg:
+#
+#   python tools/fulltext-bench.py 2000 4
+#
+# indexes 2000 basefiles with 10 resources each, first in a single
+# process the regular way, then in bulk mode with 1 and with 4
+# processes (both for spooling and for merge_bulk). Regular indexing
+# is only done in a single process, since several processes fail on
+# the index lock.
+
+RESOURCES = 10
+WORDS = 200
+
+
+def make_docs(basefiles, seed=0):
+    rnd = random.Random(seed)
+    vocabulary = ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyzåäö")
+                          for i in range(rnd.randint(3, 12)))
+                  for j in range(5000)]
+    docs = []
+    for basefile in range(basefiles):
+        resources = []
+        for resource in range(RESOURCES):
+            uri = "http://example.org/doc/%s#%s" % (basefile, resource)
+            resources.append({'uri': uri,
+                              'repo': 'base',
+                              'basefile': str(basefile),
+                              'text': " ".join(rnd.choice(vocabulary)
+                                               for i in range(WORDS))})
+        docs.append(resources)
+    return docs
+
+
+def index_basefiles(location, docs, bulk):
+    index = FulltextIndex.connect("WHOOSH", location, [DocumentRepository()])
+    index.bulk = bulk
+    for resources in docs:
+        for resource in resources:
+            index.update(**resource)
+        index.commit()
+    index.close()
+
+
+def run(docs, processes, bulk):
+    location = tempfile.mkdtemp()
+    try:
+        index = FulltextIndex.connect("WHOOSH", location, [DocumentRepository()])
+        start = time.time()
+        if processes == 1:
+            index_basefiles(location, docs, bulk)
+        else:
+            procs = [multiprocessing.Process(target=index_basefiles,
+                                             args=(location, docs[i::processes], bulk))
+                     for i in range(processes)]
+            for proc in procs:
+                proc.start()
+            for proc in procs:
+                proc.join()
+        indexed = time.time() - start
+        index.merge_bulk(processes)
+        elapsed = time.time() - start
+        count = index.doccount()
+        index.close()
+        return indexed, elapsed, count
+    finally:
+        shutil.rmtree(location)
+
+
+def main(basefiles, processes):
+    docs = make_docs(basefiles)
+    resources = basefiles * RESOURCES
+    print("%-22s %9s %9s %10s %12s" % ("mode", "index (s)", "total (s)",
+                                      "resources", "resources/s"))
+    for label, procs, bulk in (("regular, 1 process", 1, False),
+                               ("bulk, 1 process", 1, True),
+                               ("bulk, %s processes" % processes, processes, True)):
+        indexed, elapsed, count = run(docs, procs, bulk)
+        print("%-22s %9.2f %9.2f %10s %12.0f" % (label, indexed, elapsed, count,
+                                                 resources / elapsed))
+        if count != resources:
+            print("ERROR: %s resources indexed, expected %s" % (count, resources))
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("USAGE: %s basefiles [processes]" % sys.argv[0])
+        sys.exit(1)
+    basefiles = int(sys.argv[1])
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    sys.exit(0 if main(basefiles, processes) else 1)
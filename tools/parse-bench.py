@@ -104,7 +104,7 @@ class RepoTest(object):
         self.alias = alias
 
     def timetest(self, basefile, basedir):
-        serialized_path = self.repo.store.serialized_path(basefile) + ".unparsed"
+        serialized_path = self.repo.store.serialized_path(basefile, format="json") + ".unparsed"
         serialized_path = serialized_path.replace(self.repo.store.datadir+"/serialized/", basedir+"/serialized/" + self.alias + "/")
         with codecs.open(serialized_path, "r", encoding="utf-8") as fp:
             doc = deserialize(fp.read(), format="json")
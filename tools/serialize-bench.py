@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+from builtins import *
+# 1 stdlib
+import sys
+import os
+import time
+
+# 2 third party
+
+# 3 own code
+sys.path.append(os.path.normpath(os.getcwd() + os.sep + os.pardir))
+from ferenda.elements import serialize, deserialize, iterdeserialize
+
+# Compares the JSON and binary serialization formats for document
+# trees, using serialized JSON files created by the parse step with
+# the serializejson option, eg:
+#
+#   python tools/serialize-bench.py data/sfs/serialized data/dv/serialized
+#
+# For each directory (or file) given, reports total file size and
+# best-of-N deserialization times for both formats, the time needed
+# to get at the first child of the document body with
+# iterdeserialize, and verifies that both formats deserialize to
+# identical trees.
+
+
+def best(func, repeat):
+    elapsed = None
+    for i in range(repeat):
+        start = time.time()
+        result = func()
+        t = time.time() - start
+        elapsed = t if elapsed is None else min(elapsed, t)
+    return result, elapsed
+
+
+def jsonfiles(path):
+    if os.path.isfile(path):
+        return [path]
+    res = []
+    for root, dirs, files in os.walk(path):
+        res.extend(os.path.join(root, f) for f in files if f.endswith(".json"))
+    return sorted(res)
+
+
+def bench(path, repeat):
+    totals = {'files': 0, 'jsonsize': 0, 'binsize': 0, 'json': 0,
+              'binary': 0, 'firstchild': 0, 'errors': []}
+    for filename in jsonfiles(path):
+        with open(filename, encoding="utf-8") as fp:
+            jsondata = fp.read()
+        jsontree, elapsed = best(lambda: deserialize(jsondata, format="json"), repeat)
+        totals['json'] += elapsed
+        bindata = serialize(jsontree, format="binary")
+        bintree, elapsed = best(lambda: deserialize(bindata, format="binary"), repeat)
+        totals['binary'] += elapsed
+        if hasattr(bintree, 'body'):
+            first, elapsed = best(lambda: next(iterdeserialize(bindata, ("body",)), None), repeat)
+            totals['firstchild'] += elapsed
+        totals['files'] += 1
+        totals['jsonsize'] += len(jsondata.encode("utf-8"))
+        totals['binsize'] += len(bindata)
+        if jsontree != bintree:
+            totals['errors'].append(filename)
+    return totals
+
+
+def main(paths, repeat=3):
+    print("%-30s %6s %10s %10s %9s %9s %11s" % ("path", "files", "json (kB)", "bin (kB)",
+                                              "json (s)", "bin (s)", "1st child"))
+    errors = []
+    for path in paths:
+        t = bench(path, repeat)
+        print("%-30s %6s %10.1f %10.1f %9.3f %9.3f %11.4f" % (
+            path, t['files'], t['jsonsize'] / 1024, t['binsize'] / 1024,
+            t['json'], t['binary'], t['firstchild']))
+        errors.extend(t['errors'])
+    for filename in errors:
+        print("ERROR: %s deserializes differently in the binary format" % filename)
+    return not errors
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("USAGE: %s serializeddir [serializeddir...]" % sys.argv[0])
+        sys.exit(1)
+    sys.exit(0 if main(sys.argv[1:]) else 1)